@@ -0,0 +1,268 @@
+"""
+Diffs two release snapshots into the albums the next ingest has to touch.
+
+Snapshots are the JSONL files written by Preprocessor/Extract/extracted_snapshot.py
+(one line per file) or unextracted_snapshot.py (one per archive), each line
+{path: {"hash": xxh128, "size": bytes}}. Paths are absolute on the machine that
+took the snapshot, so each side is made relative to its own root first -- the
+common prefix of its paths unless given -- and the releases are compared on
+`<circle>/<album>/...`.
+
+Per file:
+
+  * same relative path, same hash   -> unchanged
+  * same relative path, other hash  -> modified
+  * path only in the new release whose hash and size match a file that left
+    the old one                     -> moved (a rename, or a circle respelt)
+  * otherwise                       -> added / removed
+
+Per album, from its files: an album on both sides is modified when any of its
+files is; a new album whose files mostly came from one vanished album is that
+album moved; the rest are added or removed.
+
+Writes output/delta_report.output.json -- every album that changed and how, with
+its files -- and output/delta_worklist.output.json, the added, modified and
+moved albums under "Albums". Point TLMC_DELTA_WORKLIST at the latter to run the
+per-album stages over just those (Shared/delta_worklist.py).
+
+For archive snapshots the same comparison runs per archive; there is no album
+level, and the report lists the archives a new release adds or changes.
+
+    python DataUpdates/FileDeltaScanner/fs-compare.py <old snapshot> <new snapshot> [old root] [new root]
+"""
+
+import json
+import os
+import sys
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import DataUpdates.FileDeltaScanner.output.path_definitions as DeltaOutputPaths
+from Shared.json_utils import json_dump
+from Shared.utils import get_output_path
+
+AUDIO_EXTENSIONS = (".flac", ".mp3", ".wav", ".wv", ".m4a")
+
+# A new album counts as an old one moved when more than this share of its files
+# arrived from that album by hash. Below it, it is a new album that happens to
+# share a cover or a booklet scan with one that went away.
+MOVED_ALBUM_MIN_SHARE = 0.5
+
+report_output_path = get_output_path(
+    DeltaOutputPaths, DeltaOutputPaths.DELTA_REPORT_OUTPUT_NAME
+)
+worklist_output_path = get_output_path(
+    DeltaOutputPaths, DeltaOutputPaths.DELTA_WORKLIST_OUTPUT_NAME
+)
+
+Entry = Tuple[str, int]  # (hash, size)
+
+
+def load_snapshot(path: str) -> Dict[str, Entry]:
+    snapshot = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            for file, info in json.loads(line).items():
+                # Snapshots are appended to across resumed runs; the last line
+                # for a path is the newest.
+                snapshot[file.replace("\\", "/")] = (info["hash"], info["size"])
+    return snapshot
+
+
+def relativize(snapshot: Dict[str, Entry], root: Optional[str]) -> Dict[str, Entry]:
+    if root is None:
+        # The library root is the deepest directory every file sits under.
+        root = os.path.commonpath(list(snapshot)) if len(snapshot) > 1 else ""
+    root = root.replace("\\", "/").rstrip("/") + "/"
+    return {
+        path[len(root) :] if path.startswith(root) else path: entry
+        for path, entry in snapshot.items()
+    }
+
+
+def album_of(rel_path: str) -> Optional[str]:
+    parts = rel_path.split("/")
+    # Files directly under a circle (or the root) belong to no album; no stage
+    # reaches them.
+    return "/".join(parts[:2]) if len(parts) > 2 else None
+
+
+def diff_files(old: Dict[str, Entry], new: Dict[str, Entry]):
+    """(added, removed, modified, moved {old: new}) relative paths."""
+    modified = [p for p in new if p in old and old[p] != new[p]]
+    gone = defaultdict(list)
+    for p in old:
+        if p not in new:
+            gone[old[p]].append(p)
+
+    added, moved = [], {}
+    for p in new:
+        if p in old:
+            continue
+        candidates = gone.get(new[p])
+        if not candidates:
+            added.append(p)
+            continue
+        # Identical files recur across albums (a circle's logo, a blank
+        # booklet page); when several left, pair with the one of the same name.
+        name = p.rsplit("/", 1)[-1]
+        pick = next(
+            (i for i, c in enumerate(candidates) if c.rsplit("/", 1)[-1] == name), 0
+        )
+        moved[candidates.pop(pick)] = p
+
+    removed = [p for paths in gone.values() for p in paths]
+    return added, removed, modified, moved
+
+
+def diff_albums(old: Dict[str, Entry], new: Dict[str, Entry]) -> Dict[str, dict]:
+    added, removed, modified, moved = diff_files(old, new)
+
+    changes = defaultdict(
+        lambda: {"added": [], "removed": [], "modified": [], "moved_in": {}, "moved_out": {}}
+    )
+    for p in added:
+        changes[album_of(p)]["added"].append(p)
+    for p in removed:
+        changes[album_of(p)]["removed"].append(p)
+    for p in modified:
+        changes[album_of(p)]["modified"].append(p)
+    for src, dst in moved.items():
+        if album_of(src) != album_of(dst):
+            changes[album_of(dst)]["moved_in"][src] = dst
+            changes[album_of(src)]["moved_out"][src] = dst
+        else:
+            # A rename inside the album changes that album only.
+            changes[album_of(dst)]["moved_in"][src] = dst
+    changes.pop(None, None)
+
+    old_albums = {a for a in map(album_of, old) if a}
+    new_albums = {a for a in map(album_of, new) if a}
+    album_sizes = defaultdict(int)
+    for p in new:
+        album_sizes[album_of(p)] += 1
+
+    albums = {}
+    moved_from = {}
+    for album in sorted(new_albums - old_albums):
+        sources = defaultdict(int)
+        for src in changes[album]["moved_in"]:
+            sources[album_of(src)] += 1
+        source, count = max(sources.items(), key=lambda kv: kv[1], default=(None, 0))
+        if (
+            source is not None
+            and source not in new_albums
+            and source not in moved_from
+            and count > album_sizes[album] * MOVED_ALBUM_MIN_SHARE
+        ):
+            moved_from[source] = album
+            albums[album] = {"status": "moved", "from": source}
+        else:
+            albums[album] = {"status": "added"}
+
+    for album in sorted(old_albums - new_albums):
+        if album in moved_from:
+            continue
+        albums[album] = {"status": "removed"}
+
+    for album in sorted(old_albums & new_albums):
+        c = changes.get(album)
+        if c and (c["added"] or c["removed"] or c["modified"] or c["moved_in"] or c["moved_out"]):
+            albums[album] = {"status": "modified"}
+
+    for album, info in albums.items():
+        c = changes.get(album, {})
+        info.update({k: v for k, v in c.items() if v})
+        files = c.get("added", []) + c.get("modified", []) + list(c.get("moved_in", {}).values())
+        info["audio_changed"] = sum(p.lower().endswith(AUDIO_EXTENSIONS) for p in files)
+    return albums
+
+
+def diff_archives(old: Dict[str, Entry], new: Dict[str, Entry]) -> Dict[str, dict]:
+    added, removed, modified, moved = diff_files(old, new)
+    archives = {}
+    for p in added:
+        archives[p] = {"status": "added"}
+    for p in modified:
+        archives[p] = {"status": "modified"}
+    for p in removed:
+        archives[p] = {"status": "removed"}
+    for src, dst in moved.items():
+        archives[dst] = {"status": "moved", "from": src}
+    return dict(sorted(archives.items()))
+
+
+def is_archive_snapshot(snapshot: Dict[str, Entry]) -> bool:
+    return bool(snapshot) and all(
+        p.lower().endswith((".7z", ".zip", ".rar")) for p in snapshot
+    )
+
+
+def summarize(changes: Dict[str, dict]) -> Dict[str, int]:
+    summary = defaultdict(int)
+    for info in changes.values():
+        summary[info["status"]] += 1
+    return dict(sorted(summary.items()))
+
+
+def main():
+    if len(sys.argv) in (3, 5):
+        old_path, new_path = sys.argv[1], sys.argv[2]
+        old_root, new_root = (sys.argv[3], sys.argv[4]) if len(sys.argv) == 5 else (None, None)
+    else:
+        old_path = input("Enter path to the OLD release snapshot: ").strip()
+        new_path = input("Enter path to the NEW release snapshot: ").strip()
+        old_root = input("Old release root (blank to infer): ").strip() or None
+        new_root = input("New release root (blank to infer): ").strip() or None
+
+    for path in (old_path, new_path):
+        if not os.path.isfile(path):
+            print(f"Invalid path: {path}")
+            exit(1)
+
+    print("Loading snapshots...")
+    old = relativize(load_snapshot(old_path), old_root)
+    new = relativize(load_snapshot(new_path), new_root)
+    print(f"Old: {len(old)} entries  New: {len(new)} entries")
+
+    if is_archive_snapshot(old) and is_archive_snapshot(new):
+        archives = diff_archives(old, new)
+        report = {
+            "Old": old_path,
+            "New": new_path,
+            "Summary": summarize(archives),
+            "Archives": archives,
+        }
+        json_dump(report, report_output_path)
+        print(f"Archives: {report['Summary']}")
+        print(f"Wrote {report_output_path}")
+        return
+
+    albums = diff_albums(old, new)
+    summary = summarize(albums)
+    json_dump(
+        {"Old": old_path, "New": new_path, "Summary": summary, "Albums": albums},
+        report_output_path,
+    )
+    json_dump(
+        {
+            "Old": old_path,
+            "New": new_path,
+            "Albums": sorted(a for a, i in albums.items() if i["status"] != "removed"),
+            "Removed": sorted(a for a, i in albums.items() if i["status"] == "removed"),
+            "Moved": {i["from"]: a for a, i in albums.items() if i["status"] == "moved"},
+        },
+        worklist_output_path,
+    )
+
+    print(f"Albums: {summary}")
+    print(f"Wrote {report_output_path}")
+    print(f"Wrote {worklist_output_path}")
+    print(f"Run the per-album stages with TLMC_DELTA_WORKLIST={worklist_output_path}")
+
+
+if __name__ == "__main__":
+    main()
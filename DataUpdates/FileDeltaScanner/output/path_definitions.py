@@ -0,0 +1,2 @@
+DELTA_REPORT_OUTPUT_NAME = "delta_report.output.json"
+DELTA_WORKLIST_OUTPUT_NAME = "delta_worklist.output.json"
@@ -0,0 +1,99 @@
+"""Tests for the CPU chamfer precompute in Experimental/vector_search.
+
+Builds a small chunk store with random unit vectors and checks the tile kernel
+and the top-N bookkeeping against rerank.chamfer_scores and a brute-force
+ranking. numpy only; no torch.
+"""
+import os, shutil, sys, tempfile
+
+import numpy as np
+
+EXP = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(EXP, "vector_search"))
+import precompute_similar_tracks_cpu as pc  # noqa: E402
+from chunk_store import ChunkStore, ChunkStoreWriter  # noqa: E402
+
+fails = 0
+def check(cond, label):
+    global fails
+    print(("  OK   " if cond else "  FAIL ") + label)
+    if not cond:
+        fails += 1
+
+rng = np.random.default_rng(7)
+tmp = tempfile.mkdtemp()
+DIM, PAD, N = 32, 12, 60
+counts = rng.integers(1, 20, N)
+with ChunkStoreWriter(tmp, dim=DIM) as w:
+    for i, c in enumerate(counts):
+        v = rng.standard_normal((c, DIM)).astype(np.float32)
+        w.add(f"t{i:03d}", v / np.linalg.norm(v, axis=1, keepdims=True))
+
+store = ChunkStore(tmp)
+pr = pc.PaddedRows(store, PAD)
+rr = pc.load_rerank_module()
+ids = [str(t) for t in store.track_ids]
+
+# --- 1. padded rows -----------------------------------------------------------
+ok = True
+for r in range(N):
+    o, c = int(store.offsets[r]), int(store.counts[r])
+    want = o + (np.arange(c) if c <= PAD else np.linspace(0, c - 1, PAD).round().astype(int))
+    ok &= np.array_equal(pr.rows[pr.starts[r]:pr.starts[r + 1]], want)
+check(ok, "per-track rows: whole short tracks, uniform subsample of long ones")
+
+tracks = np.arange(N)
+check(sum(len(t) for t in pc.tiles(tracks, pr.eff, budget=50)) == N
+      and all(pr.eff[t].sum() <= 50 or len(t) == 1 for t in pc.tiles(tracks, pr.eff, budget=50)),
+      "tiles cover every track once and respect the chunk budget")
+
+# --- 2. tile kernel vs rerank.chamfer_scores ---------------------------------
+fits = np.flatnonzero(store.counts <= PAD)
+a_tracks, b_tracks = fits[:5], fits[5:25]
+a, a_s, a_c = pr.tile(a_tracks)
+b, b_s, b_c = pr.tile(b_tracks)
+block = pc.chamfer_block(a, a_s, a_c, b, b_s, b_c)
+worst = 0.0
+for i, t in enumerate(a_tracks):
+    m, s, c, _ = store.gather([ids[x] for x in b_tracks])
+    ref = rr.chamfer_scores(np.asarray(store.get(ids[t]), np.float32), m, s, c)
+    worst = max(worst, float(np.abs(block[i] - ref).max()))
+check(worst < 1e-5, f"block kernel matches chamfer_scores ({worst:.1e})")
+back = pc.chamfer_block(b, b_s, b_c, a, a_s, a_c)
+check(np.allclose(block, back.T, atol=1e-6), "chamfer is symmetric")
+
+# --- 3. all-pairs top-N vs brute force ----------------------------------------
+full = np.vstack([
+    pc.chamfer_block(*pr.tile(np.array([r])), *pr.tile(tracks))[0] for r in range(N)])
+np.fill_diagonal(full, -np.inf)
+pc.TILE_CHUNKS = 64  # force many candidate tiles
+rows, scores = pc.score_anchors(np.arange(10, 20), pr, None, top=7)
+want = np.argsort(-full[10:20], axis=1, kind="stable")[:, :7]
+check(np.array_equal(np.sort(rows, axis=1), np.sort(want, axis=1)),
+      "bounded top-N across tiles keeps the true nearest neighbours")
+check(bool(np.all(np.diff(scores, axis=1) <= 0)), "neighbours come back ranked")
+check(not np.any(rows == np.arange(10, 20)[:, None]), "anchor never its own neighbour")
+
+# --- 4. recall mode ------------------------------------------------------------
+pooled = pc.pooled_vectors(pr)
+cand = pc.recall_candidates(pooled, 15)
+check(not np.any(cand == np.arange(N)[:, None]), "recall excludes the anchor")
+rows, scores = pc.score_anchors(np.arange(5), pr, cand, top=5)
+ok = True
+for i in range(5):
+    ranked = sorted(cand[i], key=lambda c: -full[i, c])[:5]
+    ok &= set(rows[i]) == set(ranked)
+check(ok, "recall mode ranks each anchor's candidates by chamfer")
+
+cache = pc.BlockCache(max_bytes=1 << 20)
+again, again_scores = pc.score_anchors(np.arange(5), pr, cand, top=5, cache=cache)
+check(np.array_equal(again, rows) and np.allclose(again_scores, scores),
+      "cached candidate tiles score the same as fresh ones")
+check(cache.hits > 0 and cache.misses <= N, "shared candidates are read and upcast once")
+small = pc.BlockCache(max_bytes=PAD * DIM * 4 * 3)
+pc.score_anchors(np.arange(5), pr, cand, top=5, cache=small)
+check(small.bytes <= small.max_bytes, "cache stays within its byte budget")
+
+shutil.rmtree(tmp, ignore_errors=True)
+print("PASS" if not fails else f"{fails} CHECK(S) FAILED")
+sys.exit(1 if fails else 0)
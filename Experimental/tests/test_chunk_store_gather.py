@@ -0,0 +1,79 @@
+"""Tests for ChunkStore.gather in Experimental/vector_search.
+
+Checks the run-coalesced gather, the reusable output buffer and the block
+cache against a plain per-track concatenation of ChunkStore.get. numpy only.
+"""
+import os, shutil, sys, tempfile
+
+import numpy as np
+
+EXP = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(EXP, "vector_search"))
+from chunk_store import BlockCache, ChunkStore, ChunkStoreWriter  # noqa: E402
+
+fails = 0
+def check(cond, label):
+    global fails
+    print(("  OK   " if cond else "  FAIL ") + label)
+    if not cond:
+        fails += 1
+
+rng = np.random.default_rng(3)
+tmp = tempfile.mkdtemp()
+DIM, N = 16, 40
+with ChunkStoreWriter(tmp, dim=DIM) as w:
+    for i in range(N):
+        w.add(f"t{i:02d}", rng.standard_normal((rng.integers(1, 12), DIM)))
+
+store = ChunkStore(tmp)
+ids = [str(t) for t in store.track_ids]
+
+def reference(track_ids):
+    present = [t for t in track_ids if t in store]
+    return np.concatenate([store.get(t).astype(np.float32) for t in present]), present
+
+def same(got, track_ids):
+    matrix, starts, counts, present = got
+    want, want_ids = reference(track_ids)
+    return (present == want_ids and matrix.dtype == np.float32
+            and np.array_equal(matrix, want)
+            and np.array_equal(starts, np.r_[0, np.cumsum(counts)[:-1]])
+            and all(counts[i] == store.get(t).shape[0] for i, t in enumerate(present)))
+
+# --- 1. gather ----------------------------------------------------------------
+picks = [list(rng.permutation(ids)[:15]), ids[5:20], ids[5:10] + ids[2:4] + ids[10:12],
+         ids[:1], ["missing", ids[3], "also missing", ids[4]]]
+check(all(same(store.gather(p), p) for p in picks),
+      "shuffled, consecutive, partly consecutive and stale-id candidate lists")
+m, s, c, present = store.gather(["missing"])
+check(m.shape == (0, DIM) and len(s) == len(c) == 0 and present == [], "nothing known -> empty")
+
+# --- 2. reusable buffer -------------------------------------------------------
+buf = np.empty((500, DIM), dtype=np.float32)
+got = store.gather(picks[0], out=buf)
+check(np.shares_memory(got[0], buf) and same(got, picks[0]), "gathers into a big enough `out`")
+got = store.gather(ids, out=np.empty((3, DIM), dtype=np.float32))
+check(same(got, ids), "allocates when `out` is too small")
+
+# --- 3. block cache -----------------------------------------------------------
+cached = ChunkStore(tmp, cache_bytes=1 << 20)
+first = cached.gather(picks[0])
+again = cached.gather(picks[0] + ids[:5])
+check(same(first, picks[0]) and same(again, picks[0] + ids[:5]), "cached gathers match")
+check(cached._cache.hits >= len(picks[0]), "repeated candidates are served from the cache")
+first[0][:] = 0
+check(same(cached.gather(picks[0]), picks[0]), "cached blocks are copies, not views of a result")
+
+lru = BlockCache(max_bytes=3 * 64)
+lru.put_many((r, np.full((1, 16), r, dtype=np.float32)) for r in range(3))
+lru.get_many([0])
+lru.put_many([(3, np.ones((1, 16), dtype=np.float32))])
+check(lru.bytes <= 3 * 64 and [b is None for b in lru.get_many([0, 1, 2, 3])]
+      == [False, True, False, False], "evicts the least recently used block past the budget")
+lru.put_many([(9, np.ones((10, 16), dtype=np.float32))])
+check(lru.get_many([9]) == [None], "a block larger than the whole budget is not kept")
+
+del store, cached
+shutil.rmtree(tmp, ignore_errors=True)
+print("PASS" if not fails else f"{fails} CHECK(S) FAILED")
+sys.exit(1 if fails else 0)
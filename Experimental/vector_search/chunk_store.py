@@ -19,6 +19,8 @@ derived from this store, not the other way around.
 
 import json
 import os
+import threading
+from collections import OrderedDict
 from typing import Dict, Iterable, List, Optional, Sequence, Tuple
 
 import numpy as np
@@ -105,9 +107,13 @@ class ChunkStore:
 
     The vectors file is never read in full; slicing a track touches only its own
     pages, so memory use tracks the working set rather than the store size.
+
+    `cache_bytes` > 0 keeps up to that many bytes of recently gathered tracks
+    already upcast to float32 (see BlockCache). At ~60 chunks x 1024 dims a
+    track is ~240 KiB, so 1 GiB holds the ~4k hottest candidates.
     """
 
-    def __init__(self, root: str):
+    def __init__(self, root: str, cache_bytes: int = 0):
         self.root = root
 
         with open(os.path.join(root, MANIFEST_NAME), "r", encoding="utf-8") as f:
@@ -132,6 +138,12 @@ class ChunkStore:
             str(tid): i for i, tid in enumerate(self.track_ids)
         }
 
+        # Off unless asked for: a one-pass precompute touches every track once
+        # and would only churn it.
+        self._cache: Optional[BlockCache] = (
+            BlockCache(cache_bytes) if cache_bytes > 0 else None
+        )
+
     def __len__(self) -> int:
         return len(self.track_ids)
 
@@ -165,8 +177,14 @@ class ChunkStore:
             )
         return chunk_index * (float(chunk_s) - float(overlap_s))
 
+    def rows_of(self, track_ids: Sequence[str]) -> Tuple[np.ndarray, List[str]]:
+        """Index rows of the known ids among `track_ids`, and those ids, in order."""
+        present = [t for t in track_ids if t in self._row]
+        rows = np.fromiter((self._row[t] for t in present), dtype=np.int64, count=len(present))
+        return (rows, present)
+
     def gather(
-        self, track_ids: Sequence[str]
+        self, track_ids: Sequence[str], out: Optional[np.ndarray] = None
     ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, List[str]]:
         """
         Concatenates several tracks' chunks into one matrix for batched scoring.
@@ -175,25 +193,117 @@ class ChunkStore:
         Unknown ids are skipped rather than raising, so a candidate list coming
         from a stale ANN index does not break the query. `starts` indexes into
         `matrix`, which is what the reranker segments on.
-        """
-        present = [t for t in track_ids if t in self._row]
-        if not present:
-            empty = np.zeros((0, self.dim), dtype=COMPUTE_DTYPE)
-            return (empty, np.zeros(0, np.int64), np.zeros(0, np.int64), [])
 
-        rows = [self._row[t] for t in present]
+        Offsets come from the index in one vectorised pass and tracks lying
+        back to back in the store are copied as one run, each upcast straight
+        from the mmap into the result. A single fancy-index take over all rows
+        measured 25-30% slower at ~60 chunks a track: it stages an fp16 copy
+        and then upcasts it, a second full pass over memory, while the
+        per-run loop is a few microseconds per track. Pass `out` (float32,
+        C-contiguous, [>= total, dim]) to reuse one buffer across queries,
+        which saves faulting in a fresh matrix each time; `matrix` is then a
+        view of its first rows and is overwritten by the next gather into it.
+        """
+        rows, present = self.rows_of(track_ids)
         counts = self.counts[rows].astype(np.int64)
         starts = np.zeros(len(counts), dtype=np.int64)
-        np.cumsum(counts[:-1], out=starts[1:])
+        if len(counts):
+            np.cumsum(counts[:-1], out=starts[1:])
+        total = int(counts.sum())
+
+        if (
+            out is not None
+            and out.dtype == COMPUTE_DTYPE
+            and out.flags.c_contiguous
+            and out.ndim == 2
+            and out.shape[1] == self.dim
+            and out.shape[0] >= total
+        ):
+            matrix = out[:total]
+        else:
+            matrix = np.empty((total, self.dim), dtype=COMPUTE_DTYPE)
+        if total == 0:
+            return (matrix, starts, counts, present)
+
+        if self._cache is None:
+            self._copy_runs(matrix, self.offsets[rows], starts, counts)
+            return (matrix, starts, counts, present)
+
+        cached = self._cache.get_many(rows)
+        miss = np.array(
+            [slot for slot, block in enumerate(cached) if block is None], dtype=np.int64
+        )
+        for slot, block in enumerate(cached):
+            if block is not None:
+                matrix[starts[slot] : starts[slot] + counts[slot]] = block
+        if len(miss):
+            self._copy_runs(matrix, self.offsets[rows[miss]], starts[miss], counts[miss])
+            self._cache.put_many(
+                (int(rows[slot]), matrix[starts[slot] : starts[slot] + counts[slot]])
+                for slot in miss
+            )
+        return (matrix, starts, counts, present)
 
-        matrix = np.empty((int(counts.sum()), self.dim), dtype=COMPUTE_DTYPE)
-        for slot, row in enumerate(rows):
-            src = int(self.offsets[row])
-            n = int(self.counts[row])
-            dst = int(starts[slot])
-            matrix[dst : dst + n] = self._vectors[src : src + n]
+    def _copy_runs(
+        self, matrix: np.ndarray, src: np.ndarray, dst: np.ndarray, counts: np.ndarray
+    ) -> None:
+        """Copies chunk ranges src[i]:+counts[i] of the store to dst[i] of `matrix`."""
+        # A range continues the previous run when it follows it both in the
+        # store and in the output: consecutive tracks of one album, or a
+        # candidate list sorted by store row.
+        breaks = np.ones(len(src), dtype=bool)
+        breaks[1:] = (src[1:] != src[:-1] + counts[:-1]) | (
+            dst[1:] != dst[:-1] + counts[:-1]
+        )
+        first = np.flatnonzero(breaks)
+        lengths = np.add.reduceat(counts, first)
+        for s, d, n in zip(src[first].tolist(), dst[first].tolist(), lengths.tolist()):
+            matrix[d : d + n] = self._vectors[s : s + n]
 
-        return (matrix, starts, counts, present)
+
+class BlockCache:
+    """
+    Byte-bounded LRU of upcast per-track blocks, keyed by store row.
+
+    Reranking a popular query neighbourhood sees the same candidates again and
+    again, and for those a gather is then a float32 memcpy instead of an fp16
+    read and upcast. Blocks are copies, never views of a caller's matrix.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = int(max_bytes)
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._blocks: "OrderedDict[int, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._blocks)
+
+    def get_many(self, rows: Iterable[int]) -> List[Optional[np.ndarray]]:
+        found: List[Optional[np.ndarray]] = []
+        with self._lock:
+            for row in rows:
+                block = self._blocks.get(int(row))
+                if block is None:
+                    self.misses += 1
+                else:
+                    self._blocks.move_to_end(int(row))
+                    self.hits += 1
+                found.append(block)
+        return found
+
+    def put_many(self, blocks: Iterable[Tuple[int, np.ndarray]]) -> None:
+        with self._lock:
+            for row, block in blocks:
+                if block.nbytes > self.max_bytes or row in self._blocks:
+                    continue
+                self._blocks[row] = block.copy()
+                self.bytes += block.nbytes
+                while self.bytes > self.max_bytes:
+                    _, evicted = self._blocks.popitem(last=False)
+                    self.bytes -= evicted.nbytes
 
 
 def write_store_from_tensors(
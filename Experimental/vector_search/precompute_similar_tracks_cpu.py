@@ -0,0 +1,444 @@
+"""CPU chamfer precompute: top-N similar tracks for every track in a chunk store.
+
+The CPU counterpart of precompute_similar_tracks.py, for the storage host that
+holds vectors.f16 but has no GPU. Same scoring, same padding rule, same CSV
+shards, so either backend's output can stand in for the other's.
+
+The store is never loaded whole. Tracks are read from the shared mmap in tiles
+of whole tracks, a few thousand chunks each, upcast to fp32 once per tile, and
+scored a tile pair at a time with one BLAS matmul; segment maxima and means come
+from np.maximum.reduceat / np.add.reduceat over the tile's track boundaries, as
+in rerank.chamfer_scores. Anchor shards fan out over a process pool, each
+worker opening the store itself -- the page cache is the only copy of the
+vectors, shared by all of them.
+
+Candidates per anchor, as on the GPU:
+  --k N   exact pooled-cosine recall of N candidates, then chamfer over those.
+          The default; a full run is minutes to hours.
+  --k 0   chamfer against every track, with a bounded top-N kept per anchor
+          as candidate tiles stream past. Exact, and roughly N_tracks/500
+          times the work of --k 500: days at TLMC scale, for spot checks of
+          what recall misses rather than nightly runs.
+
+Recall mode groups an anchor's candidates into tiles of the same size, and
+each worker keeps the candidates' upcast blocks in a BlockCache (--cache-mb),
+so a track that is a candidate for a whole album's worth of anchors is read
+off the mmap and upcast once rather than once per anchor.
+
+Album and circle neighbours (precompute_similar_groups.py) stay GPU-only: they
+score pooled track vectors, not chunks, and those are ~1/60th of the store --
+small enough to copy to the GPU host.
+
+Modes:
+  bench   check the tile kernel against rerank.chamfer_scores, then time a
+          sample of anchors and report a full-run ETA
+  run     the full precompute; CSV shards of (anchor, neighbor, rank, score),
+          resumable per shard
+"""
+
+import argparse
+import csv
+import importlib.util
+import json
+import multiprocessing
+import os
+import sys
+import time
+import types
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Tuple
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+import chunk_store as cs_mod  # noqa: E402
+from chunk_store import COMPUTE_DTYPE, BlockCache, ChunkStore  # noqa: E402
+
+# Chunks per tile. A 4096 x 1024 fp32 tile is 16 MiB and the similarity block
+# between two of them 64 MiB: large enough that the matmul runs at BLAS speed,
+# small enough that a worker per core stays within the host's RAM.
+TILE_CHUNKS = 4096
+
+# Upcast candidate blocks kept per worker in recall mode. At pad 96 a track is
+# 384 KiB of fp32, so 512 MiB holds ~1.4k candidates: the overlapping recall
+# sets of a few neighbouring anchors.
+CACHE_MB = 512
+
+# Anchors per shard file, and per unit of work handed to a worker.
+SHARD_SIZE = 2_000
+
+
+def load_rerank_module():
+    """Loads rerank.py despite its package-qualified chunk_store import."""
+    pkg = types.ModuleType("Experimental")
+    pkg.__path__ = []
+    sub = types.ModuleType("Experimental.vector_search")
+    sub.__path__ = []
+    sys.modules.setdefault("Experimental", pkg)
+    sys.modules.setdefault("Experimental.vector_search", sub)
+    sys.modules["Experimental.vector_search.chunk_store"] = cs_mod
+    spec = importlib.util.spec_from_file_location(
+        "rerank", os.path.join(HERE, "rerank.py"))
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+
+class PaddedRows:
+    """Per-track chunk row indices into the store, subsampled to --pad chunks.
+
+    Same rule as GpuStore: a track longer than `pad` keeps `pad` uniformly
+    spaced chunks, so both backends score the same vectors.
+    """
+
+    def __init__(self, store: ChunkStore, pad: int):
+        self.store = store
+        offsets = store.offsets.astype(np.int64)
+        counts = store.counts.astype(np.int64)
+        self.eff = np.minimum(counts, pad)
+        self.starts = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(self.eff, out=self.starts[1:])
+
+        rows = np.empty(int(self.starts[-1]), dtype=np.int64)
+        for r in np.flatnonzero(counts > pad):
+            rows[self.starts[r]:self.starts[r + 1]] = offsets[r] + np.linspace(
+                0, counts[r] - 1, pad).round().astype(np.int64)
+        short = np.flatnonzero(counts <= pad)
+        # Short tracks are a plain run of rows: offset + 0..count-1, built for
+        # all of them at once.
+        within = np.arange(int(self.eff[short].sum())) - np.repeat(
+            np.cumsum(self.eff[short]) - self.eff[short], self.eff[short])
+        rows[np.repeat(self.starts[short], self.eff[short]) + within] = \
+            np.repeat(offsets[short], self.eff[short]) + within
+        self.rows = rows
+
+    def tile(self, tracks: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(matrix fp32 [chunks, dim], starts, counts) for `tracks`, end to end."""
+        counts = self.eff[tracks]
+        starts = np.zeros(len(tracks), dtype=np.int64)
+        np.cumsum(counts[:-1], out=starts[1:])
+        idx = np.concatenate(
+            [self.rows[self.starts[t]:self.starts[t + 1]] for t in tracks])
+        # One fancy-index read off the mmap, one upcast.
+        matrix = self.store._vectors[idx].astype(COMPUTE_DTYPE)
+        return matrix, starts, counts
+
+    def cached_tile(self, tracks: np.ndarray, cache: BlockCache
+                    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """tile(), with each track's block taken from `cache` when it is there."""
+        found = cache.get_many(tracks.tolist())
+        missing = np.array([t for t, b in zip(tracks, found) if b is None],
+                           dtype=np.int64)
+        if len(missing):
+            matrix, starts, counts = self.tile(missing)
+            fresh = {int(t): matrix[s:s + c]
+                     for t, s, c in zip(missing, starts, counts)}
+            cache.put_many(fresh.items())
+            found = [fresh[int(t)] if b is None else b for t, b in zip(tracks, found)]
+        counts = self.eff[tracks]
+        starts = np.zeros(len(tracks), dtype=np.int64)
+        np.cumsum(counts[:-1], out=starts[1:])
+        return np.concatenate(found), starts, counts
+
+
+def tiles(tracks: np.ndarray, eff: np.ndarray, budget: Optional[int] = None):
+    """Splits `tracks` into runs of whole tracks of about `budget` chunks."""
+    budget = budget or TILE_CHUNKS
+    ends = np.cumsum(eff[tracks])
+    start = 0
+    while start < len(tracks):
+        base = ends[start - 1] if start else 0
+        stop = int(np.searchsorted(ends, base + budget, side="right"))
+        stop = max(stop, start + 1)
+        yield tracks[start:stop]
+        start = stop
+
+
+def chamfer_block(a: np.ndarray, a_starts: np.ndarray, a_counts: np.ndarray,
+                  b: np.ndarray, b_starts: np.ndarray, b_counts: np.ndarray
+                  ) -> np.ndarray:
+    """Symmetric chamfer of every track in tile A against every track in B.
+
+    One matmul for the whole tile pair, then segment reductions both ways:
+    reduceat along B's boundaries gives each A chunk's best match per B track,
+    along A's boundaries each B chunk's best per A track. Returns [nA, nB].
+    """
+    sims = a @ b.T                                         # [Ca, Cb]
+    row_best = np.maximum.reduceat(sims, b_starts, axis=1)  # [Ca, nB]
+    col_best = np.maximum.reduceat(sims, a_starts, axis=0)  # [nA, Cb]
+    a_side = np.add.reduceat(row_best, a_starts, axis=0) / a_counts[:, None]
+    b_side = np.add.reduceat(col_best, b_starts, axis=1) / b_counts[None, :]
+    return 0.5 * (a_side + b_side)
+
+
+class TopK:
+    """Bounded best-N (score, row) per anchor, merged a candidate tile at a time."""
+
+    def __init__(self, n_anchors: int, top: int):
+        self.top = top
+        self.scores = np.full((n_anchors, top), -np.inf, dtype=COMPUTE_DTYPE)
+        self.rows = np.full((n_anchors, top), -1, dtype=np.int64)
+
+    def merge(self, scores: np.ndarray, rows: np.ndarray) -> None:
+        """`scores` [nA, m] for candidate `rows` ([m], or [nA, m] per anchor)."""
+        if rows.ndim == 1:
+            rows = np.broadcast_to(rows, scores.shape)
+        all_scores = np.concatenate([self.scores, scores], axis=1)
+        all_rows = np.concatenate([self.rows, rows], axis=1)
+        if all_scores.shape[1] > self.top:
+            keep = np.argpartition(-all_scores, self.top - 1, axis=1)[:, :self.top]
+            all_scores = np.take_along_axis(all_scores, keep, axis=1)
+            all_rows = np.take_along_axis(all_rows, keep, axis=1)
+        self.scores, self.rows = all_scores, all_rows
+
+    def ranked(self) -> Tuple[np.ndarray, np.ndarray]:
+        order = np.argsort(-self.scores, axis=1, kind="stable")
+        return (np.take_along_axis(self.rows, order, axis=1),
+                np.take_along_axis(self.scores, order, axis=1))
+
+
+def pooled_vectors(pr: PaddedRows) -> np.ndarray:
+    """Mean of each track's (padded) chunks, renormalised, [n, dim] fp32."""
+    n = len(pr.eff)
+    out = np.empty((n, pr.store.dim), dtype=COMPUTE_DTYPE)
+    for t in tiles(np.arange(n), pr.eff, budget=TILE_CHUNKS * 16):
+        matrix, starts, counts = pr.tile(t)
+        sums = np.add.reduceat(matrix, starts, axis=0) / counts[:, None]
+        out[t] = sums
+    norms = np.linalg.norm(out, axis=1, keepdims=True)
+    np.maximum(norms, 1e-12, out=norms)
+    out /= norms
+    return out
+
+
+def recall_candidates(pooled: np.ndarray, k: int, tile: int = 1024) -> np.ndarray:
+    """Exact pooled-cosine top-k per track, self excluded. [n, k] int32."""
+    n = pooled.shape[0]
+    cand = np.empty((n, k), dtype=np.int32)
+    for i in range(0, n, tile):
+        j = min(n, i + tile)
+        sims = pooled[i:j] @ pooled.T
+        sims[np.arange(j - i), np.arange(i, j)] = -np.inf
+        part = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+        cand[i:j] = part
+    return cand
+
+
+# Per-worker state, set up once by _init_worker rather than pickled per task.
+_pr: Optional[PaddedRows] = None
+_cand: Optional[np.ndarray] = None
+_cache: Optional[BlockCache] = None
+
+
+def _init_worker(store_root: str, pad: int, cand_path: Optional[str],
+                 cache_mb: int) -> None:
+    global _pr, _cand, _cache
+    _pr = PaddedRows(ChunkStore(store_root), pad)
+    _cand = np.load(cand_path, mmap_mode="r") if cand_path else None
+    _cache = BlockCache(cache_mb << 20)
+
+
+def score_anchors(anchors: np.ndarray, pr: PaddedRows, cand: Optional[np.ndarray],
+                  top: int, cache: Optional[BlockCache] = None
+                  ) -> Tuple[np.ndarray, np.ndarray]:
+    """Ranked (rows, scores) [len(anchors), top] for each anchor."""
+    if cand is not None:
+        # Recall mode: each anchor against its own candidates, in tiles of the
+        # usual chunk budget. Candidates are read through the cache: anchors
+        # next to each other in the store are mostly the same album, and
+        # share most of their recall sets.
+        if cache is None:
+            cache = BlockCache(CACHE_MB << 20)
+        best = TopK(len(anchors), min(top, cand.shape[1]))
+        for i, anchor in enumerate(anchors):
+            a, a_starts, a_counts = pr.tile(np.array([anchor]))
+            sub = TopK(1, best.top)
+            for rows in tiles(np.asarray(cand[anchor], dtype=np.int64), pr.eff):
+                b, b_starts, b_counts = pr.cached_tile(rows, cache)
+                sub.merge(chamfer_block(a, a_starts, a_counts, b, b_starts, b_counts),
+                          rows)
+            best.scores[i], best.rows[i] = sub.scores[0], sub.rows[0]
+        return best.ranked()
+
+    # All pairs: anchor tiles against every candidate tile, top-N carried
+    # across candidate tiles.
+    n = len(pr.eff)
+    out_rows = np.empty((len(anchors), top), dtype=np.int64)
+    out_scores = np.empty((len(anchors), top), dtype=COMPUTE_DTYPE)
+    done = 0
+    for a_tracks in tiles(anchors, pr.eff, budget=TILE_CHUNKS // 2):
+        a, a_starts, a_counts = pr.tile(a_tracks)
+        best = TopK(len(a_tracks), top)
+        for b_tracks in tiles(np.arange(n), pr.eff):
+            b, b_starts, b_counts = pr.tile(b_tracks)
+            scores = chamfer_block(a, a_starts, a_counts, b, b_starts, b_counts)
+            scores[a_tracks[:, None] == b_tracks[None, :]] = -np.inf
+            best.merge(scores, b_tracks)
+        rows, scores = best.ranked()
+        out_rows[done:done + len(a_tracks)] = rows
+        out_scores[done:done + len(a_tracks)] = scores
+        done += len(a_tracks)
+    return out_rows, out_scores
+
+
+def _score_shard(job) -> Tuple[int, int, np.ndarray, np.ndarray]:
+    s0, s1, top = job
+    rows, scores = score_anchors(np.arange(s0, s1), _pr, _cand, top, _cache)
+    return s0, s1, rows, scores
+
+
+def validate(pr: PaddedRows, cand: Optional[np.ndarray], n_anchors: int = 25) -> bool:
+    """Tile kernel vs the numpy reference, on tracks the pad does not subsample."""
+    rr = load_rerank_module()
+    store = pr.store
+    rng = np.random.default_rng(42)
+    fits = store.counts == pr.eff
+    ok_rows = np.flatnonzero(fits)
+    n_anchors = min(n_anchors, len(ok_rows))
+    anchors = rng.choice(ok_rows, n_anchors, replace=False)
+    ids = [str(t) for t in store.track_ids]
+
+    worst = 0.0
+    for r in anchors:
+        pool = cand[r] if cand is not None else rng.choice(len(ids), 100, replace=False)
+        rows = np.array([c for c in pool if fits[c] and c != r][:100], dtype=np.int64)
+        if len(rows) == 0:
+            continue
+        a, a_starts, a_counts = pr.tile(np.array([r]))
+        b, b_starts, b_counts = pr.tile(rows)
+        ours = chamfer_block(a, a_starts, a_counts, b, b_starts, b_counts)[0]
+        matrix, starts, counts, _ = store.gather([ids[c] for c in rows])
+        ref = rr.chamfer_scores(np.asarray(store.get(ids[r]), dtype=np.float32),
+                                matrix, starts, counts)
+        worst = max(worst, float(np.abs(ours - ref).max()))
+
+    print(f"validate: |tile-ref| max {worst:.2e} over {n_anchors} anchors", flush=True)
+    passed = worst < 1e-4
+    print("validate:", "PASS" if passed else "FAIL", flush=True)
+    return passed
+
+
+def make_pool(workers: int, store_root: str, pad: int, cand_path: Optional[str],
+              cache_mb: int):
+    # One BLAS thread per worker: the pool is the parallelism, and N workers
+    # each spinning up N BLAS threads oversubscribes the host N-fold. The
+    # limits are read when a spawned worker first imports numpy.
+    for var in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ[var] = "1"
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(store_root, pad, cand_path, cache_mb),
+    )
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--store", required=True)
+    ap.add_argument("--mode", choices=["bench", "run"], required=True)
+    ap.add_argument("--k", type=int, default=500,
+                    help="recall candidates per track; 0 scores all pairs")
+    ap.add_argument("--top", type=int, default=100, help="neighbors kept per track")
+    ap.add_argument("--pad", type=int, default=96)
+    ap.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1))
+    ap.add_argument("--cache-mb", type=int, default=CACHE_MB,
+                    help="upcast candidate blocks kept per worker in recall mode")
+    ap.add_argument("--shard-size", type=int, default=SHARD_SIZE)
+    ap.add_argument("--out", default=None, help="output dir")
+    ap.add_argument("--bench-anchors", type=int, default=256)
+    args = ap.parse_args()
+
+    store = ChunkStore(args.store)
+    pr = PaddedRows(store, args.pad)
+    n = len(store)
+    ids = [str(t) for t in store.track_ids]
+    print(f"store: {n} tracks, {store.total_chunks} chunks, pad {args.pad}", flush=True)
+
+    out = args.out or os.path.join(args.store, "similar_tracks")
+    os.makedirs(out, exist_ok=True)
+
+    cand_path = None
+    cand = None
+    if args.k:
+        # Recall is cheap next to the rerank but not free; keep it so a resumed
+        # run scores the same candidates it started with.
+        cand_path = os.path.join(out, f"recall_k{args.k}_pad{args.pad}.npy")
+        if os.path.exists(cand_path):
+            print(f"recall: reusing {cand_path}", flush=True)
+        else:
+            t0 = time.time()
+            pooled = pooled_vectors(pr)
+            cand = recall_candidates(pooled, min(args.k, n - 1))
+            del pooled
+            np.save(cand_path + ".tmp.npy", cand)
+            os.replace(cand_path + ".tmp.npy", cand_path)
+            print(f"recall: exact top-{args.k} for {n} tracks in "
+                  f"{time.time() - t0:.1f}s", flush=True)
+        cand = np.load(cand_path, mmap_mode="r")
+
+    if args.mode == "bench":
+        if not validate(pr, cand):
+            sys.exit(1)
+        sample = np.arange(min(args.bench_anchors, n))
+        t0 = time.time()
+        cache = BlockCache(args.cache_mb << 20)
+        score_anchors(sample, pr, cand, args.top, cache)
+        dt = time.time() - t0
+        rate = len(sample) / dt
+        print(f"bench: {rate:.2f} anchors/s in this process at K={args.k or n} "
+              f"pad={args.pad}; full {n} tracks on {args.workers} workers "
+              f"~= {n / rate / args.workers / 3600:.2f} h", flush=True)
+        if cand is not None:
+            print(f"bench: candidate cache {cache.hits} hits, {cache.misses} misses",
+                  flush=True)
+        return
+
+    jobs = []
+    for s0 in range(0, n, args.shard_size):
+        s1 = min(n, s0 + args.shard_size)
+        if os.path.exists(os.path.join(out, f"similar_{s0:07d}_{s1:07d}.csv")):
+            print(f"shard {s0}-{s1} exists, skipping", flush=True)
+            continue
+        jobs.append((s0, s1, args.top))
+
+    t_run = time.time()
+    scored = 0
+    with make_pool(args.workers, args.store, args.pad, cand_path,
+                   args.cache_mb) as pool:
+        for s0, s1, rows, scores in pool.map(_score_shard, jobs):
+            shard_path = os.path.join(out, f"similar_{s0:07d}_{s1:07d}.csv")
+            tmp = shard_path + ".tmp"
+            with open(tmp, "w", newline="", encoding="utf-8") as f:
+                wcsv = csv.writer(f)
+                wcsv.writerow(["anchor_id", "neighbor_id", "rank", "score"])
+                for bi, anchor in enumerate(range(s0, s1)):
+                    for rank in range(rows.shape[1]):
+                        # Fewer tracks than --top leaves unfilled slots.
+                        if rows[bi, rank] < 0 or not np.isfinite(scores[bi, rank]):
+                            break
+                        wcsv.writerow([ids[anchor], ids[rows[bi, rank]], rank + 1,
+                                       f"{scores[bi, rank]:.6f}"])
+            os.replace(tmp, shard_path)
+            scored += s1 - s0
+            rate = scored / (time.time() - t_run)
+            remaining = sum(j[1] - j[0] for j in jobs) - scored
+            print(f"shard {s0}-{s1} done ({rate:.1f} anchors/s overall, "
+                  f"~{remaining / rate / 3600:.2f} h remaining)", flush=True)
+
+    with open(os.path.join(out, "run_manifest.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            "store": args.store, "tracks": n, "k_recall": args.k or None,
+            "top_kept": args.top, "pad": args.pad, "backend": "cpu",
+            "workers": args.workers,
+            "scoring": "chamfer, symmetric, mean-of-max both sides",
+            "recall": ("exact pooled cosine (mean of chunks, renormalized)"
+                       if args.k else "none, all pairs"),
+            "wall_seconds": round(time.time() - t_run, 1),
+        }, f, indent=2)
+    print("run complete", flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -124,19 +124,21 @@ def rerank(
     top_k: Optional[int] = None,
     query_weights: Optional[np.ndarray] = None,
     normalize: bool = False,
+    out: Optional[np.ndarray] = None,
 ) -> List[Tuple[str, float]]:
     """
     Scores `candidate_ids` against `query` and returns them ranked.
 
     Candidates typically come from a cheap first stage (pooled-vector ANN in
     pgvector, or a chunk level ANN index for moment search). Unknown ids are
-    dropped by the store rather than raising.
+    dropped by the store rather than raising. `out` is handed to
+    ChunkStore.gather as its reusable buffer.
     """
     scorer = {"chamfer": chamfer_scores, "maxsim": maxsim_scores}.get(mode)
     if scorer is None:
         raise ValueError(f"unknown mode {mode!r}, expected 'chamfer' or 'maxsim'")
 
-    matrix, starts, counts, resolved = store.gather(candidate_ids)
+    matrix, starts, counts, resolved = store.gather(candidate_ids, out=out)
     if not resolved:
         return []
 
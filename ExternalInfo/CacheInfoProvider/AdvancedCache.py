@@ -1,13 +1,8 @@
-import datetime
-import os
 import re
-from typing import Any, Callable, Optional
+from typing import Any, Callable, Iterable, List, Optional
 
 import hashlib
-import ExternalInfo.ThwikiInfoProvider.Databases.path_definitions as DatabasesPathDef
-from ExternalInfo.CacheInfoProvider.Model.AdvancedCacheModel import (
-    AdvancedSourceCacheTable
-)
+from ExternalInfo.CacheInfoProvider.PageStore import get_store, has_legacy, restore_legacy
 
 
 def adv_cache_hashed_id_generator(*args):
@@ -22,88 +17,67 @@ def advanced_cache(
     cache_save_transformer: Optional[Callable[[Any], str]] = lambda x: str(x),
     cache_load_transformer: Optional[Callable[[str], Any]] = lambda x: x,
     cache_filename_generator: Optional[Callable[[Any], str]] = lambda x: str(x),
-    # Mirrors Cache.cached's restore: when the index row is missing but the
-    # file exists under cache_dir, re-register it instead of refetching. This
-    # is what makes a cache directory carried over from another machine (the
-    # v5 scrape) usable without its cache.db, whose recorded absolute paths
-    # died with the old filesystem.
+    # Kept for callers. Entries live in the shared page store (PageStore.py)
+    # and a store miss always falls back to the loose file under cache_dir a
+    # previous version left there -- what restore used to switch on for a
+    # cache directory carried over from another machine without its index.
     restore=False,
+    # Seconds after which an entry counts as a miss and is fetched again.
+    ttl: Optional[float] = None,
 ):
     norm_path = lambda path, subchar="_": re.sub(r"\<|\>|\:|\"|\/|\\|\||\?|\*", subchar, path)
-
-    if not os.path.isdir(cache_dir):
-        os.makedirs(cache_dir, exist_ok=True)
+    store = get_store()
 
     def actual_decorator(func):
 
-        def wrapper(*args, **kwargs):
+        def get_path_id(args):
             path_id = cache_id + "__" + "__".join([str(norm_path(x)) for x in args])
             if cache_filename_generator:
                 path_id = cache_filename_generator(path_id)
-            if (
-                AdvancedSourceCacheTable.select()
-                .where(AdvancedSourceCacheTable.path == path_id)
-                .exists()
-            ):
-                cached = AdvancedSourceCacheTable.get(
-                    AdvancedSourceCacheTable.path == path_id
-                ).cached_source_path
-                if cached != "" and os.path.exists(cached):
-                    if debug:
-                        print("Cache Hit for " + path_id)
-                    with open(cached, "r", encoding="utf-8") as f:
-                        return cache_load_transformer(f.read())
-            if restore and os.path.exists(os.path.join(cache_dir, path_id)):
-                restore_path = os.path.join(cache_dir, path_id)
-                if (
-                    AdvancedSourceCacheTable.select()
-                    .where(AdvancedSourceCacheTable.path == path_id)
-                    .exists()
-                ):
-                    AdvancedSourceCacheTable.replace(
-                        path=path_id,
-                        cached_source_path=restore_path,
-                        time_cached=datetime.datetime.now(),
-                    ).execute()
-                else:
-                    AdvancedSourceCacheTable.create(
-                        path=path_id,
-                        cached_source_path=restore_path,
-                        time_cached=datetime.datetime.now(),
-                    )
+            return path_id
+
+        def wrapper(*args, **kwargs):
+            path_id = get_path_id(args)
+            src = store.get(path_id, ttl)
+            if src is not None:
+                if debug:
+                    print("Cache Hit for " + path_id)
+                return cache_load_transformer(src)
+
+            src = restore_legacy(store, cache_dir, path_id, ttl)
+            if src is not None:
                 if debug:
                     print("Cache Restored for " + path_id)
-                with open(restore_path, "r", encoding="utf-8") as f:
-                    return cache_load_transformer(f.read())
+                return cache_load_transformer(src)
+
             if debug:
                 print("Cache Miss for " + path_id)
             src = func(*args, **kwargs)
-            with open(
-                caced_src_path := os.path.join(cache_dir, path_id),
-                "w",
-                encoding="utf-8",
-            ) as f:
-                if debug:
-                    print("Caching " + path_id)
-                f.write(cache_save_transformer(src))
-                if (
-                    AdvancedSourceCacheTable.select()
-                    .where(AdvancedSourceCacheTable.path == path_id)
-                    .exists()
-                ):
-                    AdvancedSourceCacheTable.replace(
-                        path=path_id,
-                        cached_source_path=caced_src_path,
-                        time_cached=datetime.datetime.now(),
-                    ).execute()  # replace() builds a query; unexecuted it was a silent no-op
-                else:
-                    AdvancedSourceCacheTable.create(
-                        path=path_id,
-                        cached_source_path=caced_src_path,
-                        time_cached=datetime.datetime.now(),
-                    )
+            if debug:
+                print("Caching " + path_id)
+            store.put(path_id, cache_save_transformer(src))
             return src
 
+        def missing(keys: Iterable[Any]) -> List[Any]:
+            # What the wrapper would have to fetch, answered in a few queries
+            # rather than one per key, so a caller can batch-fetch just those.
+            # Each key is the wrapper's argument, or a tuple of them.
+            path_ids = {
+                key: get_path_id(key if isinstance(key, tuple) else (key,))
+                for key in dict.fromkeys(keys)
+            }
+            present = store.present(path_ids.values(), ttl)
+            return [
+                key
+                for key, path_id in path_ids.items()
+                if path_id not in present and not has_legacy(cache_dir, path_id, ttl)
+            ]
+
+        def is_cached(*args):
+            return not missing([args])
+
+        wrapper.missing = missing
+        wrapper.is_cached = is_cached
         return wrapper
 
     return actual_decorator
@@ -1,11 +1,10 @@
-import datetime
-import os
 import re
+from typing import Iterable, List, Optional
 from urllib.parse import unquote, urlparse
 
 import mwparserfromhell as mw
 
-from ExternalInfo.CacheInfoProvider.Model.CacheModel import SourceCacheTable
+from ExternalInfo.CacheInfoProvider.PageStore import get_store, has_legacy, restore_legacy
 
 
 def NormalizePath(path, subchar="_"):
@@ -21,90 +20,66 @@ def get_cache_id(url, id):
     return id + "__" + NormalizePath(unquote(get_url_path(url)))
 
 
-def cached(cache_id, cache_dir, debug=False, disable_parse=False, restore=False):
-    if not os.path.isdir(cache_dir):
-        os.makedirs(cache_dir, exist_ok=True)
+def cached(
+    cache_id,
+    cache_dir,
+    debug=False,
+    disable_parse=False,
+    restore=False,
+    ttl: Optional[float] = None,
+):
+    # Entries live in the shared page store (PageStore.py). cache_dir is only
+    # read now: a miss in the store falls back to the loose file a previous
+    # version left there and moves it in. That used to need restore=True for
+    # files without an index row; the store has no index to be out of step
+    # with, so the fallback always applies and `restore` is kept for callers.
+    #
+    # ttl: seconds after which an entry counts as a miss and is fetched again.
+    store = get_store()
 
     def actual_decorator(func):
 
+        def load(src):
+            return src if disable_parse else mw.parse(src)
+
         def wrapper(url):
-            path_id = cache_id + "__" + NormalizePath(unquote(get_url_path(url)))
-            if (
-                SourceCacheTable.select()
-                .where(SourceCacheTable.path == path_id)
-                .exists()
-            ):
-                cached = SourceCacheTable.get(
-                    SourceCacheTable.path == path_id
-                ).cached_source_path
-
-                if cached != "" and os.path.exists(cached):
-                    if debug:
-                        print("Cache Hit for " + url)
-                    with open(cached, "r", encoding="utf-8") as f:
-                        if disable_parse:
-                            return f.read()
-                        return mw.parse(f.read())
-            # Top level on purpose: a cache directory carried over from another
-            # machine has the files but no index rows at all, so restoring only
-            # from inside the row-exists branch (the previous shape) never
-            # fired for exactly the case restore exists for.
-            if restore and os.path.exists(os.path.join(cache_dir, path_id)):
-                restore_path = os.path.join(cache_dir, path_id)
-                if (
-                    SourceCacheTable.select()
-                    .where(SourceCacheTable.path == path_id)
-                    .exists()
-                ):
-                    SourceCacheTable.replace(
-                        path=path_id,
-                        cached_source_path=restore_path,
-                        time_cached=datetime.datetime.now(),
-                    ).execute()
-                else:
-                    SourceCacheTable.create(
-                        path=path_id,
-                        cached_source_path=restore_path,
-                        time_cached=datetime.datetime.now(),
-                    )
-                with open(restore_path, "r", encoding="utf-8") as f:
-                    if disable_parse:
-                        return f.read()
-                    return mw.parse(f.read())
+            path_id = get_cache_id(url, cache_id)
+            src = store.get(path_id, ttl)
+            if src is not None:
+                if debug:
+                    print("Cache Hit for " + url)
+                return load(src)
+
+            src = restore_legacy(store, cache_dir, path_id, ttl)
+            if src is not None:
+                if debug:
+                    print("Cache Restored for " + url)
+                return load(src)
+
             if debug:
                 print("Cache Miss for " + url)
             src = func(url)
-            with open(
-                caced_src_path := os.path.join(cache_dir, path_id),
-                "w",
-                encoding="utf-8",
-            ) as f:
-                if debug:
-                    print("Caching " + url)
-                f.write(str(src))
-                if (
-                    SourceCacheTable.select()
-                    .where(SourceCacheTable.path == path_id)
-                    .exists()
-                ):
-                    SourceCacheTable.replace(
-                        path=path_id,
-                        cached_source_path=caced_src_path,
-                        time_cached=datetime.datetime.now(),
-                    ).execute()
-
-                else:
-                    # Model.create() executes the insert itself; chaining
-                    # .execute() onto the returned instance raised
-                    # AttributeError on every first-time write, killing the
-                    # scrape on its first cache miss.
-                    SourceCacheTable.create(
-                        path=path_id,
-                        cached_source_path=caced_src_path,
-                        time_cached=datetime.datetime.now(),
-                    )
+            if debug:
+                print("Caching " + url)
+            store.put(path_id, str(src))
             return src
 
+        def missing(urls: Iterable[str]) -> List[str]:
+            # What the wrapper would have to fetch, answered in a few queries
+            # rather than one per url, so a caller can batch-fetch just those.
+            path_ids = {url: get_cache_id(url, cache_id) for url in dict.fromkeys(urls)}
+            present = store.present(path_ids.values(), ttl)
+            return [
+                url
+                for url, path_id in path_ids.items()
+                if path_id not in present and not has_legacy(cache_dir, path_id, ttl)
+            ]
+
+        def is_cached(url):
+            return not missing([url])
+
+        wrapper.missing = missing
+        wrapper.is_cached = is_cached
         return wrapper
 
     return actual_decorator
@@ -0,0 +1,277 @@
+"""
+One-file, compressed store behind Cache.cached and AdvancedCache.advanced_cache.
+
+The caches used to keep every page as its own loose file under cache_dir, named
+by the normalised title, with a peewee index row pointing at it. A lookup was up
+to three queries (exists, get, then replace or create) plus an open() of the
+file, and a full lyrics and album scrape left a few hundred thousand small files
+behind -- slow to list, slow to copy between machines, and mostly whitespace
+JSON. Here the payload lives in the row itself:
+
+  * one SQLite file in WAL mode, so the scrapers' reads never wait behind a
+    write and a write is one append to the log rather than a rewrite;
+  * payloads compressed with zstd when `zstandard` is installed, zlib when not.
+    The codec is stored per row, so a store written on one machine reads on
+    another;
+  * a lookup is one SELECT and a write one INSERT .. ON CONFLICT upsert;
+  * `missing()` answers for many keys in one query, so a prefetch pass can
+    find what to batch-fetch without a round trip per title;
+  * every row carries the time it was stored, and a decorator given `ttl`
+    treats older rows as misses, so the page is fetched again and replaced.
+
+The old cache_dir trees are read on demand -- a miss falls back to the loose
+file and moves it into the store -- or all at once:
+
+    python -m ExternalInfo.CacheInfoProvider.PageStore import <cache_dir>...
+    python -m ExternalInfo.CacheInfoProvider.PageStore stats
+
+Keys are the same path ids the loose files were named by, so an imported tree
+hits for exactly the calls it hit for before.
+"""
+
+import os
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Tuple
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+import ExternalInfo.ThwikiInfoProvider.Databases.path_definitions as DatabasesPathDef
+from Shared import utils
+
+CODEC_RAW = 0
+CODEC_ZLIB = 1
+CODEC_ZSTD = 2
+
+# Below this compression costs more than it saves: the opensearch responses and
+# LLM line healings are a few hundred bytes.
+COMPRESS_MIN_BYTES = 256
+
+# SQLite's default limit on bound parameters is 999 on older builds.
+LOOKUP_BATCH = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS page (
+    key    TEXT PRIMARY KEY,
+    codec  INTEGER NOT NULL,
+    data   BLOB NOT NULL,
+    stored REAL NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+def _compress(text: str) -> Tuple[int, bytes]:
+    raw = text.encode("utf-8")
+    if len(raw) < COMPRESS_MIN_BYTES:
+        return CODEC_RAW, raw
+    if zstandard is not None:
+        return CODEC_ZSTD, zstandard.ZstdCompressor(level=9).compress(raw)
+    return CODEC_ZLIB, zlib.compress(raw, 6)
+
+
+def _decompress(codec: int, data: bytes) -> str:
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise RuntimeError("page cache entry is zstd-compressed; install zstandard")
+        data = zstandard.ZstdDecompressor().decompress(data)
+    elif codec == CODEC_ZLIB:
+        data = zlib.decompress(data)
+    return data.decode("utf-8")
+
+
+def _chunks(items: List[str], size: int) -> Iterable[List[str]]:
+    for i in range(0, len(items), size):
+        yield items[i : i + size]
+
+
+class PageStore:
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # One connection shared by whatever threads a scraper runs, serialised
+        # by _lock; every statement is short. The store is local to the machine
+        # running the scrape, so WAL's shared-memory index is safe here.
+        self._conn = sqlite3.connect(
+            path, timeout=60, isolation_level=None, check_same_thread=False
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # A crash can lose the last few commits, never corrupt the file; a lost
+        # entry is just fetched again.
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    @staticmethod
+    def _fresh_after(ttl: Optional[float]) -> float:
+        return time.time() - ttl if ttl is not None else float("-inf")
+
+    def get(self, key: str, ttl: Optional[float] = None) -> Optional[str]:
+        """The payload stored under `key`, or None if absent or older than `ttl` seconds."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT codec, data FROM page WHERE key = ? AND stored >= ?",
+                (key, self._fresh_after(ttl)),
+            ).fetchone()
+        if row is None:
+            return None
+        return _decompress(*row)
+
+    def put(self, key: str, text: str, stored: Optional[float] = None) -> None:
+        codec, data = _compress(text)
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO page (key, codec, data, stored) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET "
+                "codec = excluded.codec, data = excluded.data, stored = excluded.stored",
+                (key, codec, data, stored if stored is not None else time.time()),
+            )
+
+    def put_many(self, items: Iterable[Tuple[str, str, float]]) -> int:
+        """Upsert (key, text, stored) triples in one transaction."""
+        rows = [(key, *_compress(text), stored) for key, text, stored in items]
+        with self._transaction() as conn:
+            conn.executemany(
+                "INSERT INTO page (key, codec, data, stored) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET "
+                "codec = excluded.codec, data = excluded.data, stored = excluded.stored",
+                rows,
+            )
+        return len(rows)
+
+    def present(self, keys: Iterable[str], ttl: Optional[float] = None) -> set:
+        """Which of `keys` have a fresh entry, a few hundred per query."""
+        keys = list(dict.fromkeys(keys))
+        fresh_after = self._fresh_after(ttl)
+        found = set()
+        with self._lock:
+            for chunk in _chunks(keys, LOOKUP_BATCH):
+                marks = ",".join("?" * len(chunk))
+                found.update(
+                    row[0]
+                    for row in self._conn.execute(
+                        f"SELECT key FROM page WHERE key IN ({marks}) AND stored >= ?",
+                        (*chunk, fresh_after),
+                    )
+                )
+        return found
+
+    def delete(self, key: str) -> bool:
+        with self._lock:
+            return self._conn.execute("DELETE FROM page WHERE key = ?", (key,)).rowcount > 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            entries, stored_bytes = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(data)), 0) FROM page"
+            ).fetchone()
+        return {"entries": entries, "stored_bytes": stored_bytes}
+
+    def import_dir(self, cache_dir: str, batch: int = 1000) -> int:
+        """
+        Move a file-per-entry cache tree into the store, keyed by file name.
+
+        Files are left in place; delete the tree once a scrape has run from the
+        store. Entries keep the file's mtime as their stored time, so a ttl
+        judges them by when they were really fetched.
+        """
+        imported = 0
+        pending = []
+        with os.scandir(cache_dir) as it:
+            for entry in it:
+                if not entry.is_file():
+                    continue
+                with open(entry.path, "r", encoding="utf-8") as f:
+                    pending.append((entry.name, f.read(), entry.stat().st_mtime))
+                if len(pending) >= batch:
+                    imported += self.put_many(pending)
+                    pending = []
+        if pending:
+            imported += self.put_many(pending)
+        return imported
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_store: Optional[PageStore] = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> PageStore:
+    """The process-wide store, opened on first use."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = PageStore(
+                utils.get_output_path(DatabasesPathDef, DatabasesPathDef.PAGE_CACHE_DATABASE)
+            )
+        return _store
+
+
+def _legacy_mtime(cache_dir: str, key: str, ttl: Optional[float]) -> Optional[float]:
+    try:
+        mtime = os.path.getmtime(os.path.join(cache_dir, key))
+    except OSError:
+        return None
+    return mtime if mtime >= PageStore._fresh_after(ttl) else None
+
+
+def has_legacy(cache_dir: str, key: str, ttl: Optional[float] = None) -> bool:
+    """Whether a fresh loose cache file from before the store exists for `key`."""
+    return _legacy_mtime(cache_dir, key, ttl) is not None
+
+
+def restore_legacy(
+    store: PageStore, cache_dir: str, key: str, ttl: Optional[float] = None
+) -> Optional[str]:
+    """Move a fresh loose cache file into the store; returns its text, if there was one."""
+    mtime = _legacy_mtime(cache_dir, key, ttl)
+    if mtime is None:
+        return None
+    with open(os.path.join(cache_dir, key), "r", encoding="utf-8") as f:
+        text = f.read()
+    store.put(key, text, stored=mtime)
+    return text
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] not in ("import", "stats") or (
+        sys.argv[1] == "import" and len(sys.argv) < 3
+    ):
+        print(
+            "usage: python -m ExternalInfo.CacheInfoProvider.PageStore "
+            "import <cache_dir>... | stats"
+        )
+        sys.exit(2)
+
+    store = get_store()
+    if sys.argv[1] == "import":
+        for cache_dir in sys.argv[2:]:
+            print(f"Imported {store.import_dir(cache_dir):,} entries from {cache_dir}")
+
+    stats = store.stats()
+    print(f"{stats['entries']:,} entries, {stats['stored_bytes'] / 2**20:,.1f} MiB stored")
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -10,3 +10,6 @@ THWIKI_FORMATTED_DATABASE = "formatted.db"
 THWIKI_LYRICS_INFO_DATABASE = "lyrics_info.db"
 
 THWIKI_CIRCLES_INFO_DATABASE = "circles_info.db"
+
+# Cache.cached / AdvancedCache.advanced_cache payloads (CacheInfoProvider/PageStore.py).
+PAGE_CACHE_DATABASE = "page_cache.db"
@@ -9,6 +9,10 @@ Configuration comes from the environment:
 
 The wire is snake_case throughout (Newtonsoft SnakeCaseNamingStrategy on the
 backend), including enum values ("arranger", "active").
+
+`send` is one blocking call at a time; the bulk scripts go through
+push_engine.py instead, which keeps many requests in flight over a pooled
+client and remembers what the backend has already acknowledged.
 """
 
 import os
@@ -59,10 +63,16 @@ def require_api_key() -> str:
     return _API_KEY
 
 
+def auth_headers() -> dict:
+    return {
+        "X-Internal-Api-Key": require_api_key(),
+        "Content-Type": "application/json",
+    }
+
+
 def make_session() -> requests.Session:
     session = requests.Session()
-    session.headers["X-Internal-Api-Key"] = require_api_key()
-    session.headers["Content-Type"] = "application/json"
+    session.headers.update(auth_headers())
     return session
 
 
@@ -0,0 +1,78 @@
+"""Measures push_engine against the serial api_client.send loop.
+
+Generates synthetic track metadata -- an originals and a credits PUT per track,
+the shape push_track_metadata.py sends -- and pushes it to TLMC_API_BASE twice:
+a sample with send, one request after another, then the whole set through the
+engine with a throwaway ledger. Then pushes the set once more through the same
+ledger, which should send nothing. Meant for stub_server.py; pointed at a real
+backend it writes credits to random track ids, which the backend rejects.
+
+  python -m ExternalInfo.ThwikiInfoProvider.PushChange.push_bench [tracks] [serial sample]
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+from ExternalInfo.ThwikiInfoProvider.PushChange import push_engine
+from ExternalInfo.ThwikiInfoProvider.PushChange.api_client import (
+    API_BASE,
+    make_session,
+    send,
+    track_typeid,
+)
+from ExternalInfo.ThwikiInfoProvider.PushChange.push_track_metadata import (
+    CREDITS,
+    ORIGINALS,
+)
+
+
+def synthetic_jobs(count: int):
+    jobs = []
+    for i in range(count):
+        track_id = str(uuid.uuid4())
+        path = f"/api/internal/track/{track_typeid(track_id)}"
+        jobs.append(push_engine.Job(ORIGINALS, track_id, f"{path}/originals",
+                                    {"song_external_keys": [f"EoSD-{i % 17}"]}))
+        jobs.append(push_engine.Job(CREDITS, track_id, f"{path}/credits",
+                                    {"credits": [{"role": "arranger", "names": [f"artist {i}"]}]}))
+    return jobs
+
+
+def main():
+    tracks = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    sample = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    jobs = synthetic_jobs(tracks)
+    print(f"{len(jobs)} requests against {API_BASE}")
+
+    session = make_session()
+    serial = jobs[: min(sample, len(jobs))]
+    start = time.monotonic()
+    for job in serial:
+        send(session, job.route.method, job.path, job.payload)
+    elapsed = time.monotonic() - start
+    print(f"serial send: {len(serial)} requests in {elapsed:.1f}s, {len(serial) / elapsed:.0f}/s")
+
+    with tempfile.TemporaryDirectory(prefix="push-bench-") as ledger_dir:
+        ledger = push_engine.Ledger(os.path.join(ledger_dir, "ledger.sqlite3"), API_BASE)
+        try:
+            start = time.monotonic()
+            result = asyncio.run(push_engine.PushEngine(ledger).run(jobs))
+            elapsed = time.monotonic() - start
+            print(f"engine: {sum(result.acked.values())} acked, {len(result.failures)} failed "
+                  f"in {elapsed:.1f}s, {len(jobs) / elapsed:.0f}/s")
+
+            start = time.monotonic()
+            result = asyncio.run(push_engine.PushEngine(ledger).run(jobs))
+            elapsed = time.monotonic() - start
+            print(f"rerun: {sum(result.skipped.values())} skipped from the ledger, "
+                  f"{sum(result.acked.values())} sent, in {elapsed:.1f}s")
+        finally:
+            ledger.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -6,13 +6,21 @@ gone; v6 upserts by exact name via
   PUT api/internal/circle   [ {name, status, established, country, websites}, ... ]
 
 Runs after the ThwikiArtistPageQueryScraper stages have populated
-circles_info.db. Batched; safe to re-run.
+circles_info.db. Batched; safe to re-run. Batches go through push_engine.py,
+several in flight at once; a batch the backend rejects is split until the
+offending circle is isolated, and a rerun skips circles already upserted with
+the same fields.
 """
 
 import json
 import re
 
-from ExternalInfo.ThwikiInfoProvider.PushChange.api_client import make_session, send
+from ExternalInfo.ThwikiInfoProvider.PushChange.push_engine import (
+    Job,
+    Route,
+    push,
+    write_failures,
+)
 from ExternalInfo.ThwikiInfoProvider.ThwikiArtistPageQueryScraper.Model.CircleData import (
     CircleData,
     QueryStatus,
@@ -20,6 +28,10 @@ from ExternalInfo.ThwikiInfoProvider.ThwikiArtistPageQueryScraper.Model.CircleDa
 
 BATCH_SIZE = 200
 
+# Each batch is one upsert transaction over up to BATCH_SIZE rows, so fewer in
+# flight than the per-entity routes.
+CIRCLES = Route("circle", "PUT", frozenset({200}), concurrency=4, batch_size=BATCH_SIZE)
+
 country_map = {
     "日本": "jpn",
     "中国大陆": "chn",
@@ -107,26 +119,22 @@ def main():
     ]
     print(f"{len(dtos)} circles to upsert")
 
-    session = make_session()
-    created = updated = 0
-    failures = []
-    for i in range(0, len(dtos), BATCH_SIZE):
-        batch = dtos[i : i + BATCH_SIZE]
-        resp = send(session, "PUT", "/api/internal/circle", batch)
-        if resp.status_code == 200:
-            body = resp.json()
-            created += body.get("created", 0)
-            updated += body.get("updated", 0)
-        else:
-            failures.append(f"batch {i}: {resp.status_code} {resp.text[:200]}")
-        print(f"[{min(i + BATCH_SIZE, len(dtos))}/{len(dtos)}] created {created}, updated {updated}", end="\r")
-
-    print()
-    print(f"Done: {created} created, {updated} updated, {len(failures)} failed batches.")
-    if failures:
-        with open("push_circles_failures.txt", "w", encoding="utf-8") as f:
-            f.write("\n".join(failures) + "\n")
-        print("See push_circles_failures.txt")
+    counts = {"created": 0, "updated": 0}
+
+    def on_ack(jobs, resp):
+        body = resp.json()
+        for key in counts:
+            counts[key] += body.get(key, 0)
+
+    # Upserted by exact name, so the name is the entity key.
+    result = push([Job(CIRCLES, dto["name"], "/api/internal/circle", dto) for dto in dtos], on_ack)
+
+    print(
+        f"Done: {counts['created']} created, {counts['updated']} updated, "
+        f"{result.skipped[CIRCLES.name]} unchanged since last push, "
+        f"{len(result.failures)} circles failed."
+    )
+    write_failures(result, "push_circles_failures.txt")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,372 @@
+"""Concurrent bulk push to the v6 backend.
+
+api_client.send is one blocking requests call at a time, and the push scripts
+walked their entities with it: one PUT per track per role, one per lyrics
+document, one per release. A full v6 push was hundreds of thousands of strictly
+sequential round trips, each waiting out the backend's transaction before the
+next one started. Here the same calls go out over one pooled httpx.AsyncClient
+with many in flight at once, so the keep-alive connections stay busy and the
+backend's own parallelism does the work.
+
+A script describes each call as a Job on a Route:
+
+  Route  one endpoint: method, the statuses that mean "acknowledged", how many
+         requests may be in flight against it, and -- for endpoints that take
+         a JSON array of entities, like PUT api/internal/circle -- how many
+         entities go in one request. Of the endpoints the scripts use, only
+         the circle upsert takes a batch; the track, lyrics and release routes
+         are per entity on the backend, so they are pipelined, not grouped.
+  Job    one entity on a route: a stable key (the entity id), the request path
+         and the payload.
+
+Concurrency per route is adaptive (AIMD): it starts at a quarter of the route's
+ceiling, grows by one for every window of successful requests, and halves
+whenever the backend answers with one of api_client's retryable statuses or
+the connection fails -- once per window, as TCP does: only a request sent
+after the last cut can cut again, so a burst of 503s from one overload counts
+once. The retried request waits Retry-After if the backend sent one (and the
+whole route pauses with it), otherwise an exponential delay with full jitter.
+A batch rejected with a non-retryable status is split in half and retried,
+down to single entities, so one bad row costs only itself.
+
+Every acknowledged entity is recorded in a SQLite ledger (push_ledger.sqlite3
+under ThwikiInfoProvider/output) with a hash of the payload it was sent with,
+per backend base url. A restarted push skips entities whose payload is
+unchanged since they were acknowledged, and re-sends the rest -- so a rerun
+after the matcher improves pushes just what changed. Delete the ledger (or set
+TLMC_PUSH_LEDGER to another file) to push everything again; TLMC_PUSH_LEDGER=-
+turns it off.
+
+Connection errors that outlast the retry budget still raise, as with send: if
+the backend is down, stopping is correct. Everything acknowledged until then is
+already in the ledger.
+
+stub_server.py stands in for the backend for throughput tests, and
+push_bench.py measures the engine against the serial send loop.
+"""
+
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, NamedTuple, Optional
+
+import httpx
+import xxhash
+
+import ExternalInfo.ThwikiInfoProvider.output.path_definitions as ThwikiOutput
+from ExternalInfo.ThwikiInfoProvider.PushChange.api_client import (
+    _RETRYABLE,
+    API_BASE,
+    auth_headers,
+)
+from Shared import utils
+
+# Ceiling on requests in flight per route. Each internal PUT is one short
+# backend transaction; against the k3s deployment throughput stops improving
+# somewhere past 16, and the adaptive limit finds the actual knee below it.
+DEFAULT_CONCURRENCY = int(os.environ.get("TLMC_PUSH_CONCURRENCY", "16"))
+# Pool size across all routes.
+MAX_CONNECTIONS = int(os.environ.get("TLMC_PUSH_CONNECTIONS", "64"))
+
+MAX_RETRIES = 6
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 30.0
+
+REQUEST_TIMEOUT = 120.0
+
+LEDGER_COMMIT_EVERY = 500
+PROGRESS_EVERY = 500
+
+ledger_path = os.environ.get("TLMC_PUSH_LEDGER") or utils.get_output_path(
+    ThwikiOutput, ThwikiOutput.THWIKI_PUSH_LEDGER_OUTPUT
+)
+
+
+class Route(NamedTuple):
+    # Ledger namespace and progress label, e.g. "track.credits".
+    name: str
+    method: str
+    ok: FrozenSet[int]
+    concurrency: int = DEFAULT_CONCURRENCY
+    # >1: up to this many jobs sharing a path go out as one JSON array.
+    batch_size: int = 1
+
+
+class Job(NamedTuple):
+    route: Route
+    key: str
+    path: str
+    payload: Any
+
+
+class PushResult:
+    def __init__(self) -> None:
+        self.acked: Counter = Counter()
+        self.skipped: Counter = Counter()
+        self.failures: List[str] = []
+
+
+def payload_digest(payload: Any) -> str:
+    data = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return xxhash.xxh128_hexdigest(data.encode("utf-8"))
+
+
+class Ledger:
+    """What the backend at `base` has acknowledged, per route and entity key."""
+
+    def __init__(self, path: str, base: str) -> None:
+        self.base = base
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS acked ("
+            " base TEXT NOT NULL, route TEXT NOT NULL, key TEXT NOT NULL,"
+            " digest TEXT NOT NULL, acked_at REAL NOT NULL,"
+            " PRIMARY KEY (base, route, key)) WITHOUT ROWID"
+        )
+        self.conn.commit()
+        self._pending = 0
+
+    def digests(self, route: str) -> Dict[str, str]:
+        rows = self.conn.execute(
+            "SELECT key, digest FROM acked WHERE base = ? AND route = ?", (self.base, route)
+        )
+        return dict(rows)
+
+    def record(self, route: str, entries: Iterable[tuple]) -> None:
+        """Records (key, digest) pairs; committed every LEDGER_COMMIT_EVERY."""
+        now = time.time()
+        rows = [(self.base, route, key, digest, now) for key, digest in entries]
+        self.conn.executemany("INSERT OR REPLACE INTO acked VALUES (?, ?, ?, ?, ?)", rows)
+        self._pending += len(rows)
+        if self._pending >= LEDGER_COMMIT_EVERY:
+            self.conn.commit()
+            self._pending = 0
+
+    def close(self) -> None:
+        self.conn.commit()
+        self.conn.close()
+
+
+class AsyncAdaptiveLimit:
+    """
+    A resizable asyncio semaphore: additive increase on success, halve on
+    backoff.
+
+    The per-request cousin of Shared/adaptive_concurrency.AdaptiveLimit. That
+    one is a thread limit moved by AimdController from throughput measured
+    over windows; here every response is its own signal -- a 429 or 503 is the
+    backend saying so -- and the cut happens on the reply that carried it.
+    """
+
+    def __init__(self, ceiling: int) -> None:
+        self.ceiling = max(1, ceiling)
+        self.limit = float(max(1, self.ceiling // 4))
+        self.in_flight = 0
+        self.paused_until = 0.0
+        # Requests handed out so far, and the count at the last cut.
+        self._started = 0
+        self._cut_at = 0
+        self._cond = asyncio.Condition()
+
+    async def acquire(self) -> int:
+        """Waits for a slot; returns the ticket to pass back to release()."""
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+            self._started += 1
+            ticket = self._started
+        delay = self.paused_until - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return ticket
+
+    async def release(self, ticket: int, backoff: bool, retry_after: Optional[float] = None) -> None:
+        async with self._cond:
+            self.in_flight -= 1
+            if backoff:
+                # Sent before the last cut: it saw the old limit, and the cut
+                # already answered for it.
+                if ticket > self._cut_at:
+                    self.limit = max(1.0, self.limit / 2)
+                    self._cut_at = self._started
+                if retry_after:
+                    self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+            else:
+                self.limit = min(float(self.ceiling), self.limit + 1.0 / self.limit)
+            self._cond.notify_all()
+
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    value = response.headers.get("Retry-After")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        # The HTTP-date form; the backend does not send it.
+        return None
+
+
+def _units(jobs: List[Job]) -> Dict[Route, List[List[Job]]]:
+    """Jobs per route, grouped into requests: batches share a path."""
+    by_path: Dict[Route, Dict[str, List[Job]]] = {}
+    for job in jobs:
+        by_path.setdefault(job.route, {}).setdefault(job.path, []).append(job)
+    units: Dict[Route, List[List[Job]]] = {}
+    for route, paths in by_path.items():
+        out = units.setdefault(route, [])
+        for path_jobs in paths.values():
+            if route.batch_size > 1:
+                for i in range(0, len(path_jobs), route.batch_size):
+                    out.append(path_jobs[i : i + route.batch_size])
+            else:
+                out.extend([job] for job in path_jobs)
+    return units
+
+
+class PushEngine:
+    def __init__(
+        self,
+        ledger: Optional[Ledger],
+        on_ack: Optional[Callable[[List[Job], httpx.Response], None]] = None,
+    ) -> None:
+        self.ledger = ledger
+        self.on_ack = on_ack
+        self.result = PushResult()
+        self._limits: Dict[Route, AsyncAdaptiveLimit] = {}
+        self._done = 0
+        self._total = 0
+
+    async def _request(self, client: httpx.AsyncClient, route: Route, path: str, body) -> httpx.Response:
+        limit = self._limits[route]
+        for attempt in range(MAX_RETRIES + 1):
+            ticket = await limit.acquire()
+            try:
+                response = await client.request(route.method, path, json=body)
+            except httpx.TransportError:
+                await limit.release(ticket, backoff=True)
+                if attempt == MAX_RETRIES:
+                    raise
+                retry_after = None
+            else:
+                retryable = response.status_code in _RETRYABLE
+                retry_after = _retry_after(response) if retryable else None
+                await limit.release(ticket, backoff=retryable, retry_after=retry_after)
+                if not retryable or attempt == MAX_RETRIES:
+                    return response
+            await asyncio.sleep(
+                retry_after or random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+            )
+
+    def _ack(self, route: Route, jobs: List[Job], digests: List[str], response: httpx.Response) -> None:
+        self.result.acked[route.name] += len(jobs)
+        if self.ledger is not None:
+            self.ledger.record(route.name, ((job.key, d) for job, d in zip(jobs, digests)))
+        if self.on_ack is not None:
+            self.on_ack(jobs, response)
+
+    async def _push_unit(self, client: httpx.AsyncClient, route: Route, jobs: List[Job]) -> None:
+        digests = [payload_digest(job.payload) for job in jobs]
+        body = [job.payload for job in jobs] if route.batch_size > 1 else jobs[0].payload
+        response = await self._request(client, route, jobs[0].path, body)
+
+        if response.status_code in route.ok:
+            self._ack(route, jobs, digests, response)
+        elif len(jobs) > 1 and response.status_code not in _RETRYABLE:
+            # One bad entity rejects its whole batch; halve until it is alone.
+            mid = len(jobs) // 2
+            await self._push_unit(client, route, jobs[:mid])
+            await self._push_unit(client, route, jobs[mid:])
+            return
+        else:
+            for job in jobs:
+                self.result.failures.append(
+                    f"{job.key} {route.name}: {response.status_code} {response.text[:200]}"
+                )
+        self._progress(len(jobs))
+
+    def _progress(self, n: int) -> None:
+        before = self._done
+        self._done += n
+        if self._done // PROGRESS_EVERY != before // PROGRESS_EVERY or self._done == self._total:
+            acked = ", ".join(f"{name} {count}" for name, count in sorted(self.result.acked.items()))
+            print(
+                f"[{self._done}/{self._total}] {acked or 'nothing acked yet'}, "
+                f"failures {len(self.result.failures)}",
+                end="\r",
+            )
+
+    async def _worker(self, client: httpx.AsyncClient, route: Route, units) -> None:
+        # Workers share one iterator; the event loop is single-threaded, so
+        # next() needs no lock.
+        for unit in units:
+            await self._push_unit(client, route, unit)
+
+    def _pending(self, jobs: List[Job]) -> List[Job]:
+        """Jobs not already acknowledged with the same payload."""
+        if self.ledger is None:
+            return jobs
+        known = {route.name: self.ledger.digests(route.name) for route in {job.route for job in jobs}}
+        pending = []
+        for job in jobs:
+            if known[job.route.name].get(job.key) == payload_digest(job.payload):
+                self.result.skipped[job.route.name] += 1
+            else:
+                pending.append(job)
+        return pending
+
+    async def run(self, jobs: List[Job]) -> PushResult:
+        jobs = self._pending(jobs)
+        self._total = len(jobs)
+        units = _units(jobs)
+        self._limits = {route: AsyncAdaptiveLimit(route.concurrency) for route in units}
+
+        connections = min(MAX_CONNECTIONS, sum(route.concurrency for route in units) or 1)
+        async with httpx.AsyncClient(
+            base_url=API_BASE,
+            headers=auth_headers(),
+            timeout=httpx.Timeout(REQUEST_TIMEOUT),
+            limits=httpx.Limits(max_connections=connections, max_keepalive_connections=connections),
+        ) as client:
+            workers = []
+            for route, route_units in units.items():
+                shared = iter(route_units)
+                workers += [
+                    self._worker(client, route, shared)
+                    for _ in range(min(route.concurrency, len(route_units)))
+                ]
+            await asyncio.gather(*workers)
+        if self._total:
+            print()
+        return self.result
+
+
+def open_ledger() -> Optional[Ledger]:
+    if ledger_path == "-":
+        return None
+    return Ledger(ledger_path, API_BASE)
+
+
+def push(
+    jobs: List[Job],
+    on_ack: Optional[Callable[[List[Job], httpx.Response], None]] = None,
+) -> PushResult:
+    """Blocking entry point for the push scripts."""
+    ledger = open_ledger()
+    engine = PushEngine(ledger, on_ack)
+    try:
+        return asyncio.run(engine.run(jobs))
+    finally:
+        if ledger is not None:
+            ledger.close()
+
+
+def write_failures(result: PushResult, path: str) -> None:
+    if result.failures:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n".join(result.failures) + "\n")
+        print(f"See {path}")
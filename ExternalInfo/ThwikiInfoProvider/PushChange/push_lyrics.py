@@ -6,7 +6,9 @@ LyricsInfo rows in PARSE_PROCESSED state (stage 8 formatter output) and calls
 
   PUT api/internal/track/{remote_track_id}/lyrics  {variants, reference_url}
 
-The endpoint replaces the whole lyrics document, so the script is re-runnable.
+The endpoint replaces the whole lyrics document, so the script is re-runnable;
+calls go through push_engine.py, and a rerun skips documents the backend
+already acknowledged unchanged.
 The variants document shape mirrors the backend's jsonb contract:
   [{variant, lines: [{index, time, blocks: [{lang, text, ruby: [{index, length, text}]}]}]}]
 """
@@ -16,10 +18,12 @@ import re
 from collections import defaultdict
 from typing import Any, Dict, List, Optional
 
-from ExternalInfo.ThwikiInfoProvider.PushChange.api_client import (
-    make_session,
-    send,
-    track_typeid,
+from ExternalInfo.ThwikiInfoProvider.PushChange.api_client import track_typeid
+from ExternalInfo.ThwikiInfoProvider.PushChange.push_engine import (
+    Job,
+    Route,
+    push,
+    write_failures,
 )
 from ExternalInfo.ThwikiInfoProvider.ThwikiLyricsPageScraper.lyrics_formatter import (
     LyricsAnnotatedLine,
@@ -31,6 +35,8 @@ from ExternalInfo.ThwikiInfoProvider.ThwikiLyricsPageScraper.Model.ThwikiLyricsI
 
 THWIKI_BASE_URL = "https://thwiki.cc/"
 
+LYRICS = Route("track.lyrics", "PUT", frozenset({200}))
+
 
 def pad_timespan(timespan: Optional[str]) -> Optional[str]:
     if timespan is None:
@@ -146,8 +152,6 @@ def json_to_variants(lyrics_info: LyricsInfo) -> Optional[List[dict]]:
 
 
 def main():
-    session = make_session()
-
     entries = list(
         LyricsInfo.select().where(
             LyricsInfo.process_status == LyricsProcessingStatus.PARSE_PROCESSED
@@ -155,9 +159,9 @@ def main():
     )
     print(f"{len(entries)} formatted lyrics entries")
 
-    pushed = empty = 0
-    failures = []
-    for i, entry in enumerate(entries, 1):
+    jobs = []
+    empty = 0
+    for entry in entries:
         variants = json_to_variants(entry)
         if not variants:
             empty += 1
@@ -168,29 +172,20 @@ def main():
             "variants": variants,
             "reference_url": THWIKI_BASE_URL + reference_title if reference_title else None,
         }
-
-        resp = send(
-            session,
-            "PUT",
+        jobs.append(Job(
+            LYRICS,
+            str(entry.remote_track_id),
             f"/api/internal/track/{track_typeid(entry.remote_track_id)}/lyrics",
             payload,
-        )
-        if resp.status_code == 200:
-            pushed += 1
-        else:
-            failures.append(
-                f"{entry.remote_track_id} ({entry.track_id}): {resp.status_code} {resp.text[:200]}"
-            )
-
-        if i % 200 == 0 or i == len(entries):
-            print(f"[{i}/{len(entries)}] pushed {pushed}, empty {empty}, failures {len(failures)}", end="\r")
-
-    print()
-    print(f"Done: {pushed} pushed, {empty} empty, {len(failures)} failures.")
-    if failures:
-        with open("push_lyrics_failures.txt", "w", encoding="utf-8") as f:
-            f.write("\n".join(failures) + "\n")
-        print("See push_lyrics_failures.txt")
+        ))
+
+    result = push(jobs)
+
+    print(
+        f"Done: {result.acked[LYRICS.name]} pushed, {result.skipped[LYRICS.name]} unchanged since "
+        f"last push, {empty} empty, {len(result.failures)} failures."
+    )
+    write_failures(result, "push_lyrics_failures.txt")
 
 
 if __name__ == "__main__":
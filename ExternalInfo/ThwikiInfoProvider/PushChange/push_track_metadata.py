@@ -8,16 +8,20 @@ Reads track_format_result.output.json (stage 4 matcher output) and writes:
 
 Credits replace only the roles this pass owns (arranger/composer/vocalist/
 lyricist); the loader's verbatim staff rows are untouched. Both endpoints are
-idempotent, so the script is safe to re-run.
+idempotent, so the script is safe to re-run. Calls go through push_engine.py,
+many in flight at once; a rerun skips tracks whose originals or credits the
+backend already acknowledged unchanged.
 """
 
 import json
 
 import ExternalInfo.ThwikiInfoProvider.output.path_definitions as ThwikiOutput
-from ExternalInfo.ThwikiInfoProvider.PushChange.api_client import (
-    make_session,
-    send,
-    track_typeid,
+from ExternalInfo.ThwikiInfoProvider.PushChange.api_client import track_typeid
+from ExternalInfo.ThwikiInfoProvider.PushChange.push_engine import (
+    Job,
+    Route,
+    push,
+    write_failures,
 )
 from Shared import utils
 
@@ -25,6 +29,9 @@ track_formatted_output_path = utils.get_output_path(
     ThwikiOutput, ThwikiOutput.THWIKI_TRACK_FORMAT_RESULT_OUTPUT
 )
 
+ORIGINALS = Route("track.originals", "PUT", frozenset({204}))
+CREDITS = Route("track.credits", "PUT", frozenset({204}))
+
 # fmt-key -> wire role (snake_case CreditRole)
 ROLE_MAP = {
     "arrangement": "arranger",
@@ -44,66 +51,42 @@ def credit_groups(entry):
     return groups
 
 
+def jobs_for(track_id, entry):
+    path = f"/api/internal/track/{track_typeid(track_id)}"
+    jobs = []
+
+    originals = entry.get("original") or []
+    if originals:
+        jobs.append(Job(ORIGINALS, track_id, f"{path}/originals", {"song_external_keys": originals}))
+
+    groups = credit_groups(entry)
+    if groups:
+        jobs.append(Job(CREDITS, track_id, f"{path}/credits", {"credits": groups}))
+
+    return jobs
+
+
 def main():
     with open(track_formatted_output_path, "r", encoding="utf-8") as f:
         tracks = json.load(f)
 
-    session = make_session()
-
-    total = len(tracks)
-    originals_pushed = credits_pushed = skipped = 0
-    failures = []
-    for i, (track_id, entry) in enumerate(tracks.items(), 1):
-        did_something = False
-        wire_id = track_typeid(track_id)
-
-        originals = entry.get("original") or []
-        if originals:
-            resp = send(
-                session,
-                "PUT",
-                f"/api/internal/track/{wire_id}/originals",
-                {"song_external_keys": originals},
-            )
-            if resp.status_code == 204:
-                originals_pushed += 1
-            else:
-                failures.append(f"{track_id} originals: {resp.status_code} {resp.text[:200]}")
-            did_something = True
-
-        groups = credit_groups(entry)
-        if groups:
-            resp = send(
-                session,
-                "PUT",
-                f"/api/internal/track/{wire_id}/credits",
-                {"credits": groups},
-            )
-            if resp.status_code == 204:
-                credits_pushed += 1
-            else:
-                failures.append(f"{track_id} credits: {resp.status_code} {resp.text[:200]}")
-            did_something = True
-
-        if not did_something:
+    jobs = []
+    skipped = 0
+    for track_id, entry in tracks.items():
+        track_jobs = jobs_for(track_id, entry)
+        if not track_jobs:
             skipped += 1
+        jobs += track_jobs
+    print(f"{len(tracks)} tracks, {len(jobs)} calls, {skipped} empty entries")
 
-        if i % 500 == 0 or i == total:
-            print(
-                f"[{i}/{total}] originals {originals_pushed}, credits {credits_pushed}, "
-                f"empty {skipped}, failures {len(failures)}",
-                end="\r",
-            )
+    result = push(jobs)
 
-    print()
     print(
-        f"Done: {originals_pushed} originals, {credits_pushed} credit sets, "
-        f"{skipped} empty entries, {len(failures)} failures."
+        f"Done: {result.acked[ORIGINALS.name]} originals, {result.acked[CREDITS.name]} credit sets, "
+        f"{sum(result.skipped.values())} unchanged since last push, "
+        f"{skipped} empty entries, {len(result.failures)} failures."
     )
-    if failures:
-        with open("push_track_metadata_failures.txt", "w", encoding="utf-8") as f:
-            f.write("\n".join(failures) + "\n")
-        print("See push_track_metadata_failures.txt")
+    write_failures(result, "push_track_metadata_failures.txt")
 
 
 if __name__ == "__main__":
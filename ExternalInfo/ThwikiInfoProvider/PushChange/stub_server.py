@@ -0,0 +1,190 @@
+"""A stand-in for the backend's internal push API, for throughput tests.
+
+Answers the routes the push scripts call with the statuses the backend
+returns, and nothing else -- payloads are parsed and dropped:
+
+  PUT  api/internal/track/{trk_id}/originals     204
+  PUT  api/internal/track/{trk_id}/credits       204
+  PUT  api/internal/track/{trk_id}/lyrics        200
+  PUT  api/internal/release/{rel_id}/source-meta 204
+  PUT  api/internal/circle  [...]                200 {created, updated}
+  POST api/source/work                           200 {id}
+  POST api/source/work/{id}/song                 200 {id}
+
+Requests without an X-Internal-Api-Key (or, when TLMC_INTERNAL_API_KEY is set,
+with a different one) get 401, and ids that are not TypeIDs of the right
+prefix get 404, as on the backend. Connections are HTTP/1.1 keep-alive, so a
+pooled client is measured as it would run against the real thing.
+
+To make the numbers mean something, each request holds its thread for
+--latency seconds (the backend's transaction time), and past --capacity
+requests in flight the server answers 503, as the ingress does when the
+backend pods are saturated. --fail-rate adds random 503s on top, and
+--retry-after makes the overload answer a 429 with that Retry-After instead,
+like a rate-limited gateway.
+
+  python -m ExternalInfo.ThwikiInfoProvider.PushChange.stub_server --port 30090
+  TLMC_API_BASE=http://localhost:30090 TLMC_INTERNAL_API_KEY=x \\
+      python -m ExternalInfo.ThwikiInfoProvider.PushChange.push_bench
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_TYPEID = "[0-7][0-9a-hjkmnp-tv-z]{25}"
+
+ROUTES = [
+    ("PUT", re.compile(rf"^/api/internal/track/trk_{_TYPEID}/(originals|credits)$"), 204),
+    ("PUT", re.compile(rf"^/api/internal/track/trk_{_TYPEID}/lyrics$"), 200),
+    ("PUT", re.compile(rf"^/api/internal/release/rel_{_TYPEID}/source-meta$"), 204),
+    ("PUT", re.compile(r"^/api/internal/circle$"), 200),
+    ("POST", re.compile(r"^/api/source/work$"), 200),
+    ("POST", re.compile(r"^/api/source/work/[^/]+/song$"), 200),
+]
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # socketserver's default backlog of 5 resets connections when a pooled
+    # client opens its whole pool at once.
+    request_queue_size = 1024
+
+
+class Stats:
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.by_status = {}
+        self.entities = 0
+
+    def count(self, status: int, entities: int) -> None:
+        with self.lock:
+            self.by_status[status] = self.by_status.get(status, 0) + 1
+            self.entities += entities
+
+
+def make_handler(args, stats: Stats):
+    api_key = os.environ.get("TLMC_INTERNAL_API_KEY")
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *a):
+            pass
+
+        def _reply(self, status: int, body=None, headers=None) -> None:
+            data = json.dumps(body).encode("utf-8") if body is not None else b""
+            self.send_response(status)
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            if body is not None:
+                self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _handle(self) -> None:
+            length = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(length) if length else b""
+
+            key = self.headers.get("X-Internal-Api-Key")
+            if not key or (api_key and key != api_key):
+                stats.count(401, 0)
+                return self._reply(401)
+
+            status = next(
+                (s for method, pattern, s in ROUTES if method == self.command and pattern.match(self.path)),
+                None,
+            )
+            if status is None:
+                stats.count(404, 0)
+                return self._reply(404, {"error": f"no route for {self.command} {self.path}"})
+
+            try:
+                payload = json.loads(raw) if raw else None
+            except ValueError:
+                stats.count(400, 0)
+                return self._reply(400, {"error": "body is not JSON"})
+
+            with stats.lock:
+                stats.in_flight += 1
+                overloaded = stats.in_flight > args.capacity
+            try:
+                if overloaded and args.retry_after:
+                    stats.count(429, 0)
+                    return self._reply(429, headers={"Retry-After": str(args.retry_after)})
+                if overloaded or random.random() < args.fail_rate:
+                    stats.count(503, 0)
+                    return self._reply(503)
+                time.sleep(args.latency)
+            finally:
+                with stats.lock:
+                    stats.in_flight -= 1
+
+            entities = len(payload) if isinstance(payload, list) else 1
+            stats.count(status, entities)
+            if status == 204:
+                return self._reply(204)
+            if self.path == "/api/internal/circle":
+                return self._reply(200, {"created": entities, "updated": 0})
+            if self.path.startswith("/api/source/"):
+                return self._reply(200, {"id": str(uuid.uuid4())})
+            return self._reply(200, {})
+
+        do_PUT = _handle
+        do_POST = _handle
+
+    return Handler
+
+
+def report(stats: Stats, interval: float) -> None:
+    last_entities, last_time = 0, time.monotonic()
+    while True:
+        time.sleep(interval)
+        now = time.monotonic()
+        with stats.lock:
+            entities = stats.entities
+            by_status = dict(sorted(stats.by_status.items()))
+        rate = (entities - last_entities) / (now - last_time)
+        if entities != last_entities:
+            print(f"{rate:8.0f} entities/s  total {entities}  responses {by_status}")
+        last_entities, last_time = entities, now
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=30090)
+    parser.add_argument("--latency", type=float, default=0.005,
+                        help="seconds each request takes (default 0.005)")
+    parser.add_argument("--capacity", type=int, default=64,
+                        help="requests in flight before answering 503 (default 64)")
+    parser.add_argument("--fail-rate", type=float, default=0.0,
+                        help="fraction of requests answered 503 at random")
+    parser.add_argument("--retry-after", type=int, default=0,
+                        help="answer overload with 429 and this Retry-After instead of 503")
+    parser.add_argument("--report", type=float, default=5.0,
+                        help="seconds between throughput lines")
+    args = parser.parse_args()
+
+    stats = Stats()
+    server = StubServer((args.host, args.port), make_handler(args, stats))
+    threading.Thread(target=report, args=(stats, args.report), daemon=True).start()
+    print(f"stub backend on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+"""
+Batched, pooled page-source fetching from thwiki.cc for the scrapers.
+
+The album, lyrics and artist scrapers each asked for one page per blocking
+httpx.get, on a fresh connection, strictly one after another -- a cold lyrics
+scrape was tens of thousands of sequential round trips. The MediaWiki
+`action=query&prop=revisions` API takes up to 50 titles per request and, with
+`redirects=1`, resolves redirects on the server, so here pages are fetched 50
+at a time over one pooled AsyncClient, a few requests in flight at once, paced
+by a politeness limit on how often a request may start.
+
+Results come back shaped exactly like the single-title responses the scrapers
+already cache -- {"query": {"pages": {id: page}}} -- with the redirect hops, if
+any, under "query"/"redirects". A scraper prefetches the titles its cache does
+not have yet, then runs its existing cached fetch for each, which takes the
+prefetched response instead of going to the network. The caches are filled the
+same way as before; only the round trips change.
+"""
+
+import asyncio
+import time
+from typing import Dict, Iterable, List, Optional
+
+import httpx
+
+API_URL = "https://thwiki.cc/api.php"
+
+HEADER = {
+    "sec-ch-ua": '" Not A;Brand";v="99", "Chromium";v="102", "Google Chrome";v="102"',
+    "Accept": "application/json, text/javascript, */*; q=0.01",
+    "Referer": "https://thwiki.cc/",
+    "X-Requested-With": "XMLHttpRequest",
+    "sec-ch-ua-mobile": "?0",
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/102.0.0.0 Safari/537.36",
+    "sec-ch-ua-platform": '"Windows"',
+}
+
+# The API's ceiling for `titles` without bot rights.
+BATCH_TITLES = 50
+
+# thwiki is a community wiki, not a CDN. Two requests in flight and at most two
+# starts a second is 100 pages/s at 50 a batch -- a cold lyrics scrape in
+# minutes -- while staying well under anything a browser session would do.
+MAX_IN_FLIGHT = 2
+REQUESTS_PER_SECOND = 2.0
+
+MAX_RETRIES = 5
+_RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class RateLimiter:
+    """Spaces request starts at least 1/rate seconds apart."""
+
+    def __init__(self, rate: float) -> None:
+        self.interval = 1.0 / rate
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self) -> None:
+        async with self._lock:
+            now = time.monotonic()
+            if self._next > now:
+                await asyncio.sleep(self._next - now)
+                now = self._next
+            self._next = now + self.interval
+
+
+def _chunks(items: List[str], size: int) -> Iterable[List[str]]:
+    for i in range(0, len(items), size):
+        yield items[i : i + size]
+
+
+def _resolve(title: str, normalized: Dict[str, str], redirects: Dict[str, dict]):
+    """Final title for a requested one, and the redirect hops taken to get there."""
+    title = normalized.get(title, title)
+    hops = []
+    # redirects=1 already resolves chains, but reports each hop separately.
+    while title in redirects and len(hops) < 10:
+        hop = redirects[title]
+        hops.append(hop)
+        title = hop["to"]
+    return title, hops
+
+
+class ThwikiClient:
+    def __init__(
+        self,
+        max_in_flight: int = MAX_IN_FLIGHT,
+        requests_per_second: float = REQUESTS_PER_SECOND,
+    ) -> None:
+        self.max_in_flight = max_in_flight
+        self.requests_per_second = requests_per_second
+        self._client: Optional[httpx.AsyncClient] = None
+
+    async def __aenter__(self):
+        self._client = httpx.AsyncClient(
+            headers=HEADER,
+            timeout=httpx.Timeout(60.0),
+            limits=httpx.Limits(
+                max_connections=self.max_in_flight,
+                max_keepalive_connections=self.max_in_flight,
+            ),
+        )
+        self._limiter = RateLimiter(self.requests_per_second)
+        self._slots = asyncio.Semaphore(self.max_in_flight)
+        return self
+
+    async def __aexit__(self, *exc):
+        await self._client.aclose()
+        self._client = None
+
+    async def _get(self, params: dict) -> dict:
+        delay = 1.0
+        for attempt in range(MAX_RETRIES):
+            await self._limiter.wait()
+            try:
+                response = await self._client.get(API_URL, params=params)
+            except httpx.TransportError as e:
+                if attempt == MAX_RETRIES - 1:
+                    raise
+                print(f"thwiki request failed ({e!r}), retrying in {delay:.0f}s")
+            else:
+                if response.status_code == 200:
+                    j = response.json()
+                    # maxlag: the wiki asks clients to back off while its
+                    # replicas catch up, and says for how long.
+                    if j.get("error", {}).get("code") != "maxlag":
+                        return j
+                    delay = max(delay, float(response.headers.get("Retry-After", 5)))
+                elif response.status_code not in _RETRYABLE_STATUS:
+                    raise Exception(
+                        f"thwiki returned {response.status_code} for {params.get('titles')!r}"
+                    )
+                if attempt == MAX_RETRIES - 1:
+                    raise Exception(
+                        f"thwiki still returning {response.status_code} after {MAX_RETRIES} tries"
+                    )
+            await asyncio.sleep(delay)
+            delay *= 2
+
+    async def fetch_batch(self, titles: List[str]) -> Dict[str, dict]:
+        """
+        Page source for up to BATCH_TITLES titles in one query (plus any
+        continuations), keyed by the title as requested.
+        """
+        params = {
+            "action": "query",
+            "prop": "revisions",
+            "rvprop": "content",
+            "format": "json",
+            "utf8": "1",
+            "redirects": "1",
+            "maxlag": "5",
+            "titles": "|".join(titles),
+        }
+
+        pages: Dict[str, tuple] = {}
+        normalized: Dict[str, str] = {}
+        redirects: Dict[str, dict] = {}
+        async with self._slots:
+            while True:
+                j = await self._get(params)
+                query = j.get("query", {})
+                for n in query.get("normalized", []):
+                    normalized[n["from"]] = n["to"]
+                for r in query.get("redirects", []):
+                    redirects[r["from"]] = r
+                for page_id, page in query.get("pages", {}).items():
+                    # A continuation repeats pages whose content did not fit
+                    # in the previous response; keep whichever has it.
+                    known = pages.get(page["title"])
+                    if known is None or "revisions" not in known[1]:
+                        pages[page["title"]] = (page_id, page)
+
+                # Responses are size-capped, so a batch of long pages comes
+                # back in parts.
+                if "continue" not in j:
+                    break
+                params = dict(params, **j["continue"])
+
+        results = {}
+        for title in titles:
+            final, hops = _resolve(title, normalized, redirects)
+            if final not in pages:
+                continue
+            page_id, page = pages[final]
+            query = {"pages": {page_id: page}}
+            if hops:
+                query["redirects"] = hops
+            results[title] = {"query": query}
+        return results
+
+    async def fetch_many(self, titles: Iterable[str]) -> Dict[str, dict]:
+        # Duplicates would waste a slot in a batch and come back once anyway.
+        unique = list(dict.fromkeys(titles))
+        batches = await asyncio.gather(
+            *(self.fetch_batch(chunk) for chunk in _chunks(unique, BATCH_TITLES)),
+            return_exceptions=True,
+        )
+        results: Dict[str, dict] = {}
+        for batch in batches:
+            if isinstance(batch, BaseException):
+                # Titles from a failed batch are simply absent; the scraper's
+                # own single-title fetch picks them up.
+                print(f"thwiki batch failed: {batch!r}")
+                continue
+            results.update(batch)
+        return results
+
+
+def fetch_pages(titles: Iterable[str], **kwargs) -> Dict[str, dict]:
+    """Blocking entry point for the (synchronous) scrapers."""
+
+    async def run():
+        async with ThwikiClient(**kwargs) as client:
+            return await client.fetch_many(titles)
+
+    return asyncio.run(run())
+
+
+def page_of(response: dict) -> Optional[dict]:
+    """The single page in a per-title response."""
+    pages = response.get("query", {}).get("pages", {})
+    return next(iter(pages.values()), None)
@@ -10,6 +10,7 @@ import mwparserfromhell as mw
 from ExternalInfo.CacheInfoProvider.Cache import cached
 from ExternalInfo.CacheInfoProvider.AdvancedCache import advanced_cache
 import ExternalInfo.ThwikiInfoProvider.cache.path_definitions as CachePathDef
+from ExternalInfo.ThwikiInfoProvider.Shared import ThwikiClient
 
 from Shared import utils
 song_wiki_page_cache_path = utils.get_output_path(
@@ -95,7 +96,13 @@ def query_keywords(query, cache_id, cache_path) -> Optional[dict]:
 
     return __query_keywords(query)
 
-def get_thwiki_source_raw_resp(page_title, cache_id, cache_path) -> Optional[Dict]:
+# Responses fetched ahead in batches by prefetch_thwiki_sources, keyed by
+# (cache_id, page_title). The next cache miss for that title takes its response
+# from here instead of the network, so it is cached exactly as before.
+_prefetched: Dict[tuple, Dict] = {}
+
+
+def __thwiki_source_fetcher(cache_id, cache_path):
     @advanced_cache(
         cache_id=cache_id,
         cache_dir=cache_path,
@@ -105,6 +112,10 @@ def get_thwiki_source_raw_resp(page_title, cache_id, cache_path) -> Optional[Dic
         restore=True,
     )
     def __get_thwiki_source(page_title):
+        prefetched = _prefetched.pop((cache_id, page_title), None)
+        if prefetched is not None:
+            return prefetched
+
         PAGE_SRC_URL = "https://thwiki.cc/api.php?action=query&prop=revisions&rvprop=content&format=json&titles={path}&utf8=1"
         HEADER = {
             "sec-ch-ua": '" Not A;Brand"lyrics_author;v="99", "Chromium";v="102", "Google Chrome";v="102"',
@@ -134,8 +145,28 @@ def get_thwiki_source_raw_resp(page_title, cache_id, cache_path) -> Optional[Dic
 
         j = response.json()
         return j
-    
-    return __get_thwiki_source(page_title)
+
+    return __get_thwiki_source
+
+
+def get_thwiki_source_raw_resp(page_title, cache_id, cache_path) -> Optional[Dict]:
+    return __thwiki_source_fetcher(cache_id, cache_path)(page_title)
+
+
+def prefetch_thwiki_sources(page_titles, cache_id, cache_path) -> int:
+    """
+    Fetch every title not yet cached in batches (ThwikiClient), ready for the
+    get_thwiki_source_* calls that follow. Returns how many were missing.
+
+    Redirects are resolved by the server, so a redirecting title is cached with
+    its target's source and the follow-redirects loop ends on its first step.
+    """
+    fetcher = __thwiki_source_fetcher(cache_id, cache_path)
+    missing = fetcher.missing(page_titles)
+    if missing:
+        for title, response in ThwikiClient.fetch_pages(missing).items():
+            _prefetched[(cache_id, title)] = response
+    return len(missing)
 
 
 def get_thwiki_source_follow_redircts(page_title, cache_id, cache_path) -> Optional[Dict]:
@@ -1,10 +1,12 @@
 import json
 import os
 import unicodedata
-from typing import Dict, Union
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Tuple, Union
 
 import numpy as np
-from fuzzywuzzy import fuzz
+from rapidfuzz import fuzz, process
 from scipy.optimize import linear_sum_assignment
 
 import ExternalInfo.ThwikiInfoProvider.output.path_definitions as ThwikiOutput
@@ -31,6 +33,12 @@ score_debug_output_path = utils.get_output_path(
     ThwikiOutput, ThwikiOutput.THWIKI_ALBUM_FORMAT_SCORE_DEBUG_OUTPUT
 )
 
+# Albums are scored in worker processes (see score_album): the score matrix and
+# the assignment are pure CPU on plain strings, and ~15k albums went one after
+# another. One core is left for the parent, which holds the peewee rows and
+# assembles the results.
+MATCH_WORKERS = max(1, (os.cpu_count() or 4) - 1)
+
 non_offical_works = {
     "地灵殿PH音乐名",
     "东方夏夜祭音乐名",
@@ -120,11 +128,69 @@ def collect_tracks(entry):
     return all_tracks
 
 
-def match_src_thw_tracks_fuzzy(src_tracks, thc_tracks) -> Union[Dict[str, dict], None]:
+def load_thwiki_tracks() -> Dict[str, List[Tuple[Track, str]]]:
+    """
+    Every thwiki track with its normalised title, grouped by album id.
+
+    One query instead of one per album, and each title is normalised once; it
+    used to be normalised twice per album, once for the title map and once
+    for the score matrix.
+    """
+    grouped = defaultdict(list)
+    # Table order, which is the order the per-album query returned them in, so
+    # the assignment breaks ties the same way.
+    for track in Track.select():
+        grouped[track.album_id].append(
+            (track, normalize_text(json.loads(track.title_jp)[0]))
+        )
+    return grouped
+
 
-    title_map = {
-        normalize_text(json.loads(track.title_jp)[0]): track for track in thc_tracks
-    }
+def score_matrix(src_normalized: List[str], thw_normalized: List[str]) -> np.ndarray:
+    """fuzz.ratio of every src title against every thwiki title, as integers."""
+    # rapidfuzz's ratio is the same indel similarity fuzzywuzzy computed with
+    # python-Levenshtein; fuzzywuzzy then rounded half to even, as np.rint does.
+    # An integer dtype here would truncate instead.
+    return np.rint(
+        process.cdist(src_normalized, thw_normalized, scorer=fuzz.ratio, dtype=np.float64)
+    ).astype(np.int64)
+
+
+def score_album(job):
+    """
+    Optimal src -> thwiki title assignment for one album. Runs in a worker
+    process, so it takes and returns plain values only.
+    """
+    # Maximize the sum of the scores of the thwiki track titles and the src track titles
+    # Hint: This is a variant of the assignment problem
+    # https://en.wikipedia.org/wiki/Assignment_problem
+    album_id, src_normalized, thw_normalized = job
+    scores = score_matrix(src_normalized, thw_normalized)
+    # Negated because the Hungarian algorithm minimizes cost
+    row_ind, col_ind = linear_sum_assignment(-scores)
+    return album_id, row_ind, col_ind, scores[row_ind, col_ind]
+
+
+def calc_optimal_name_mapping(
+    src_track_titles: list, thw_tracks: List[Tuple[Track, str]], assignment
+) -> Dict[str, dict]:
+    _, row_ind, col_ind, scores = assignment
+
+    # Retrieve the matches
+    best_matches = {}
+    for src_idx, thw_idx, score in zip(row_ind, col_ind, scores):
+        thw_track, _ = thw_tracks[thw_idx]
+        best_matches[src_track_titles[src_idx]] = {
+            "matched_with": thw_track,
+            "score": score,
+        }
+
+    return best_matches
+
+
+def match_src_thw_tracks_fuzzy(
+    src_tracks, thc_tracks: List[Tuple[Track, str]], assignment, debug_out
+) -> Union[Dict[str, dict], None]:
 
     title_to_id = {
         track["TrackMetadata"]["title"]: track["TrackMetadata"]["TrackId"]
@@ -135,13 +201,12 @@ def match_src_thw_tracks_fuzzy(src_tracks, thc_tracks) -> Union[Dict[str, dict],
         [normalize_text(track["TrackMetadata"]["title"]) for track in src_tracks]
     )
 
-    if len(src_tracks) == 0 or len(thc_tracks) == 0:
-        return None
-
-    album_key = thc_tracks[0].album_id
+    album_key = thc_tracks[0][0].album_id
 
     mapped_entry = calc_optimal_name_mapping(
-        [track["TrackMetadata"]["title"] for track in src_tracks], thc_tracks
+        [track["TrackMetadata"]["title"] for track in src_tracks],
+        thc_tracks,
+        assignment,
     )
 
     sum_score = sum([entry["score"] for entry in mapped_entry.values()])
@@ -152,13 +217,11 @@ def match_src_thw_tracks_fuzzy(src_tracks, thc_tracks) -> Union[Dict[str, dict],
         "src_track_len": len(src_tracks),
         "thc_track_len": len(thc_tracks),
         "total_potential": total_potential,
-        "actual_score": sum_score.item(),
-        "score_ratio": (sum_score / total_potential).item(),
+        "actual_score": int(sum_score),
+        "score_ratio": float(sum_score / total_potential),
     }
 
-    utils.append_file(
-        score_debug_output_path, json.dumps(debug_info, ensure_ascii=False) + "\n"
-    )
+    debug_out.write(json.dumps(debug_info, ensure_ascii=False) + "\n")
 
     if sum_score < total_potential * 0.8:
         return None
@@ -171,43 +234,6 @@ def match_src_thw_tracks_fuzzy(src_tracks, thc_tracks) -> Union[Dict[str, dict],
     return result
 
 
-def calc_optimal_name_mapping(
-    src_track_titles: list, thw_tracks: list
-) -> Dict[str, dict]:
-    # Maximize the sum of the scores of the thwiki track titles and the src track titles
-    # Hint: This is a variant of the assignment problem
-    # https://en.wikipedia.org/wiki/Assignment_problem
-    src_normalized_list = [(track, normalize_text(track)) for track in src_track_titles]
-
-    thw_normalized_list = [
-        (track, normalize_text(json.loads(track.title_jp)[0])) for track in thw_tracks
-    ]
-
-    # Create a cost matrix using negative scores because the Hungarian algorithm minimizes cost
-    cost_matrix = -np.array(
-        [
-            [
-                fuzz.ratio(src_normalized, thw_normalized)
-                for _, thw_normalized in thw_normalized_list
-            ]
-            for _, src_normalized in src_normalized_list
-        ]
-    )
-
-    # Solve the assignment problem
-    row_ind, col_ind = linear_sum_assignment(cost_matrix)
-
-    # Retrieve the matches
-    best_matches = {}
-    for src_idx, thw_idx in zip(row_ind, col_ind):
-        src_track, _ = src_normalized_list[src_idx]
-        thw_track, _ = thw_normalized_list[thw_idx]
-        score = -cost_matrix[src_idx, thw_idx]  # Convert back to positive score
-        best_matches[src_track] = {"matched_with": thw_track, "score": score}
-
-    return best_matches
-
-
 def generate_track_formatted(mapped_tracks, abbriv_map: Dict[str, str]):
     track: Track
 
@@ -259,43 +285,75 @@ def main():
 
     abbriv_map = load_original_song_map()
 
+    thc_albums = {album.album_id: album for album in Album.select()}
+    thc_tracks = load_thwiki_tracks()
+
     matched_total = 0
     no_match_total = 0
     coll_trk_fmt = {}
     coll_alb_fmt = {}
+
+    def report_no_match(album_id):
+        print(
+            "[{}/{} | {}] Album {} no match".format(
+                matched_total, len(id_assignment), no_match_total, album_id
+            ),
+            end="\r",
+        )
+
+    src_tracks = {}
+    jobs = []
     for id, entry in id_assignment.items():
         album_id = id
 
-        thc_album = Album.get_or_none(Album.album_id == album_id)
-        if thc_album is None:
+        if album_id not in thc_albums:
             print("Album {} not found".format(album_id), end="\r")
             continue
 
-        src_tracks = collect_tracks(entry)
-        thc_tracks = list(Track.select().where(Track.album == thc_album))
-
-        mapped_tracks = match_src_thw_tracks_fuzzy(src_tracks, thc_tracks)
-        if mapped_tracks is None:
+        src_tracks[album_id] = collect_tracks(entry)
+        if not src_tracks[album_id] or not thc_tracks.get(album_id):
             no_match_total += 1
-            print(
-                "[{}/{} | {}] Album {} no match".format(
-                    matched_total, len(id_assignment), no_match_total, album_id
-                ),
-                end="\r",
-            )
+            report_no_match(album_id)
             continue
-        else:
-            print(
-                "[{}/{} | {}] Album {} matched".format(
-                    matched_total, len(id_assignment), no_match_total, album_id
-                ),
-                end="\r",
+
+        jobs.append(
+            (
+                album_id,
+                [
+                    normalize_text(track["TrackMetadata"]["title"])
+                    for track in src_tracks[album_id]
+                ],
+                [normalized for _, normalized in thc_tracks[album_id]],
+            )
+        )
+
+    # One buffered handle for the whole run rather than an open/append/close
+    # per album.
+    with open(score_debug_output_path, "a", encoding="utf-8", buffering=1 << 20) as debug_out, \
+            ProcessPoolExecutor(max_workers=MATCH_WORKERS) as executor:
+        # Albums are a few dozen titles each: batch them so a worker round
+        # trip carries more than one matrix.
+        for assignment in executor.map(score_album, jobs, chunksize=64):
+            album_id = assignment[0]
+            mapped_tracks = match_src_thw_tracks_fuzzy(
+                src_tracks[album_id], thc_tracks[album_id], assignment, debug_out
             )
-            matched_total += 1
-            trk_fmt = generate_track_formatted(mapped_tracks, abbriv_map)
-            alb_fmt = generate_album_formatted(thc_album, album_id)
-            coll_trk_fmt.update(trk_fmt)
-            coll_alb_fmt[album_id] = alb_fmt
+            if mapped_tracks is None:
+                no_match_total += 1
+                report_no_match(album_id)
+                continue
+            else:
+                print(
+                    "[{}/{} | {}] Album {} matched".format(
+                        matched_total, len(id_assignment), no_match_total, album_id
+                    ),
+                    end="\r",
+                )
+                matched_total += 1
+                trk_fmt = generate_track_formatted(mapped_tracks, abbriv_map)
+                alb_fmt = generate_album_formatted(thc_albums[album_id], album_id)
+                coll_trk_fmt.update(trk_fmt)
+                coll_alb_fmt[album_id] = alb_fmt
 
     with open(track_formatted_output_path, "w", encoding="utf-8") as f:
         json.dump(coll_trk_fmt, f, indent=4, ensure_ascii=False)
@@ -1,9 +1,18 @@
+import os
+
+import ExternalInfo.ThwikiInfoProvider.cache.path_definitions as CachePathDef
 from ExternalInfo.CacheInfoProvider.Cache import get_cache_id
-from ExternalInfo.CacheInfoProvider.Model.CacheModel import (
-    SourceCacheTable,
-)
+from ExternalInfo.CacheInfoProvider.PageStore import get_store
+from Shared import utils
 
 if __name__ == "__main__":
+    store = get_store()
+    # Loose files from before the page store would be restored on the next
+    # miss, so they go too.
+    legacy_dir = utils.get_output_path(
+        CachePathDef, CachePathDef.THWIKI_SONG_INFO_WIKI_PAGE_CACHE_DIR
+    )
+
     print("Enter list of cache id in form of URL to purge:")
 
     cache_ids = []
@@ -13,14 +22,12 @@ if __name__ == "__main__":
             break
         cache_ids.append(cache_id)
 
-    to_delete = []
-    not_found = []
-    for cache_id in cache_ids:
-        path_id = get_cache_id(cache_id, "thc")
-        if SourceCacheTable.select().where(SourceCacheTable.path == path_id).exists():
-            to_delete.append(path_id)
-        else:
-            not_found.append(path_id)
+    path_ids = [get_cache_id(cache_id, "thc") for cache_id in cache_ids]
+    present = store.present(path_ids)
+    to_delete = [
+        p for p in path_ids if p in present or os.path.exists(os.path.join(legacy_dir, p))
+    ]
+    not_found = [p for p in path_ids if p not in to_delete]
 
     print("Found " + str(len(to_delete)) + " cache entries to delete.")
     print("Not Found " + str(len(not_found)))
@@ -31,9 +38,8 @@ if __name__ == "__main__":
     print("Proceed? (y/n)")
     if input() == "y":
         for path_id in to_delete:
-            SourceCacheTable.delete().where(SourceCacheTable.path == path_id).execute()
+            store.delete(path_id)
+            legacy_path = os.path.join(legacy_dir, path_id)
+            if os.path.exists(legacy_path):
+                os.remove(legacy_path)
             print("Purged " + path_id)
-
-        # if (SourceCacheTable.select().where(SourceCacheTable.path == path_id).exists()):
-        #     SourceCacheTable.delete().where(SourceCacheTable.path == path_id).execute()
-        #     print("Purged " + cache_id)
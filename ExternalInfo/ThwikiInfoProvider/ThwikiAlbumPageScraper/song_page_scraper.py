@@ -2,7 +2,7 @@ import json
 import re
 import uuid
 from typing import Any, Dict, List
-from urllib.parse import quote, urlparse
+from urllib.parse import quote, unquote, urlparse
 
 import httpx
 import mwparserfromhell as mw
@@ -11,6 +11,7 @@ from mwparserfromhell.wikicode import Wikicode
 
 import ExternalInfo.ThwikiInfoProvider.cache.path_definitions as CachePathDef
 from ExternalInfo.CacheInfoProvider.Cache import cached
+from ExternalInfo.ThwikiInfoProvider.Shared import ThwikiClient
 from ExternalInfo.ThwikiInfoProvider.ThwikiAlbumPageQueryScraper.Model.QueryModel import (
     QueryData,
 )
@@ -112,6 +113,23 @@ class ThWikiCc:
     # parsed the redirect stub, found no infobox, and marked the album FAILED.
     REDIRECT_SCAN = re.compile(r"#(?:redirect|重定向)\s*\[\[(.+?)\]\]", re.IGNORECASE)
 
+    # Responses fetched ahead in batches by prefetch(), keyed by url. The next
+    # cache miss for that url takes its response from here instead of the
+    # network, so it is cached exactly as before.
+    _prefetched: Dict[str, dict] = {}
+
+    @staticmethod
+    def prefetch(urls) -> int:
+        """Batch-fetch the uncached pages among `urls`; returns how many were missing."""
+        missing = ThWikiCc.get_source.missing(urls)
+        titles = {url: unquote(ThWikiCc.get_title_from_url(url)) for url in missing}
+        if titles:
+            fetched = ThwikiClient.fetch_pages(titles.values())
+            for url, title in titles.items():
+                if title in fetched:
+                    ThWikiCc._prefetched[url] = fetched[title]
+        return len(missing)
+
     @staticmethod
     @cached(
         cache_id="thc",
@@ -120,17 +138,23 @@ class ThWikiCc:
     )
     def get_source(url):
         title = ThWikiCc.get_title_from_url(url)
+        # Prefetched pages had their redirects resolved by the server, so the
+        # loop below finishes on its first pass for them.
+        prefetched = ThWikiCc._prefetched.pop(url, None)
         for _ in range(3):
-            api_url = ThWikiCc.PAGE_SRC_URL.format(path=title)
-            response = httpx.get(api_url, headers=ThWikiCc.HEADER)
-            if response.status_code != 200:
-                raise Exception(
-                    "Failed to get page source for {path}. Error: {code}".format(
-                        path=api_url, code=response.status_code
+            if prefetched is not None:
+                j, prefetched = prefetched, None
+            else:
+                api_url = ThWikiCc.PAGE_SRC_URL.format(path=title)
+                response = httpx.get(api_url, headers=ThWikiCc.HEADER)
+                if response.status_code != 200:
+                    raise Exception(
+                        "Failed to get page source for {path}. Error: {code}".format(
+                            path=api_url, code=response.status_code
+                        )
                     )
-                )
 
-            j = response.json()
+                j = response.json()
             page = list(j["query"]["pages"].values())[0]
             if "revisions" not in page:
                 # Distinct message so mistagged.txt separates dead links from
@@ -409,13 +433,23 @@ def process_album(album: Album):
         SaleSource.bulk_create(created_sellers)
 
 
+# Albums per prefetch round: bounds how many page sources sit in memory waiting
+# for their turn, at 20 API requests a round.
+PREFETCH_CHUNK = 1000
+
+
 def process():
-    total = Album.select().where(Album.process_status == ProcessStatus.PENDING).count()
+    pending = list(Album.select().where(Album.process_status == ProcessStatus.PENDING))
+    total = len(pending)
     current = 0
-    for album in Album.select().where(Album.process_status == ProcessStatus.PENDING):
-        current += 1
-        print(f"[{current}/{total}] Processing {album.album_id}")
-        process_album(album)
+    for i in range(0, total, PREFETCH_CHUNK):
+        chunk = pending[i : i + PREFETCH_CHUNK]
+        missing = ThWikiCc.prefetch(album.data_source for album in chunk)
+        print(f"Prefetched {missing} uncached pages for albums {i}-{i + len(chunk)}")
+        for album in chunk:
+            current += 1
+            print(f"[{current}/{total}] Processing {album.album_id}")
+            process_album(album)
 
 
 if __name__ == "__main__":
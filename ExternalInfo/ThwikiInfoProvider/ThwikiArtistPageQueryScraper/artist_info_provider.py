@@ -190,9 +190,21 @@ def __proc_page(raw_src: set) -> Optional[dict]:
 
 def process_page() -> None:
     circle: CircleData
-    for idx, circle in enumerate(CircleData.select().where(CircleData.circle_query_status == QueryStatus.QUERY_RESULT_FOUND)):
+    pending = list(CircleData.select().where(CircleData.circle_query_status == QueryStatus.QUERY_RESULT_FOUND))
+    titles = {
+        circle.circle_remote_id: ThwikiUtils.extract_title_from_url(circle.circle_wiki_url)
+        for circle in pending
+    }
+
+    # Fetch the uncached pages 50 to a request before walking them one by one.
+    missing = ThwikiUtils.prefetch_thwiki_sources(
+        titles.values(), "thwiki_artist1_info_cache", artist_info_page_cache_path
+    )
+    print(f"Prefetched {missing} of {len(titles)} circle pages")
+
+    for idx, circle in enumerate(pending):
         result = ThwikiUtils.get_thwiki_page_content_after_redirects(
-            ThwikiUtils.extract_title_from_url(circle.circle_wiki_url), 
+            titles[circle.circle_remote_id],
             "thwiki_artist1_info_cache", 
             artist_info_page_cache_path
         )
@@ -22,7 +22,7 @@ import mwparserfromhell as mw
 from mwparserfromhell.nodes.template import Template
 from mwparserfromhell.wikicode import Wikicode
 from ExternalInfo.CacheInfoProvider.Cache import cached
-from ExternalInfo.ThwikiInfoProvider.Shared import ThwikiUtils
+from ExternalInfo.ThwikiInfoProvider.Shared import ThwikiClient, ThwikiUtils
 
 album_formatted_output_path = utils.get_output_path(
     ThwikiOutput, ThwikiOutput.THWIKI_ALBUM_FORMAT_RESULT_OUTPUT
@@ -119,6 +119,16 @@ def follow_redirect(src) -> Optional[str]:
     return redirect_link.title
 
 
+# Responses fetched ahead in batches by prefetch_page_sources, keyed by title.
+# The next cache miss for that title takes its response from here instead of the
+# network, so it is cached exactly as before.
+_prefetched: Dict[str, dict] = {}
+
+# Entries per prefetch round: bounds how many page sources sit in memory waiting
+# for their turn, at 20 API requests a round.
+PREFETCH_CHUNK = 1000
+
+
 @cached(
     "lyric_page_src",
     lyrics_wiki_page_cache_path,
@@ -127,6 +137,10 @@ def follow_redirect(src) -> Optional[str]:
     restore=True,
 )
 def get_page_source(page_title) -> Optional[str]:
+    prefetched = _prefetched.pop(page_title, None)
+    if prefetched is not None:
+        return json.dumps(prefetched, ensure_ascii=False, indent=4)
+
     PAGE_SRC_URL = "https://thwiki.cc/api.php?action=query&prop=revisions&rvprop=content&format=json&titles={path}&utf8=1"
     HEADER = {
         "sec-ch-ua": '" Not A;Brand"lyrics_author;v="99", "Chromium";v="102", "Google Chrome";v="102"',
@@ -155,6 +169,25 @@ def get_page_source(page_title) -> Optional[str]:
     j = response.json()
     return json.dumps(j, ensure_ascii=False, indent=4)
 
+def prefetch_page_sources(page_titles) -> int:
+    """Batch-fetch the uncached titles (ThwikiClient); returns how many were missing."""
+    missing = get_page_source.missing(page_titles)
+    if missing:
+        _prefetched.update(ThwikiClient.fetch_pages(missing))
+    return len(missing)
+
+
+def get_redirect_target(quersrc: str) -> Optional[str]:
+    """Title the server resolved a redirect to, for batch-fetched sources."""
+    if not quersrc:
+        return None
+    j = json.loads(quersrc)
+    if not j["query"].get("redirects"):
+        return None
+    page = list(j["query"]["pages"].values())[0]
+    return page.get("title")
+
+
 def get_wiki_page_source(quersrc: str) -> Optional[str]:
     if not quersrc:
         return None
@@ -332,7 +365,15 @@ def get_lyrics_metadata(data: Wikicode) -> Optional[Dict[str, str]]:
 def process_one(entry: LyricsInfo):
     page_title = entry.wiki_page_title_constructed if entry.wiki_page_title_actual is None else entry.wiki_page_title_actual
 
-    src = get_wiki_page_source(get_page_source(page_title))
+    quersrc = get_page_source(page_title)
+    src = get_wiki_page_source(quersrc)
+
+    # Batch-fetched sources already hold the redirect target's page; record
+    # where it led and carry on instead of waiting for the next run.
+    resolved = get_redirect_target(quersrc)
+    if resolved is not None:
+        entry.wiki_page_title_actual = resolved
+
     if src is None:
         entry.process_status = LyricsProcessingStatus.NO_LYRICS_FOUND
         entry.save()
@@ -361,20 +402,30 @@ def process_one(entry: LyricsInfo):
 
 
 def process():
-    total = LyricsInfo.select().where(LyricsInfo.process_status == LyricsProcessingStatus.PENDING).count()
+    entries = list(
+        LyricsInfo.select().where(
+            LyricsInfo.process_status == LyricsProcessingStatus.PENDING
+        )
+    )
+    total = len(entries)
     current = 0
     pending: LyricsInfo
-    for pending in LyricsInfo.select().where(
-        LyricsInfo.process_status == LyricsProcessingStatus.PENDING
-    ):
-        current += 1
-        print(f"Processing {current}/{total}")
-        try:
-            process_one(pending)
-        except Exception as e:
-            print(f"Failed to process {pending.track_id}. Error: {e}")
-            pending.process_status = LyricsProcessingStatus.FAILED
-            pending.save()
+    for i in range(0, total, PREFETCH_CHUNK):
+        chunk = entries[i : i + PREFETCH_CHUNK]
+        missing = prefetch_page_sources(
+            e.wiki_page_title_constructed if e.wiki_page_title_actual is None else e.wiki_page_title_actual
+            for e in chunk
+        )
+        print(f"Prefetched {missing} uncached pages for entries {i}-{i + len(chunk)}")
+        for pending in chunk:
+            current += 1
+            print(f"Processing {current}/{total}")
+            try:
+                process_one(pending)
+            except Exception as e:
+                print(f"Failed to process {pending.track_id}. Error: {e}")
+                pending.process_status = LyricsProcessingStatus.FAILED
+                pending.save()
 
 def main():
     if LyricsInfo.select().count() == 0:
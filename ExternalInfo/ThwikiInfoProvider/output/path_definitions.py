@@ -1,3 +1,4 @@
 THWIKI_ALBUM_FORMAT_SCORE_DEBUG_OUTPUT = "album_format_score_debug.output.json"
 THWIKI_ALBUM_FORMAT_RESULT_OUTPUT = "album_format_result.output.json"
 THWIKI_TRACK_FORMAT_RESULT_OUTPUT = "track_format_result.output.json"
+THWIKI_PUSH_LEDGER_OUTPUT = "push_ledger.sqlite3"
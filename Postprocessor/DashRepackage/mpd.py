@@ -0,0 +1,108 @@
+"""
+Renders a track's DASH manifest from its parsed HLS variant playlists.
+
+Shared by dash-repackage.py, which reads the playlists itself, and
+hls_finalizer.py, which already has them parsed while it writes the HLS master
+playlist -- so a newly finalized track gets its manifest.mpd in the same pass,
+with no second walk of the tree.
+
+Both layouts map onto SegmentList:
+
+  single_file  Initialization and every SegmentURL point into the one media
+               file with a byte range, straight from EXT-X-MAP and
+               EXT-X-BYTERANGE.
+  segments     Initialization is init.mp4 and each SegmentURL names its own
+               segment file, in playlist order.
+
+SegmentBase/indexRange would be more compact for single_file, but it needs one
+sidx indexing the whole stream. ffmpeg's HLS muxer writes an sidx per fragment,
+each covering only its own moof, so a player reading the first one would see a
+ten-second track.
+"""
+
+import os
+from datetime import timedelta
+from typing import List
+from xml.dom import minidom
+from xml.etree.ElementTree import Element, SubElement, tostring
+
+from Postprocessor.HlsTranscode.hls_playlist import Playlist
+
+MPD_NAME = "manifest.mpd"
+
+TIMESCALE = 48000
+
+
+def seconds_to_iso_duration(seconds: float) -> str:
+    """Converts seconds to ISO 8601 duration format (e.g., PT60S)."""
+    td = timedelta(seconds=seconds)
+    total_seconds = int(td.total_seconds())
+    return f"PT{total_seconds}S"
+
+
+def _range(byterange) -> str:
+    # HLS (offset, length) -> DASH inclusive "first-last".
+    offset, length = byterange
+    return f"{offset}-{offset + length - 1}"
+
+
+def representation(bandwidth: int, variant_dir: str, mpd_dir: str, playlist: Playlist) -> dict:
+    return {
+        "bandwidth": bandwidth,
+        # As dash-repackage.py has always written it; the backend resolves
+        # BaseURL with the hls/ level dropped.
+        "base_url": (os.path.relpath(variant_dir, start=mpd_dir) + "/").replace("hls/", ""),
+        "playlist": playlist,
+    }
+
+
+def render(representations: List[dict]) -> str:
+    mpd_duration = seconds_to_iso_duration(
+        max((r["playlist"].duration for r in representations), default=0.0)
+    )
+
+    mpd = Element("MPD", xmlns="urn:mpeg:dash:schema:mpd:2011",
+                  profiles="urn:mpeg:dash:profile:isoff-on-demand:2011",
+                  type="static", minBufferTime="PT1.5S",
+                  mediaPresentationDuration=mpd_duration)
+
+    period = SubElement(mpd, "Period", start="PT0S")
+    adaptation_set = SubElement(period, "AdaptationSet", mimeType="audio/mp4",
+                                codecs="mp4a.40.2", startWithSAP="1", segmentAlignment="true", lang="en")
+
+    for rep in representations:
+        playlist: Playlist = rep["playlist"]
+        element = SubElement(adaptation_set, "Representation",
+                             id=str(rep["bandwidth"]),
+                             bandwidth=str(rep["bandwidth"]))
+        SubElement(element, "BaseURL").text = rep["base_url"]
+
+        # Child order is fixed by the DASH schema: Initialization, then
+        # SegmentTimeline, then the SegmentURL list.
+        segment_list = SubElement(element, "SegmentList", timescale=str(TIMESCALE))
+        init = {"sourceURL": playlist.init_uri}
+        if playlist.init_byterange is not None:
+            init["range"] = _range(playlist.init_byterange)
+        SubElement(segment_list, "Initialization", **init)
+
+        segment_timeline = SubElement(segment_list, "SegmentTimeline")
+        for segment in playlist.segments:
+            SubElement(segment_timeline, "S",
+                       d=str(int(round(segment.duration * TIMESCALE))))
+
+        for segment in playlist.segments:
+            url = {"media": segment.uri}
+            if segment.byterange is not None:
+                url["mediaRange"] = _range(segment.byterange)
+            SubElement(segment_list, "SegmentURL", **url)
+
+    return minidom.parseString(tostring(mpd)).toprettyxml(indent="  ")
+
+
+def write(path: str, xml: str) -> None:
+    # Atomic: a player fetching the manifest mid-write would otherwise get a
+    # truncated document.
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(xml)
+    os.replace(tmp, path)
@@ -4,8 +4,13 @@ file-target.py discovers HLS roots by walking the library tree — hours of I/O
 that hls.finalized.output.json already paid for. This driver reads that manifest
 (track_dir + bitrates per track, single-file layout throughout the v6 tree),
 fans create_mpd out over a process pool, and writes has_dash=true back into the
-manifest for every track whose manifest.mpd now exists. Re-runs skip tracks
-whose .mpd is already on disk, so an interrupted pass just resumes.
+manifest for every track whose manifest.mpd now exists -- only those rows are
+rewritten in the manifest's store, then the JSON is re-exported. Re-runs skip
+tracks whose .mpd is already on disk, so an interrupted pass just resumes.
+
+hls_finalizer.py now writes manifest.mpd itself, from the playlists it has
+already parsed, and records has_dash=true as it goes; this pass is only needed
+once for a tree finalized before that, and finds nothing to do afterwards.
 
 The DB update afterwards is a single statement (every media-carrying track is in
 the finalizer manifest):
@@ -14,13 +19,12 @@ run it only when this script reports zero failures, otherwise flip per-key.
 """
 
 import importlib.util
-import json
 import os
 import sys
 from multiprocessing import Pool
 
 import Postprocessor.HlsTranscode.output.path_definitions as HlsOutputPathDef
-from Shared import utils
+from Shared import artifact_store, utils
 
 # dash-repackage.py has a hyphen in its name; load it by path.
 _spec = importlib.util.spec_from_file_location(
@@ -69,10 +73,9 @@ def process_one(project):
 
 
 def main():
-    with open(finalized_manifest_path, "r", encoding="utf-8") as f:
-        manifest = json.load(f)
+    manifest = artifact_store.open_store(finalized_manifest_path)
 
-    projects = [build_project(entry) for entry in manifest.values()]
+    projects = [build_project(entry) for _, entry in manifest.items()]
     print(f"{len(projects)} tracks to package ({WORKERS} workers)")
 
     ok = skipped = 0
@@ -94,12 +97,15 @@ def main():
                 print(f"[{i}/{len(projects)}] ok {ok}, resumed {skipped}, failed {len(failures)}", end="\r")
 
     print()
-    for entry in manifest.values():
-        if entry["track_dir"] in done_dirs:
-            entry["has_dash"] = True
-
-    with open(finalized_manifest_path, "w", encoding="utf-8") as f:
-        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    flipped = [
+        (src, dict(entry, has_dash=True))
+        for src, entry in manifest.items()
+        if entry["track_dir"] in done_dirs and not entry.get("has_dash")
+    ]
+    manifest.put_many(flipped)
+    manifest.export_json(finalized_manifest_path)
+    manifest.close()
+    print(f"has_dash set on {len(flipped)} manifest rows")
 
     print(f"Done: {ok} written, {skipped} already present, {len(failures)} failed.")
     if failures:
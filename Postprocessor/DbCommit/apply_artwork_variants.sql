@@ -1,5 +1,9 @@
 -- Applies generate_artwork_variants.py output. Run from the directory holding
--- the CSVs: psql "$CONN" -f apply_artwork_variants.sql
+-- it: psql "$CONN" -f apply_artwork_variants.sql
+--
+-- The files are binary COPY (.bin) by default; output written with
+-- TLMC_COPY_FORMAT=csv is loaded with -v csv=1 instead. Either way the temp
+-- tables below are the column types the generator wrote.
 --
 -- Conflict-safe for reruns: asset rows dedupe on (root, storage_key), and the
 -- ladder insert resolves asset ids through storage_key so a rerun with freshly
@@ -26,9 +30,15 @@ CREATE TEMP TABLE tmp_colors (
     colors     text[]
 ) ON COMMIT DROP;
 
+\if :{?csv}
 \copy tmp_variant_file FROM 'variant_files.csv' WITH CSV
 \copy tmp_variant FROM 'variants.csv' WITH CSV
 \copy tmp_colors FROM 'colors.csv' WITH CSV
+\else
+\copy tmp_variant_file FROM 'variant_files.bin' WITH (FORMAT binary)
+\copy tmp_variant FROM 'variants.bin' WITH (FORMAT binary)
+\copy tmp_colors FROM 'colors.bin' WITH (FORMAT binary)
+\endif
 
 INSERT INTO asset (id, root, storage_key, name, mime, byte_size)
 SELECT asset_id, 'library'::storage_root, storage_key, name, mime, byte_size
@@ -0,0 +1,30 @@
+-- Applies content_hash.py output. Run from the directory holding it:
+-- psql "$CONN" -f apply_content_hash.sql
+-- (binary COPY by default; -v csv=1 for output written with
+-- TLMC_COPY_FORMAT=csv).
+--
+-- Matched on storage_key within the library root. Rows in the file with no
+-- asset yet (HLS output the DB does not carry) match nothing; rerunning is
+-- harmless, and only rows whose hash changed are written.
+
+BEGIN;
+
+CREATE TEMP TABLE tmp_content_hash (
+    storage_key  text,
+    content_hash text
+) ON COMMIT DROP;
+
+\if :{?csv}
+\copy tmp_content_hash FROM 'content_hash.csv' WITH CSV
+\else
+\copy tmp_content_hash FROM 'content_hash.bin' WITH (FORMAT binary)
+\endif
+
+UPDATE asset a
+SET content_hash = h.content_hash
+FROM tmp_content_hash h
+WHERE a.root = 'library'::storage_root
+  AND a.storage_key = h.storage_key
+  AND a.content_hash IS DISTINCT FROM h.content_hash;
+
+COMMIT;
@@ -0,0 +1,45 @@
+-- Applies backfill_file_metadata.py output. Run from the directory holding
+-- it: psql "$CONN" -f apply_file_metadata.sql
+--
+-- The files are binary COPY (.bin) by default; output written with
+-- TLMC_COPY_FORMAT=csv is loaded with -v csv=1 instead. Either way the temp
+-- tables below are the column types the backfill wrote.
+--
+-- Durations match tracks on media_key and byte sizes match assets on id. A
+-- delta-restricted backfill only carries its albums' tracks and leaves every
+-- other row as it was; rerunning is harmless, and only changed rows are
+-- written.
+
+BEGIN;
+
+CREATE TEMP TABLE tmp_duration (
+    media_key        text,
+    duration_seconds float8
+) ON COMMIT DROP;
+
+CREATE TEMP TABLE tmp_byte_size (
+    asset_id  uuid,
+    byte_size int8
+) ON COMMIT DROP;
+
+\if :{?csv}
+\copy tmp_duration FROM 'durations.csv' WITH CSV
+\copy tmp_byte_size FROM 'byte_sizes.csv' WITH CSV
+\else
+\copy tmp_duration FROM 'durations.bin' WITH (FORMAT binary)
+\copy tmp_byte_size FROM 'byte_sizes.bin' WITH (FORMAT binary)
+\endif
+
+UPDATE track t
+SET duration = make_interval(secs => d.duration_seconds)
+FROM tmp_duration d
+WHERE t.media_key = d.media_key
+  AND t.duration IS DISTINCT FROM make_interval(secs => d.duration_seconds);
+
+UPDATE asset a
+SET byte_size = b.byte_size
+FROM tmp_byte_size b
+WHERE a.id = b.asset_id
+  AND a.byte_size IS DISTINCT FROM b.byte_size;
+
+COMMIT;
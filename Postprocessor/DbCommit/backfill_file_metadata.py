@@ -2,20 +2,25 @@
 
 The loader never had these: durations live in the FLAC STREAMINFO headers and
 byte sizes on the filesystem, neither of which PushToDb touches. This script
-produces two CSVs the DB update applies via temp table + UPDATE FROM:
+produces two COPY files (Shared/pg_copy.py: binary .bin, or .csv under
+TLMC_COPY_FORMAT=csv) that apply_file_metadata.sql loads into temp tables of
+exactly these types and applies with UPDATE FROM:
 
-  durations.csv   media_key,duration_seconds   (from FLAC headers, exact)
-  byte_sizes.csv  asset_id,byte_size           (stat over asset storage keys)
+  durations   media_key text, duration_seconds float8  (FLAC headers, exact)
+  byte_sizes  asset_id uuid, byte_size int8            (stat over storage keys)
 
 Durations are read from the source FLACs named by the hls finalizer manifest
 (track_dir -> media_key is a relpath from the library root), so exactly the
 media-carrying tracks get one — the 811 media-less tracks stay NULL, which is
-honest. Asset ids come in via assets.csv, exported from the DB first:
+honest. Where analysis_pass.py's samples sink has decoded a track, its exact
+sample count is used instead and the file is not opened.
+
+Asset ids come in via assets.csv, exported from the DB first:
 
   COPY (SELECT id, storage_key FROM asset) TO STDOUT WITH CSV
 
 content_hash is deliberately NOT here: it needs a full read of every byte in
-the library, which is a planned pass of its own, not a side effect.
+the library, which is content_hash.py's pass, not a side effect of this one.
 """
 
 import csv
@@ -26,8 +31,8 @@ from multiprocessing import Pool
 import mutagen
 
 import Postprocessor.HlsTranscode.output.path_definitions as HlsOutputPathDef
-from Shared import utils
-from Shared.json_utils import json_load
+from Preprocessor.AudioNormalizer import analysis_pass
+from Shared import artifact_store, delta_worklist, pg_copy, probe_cache, utils
 
 LIBRARY_ROOT = "/mnt/tlmc/TLMC v6"
 WORKERS = 12
@@ -57,12 +62,18 @@ def _streaminfo_duration(path):
 
 
 def read_duration(item):
-    audio_path, media_key = item
+    audio_path, media_key, decoded = item
+    if decoded is not None:
+        return (media_key, decoded, None)
     try:
         return (media_key, _streaminfo_duration(audio_path), None)
     except Exception:
-        # Not (plain) FLAC: the library carries m4a/mp3/wav strays too, and
-        # mutagen.File dispatches on the actual container.
+        # Not (plain) FLAC: the library carries m4a/mp3/wav strays too. The
+        # info scanners will usually have probed them into the shared cache;
+        # otherwise mutagen.File dispatches on the actual container.
+        cached = probe_cache.cached(audio_path)
+        if cached is not None and cached.get("format", {}).get("duration"):
+            return (media_key, float(cached["format"]["duration"]), None)
         try:
             audio = mutagen.File(audio_path)
             if audio is None or not audio.info.length:
@@ -80,11 +91,10 @@ def stat_size(item):
         return (asset_id, None, f"{type(e).__name__}: {e}")
 
 
-def run(items, worker, out_path, label):
+def run(items, worker, out_dir, label, types):
     ok = 0
     failures = []
-    with open(out_path, "w", encoding="utf-8", newline="") as f:
-        writer = csv.writer(f)
+    with pg_copy.open_writer(label, types, out_dir) as writer:
         with Pool(WORKERS) as pool:
             for i, (key, value, err) in enumerate(
                 pool.imap_unordered(worker, items, chunksize=256), 1
@@ -108,12 +118,27 @@ def run(items, worker, out_path, label):
 def main():
     out_dir = sys.argv[1] if len(sys.argv) > 1 else "."
 
-    manifest = json_load(finalized_manifest_path)
-    duration_items = [
-        (flac_path, os.path.relpath(entry["track_dir"], LIBRARY_ROOT))
-        for flac_path, entry in manifest.items()
-    ]
-    run(duration_items, read_duration, os.path.join(out_dir, "durations.csv"), "durations")
+    # Only track_dir is needed per row; stream the manifest rather than hold
+    # the whole thing next to the (path, dir) pairs built from it.
+    # Sample counts from analysis_pass.py's decode are exact where a header
+    # can be wrong (a truncated rip still claims its full length), and need
+    # no open of the file at all.
+    decoded = analysis_pass.load_durations()
+    manifest = artifact_store.open_store(finalized_manifest_path)
+    duration_items = delta_worklist.restrict(
+        (
+            (
+                flac_path,
+                os.path.relpath(entry["track_dir"], LIBRARY_ROOT),
+                decoded.get(flac_path),
+            )
+            for flac_path, entry in manifest.items()
+        ),
+        lambda item: item[0],
+    )
+    manifest.close()
+    print(f"{sum(item[2] is not None for item in duration_items)} durations from the analysis pass")
+    run(duration_items, read_duration, out_dir, "durations", ("text", "float8"))
 
     assets_csv = os.path.join(out_dir, "assets.csv")
     if not os.path.exists(assets_csv):
@@ -123,7 +148,10 @@ def main():
 
     with open(assets_csv, encoding="utf-8", newline="") as f:
         asset_items = [tuple(row) for row in csv.reader(f)]
-    run(asset_items, stat_size, os.path.join(out_dir, "byte_sizes.csv"), "byte_sizes")
+    run(asset_items, stat_size, out_dir, "byte_sizes", ("uuid", "int8"))
+
+    csv_flag = "-v csv=1 " if pg_copy.FORMAT == pg_copy.FORMAT_CSV else ""
+    print(f"apply with: psql {csv_flag}-f apply_file_metadata.sql (from {out_dir})")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,143 @@
+"""Computes asset content hashes for the v6 database.
+
+backfill_file_metadata.py and generate_artwork_variants.py both left
+content_hash empty: it needs every byte read, so it was kept out of passes that
+only stat. This is that pass. It produces one COPY file (Shared/pg_copy.py:
+binary .bin, or .csv under TLMC_COPY_FORMAT=csv), applied by
+apply_content_hash.sql (temp table + UPDATE FROM, by storage key):
+
+  content_hash  storage_key,content_hash   (xxh128, 32 hex digits)
+
+What is hashed, as library-root-relative storage keys:
+
+  - every asset row, from assets.csv (the same export backfill_file_metadata.py
+    reads: COPY (SELECT id, storage_key FROM asset) TO STDOUT WITH CSV);
+  - the HLS output of every finalized track -- each rung's stream.m4s and
+    playlist.m3u8, the master playlist and manifest.mpd -- from the finalizer
+    manifest, whether or not the DB carries rows for them yet;
+  - everything under _derived/artwork.
+
+Hashing is Preprocessor/Extract/snapshot.py's engine: large sequential reads,
+a thread pool per device sized for spinning or solid-state storage, and a
+resumable partial. Two sources of hashes are reused without reading the file:
+
+  - this pass's own snapshot (content_hash.snapshot.output.jsonl), while
+    size, mtime and inode are unchanged;
+  - extracted_snapshot.py's snapshot of the source tree, while size and mtime
+    match -- the FLACs and scans were hashed when they were extracted. Set
+    TLMC_EXTRACTED_ROOT if that snapshot was taken with the library mounted
+    somewhere other than LIBRARY_ROOT.
+
+So a rerun reads only files that are new or changed since, and the first run
+reads little more than the HLS output and the derived artwork.
+"""
+
+import csv
+import os
+import sys
+from typing import Dict, Iterable, List
+
+import Postprocessor.DbCommit.output.path_definitions as DbCommitPathDef
+import Postprocessor.HlsTranscode.output.path_definitions as HlsOutputPathDef
+import Preprocessor.Extract.output.path_definitions as ExtractOutputPaths
+from Preprocessor.Extract.snapshot import load_entries, take_snapshot
+from Shared import artifact_store, pg_copy, utils
+
+LIBRARY_ROOT = "/mnt/tlmc/TLMC v6"
+# As generate_artwork_variants.py writes them.
+DERIVED_PREFIX = "_derived/artwork"
+
+# Where the library sat when extracted_snapshot.py ran, if not at LIBRARY_ROOT.
+EXTRACTED_ROOT = os.environ.get("TLMC_EXTRACTED_ROOT") or LIBRARY_ROOT
+
+finalized_manifest_path = utils.get_output_path(
+    HlsOutputPathDef, HlsOutputPathDef.HLS_FINALIZED_FILELIST_OUTPUT_NAME
+)
+extracted_snapshot_path = utils.get_output_path(
+    ExtractOutputPaths, ExtractOutputPaths.EXTRACTED_FILESYSTEM_SNAPSHOT_OUTPUT_NAME
+)
+snapshot_path = utils.get_output_path(
+    DbCommitPathDef, DbCommitPathDef.CONTENT_HASH_SNAPSHOT_OUTPUT_NAME
+)
+
+
+def storage_key(path: str) -> str:
+    return os.path.relpath(path, LIBRARY_ROOT).replace(os.sep, "/")
+
+
+def asset_paths(assets_csv: str) -> List[str]:
+    with open(assets_csv, encoding="utf-8", newline="") as f:
+        return [os.path.join(LIBRARY_ROOT, key) for _, key in csv.reader(f)]
+
+
+def hls_paths(manifest_entries: Iterable[dict]) -> List[str]:
+    paths = []
+    for entry in manifest_entries:
+        track_dir = entry["track_dir"]
+        paths.append(os.path.join(track_dir, "playlist.m3u8"))
+        if entry.get("has_dash"):
+            paths.append(os.path.join(track_dir, "manifest.mpd"))
+        for bitrate in entry["bitrates"]:
+            variant = os.path.join(track_dir, "hls", f"{bitrate}k")
+            paths.append(os.path.join(variant, "stream.m4s"))
+            paths.append(os.path.join(variant, "playlist.m3u8"))
+    return paths
+
+
+def derived_paths() -> List[str]:
+    paths = []
+    for root, _, files in os.walk(os.path.join(LIBRARY_ROOT, DERIVED_PREFIX)):
+        paths.extend(os.path.join(root, name) for name in files)
+    return paths
+
+
+def extracted_seed() -> Dict[str, dict]:
+    """extracted_snapshot.py's entries, keyed by where those files are now."""
+    entries = load_entries(extracted_snapshot_path)
+    if EXTRACTED_ROOT == LIBRARY_ROOT:
+        return entries
+    return {
+        os.path.join(LIBRARY_ROOT, os.path.relpath(path, EXTRACTED_ROOT)): entry
+        for path, entry in entries.items()
+    }
+
+
+def main():
+    out_dir = sys.argv[1] if len(sys.argv) > 1 else "."
+
+    paths = []
+    assets_csv = os.path.join(out_dir, "assets.csv")
+    if os.path.exists(assets_csv):
+        paths += asset_paths(assets_csv)
+    else:
+        print(f"{assets_csv} not found -- hashing HLS and derived artwork only. Export it with:")
+        print("  COPY (SELECT id, storage_key FROM asset) TO STDOUT WITH CSV")
+
+    if os.path.isfile(finalized_manifest_path):
+        manifest = artifact_store.open_store(finalized_manifest_path)
+        paths += hls_paths(entry for _, entry in manifest.items())
+        manifest.close()
+    paths += derived_paths()
+    # An asset row can name an HLS or derived file too.
+    paths = list(dict.fromkeys(paths))
+
+    seed = extracted_seed()
+    print(f"{len(paths)} files; {len(seed)} hashes on record from {extracted_snapshot_path}")
+    entries = take_snapshot(paths, snapshot_path, seed=seed)
+
+    out_path = pg_copy.output_path("content_hash", out_dir)
+    with pg_copy.open_writer("content_hash", ("text", "text"), out_dir) as writer:
+        for path in paths:
+            entry = entries.get(path)
+            if entry is not None:
+                writer.writerow([storage_key(path), entry["hash"]])
+
+    missing = len(paths) - sum(path in entries for path in paths)
+    print(f"Wrote {len(paths) - missing} hashes to {out_path}"
+          + (f"; {missing} files missing or unreadable" if missing else ""))
+    csv_flag = "-v csv=1 " if pg_copy.FORMAT == pg_copy.FORMAT_CSV else ""
+    print(f"Apply with: psql {csv_flag}-f apply_content_hash.sql (from {out_dir})")
+
+
+if __name__ == "__main__":
+    main()
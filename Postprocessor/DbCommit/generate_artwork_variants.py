@@ -19,27 +19,59 @@ no variants at all are exported):
     WHERE NOT EXISTS (SELECT 1 FROM artwork_variant v WHERE v.artwork_id = a.id)
   ) TO STDOUT WITH CSV
 
-Produces three CSVs applied by apply_artwork_variants.sql (temp table + insert,
-conflict-safe, one transaction):
+Produces three COPY files (Shared/pg_copy.py: binary .bin, or .csv under
+TLMC_COPY_FORMAT=csv) applied by apply_artwork_variants.sql (temp table +
+insert, conflict-safe, one transaction):
 
-  variant_files.csv  asset_id,storage_key,name,mime,byte_size   (new asset rows)
-  variants.csv       artwork_id,size_px,asset_id                (the ladder;
-                     size 0 references the existing source asset — the original
-                     becomes addressable through the ladder without copying it)
-  colors.csv         artwork_id,{#rrggbb,...}                   (dominant first)
+  variant_files  asset_id,storage_key,name,mime,byte_size   (new asset rows)
+  variants       artwork_id,size_px,asset_id                (the ladder;
+                 size 0 references the existing source asset — the original
+                 becomes addressable through the ladder without copying it)
+  colors         artwork_id,{#rrggbb,...}                   (dominant first)
+
+Covers are decoded no larger than they need to be: a JPEG is opened in draft
+mode at the smallest DCT scale (1/2 to 1/8) still twice the largest rung, and
+each rung is resized from the one above it rather than from the full scan.
+
+Many albums of a circle ship the same cover. Every scan is first fingerprinted
+-- xxh128 of the file, plus a 64-bit difference hash and a 32x32 RGB copy of a
+1/8-scale decode -- and variants are rendered once per distinct image:
+byte-identical files share one set. The largest copy renders; the others point
+their ladders at its files, up to their own longest edge, and take its colors.
+
+TLMC_ARTWORK_NEAR_DUPLICATES=1 also folds re-saves and re-encodes of one scan
+together. A dhash alone cannot tell those from different covers: a flat or
+plain-background cover hashes to nearly all zero bits, so two unrelated ones
+land a couple of bits apart. A near match therefore needs all of: hashes within
+PHASH_DISTANCE bits, enough set bits in both for the hash to describe an image
+at all, the same aspect ratio, and 32x32 copies that agree pixel for pixel
+within THUMB_MSE. Off by default until it has been checked against the real
+scans.
+
+Both passes checkpoint to JSONL in the output directory
+(artwork_fingerprints.jsonl, artwork_renders.jsonl) and the CSVs are written
+from those at the end, so rerunning over the same directory after an
+interruption picks up where it stopped. Delete them to start over.
 
 content_hash is deliberately NOT set here — same reasoning as
-backfill_file_metadata.py: hashing is its own planned pass.
+backfill_file_metadata.py: content_hash.py hashes the variant files afterwards.
 """
 
+import base64
 import csv
+import io
+import json
 import os
 import sys
 import uuid
 from multiprocessing import Pool
+from typing import Dict, List, Optional, Tuple
 
+import xxhash
 from PIL import Image
 
+from Shared import pg_copy
+
 LIBRARY_ROOT = "/mnt/tlmc/TLMC v6"
 DERIVED_PREFIX = "_derived/artwork"
 
@@ -50,6 +82,24 @@ JPEG_QUALITY = 85
 DOMINANT_COLORS = 8
 WORKERS = 12
 
+# Near-duplicate folding (see the module docstring); byte-identical only when off.
+NEAR_DUPLICATES = os.environ.get("TLMC_ARTWORK_NEAR_DUPLICATES", "0") != "0"
+
+# Difference-hash bits two covers may differ in and still be compared further.
+PHASH_DISTANCE = 4
+# A dhash with fewer set (or unset) bits than this is mostly flat gradient, and
+# says nothing about which cover it came from.
+DHASH_MIN_BITS = 12
+# Mean squared error per channel (0-255) between two 32x32 copies. A re-save
+# differs by compression noise; a different cover by whole regions of color.
+THUMB_MSE = 64.0
+# ...and their aspect ratios must agree this closely, so a back cover that
+# happens to share a front's layout is not folded into it.
+ASPECT_TOLERANCE = 0.02
+
+FINGERPRINTS_NAME = "artwork_fingerprints.jsonl"
+RENDERS_NAME = "artwork_renders.jsonl"
+
 Image.MAX_IMAGE_PIXELS = None  # scans legitimately exceed the decompression-bomb default
 
 
@@ -67,32 +117,173 @@ def _dominant_colors(image):
     ]
 
 
-def process_artwork(item):
+def _dhash(image) -> int:
+    """64-bit difference hash: is each pixel of a 9x8 grey copy brighter than its right neighbour."""
+    small = image.convert("L").resize((9, 8), Image.Resampling.BILINEAR)
+    px = small.tobytes()
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = (bits << 1) | (px[row * 9 + col] > px[row * 9 + col + 1])
+    return bits
+
+
+def fingerprint_artwork(item):
     artwork_id, source_asset_id, storage_key = item
+    try:
+        with open(os.path.join(LIBRARY_ROOT, storage_key), "rb") as f:
+            data = f.read()
+        with Image.open(io.BytesIO(data)) as image:
+            width, height = image.size
+            # A JPEG decodes at 1/8 scale here -- a 3000px scan costs a 375px
+            # decode -- which is plenty for a 9x8 hash and a 32x32 copy. Other
+            # formats ignore it.
+            image.draft("RGB", (max(width // 8, 1), max(height // 8, 1)))
+            dhash = _dhash(image)
+            thumb = image.convert("RGB").resize((32, 32), Image.Resampling.BILINEAR)
+        return {
+            "artwork_id": artwork_id,
+            "source_asset_id": source_asset_id,
+            "storage_key": storage_key,
+            "hash": xxhash.xxh128_hexdigest(data),
+            "dhash": dhash,
+            "thumb": base64.b64encode(thumb.tobytes()).decode("ascii"),
+            "width": width,
+            "height": height,
+        }, None
+    except Exception as e:  # noqa: BLE001 - per-item failures are data, not crashes
+        return {"artwork_id": artwork_id}, f"{type(e).__name__}: {e}"
+
+
+def _informative(p: dict) -> bool:
+    """Whether the dhash has enough structure, and the record a thumb, to compare on."""
+    ones = bin(p["dhash"]).count("1")
+    # Fingerprints checkpointed before thumbs were recorded have none.
+    return "thumb" in p and DHASH_MIN_BITS <= ones <= 64 - DHASH_MIN_BITS
+
+
+def _same_image(p: dict, other: dict) -> bool:
+    if bin(p["dhash"] ^ other["dhash"]).count("1") > PHASH_DISTANCE:
+        return False
+    aspect = p["width"] / p["height"]
+    if abs(other["width"] / other["height"] - aspect) > ASPECT_TOLERANCE * aspect:
+        return False
+    a = base64.b64decode(p["thumb"])
+    b = base64.b64decode(other["thumb"])
+    return sum((x - y) ** 2 for x, y in zip(a, b)) / len(a) <= THUMB_MSE
+
+
+def group_duplicates(prints: List[dict], near: bool = NEAR_DUPLICATES) -> Dict[str, str]:
+    """
+    {artwork_id: representative artwork_id}. Largest scans are visited first,
+    so each group renders from its best copy. Groups are byte-identical files,
+    plus confirmed near-duplicates when `near` is set.
+    """
+    order = sorted(prints, key=lambda p: (-p["width"] * p["height"], p["artwork_id"]))
+    by_hash: Dict[str, str] = {}
+    # Four 16-bit bands of the dhash: two hashes within PHASH_DISTANCE bits
+    # agree exactly on at least one band, so only those are compared.
+    bands: Dict[tuple, List[dict]] = {}
+    rep_of: Dict[str, str] = {}
+
+    for p in order:
+        rep = by_hash.get(p["hash"])
+        comparable = near and _informative(p)
+        if rep is None and comparable:
+            for band in range(4):
+                key = (band, (p["dhash"] >> (16 * band)) & 0xFFFF)
+                for other in bands.get(key, ()):
+                    if _same_image(p, other):
+                        rep = other["artwork_id"]
+                        break
+                if rep is not None:
+                    break
+        if rep is None:
+            rep = p["artwork_id"]
+            for band in range(4 if comparable else 0):
+                key = (band, (p["dhash"] >> (16 * band)) & 0xFFFF)
+                bands.setdefault(key, []).append(p)
+        by_hash.setdefault(p["hash"], rep)
+        rep_of[p["artwork_id"]] = rep
+    return rep_of
+
+
+def process_artwork(item):
+    artwork_id, storage_key = item
     try:
         out_dir = os.path.join(LIBRARY_ROOT, DERIVED_PREFIX, artwork_id)
         os.makedirs(out_dir, exist_ok=True)
 
         with Image.open(os.path.join(LIBRARY_ROOT, storage_key)) as image:
-            colors = _dominant_colors(image)
+            width, height = image.size
+            longest = max(width, height)
+            sizes = sorted((s for s in LADDER if s < longest), reverse=True)
+            if sizes:
+                # JPEG only: decode at the smallest scale that keeps twice the
+                # largest rung, so the LANCZOS pass below still has real detail
+                # to work from. Must precede the first load().
+                scale = 2 * sizes[0] / longest
+                image.draft("RGB", (int(width * scale) + 1, int(height * scale) + 1))
+            current = image.convert("RGB")
 
-            files = []
-            longest = max(image.size)
-            for size in LADDER:
-                if size >= longest:
-                    continue
-                scaled = image.convert("RGB")
-                scaled.thumbnail((size, size), Image.Resampling.LANCZOS)
-                name = f"{size}.jpg"
-                path = os.path.join(out_dir, name)
-                scaled.save(path, "JPEG", quality=JPEG_QUALITY)
-                files.append(
-                    (size, f"{DERIVED_PREFIX}/{artwork_id}/{name}", name, os.path.getsize(path))
-                )
-
-        return (artwork_id, source_asset_id, files, colors, None)
+        colors = _dominant_colors(current)
+
+        files = []
+        # Each rung from the one above it: 600 from the decode, 300 from the
+        # 600, 120 from the 300 -- not three resizes of the full scan.
+        for size in sizes:
+            current = current.copy()
+            current.thumbnail((size, size), Image.Resampling.LANCZOS)
+            name = f"{size}.jpg"
+            path = os.path.join(out_dir, name)
+            current.save(path, "JPEG", quality=JPEG_QUALITY)
+            files.append(
+                (size, f"{DERIVED_PREFIX}/{artwork_id}/{name}", name, os.path.getsize(path))
+            )
+
+        return {"artwork_id": artwork_id, "files": files, "colors": colors}, None
     except Exception as e:  # noqa: BLE001 - per-item failures are data, not crashes
-        return (artwork_id, source_asset_id, None, None, f"{type(e).__name__}: {e}")
+        return {"artwork_id": artwork_id}, f"{type(e).__name__}: {e}"
+
+
+def load_checkpoint(path: str) -> Dict[str, dict]:
+    """{artwork_id: record}; the last line for an id wins."""
+    records = {}
+    if not os.path.isfile(path):
+        return records
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # The last line may have been cut off by the interruption.
+                continue
+            records[record["artwork_id"]] = record
+    return records
+
+
+def run_checkpointed(
+    worker, items, path: str, label: str, chunksize: int
+) -> Tuple[Dict[str, dict], List[str]]:
+    """Runs `worker` over the items not yet in the checkpoint at `path`, appending as they finish."""
+    done = load_checkpoint(path)
+    todo = [item for item in items if item[0] not in done]
+    print(f"{label}: {len(done)} from the checkpoint, {len(todo)} to go")
+
+    failures = []
+    with open(path, "a", encoding="utf-8") as checkpoint, Pool(WORKERS) as pool:
+        for i, (record, err) in enumerate(pool.imap_unordered(worker, todo, chunksize=chunksize), 1):
+            if err is None:
+                checkpoint.write(json.dumps(record, ensure_ascii=False) + "\n")
+                done[record["artwork_id"]] = record
+            else:
+                failures.append(f"{record['artwork_id']} :: {err}")
+            if i % 500 == 0 or i == len(todo):
+                checkpoint.flush()
+                print(f"[{label} {i}/{len(todo)}] failed {len(failures)}", end="\r")
+    if todo:
+        print()
+    return done, failures
 
 
 def main():
@@ -106,34 +297,61 @@ def main():
     with open(artworks_csv, encoding="utf-8", newline="") as f:
         items = [tuple(row) for row in csv.reader(f)]
 
+    prints, failures = run_checkpointed(
+        fingerprint_artwork, items, os.path.join(out_dir, FINGERPRINTS_NAME), "fingerprints", 16
+    )
+    rep_of = group_duplicates([prints[a] for a, _, _ in items if a in prints])
+    reps = sorted(set(rep_of.values()))
+    identical = sum(
+        1 for a, r in rep_of.items() if a != r and prints[a]["hash"] == prints[r]["hash"]
+    )
+    print(f"{len(rep_of)} artworks, {len(reps)} distinct images "
+          f"({identical} byte-identical and {len(rep_of) - len(reps) - identical} near-identical copies)")
+
+    renders, render_failures = run_checkpointed(
+        process_artwork,
+        [(r, prints[r]["storage_key"]) for r in reps],
+        os.path.join(out_dir, RENDERS_NAME),
+        "variants",
+        4,
+    )
+    failures += render_failures
+
     ok = 0
-    failures = []
+    # One asset row per rendered file, however many artworks share it; the
+    # apply step resolves ladders through storage_key either way.
+    asset_ids: Dict[str, str] = {}
+    # Column types are the apply script's temp tables, exactly: binary COPY
+    # does not cast.
     with (
-        open(os.path.join(out_dir, "variant_files.csv"), "w", encoding="utf-8", newline="") as files_f,
-        open(os.path.join(out_dir, "variants.csv"), "w", encoding="utf-8", newline="") as variants_f,
-        open(os.path.join(out_dir, "colors.csv"), "w", encoding="utf-8", newline="") as colors_f,
+        pg_copy.open_writer(
+            "variant_files", ("uuid", "text", "text", "text", "int8"), out_dir
+        ) as files_writer,
+        pg_copy.open_writer("variants", ("uuid", "int2", "uuid"), out_dir) as variants_writer,
+        pg_copy.open_writer("colors", ("uuid", "text[]"), out_dir) as colors_writer,
     ):
-        files_writer = csv.writer(files_f)
-        variants_writer = csv.writer(variants_f)
-        colors_writer = csv.writer(colors_f)
-
-        with Pool(WORKERS) as pool:
-            for i, (artwork_id, source_asset_id, files, colors, err) in enumerate(
-                pool.imap_unordered(process_artwork, items, chunksize=16), 1
-            ):
-                if err is None:
-                    variants_writer.writerow([artwork_id, 0, source_asset_id])
-                    for size, key, name, byte_size in files:
-                        asset_id = str(uuid.uuid4())
-                        files_writer.writerow([asset_id, key, name, "image/jpeg", byte_size])
-                        variants_writer.writerow([artwork_id, size, asset_id])
-                    colors_writer.writerow([artwork_id, "{" + ",".join(colors) + "}"])
-                    ok += 1
-                else:
-                    failures.append(f"{artwork_id} :: {err}")
-                if i % 500 == 0 or i == len(items):
-                    print(f"[variants {i}/{len(items)}] ok {ok}, failed {len(failures)}", end="\r")
-    print()
+
+        for artwork_id, source_asset_id, _ in items:
+            rep = rep_of.get(artwork_id)
+            render: Optional[dict] = renders.get(rep) if rep is not None else None
+            if render is None:
+                if rep is not None and rep != artwork_id:
+                    failures.append(f"{artwork_id} :: shares its image with {rep}, which failed")
+                continue
+            longest = max(prints[artwork_id]["width"], prints[artwork_id]["height"])
+
+            variants_writer.writerow([artwork_id, 0, source_asset_id])
+            for size, key, name, byte_size in render["files"]:
+                # A smaller copy of a shared cover keeps its own never-upscale
+                # ladder: only rungs below its own longest edge.
+                if size >= longest:
+                    continue
+                if key not in asset_ids:
+                    asset_ids[key] = str(uuid.uuid4())
+                    files_writer.writerow([asset_ids[key], key, name, "image/jpeg", byte_size])
+                variants_writer.writerow([artwork_id, size, asset_ids[key]])
+            colors_writer.writerow([artwork_id, render["colors"]])
+            ok += 1
 
     if failures:
         fail_path = os.path.join(out_dir, "variants_failures.txt")
@@ -141,7 +359,8 @@ def main():
             f.write("\n".join(failures) + "\n")
         print(f"variants: {len(failures)} failures -> {fail_path}")
 
-    print(f"done: {ok} artworks; apply with: psql -f apply_artwork_variants.sql (from {out_dir})")
+    csv_flag = "-v csv=1 " if pg_copy.FORMAT == pg_copy.FORMAT_CSV else ""
+    print(f"done: {ok} artworks; apply with: psql {csv_flag}-f apply_artwork_variants.sql (from {out_dir})")
 
 
 if __name__ == "__main__":
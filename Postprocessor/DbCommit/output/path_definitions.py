@@ -1 +1,5 @@
 FINALIZED_FILELIST_OUTPUT_NAME = "finalized.filelist.output.json"
+
+# content_hash.py's own snapshot (Preprocessor/Extract/snapshot.py format): the
+# hashes of everything it has read, reused on the next run while unchanged.
+CONTENT_HASH_SNAPSHOT_OUTPUT_NAME = "content_hash.snapshot.output.jsonl"
@@ -6,7 +6,7 @@ import Processor.InfoCollector.Aggregator.output.path_definitions as AggregatorP
 import Postprocessor.HlsTranscode.output.path_definitions as HlsTranscodePathDef
 import Preprocessor.AudioNormalizer.output.path_definitions as AudioNormalizerPathDef
 from Preprocessor.AudioNormalizer.output.path_definitions import LOUDNESS_OUTPUT_NAME
-from Shared import json_utils, utils
+from Shared import artifact_store, delta_worklist, utils
 
 assigned_merged_output = utils.get_output_path(
     AggregatorPathDef, AggregatorPathDef.ID_ASSIGNED_PATH
@@ -180,6 +180,7 @@ def generate_worklist_from_ids(entry: dict):
                 track_path = track["TrackPath"]
                 all_tracks[track_id] = track_path
 
+    all_tracks = dict(delta_worklist.restrict(all_tracks.items(), lambda kv: kv[1]))
     return generate_worklist(all_tracks)
 
 
@@ -283,13 +284,13 @@ def generate_worklist(all_tracks: Dict[str, str]):
 
 def main():
     print(f"Load id assignment from {assigned_merged_output}")
-    id_assignment = json_utils.json_load(assigned_merged_output)
+    id_assignment = artifact_store.load(assigned_merged_output)
 
     print(f"Generate HLS transcode worklist")
     result = generate_worklist_from_ids(id_assignment)
 
     print(f"Writing HLS transcode worklist to {hls_worklist_output}")
-    json_utils.json_dump(result, hls_worklist_output)
+    artifact_store.dump(result, hls_worklist_output)
 
 
 if __name__ == "__main__":
@@ -4,7 +4,7 @@ from uuid import uuid4
 import Processor.InfoCollector.Aggregator.output.path_definitions as AggregatorPathDef
 import Postprocessor.HlsTranscode.output.path_definitions as HlsTranscodePathDef
 import Postprocessor.HlsTranscode.hls_assignment as HlsAssignment
-from Shared import json_utils, utils
+from Shared import artifact_store, utils
 
 
 hls_worklist_output = utils.get_output_path(
@@ -30,7 +30,7 @@ def main():
     result = generate_worklist_from_path(root)
 
     print(f"Writing HLS transcode worklist to {hls_worklist_output}")
-    json_utils.json_dump(result, hls_worklist_output)
+    artifact_store.dump(result, hls_worklist_output)
 
 
 if __name__ == "__main__":
@@ -1,7 +1,7 @@
 import os
 import subprocess
 import Postprocessor.HlsTranscode.output.path_definitions as HlsTranscodePathDef
-from Shared import json_utils, utils
+from Shared import artifact_store, utils
 from Shared.reporting_multi_processor import (
     JournalWriter,
     OutputWriter,
@@ -46,7 +46,7 @@ def remove_completed(workslist: dict):
 
 
 def main():
-    worklist = json_utils.json_load(hls_worklist_output)
+    worklist = artifact_store.load(hls_worklist_output)
 
     print(f"Worklist entries: {len(worklist)}")
     print()
@@ -1,15 +1,41 @@
+"""
+Writes each track's master playlist, its DASH manifest.mpd and the finalizer
+manifest.
+
+Every quality directory of every track used to be listed one after another over
+the network mount and the manifest rebuilt from nothing each run, so finishing
+a few thousand new encodes cost the whole catalog's round trips again -- hours
+on the SMB node. Now:
+
+  - tracks are finalized on a thread pool (TLMC_FINALIZE_WORKERS), since each
+    is a handful of metadata round trips and nothing else;
+  - a track is skipped outright when its master playlist, variant playlists and
+    manifest.mpd carry the mtimes recorded the last time it was finalized
+    (hls_finalizer.scan.sqlite3) -- a handful of stats, no directory listing;
+  - only tracks that changed are written to the manifest's store, and the JSON
+    is re-exported from it (Shared/artifact_store.py).
+
+Rows are added and refreshed, never rebuilt. A track that fails to finalize
+keeps the row it had, and a row outside the worklist is dropped only once its
+track directory is confirmed gone -- and not at all under a delta worklist
+(Shared/delta_worklist.py), which leaves most of the catalog out on purpose.
+
+A re-encode rewrites the variant playlist, and so changes its mtime and is
+picked up; deleting the scan cache forces a full pass. manifest.mpd is rendered
+from the variant playlists parsed here (Postprocessor/DashRepackage/mpd.py), so
+repackage_from_finalizer.py is only needed for trees finalized before that.
+"""
+
 import os
 import re
-import subprocess
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+
 import Postprocessor.HlsTranscode.output.path_definitions as HlsTranscodePathDef
-from Shared import json_utils, utils
-from Shared.reporting_multi_processor import (
-    JournalWriter,
-    OutputWriter,
-    PrintMessageReporter,
-    StatAutoMuxMultiProcessor,
-)
-from Shared.utils import get_output_path
+from Postprocessor.DashRepackage import mpd
+from Postprocessor.HlsTranscode import hls_playlist
+from Shared import artifact_store, delta_worklist, utils
 from Postprocessor.HlsTranscode.hls_assignment import SEGMENT_NAME_SINGLE
 
 SEGMENT_INDEX_EXTRACTOR = re.compile(r'segment_(\d+)\.m4s');
@@ -22,6 +48,15 @@ hls_finalized_struct_output_pth = utils.get_output_path(
     HlsTranscodePathDef, HlsTranscodePathDef.HLS_FINALIZED_FILELIST_OUTPUT_NAME
 )
 
+scan_cache_path = utils.get_output_path(
+    HlsTranscodePathDef, HlsTranscodePathDef.HLS_FINALIZER_SCAN_CACHE_NAME
+)
+
+# Each track is a few stats and, when it changed, a few directory listings --
+# all latency. 32 in flight keeps an SMB session busy without tripping its
+# credit limit; a local disk is done long before it matters.
+WORKERS = int(os.environ.get("TLMC_FINALIZE_WORKERS") or 32)
+
 unknown_files = []
 
 
@@ -45,8 +80,13 @@ def scan_quality_dir(dst_root) -> dict:
     """
     scanned = {'segments': {}}
 
-    for file in sorted(os.listdir(dst_root)):
-        fp = os.path.join(dst_root, file)
+    # One directory read per quality; nothing below stats an entry, so the
+    # listing is the only round trip a changed track costs here.
+    with os.scandir(dst_root) as it:
+        entries = sorted(it, key=lambda e: e.name)
+    for entry in entries:
+        file = entry.name
+        fp = entry.path
 
         if file == 'playlist.m3u8':
             scanned['playlist'] = fp
@@ -80,94 +120,235 @@ def generate_master_playlist(hls_scan_result, proc_root) -> str:
 
     return "\n".join(lines_to_write)
 
-def main():
-    # Guarded so that importing scan_quality_dir does not run the whole
-    # finalizer -- and does not fail outright when no worklist exists yet.
-    hls_worklist = json_utils.json_load(hls_worklist_output)
-
-    all_results = {}
-    for index, (track_id, entry) in enumerate(hls_worklist.items()):
-        print(f"[{index}/{len(hls_worklist)}] Processing: {track_id}", end='\r')
-        proc_root = None
+def track_signature(proc_root: str, entry: dict) -> str:
+    """mtimes of what finalizing a track reads and writes; '-' for a missing file."""
+    paths = [os.path.join(proc_root, "playlist.m3u8"), os.path.join(proc_root, mpd.MPD_NAME)]
+    paths += [os.path.join(entry[q]['dst_root'], "playlist.m3u8") for q in sorted(entry)]
+    parts = []
+    for path in paths:
         try:
-            src = entry[list(entry.keys())[0]]['src']
-            # Taken from the worklist rather than re-derived from the source
-            # name. dst_root is `<base>/hls/<rung>`, so its grandparent is the
-            # base the encode actually used. Re-deriving it here meant two
-            # places had to agree on how a source path becomes an output path,
-            # and they stopped agreeing as soon as hls_base_dirs had to
-            # disambiguate same-stem tracks -- the master playlist would have
-            # been written somewhere no encode ever wrote.
-            proc_root = os.path.dirname(
-                os.path.dirname(entry[list(entry.keys())[0]]['dst_root'])
-            )
+            parts.append(str(os.stat(path).st_mtime_ns))
+        except OSError:
+            parts.append("-")
+    return ":".join(parts)
+
+
+def track_root(entry: dict) -> str:
+    # Taken from the worklist rather than re-derived from the source name.
+    # dst_root is `<base>/hls/<rung>`, so its grandparent is the base the encode
+    # actually used. Re-deriving it here meant two places had to agree on how a
+    # source path becomes an output path, and they stopped agreeing as soon as
+    # hls_base_dirs had to disambiguate same-stem tracks -- the master playlist
+    # would have been written somewhere no encode ever wrote.
+    return os.path.dirname(
+        os.path.dirname(entry[list(entry.keys())[0]]['dst_root'])
+    )
+
+
+def finalize_track(entry: dict) -> dict:
+    """
+    Writes the master playlist if missing and the DASH manifest, and returns the
+    track's manifest row. Raises for a track whose encode is incomplete.
+    """
+    proc_root = track_root(entry)
 
-            """
-        Result sample (single_file layout -- one media entry per quality, the
-        init segment living inside it as a byte range):
-        {
-            "320k": {
-                "playlist": "<Full FP Omitted>/hls/320k/playlist.m3u8",
-                "segments": {
-                    "<Full FP Omitted>/hls/320k/stream.m4s": 0
-                }
+    """
+    Result sample (single_file layout -- one media entry per quality, the
+    init segment living inside it as a byte range):
+    {
+        "320k": {
+            "playlist": "<Full FP Omitted>/hls/320k/playlist.m3u8",
+            "segments": {
+                "<Full FP Omitted>/hls/320k/stream.m4s": 0
             }
         }
+    }
 
-        Legacy per-segment layout, still present across the v5 tree:
-        {
-            "320k": {
-                "playlist": "<Full FP Omitted>/hls/320k/playlist.m3u8",
-                "segments": {
-                    // init.mp4 always receives an index assignment of -1
-                    "<Full FP Omitted>/hls/320k/init.mp4": -1,
-
-                    // index assignment based of segment extractor regex
-                    "<Full FP Omitted>/hls/320k/segment_000.m4s": 0
-                }
-            }
+    Legacy per-segment layout, still present across the v5 tree:
+    {
+        "320k": {
+            "playlist": "<Full FP Omitted>/hls/320k/playlist.m3u8",
+            "segments": {
+                // init.mp4 always receives an index assignment of -1
+                "<Full FP Omitted>/hls/320k/init.mp4": -1,
+
+                // index assignment based of segment extractor regex
+                "<Full FP Omitted>/hls/320k/segment_000.m4s": 0
             }
-            """
-            result = {}
-            for quality, target_info in entry.items():
-                scanned = scan_quality_dir(target_info['dst_root'])
-                # A rung without its playlist or media file is a failed encode;
-                # surface it as an error rather than record a rung that 404s.
-                if 'playlist' not in scanned or not scanned['segments']:
-                    raise FileNotFoundError(
-                        f"incomplete quality dir: {target_info['dst_root']}"
-                    )
-                result[quality] = scanned
-
-            # Test if master playlist file already exists
-            master_playlist_path = os.path.join(proc_root, "playlist.m3u8")
-            if not os.path.isfile(master_playlist_path):
-                utils.append_file(master_playlist_path, generate_master_playlist(result, proc_root))
-        except Exception as e:
-            # proc_root is unset if the failure happened before it was built,
-            # which made the old handler raise NameError and abort the run.
-            utils.append_file("error.txt", f"{proc_root or track_id}\t{e!r}\n", True)
-            continue
-
-        # v6 shape (SCHEMA-V6.md section 3): per-track facts only. The on-disk
-        # layout is a convention shared with the backend, so the per-segment
-        # inventory that used to live here is no longer recorded anywhere -- the
-        # manifest survives only because collision-renamed dirs (`stem [ext]`)
-        # make track_dir non-derivable from metadata alone.
-        all_results[src] = {
-            "track_dir": proc_root,
-            "bitrates": sorted(int(q.replace("k", "")) for q in result.keys()),
-            "has_dash": os.path.isfile(os.path.join(proc_root, "manifest.mpd")),
         }
+    }
+    """
+    result = {}
+    for quality, target_info in entry.items():
+        scanned = scan_quality_dir(target_info['dst_root'])
+        # A rung without its playlist or media file is a failed encode;
+        # surface it as an error rather than record a rung that 404s.
+        if 'playlist' not in scanned or not scanned['segments']:
+            raise FileNotFoundError(
+                f"incomplete quality dir: {target_info['dst_root']}"
+            )
+        result[quality] = scanned
+
+    # Test if master playlist file already exists
+    master_playlist_path = os.path.join(proc_root, "playlist.m3u8")
+    if not os.path.isfile(master_playlist_path):
+        utils.append_file(master_playlist_path, generate_master_playlist(result, proc_root))
+
+    # The DASH manifest comes from the same variant playlists, read here once,
+    # rather than from a second walk of the tree by repackage_from_finalizer.
+    # Rewritten whenever the track is, so it follows a re-encode.
+    representations = [
+        mpd.representation(
+            int(quality.replace("k", "")) * 1000,
+            entry[quality]['dst_root'],
+            proc_root,
+            hls_playlist.read(entry[quality]['dst_root']),
+        )
+        for quality in sorted(result, key=lambda q: int(q.replace("k", "")))
+    ]
+    mpd.write(os.path.join(proc_root, mpd.MPD_NAME), mpd.render(representations))
+
+    # v6 shape (SCHEMA-V6.md section 3): per-track facts only. The on-disk
+    # layout is a convention shared with the backend, so the per-segment
+    # inventory that used to live here is no longer recorded anywhere -- the
+    # manifest survives only because collision-renamed dirs (`stem [ext]`)
+    # make track_dir non-derivable from metadata alone.
+    return {
+        "track_dir": proc_root,
+        "bitrates": sorted(int(q.replace("k", "")) for q in result.keys()),
+        "has_dash": True,
+    }
+
+
+def open_scan_cache(path: str = scan_cache_path) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, timeout=60)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS track (src TEXT PRIMARY KEY, signature TEXT NOT NULL)"
+    )
+    return conn
+
+
+def confirmed_gone(track_dir: str) -> bool:
+    """
+    Whether `track_dir` is missing from a directory that is itself reachable.
+    A dropped mount or an SMB hiccup fails the parent too, and keeps the row.
+    """
+    try:
+        os.stat(os.path.dirname(track_dir))
+    except OSError:
+        return False
+    try:
+        os.stat(track_dir)
+    except FileNotFoundError:
+        return True
+    except OSError:
+        return False
+    return False
+
+
+def process_track(
+    track_id: str, entry: dict, known: Optional[str], in_manifest: bool
+) -> Tuple[str, str, Optional[dict], Optional[str], Optional[str]]:
+    """(track_id, src, row or None if unchanged, new signature, error)."""
+    src = entry[list(entry.keys())[0]]['src']
+    proc_root = None
+    try:
+        proc_root = track_root(entry)
+        signature = track_signature(proc_root, entry)
+        if in_manifest and signature == known:
+            return track_id, src, None, signature, None
+        row = finalize_track(entry)
+        # Taken again: writing the master playlist just changed its mtime.
+        return track_id, src, row, track_signature(proc_root, entry), None
+    except Exception as e:
+        return track_id, src, None, None, f"{proc_root or track_id}\t{e!r}\n"
+
+
+def main():
+    # Guarded so that importing scan_quality_dir does not run the whole
+    # finalizer -- and does not fail outright when no worklist exists yet.
+    hls_worklist = artifact_store.load(hls_worklist_output)
+
+    manifest = artifact_store.ArtifactStore(
+        artifact_store.store_path(hls_finalized_struct_output_pth)
+    )
+    if os.path.isfile(hls_finalized_struct_output_pth):
+        manifest = artifact_store.open_store(hls_finalized_struct_output_pth)
+    in_manifest = set(manifest.keys())
+
+    cache = open_scan_cache()
+    known: Dict[str, str] = dict(cache.execute("SELECT src, signature FROM track"))
+
+    srcs = set()
+    rows, signatures = [], []
+    unchanged = 0
+    errors = []
+
+    def flush():
+        manifest.put_many(rows)
+        with cache:
+            cache.executemany(
+                "INSERT OR REPLACE INTO track (src, signature) VALUES (?, ?)", signatures
+            )
+        rows.clear()
+        signatures.clear()
+
+    with ThreadPoolExecutor(max_workers=WORKERS) as executor:
+        futures = []
+        for track_id, entry in hls_worklist.items():
+            src = entry[list(entry.keys())[0]]['src']
+            srcs.add(src)
+            futures.append(executor.submit(
+                process_track, track_id, entry, known.get(src), src in in_manifest
+            ))
+
+        for index, future in enumerate(futures):
+            track_id, src, row, signature, error = future.result()
+            print(f"[{index}/{len(futures)}] Processing: {track_id}", end='\r')
+            if error is not None:
+                # Recorded in the main thread: error.txt is appended to, not
+                # locked.
+                errors.append(error)
+                continue
+            if row is None:
+                unchanged += 1
+            else:
+                rows.append((src, row))
+            signatures.append((src, signature))
+            if len(rows) >= artifact_store.BATCH:
+                flush()
+    flush()
+
+    # Backfill, content_hash and the DASH repackager all read this manifest,
+    # so a row goes only with its track directory. A delta worklist names a
+    # handful of albums, and everything outside it is still there.
+    dropped = 0
+    if delta_worklist.load() is None:
+        absent = manifest.get_many(key for key in in_manifest if key not in srcs)
+        stale = [key for key, row in absent.items() if confirmed_gone(row['track_dir'])]
+        dropped = manifest.delete_many(stale)
+        with cache:
+            cache.executemany("DELETE FROM track WHERE src = ?", ((k,) for k in stale))
+    cache.close()
+
+    for error in errors:
+        utils.append_file("error.txt", error, True)
 
+    finalized = len(hls_worklist) - unchanged - len(errors)
     print("\nPrcoessing Complete, writing results to output")
+    print(f"{finalized} finalized, {unchanged} unchanged, {len(errors)} failed "
+          f"(see error.txt), {dropped} rows dropped from the manifest")
 
     if unknown_files:
         print(f"WARNING: {len(unknown_files)} unrecognised file(s) in quality "
               f"directories, see unknown_files.txt")
         utils.append_file("unknown_files.txt", "\n".join(unknown_files) + "\n", True)
 
-    json_utils.json_dump(all_results, hls_finalized_struct_output_pth)
+    if finalized or dropped or not manifest.is_export_of(hls_finalized_struct_output_pth):
+        manifest.export_json(hls_finalized_struct_output_pth)
+    manifest.close()
 
 
 if __name__ == "__main__":
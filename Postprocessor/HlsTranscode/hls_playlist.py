@@ -0,0 +1,117 @@
+"""
+Reading the variant playlists hls_runner writes.
+
+Only what this tree's ffmpeg emits is understood: one fMP4 rendition per
+playlist, an #EXT-X-MAP init section, and per segment an #EXTINF and -- in the
+single_file layout -- an #EXT-X-BYTERANGE into the shared media file:
+
+    #EXT-X-MAP:URI="stream.m4s",BYTERANGE="764@0"
+    #EXTINF:10.007800,
+    #EXT-X-BYTERANGE:162078@764
+    stream.m4s
+
+A range without an offset continues from where the previous range of the same
+file ended (RFC 8216 4.3.2.2). In the legacy per-segment layout there are no
+ranges at all, and each `Segment.byterange` is None.
+"""
+
+import os
+from typing import List, NamedTuple, Optional, Tuple
+
+PLAYLIST_NAME = "playlist.m3u8"
+
+
+class Segment(NamedTuple):
+    uri: str
+    duration: float
+    # (offset, length) into `uri`, or None for the whole file.
+    byterange: Optional[Tuple[int, int]]
+
+
+class Playlist(NamedTuple):
+    init_uri: Optional[str]
+    init_byterange: Optional[Tuple[int, int]]
+    segments: List[Segment]
+    # #EXT-X-ENDLIST seen. ffmpeg rewrites the playlist after every segment
+    # and adds the tag only when the encode finishes, so its absence means the
+    # encode was cut short.
+    ended: bool
+
+    @property
+    def duration(self) -> float:
+        return sum(s.duration for s in self.segments)
+
+
+def _attributes(text: str) -> dict:
+    # KEY=VALUE,KEY="VALUE, with commas" -- commas inside quotes do not split.
+    attrs = {}
+    key, value, quoted, reading_key = "", "", False, True
+    for ch in text + ",":
+        if reading_key:
+            if ch == "=":
+                reading_key = False
+            elif ch != ",":
+                key += ch
+        elif ch == '"':
+            quoted = not quoted
+        elif ch == "," and not quoted:
+            attrs[key.strip()] = value
+            key, value, reading_key = "", "", True
+        else:
+            value += ch
+    return attrs
+
+
+def _byterange(text: str, next_offset: int) -> Tuple[int, int]:
+    length, _, offset = text.strip().partition("@")
+    return (int(offset) if offset else next_offset, int(length))
+
+
+def parse(text: str) -> Playlist:
+    init_uri = None
+    init_range = None
+    segments: List[Segment] = []
+    ended = False
+
+    duration = None
+    pending_range = None
+    # End of the last range per URI, for ranges that omit their offset.
+    range_end = {}
+
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith("#EXT-X-MAP:"):
+            attrs = _attributes(line[len("#EXT-X-MAP:"):])
+            init_uri = attrs.get("URI")
+            if "BYTERANGE" in attrs:
+                # The offset of an EXT-X-MAP range is never implied.
+                init_range = _byterange(attrs["BYTERANGE"], 0)
+                range_end[init_uri] = init_range[0] + init_range[1]
+        elif line.startswith("#EXTINF:"):
+            duration = float(line[len("#EXTINF:"):].split(",", 1)[0])
+        elif line.startswith("#EXT-X-BYTERANGE:"):
+            pending_range = line[len("#EXT-X-BYTERANGE:"):]
+        elif line.startswith("#EXT-X-ENDLIST"):
+            ended = True
+        elif not line.startswith("#"):
+            byterange = None
+            if pending_range is not None:
+                byterange = _byterange(pending_range, range_end.get(line, 0))
+                range_end[line] = byterange[0] + byterange[1]
+            segments.append(Segment(line, duration or 0.0, byterange))
+            duration = None
+            pending_range = None
+
+    return Playlist(init_uri, init_range, segments, ended)
+
+
+def load(path: str) -> Playlist:
+    with open(path, "r", encoding="utf-8") as f:
+        return parse(f.read())
+
+
+def read(dst_root: str) -> Playlist:
+    """The playlist of one quality directory; OSError if it is missing."""
+    return load(os.path.join(dst_root, PLAYLIST_NAME))
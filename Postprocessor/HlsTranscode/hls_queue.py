@@ -0,0 +1,268 @@
+"""
+Lease-based work queue for running hls_runner on several nodes at once.
+
+Static sharding (TLMC_SHARD_COUNT / TLMC_SHARD_INDEX) fixes each node's share
+when it starts, so the slower node sets the finish time and the only remedy was
+moving buckets between nodes by hand (rebalance/). With a queue every node
+claims a small batch of track ids at a time and comes back for more, so a fast
+node keeps pulling until the worklist drains and nothing has to be planned.
+
+A claim is a lease: the rows are marked with the claiming node and an expiry,
+and a heartbeat thread pushes the expiry forward while the node is alive. A node
+that dies or is stopped stops heartbeating, its leases lapse, and the ids go
+back to the pool for whoever claims next. A track that fails is returned to the
+pool straight away and parked as failed after MAX_ATTEMPTS, so one broken
+source cannot loop forever across the cluster.
+
+The store is one SQLite file that every node can reach -- the library mount is
+the obvious place:
+
+    TLMC_QUEUE_DB=/mnt/tlmc/.tlmc-hls-queue.sqlite3
+
+It runs in rollback-journal mode, not WAL. WAL keeps its index in shared memory,
+which only works between processes on one host; over SMB or NFS two nodes would
+each see their own copy and corrupt the file. Every write is one short
+transaction, a handful per minute per node, so the coarse file lock costs
+nothing measurable against encodes that take seconds each.
+
+    python -m Postprocessor.HlsTranscode.hls_queue status
+    python -m Postprocessor.HlsTranscode.hls_queue requeue-failed
+"""
+
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, List
+
+# A lease outlives a missed heartbeat or two -- SMB stalls of tens of seconds
+# happen under load -- but a dead node's work is back in the pool within
+# minutes rather than at the end of the run.
+LEASE_SECONDS = int(os.environ.get("TLMC_QUEUE_LEASE_SECONDS") or 600)
+HEARTBEAT_SECONDS = max(1, LEASE_SECONDS // 10)
+
+# Ids per claim. Small enough that a node never sits on much more than it is
+# encoding, large enough that claims stay a few per minute on a 32-worker node.
+CLAIM_BATCH = int(os.environ.get("TLMC_QUEUE_BATCH") or 16)
+
+MAX_ATTEMPTS = 3
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS track (
+    id            TEXT PRIMARY KEY,
+    state         TEXT NOT NULL DEFAULT 'pending',
+    owner         TEXT,
+    lease_expires REAL,
+    attempts      INTEGER NOT NULL DEFAULT 0,
+    updated       REAL
+);
+CREATE INDEX IF NOT EXISTS track_state ON track (state, lease_expires);
+"""
+
+
+def node_name() -> str:
+    # The pid keeps two runs on one host apart, and keeps a restarted node from
+    # mistaking its previous life's leases for its own.
+    return os.environ.get("TLMC_NODE_NAME") or f"{socket.gethostname()}:{os.getpid()}"
+
+
+class LeaseQueue:
+    def __init__(self, path: str, owner: str = None) -> None:
+        self.path = path
+        self.owner = owner or node_name()
+        self._lock = threading.Lock()
+        self._heartbeat = None
+        self._stop = threading.Event()
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # One connection shared by the encode workers, the publisher and the
+        # heartbeat, serialised by _lock. isolation_level=None so transactions
+        # are opened explicitly with BEGIN IMMEDIATE, which takes the write
+        # lock up front instead of upgrading mid-transaction and deadlocking
+        # against another node doing the same.
+        self._conn = sqlite3.connect(
+            path, timeout=120, isolation_level=None, check_same_thread=False
+        )
+        self._conn.execute("PRAGMA journal_mode=DELETE")
+        self._conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _write(self, sql: str, params=()) -> sqlite3.Cursor:
+        with self._transaction() as conn:
+            return conn.execute(sql, params)
+
+    def seed(self, track_ids: Iterable[str]) -> None:
+        """Add ids not already known. Idempotent, so every node may seed."""
+        now = time.time()
+        with self._transaction() as conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO track (id, updated) VALUES (?, ?)",
+                ((track_id, now) for track_id in track_ids),
+            )
+
+    def import_completed(self, track_ids: Iterable[str]) -> None:
+        """Mark ids finished by runs that predate the queue as done."""
+        now = time.time()
+        with self._transaction() as conn:
+            conn.executemany(
+                "UPDATE track SET state = 'done', owner = NULL, "
+                "lease_expires = NULL, updated = ? "
+                "WHERE id = ? AND state != 'done'",
+                ((now, track_id) for track_id in track_ids),
+            )
+
+    def claim(self, limit: int = CLAIM_BATCH) -> List[str]:
+        """
+        Lease up to `limit` ids: pending ones first, then any whose lease ran out.
+
+        Select and update happen under one write lock, so two nodes can never be
+        handed the same id by the same round of claims.
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            ids = [
+                row[0]
+                for row in conn.execute(
+                    "SELECT id FROM track "
+                    "WHERE state = 'pending' "
+                    "OR (state = 'leased' AND lease_expires < ?) "
+                    "ORDER BY state = 'leased', id LIMIT ?",
+                    (now, limit),
+                )
+            ]
+            conn.executemany(
+                "UPDATE track SET state = 'leased', owner = ?, "
+                "lease_expires = ?, attempts = attempts + 1, updated = ? "
+                "WHERE id = ?",
+                ((self.owner, now + LEASE_SECONDS, now, i) for i in ids),
+            )
+        return ids
+
+    def complete(self, track_id: str) -> None:
+        # Not conditioned on owner: if this node's lease lapsed and another node
+        # re-claimed the id, the output is still at the destination and the
+        # other node's encode is wasted work rather than missing work.
+        self._write(
+            "UPDATE track SET state = 'done', owner = NULL, lease_expires = NULL, "
+            "updated = ? WHERE id = ?",
+            (time.time(), track_id),
+        )
+
+    def fail(self, track_id: str) -> None:
+        """Give a failed id back to the pool, or park it once out of attempts."""
+        self._write(
+            "UPDATE track SET "
+            "state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+            "owner = NULL, lease_expires = NULL, updated = ? "
+            "WHERE id = ? AND owner = ? AND state = 'leased'",
+            (MAX_ATTEMPTS, time.time(), track_id, self.owner),
+        )
+
+    def renew(self) -> int:
+        now = time.time()
+        return self._write(
+            "UPDATE track SET lease_expires = ?, updated = ? "
+            "WHERE owner = ? AND state = 'leased'",
+            (now + LEASE_SECONDS, now, self.owner),
+        ).rowcount
+
+    def release(self) -> None:
+        """Hand back everything this node still holds, without charging an attempt."""
+        self._write(
+            "UPDATE track SET state = 'pending', owner = NULL, lease_expires = NULL, "
+            "attempts = MAX(attempts - 1, 0), updated = ? "
+            "WHERE owner = ? AND state = 'leased'",
+            (time.time(), self.owner),
+        )
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT state, COUNT(*) FROM track GROUP BY state"
+            ).fetchall()
+        return dict(rows)
+
+    def leases(self) -> List[tuple]:
+        """(owner, leased count, earliest expiry) per node holding leases."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT owner, COUNT(*), MIN(lease_expires) FROM track "
+                "WHERE state = 'leased' GROUP BY owner ORDER BY owner"
+            ).fetchall()
+
+    def requeue_failed(self) -> int:
+        return self._write(
+            "UPDATE track SET state = 'pending', attempts = 0, updated = ? "
+            "WHERE state = 'failed'",
+            (time.time(),),
+        ).rowcount
+
+    def requeue(self, track_ids: Iterable[str]) -> int:
+        """Send done ids back to the pool -- hls_verify found their output broken."""
+        now = time.time()
+        with self._transaction() as conn:
+            return conn.executemany(
+                "UPDATE track SET state = 'pending', owner = NULL, "
+                "lease_expires = NULL, attempts = 0, updated = ? "
+                "WHERE id = ? AND state != 'leased'",
+                ((now, track_id) for track_id in track_ids),
+            ).rowcount
+
+    def start_heartbeat(self) -> None:
+        def beat():
+            while not self._stop.wait(HEARTBEAT_SECONDS):
+                try:
+                    self.renew()
+                except sqlite3.Error as e:
+                    # A missed beat is survivable -- the lease has ten of them
+                    # in hand -- so keep trying rather than let the thread die.
+                    print(f"\nLease heartbeat failed: {e}\n")
+
+        self._heartbeat = threading.Thread(
+            target=beat, name="lease-heartbeat", daemon=True
+        )
+        self._heartbeat.start()
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._heartbeat is not None:
+            self._heartbeat.join()
+        self.release()
+        self._conn.close()
+
+
+def main():
+    path = os.environ.get("TLMC_QUEUE_DB")
+    if not path or len(sys.argv) != 2 or sys.argv[1] not in ("status", "requeue-failed"):
+        print(
+            "usage: TLMC_QUEUE_DB=<path> "
+            "python -m Postprocessor.HlsTranscode.hls_queue status | requeue-failed"
+        )
+        sys.exit(2)
+
+    queue = LeaseQueue(path, owner="cli")
+    if sys.argv[1] == "requeue-failed":
+        print(f"Requeued {queue.requeue_failed()} failed tracks")
+
+    for state, n in sorted(queue.counts().items()):
+        print(f"{state:>8} {n:>8,}")
+
+    now = time.time()
+    for owner, n, expires in queue.leases():
+        print(f"  {owner}: {n} leased, earliest expiry in {expires - now:.0f}s")
+
+if __name__ == "__main__":
+    main()
@@ -4,10 +4,14 @@ import os
 import shutil
 import subprocess
 import threading
+import time
 from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
 import Postprocessor.HlsTranscode.output.path_definitions as HlsTranscodePathDef
 from Postprocessor.HlsTranscode.hls_assignment import make_ffmpeg_hls_ladder_cmd
-from Shared import json_utils, utils
+from Postprocessor.HlsTranscode.hls_queue import CLAIM_BATCH, LeaseQueue
+from Shared import artifact_store, utils
+from Shared.adaptive_concurrency import AdaptiveLimit, AimdController, AutoTuner
 from Shared.reporting_multi_processor import (
     JournalWriter,
     OutputWriter,
@@ -81,6 +85,21 @@ def shard_path(path: str, index: int, count: int) -> str:
     return f"{root}.shard{index}of{count}{ext}"
 
 
+# Work-queue mode: instead of a fixed shard, every node claims a few track ids
+# at a time from a lease store all nodes can reach, and comes back for more
+# until the worklist drains. A fast node simply ends up doing more, and a node
+# that dies has its leases expire back into the pool. See hls_queue.py.
+#
+#   TLMC_QUEUE_DB=/mnt/tlmc/.tlmc-hls-queue.sqlite3
+#
+# Takes precedence over TLMC_SHARD_COUNT, which is ignored when this is set.
+QUEUE_DB = os.environ.get("TLMC_QUEUE_DB") or None
+
+# How long to wait before asking again when nothing is claimable but other nodes
+# still hold leases: if one of them has died, its ids come free at expiry.
+QUEUE_POLL_SECONDS = 30
+
+
 # Encode to local scratch, then copy the finished track to its real destination.
 # Set to a path on the node's OWN disk; leave unset for direct writes.
 #
@@ -141,15 +160,71 @@ PUBLISH_WORKERS = int(os.environ.get("TLMC_PUBLISH_WORKERS") or 0)
 PUBLISH_QUEUE = int(os.environ.get("TLMC_PUBLISH_QUEUE") or 32)
 
 
+# Let the node find its own worker counts instead of benchmarking them by hand
+# as above (Shared/adaptive_concurrency.py).
+#
+#   TLMC_AUTOTUNE=1  TLMC_WORKERS=32  TLMC_WORKERS_MIN=8
+#
+# TLMC_WORKERS becomes the ceiling and TLMC_WORKERS_MIN (default a quarter of
+# it) the floor and starting point. With TLMC_PUBLISH_WORKERS on, that is the
+# publish ceiling likewise, starting from one. Every adjustment goes to the
+# general journal with the rate that prompted it, so the counts a node settled
+# at can be read back and pinned for the next run.
+AUTOTUNE = os.environ.get("TLMC_AUTOTUNE", "0") != "0"
+WORKERS_MIN = int(os.environ.get("TLMC_WORKERS_MIN") or 0)
+
+
+class LeaseSlots:
+    """
+    Leases a queue-mode node may hold: one per encode it can run right now,
+    plus one claim batch waiting behind them.
+
+    Sized from the live encode limit, not the worker ceiling. An autotuned node
+    sitting at its floor -- 8 of 32 -- would otherwise keep up to 32 + a batch
+    leased, ids another node could be encoding.
+    """
+
+    def __init__(self, running: Callable[[], int]) -> None:
+        self._running = running
+        self._held = 0
+        self._cond = threading.Condition()
+
+    def _room(self) -> int:
+        return self._running() + CLAIM_BATCH - self._held
+
+    def wait_for_room(self) -> int:
+        """Blocks until at least one more lease fits; returns how many do."""
+        with self._cond:
+            # The tuner moves the limit without telling us, so re-check on a
+            # timer as well as on every release.
+            while self._room() <= 0:
+                self._cond.wait(timeout=5)
+            return self._room()
+
+    def take(self, n: int) -> None:
+        with self._cond:
+            self._held += n
+
+    def release(self) -> None:
+        with self._cond:
+            self._held -= 1
+            self._cond.notify_all()
+
+
 class HlsRunner:
     # Set up in start() when TLMC_PUBLISH_WORKERS is on; None means publish
     # inline on the encoding worker, which is what a node with a local library
     # should do -- there is nothing to overlap.
     _publisher = None
     _publish_slots = None
+    _publish_limit = None
+    # Set in start() when TLMC_QUEUE_DB is on; completions and failures are then
+    # also recorded against the track's lease.
+    _queue = None
+    _queue_slots = None
 
     @staticmethod
-    def remove_completed(workslist: dict):
+    def read_completed():
         # Every shard's completed list is honoured, not just this node's. The
         # shard count can then change between runs -- or results be gathered
         # from other nodes -- without re-encoding what is already done.
@@ -160,11 +235,30 @@ class HlsRunner:
                 for line in f:
                     if line.strip():
                         complted.add(line.strip())
+        return complted
 
+    @staticmethod
+    def remove_completed(workslist: dict):
+        complted = HlsRunner.read_completed()
         for key in list(workslist.keys()):
             if key in complted:
                 del workslist[key]
 
+    @staticmethod
+    def record_completed(
+        journalWriter: JournalWriter, outputWriter: OutputWriter, track_id: str
+    ):
+        outputWriter.write(f"{track_id}\n")
+        journalWriter.report_completed(f"Completed {track_id}\n")
+        if HlsRunner._queue is not None:
+            HlsRunner._queue.complete(track_id)
+
+    @staticmethod
+    def record_failed(journalWriter: JournalWriter, track_id: str, msg: str):
+        journalWriter.report_error(msg)
+        if HlsRunner._queue is not None:
+            HlsRunner._queue.fail(track_id)
+
     @staticmethod
     def publish_one(stage_root: str, dst_root: str):
         """Copy one finished quality directory from scratch to its destination.
@@ -201,13 +295,14 @@ class HlsRunner:
                     os.path.join(stage_track_dir, quality), work_details["dst_root"]
                 )
 
-            outputWriter.write(f"{track_id}\n")
-            journalWriter.report_completed(f"Completed {track_id}\n")
+            HlsRunner.record_completed(journalWriter, outputWriter, track_id)
 
             if DELETE_SOURCE_AFTER_TRANSCODE and src_file:
                 os.unlink(src_file)
         except Exception as e:
-            journalWriter.report_error(f"Failed to publish {track_id}: {e}\n")
+            HlsRunner.record_failed(
+                journalWriter, track_id, f"Failed to publish {track_id}: {e}\n"
+            )
         finally:
             shutil.rmtree(stage_track_dir, ignore_errors=True)
 
@@ -265,9 +360,11 @@ class HlsRunner:
             # that all-or-nothing by construction: the exit code covers the
             # whole ladder, and a partial ladder was already treated as failure.
             if proc.returncode != 0:
-                journalWriter.report_error(
+                HlsRunner.record_failed(
+                    journalWriter,
+                    track_id,
                     f"Failed to process {track_id} with command [{cmd}]: "
-                    f"{stderr.strip()[-500:]}\n"
+                    f"{stderr.strip()[-500:]}\n",
                 )
                 return
 
@@ -276,8 +373,7 @@ class HlsRunner:
             if not stage_track_dir:
                 # Written once per track, not once per quality: `remove_completed`
                 # reads this back into a set, so the extra lines were only bloat.
-                outputWriter.write(f"{track_id}\n")
-                journalWriter.report_completed(f"Completed {track_id}\n")
+                HlsRunner.record_completed(journalWriter, outputWriter, track_id)
                 if DELETE_SOURCE_AFTER_TRANSCODE and src_file:
                     os.unlink(src_file)
                 return
@@ -301,7 +397,11 @@ class HlsRunner:
                 src_f=src_file,
             ):
                 try:
-                    HlsRunner.publish_track(jw, ow, tid, wk, stage, src_f)
+                    if HlsRunner._publish_limit is None:
+                        HlsRunner.publish_track(jw, ow, tid, wk, stage, src_f)
+                    else:
+                        with HlsRunner._publish_limit:
+                            HlsRunner.publish_track(jw, ow, tid, wk, stage, src_f)
                 finally:
                     HlsRunner._publish_slots.release()
 
@@ -320,7 +420,9 @@ class HlsRunner:
             # `work` is {quality: {...}}, so the old `work['cmd']` raised
             # KeyError from inside the handler. Nothing calls .result() on these
             # futures, so that exception was swallowed and the failure vanished.
-            journalWriter.report_error(f"Failed to process {track_id}: {e}\n")
+            HlsRunner.record_failed(
+                journalWriter, track_id, f"Failed to process {track_id}: {e}\n"
+            )
         finally:
             # A failed track must not leave its part-encoded rungs behind. Once
             # handed off, ownership of the scratch directory passes to the
@@ -329,9 +431,70 @@ class HlsRunner:
             if stage_track_dir and not handed_off:
                 shutil.rmtree(stage_track_dir, ignore_errors=True)
 
+    @staticmethod
+    def process_leased(
+        journalWriter: JournalWriter,
+        messageWriter: PrintMessageReporter,
+        outputWriter: OutputWriter,
+        track_id: str,
+        work: dict,
+    ):
+        try:
+            if work is None:
+                # Every node must load the same worklist; an id this node has
+                # never heard of goes back for a node that has.
+                HlsRunner.record_failed(
+                    journalWriter, track_id, f"{track_id} is not in this node's worklist\n"
+                )
+                return
+            HlsRunner.process_one(
+                journalWriter, messageWriter, outputWriter, track_id, work
+            )
+        finally:
+            HlsRunner._queue_slots.release()
+
+    @staticmethod
+    def drain_queue(processor: StatAutoMuxMultiProcessor, worklist: dict):
+        """Claim, encode and come back for more until no node has anything left."""
+        queue = HlsRunner._queue
+        claimed = 0
+        slots = HlsRunner._queue_slots
+        while True:
+            # Blocks once every running encode is busy and a batch is queued
+            # behind them, and claims no more than fits, so the node never
+            # holds leases it is not about to use.
+            room = slots.wait_for_room()
+            ids = queue.claim(min(room, CLAIM_BATCH))
+            slots.take(len(ids))
+            if ids:
+                claimed += len(ids)
+                for track_id in ids:
+                    processor.submit_job(
+                        HlsRunner.process_leased, track_id, worklist.get(track_id)
+                    )
+                counts = queue.counts()
+                print(
+                    f"Claimed {claimed} so far | queue: {counts.get('done', 0)} done, "
+                    f"{counts.get('leased', 0)} leased, {counts.get('pending', 0)} pending, "
+                    f"{counts.get('failed', 0)} failed"
+                )
+                continue
+
+            # Nothing claimable. Leases still out -- ours in flight, or another
+            # node's -- may yet come back as pending (a failure) or expire (a
+            # dead node), so keep asking until none are left.
+            counts = queue.counts()
+            if not counts.get("leased") and not counts.get("pending"):
+                break
+            time.sleep(QUEUE_POLL_SECONDS)
+
     @staticmethod
     def start():
-        index, count = shard_config()
+        if QUEUE_DB:
+            # Which node does what is decided by the queue, not by the shard.
+            index, count = 0, 1
+        else:
+            index, count = shard_config()
 
         if STAGE_DIR:
             os.makedirs(STAGE_DIR, exist_ok=True)
@@ -363,17 +526,73 @@ class HlsRunner:
         # that is not CPU-bound anyway (the SMB node ran at 454% of 3200%) buys
         # nothing from more workers and costs the other node seeks.
         workers = int(os.environ.get("TLMC_WORKERS") or os.cpu_count())
+        tuner = None
+        encode_limit = None
+        if AUTOTUNE:
+            floor = WORKERS_MIN or max(1, workers // 4)
+            encode_limit = AdaptiveLimit(floor)
+            controllers = [AimdController("encode", encode_limit, floor, workers)]
+            if HlsRunner._publisher is not None:
+                HlsRunner._publish_limit = AdaptiveLimit(1)
+                controllers.append(
+                    AimdController(
+                        "publish", HlsRunner._publish_limit, 1, PUBLISH_WORKERS, step=1
+                    )
+                )
+            # Completed means published, so the rate is the end-to-end one both
+            # controllers are trying to raise.
+            tuner = AutoTuner(
+                lambda: journal_writer.stats["completed"],
+                controllers,
+                log=journal_writer.report,
+            )
+
         processor = StatAutoMuxMultiProcessor(
             workers,
             journal_writer,
             output_writer,
+            limit=encode_limit,
         )
-        print(f"Using {workers} workers")
+        if tuner is not None:
+            print(f"Autotuning encode workers between {floor} and {workers}")
+            tuner.start()
+        else:
+            print(f"Using {workers} workers")
 
         print("Loading worklist")
-        worklist = json_utils.json_load(hls_worklist_output)
+        worklist = artifact_store.load(hls_worklist_output)
         print("Loaded worklist ({} items)".format(len(worklist)))
 
+        if QUEUE_DB:
+            HlsRunner._queue = LeaseQueue(QUEUE_DB)
+            HlsRunner._queue_slots = LeaseSlots(
+                (lambda: encode_limit.limit) if encode_limit is not None else (lambda: workers)
+            )
+            print(f"Work queue {QUEUE_DB} as {HlsRunner._queue.owner}")
+
+            # The queue's own state is what says a track is done. Completed
+            # lists from runs that predate it are folded in once, so switching
+            # a sharded run over re-encodes nothing.
+            HlsRunner._queue.seed(worklist.keys())
+            HlsRunner._queue.import_completed(HlsRunner.read_completed())
+            HlsRunner._queue.start_heartbeat()
+            try:
+                HlsRunner.drain_queue(processor, worklist)
+                processor.wait_print_complete()
+                if HlsRunner._publisher is not None:
+                    print("\nEncodes finished, draining publish queue...")
+                    HlsRunner._publisher.shutdown(wait=True)
+                    print("Publish queue drained.")
+            finally:
+                # Anything still leased here was never finished; hand it back
+                # now rather than leaving it to expire.
+                HlsRunner._queue.close()
+                if tuner is not None:
+                    tuner.stop()
+
+            processor.reset_terminal()
+            return
+
         if count > 1:
             before = len(worklist)
             worklist = {
@@ -402,6 +621,9 @@ class HlsRunner:
             HlsRunner._publisher.shutdown(wait=True)
             print("Publish queue drained.")
 
+        if tuner is not None:
+            tuner.stop()
+
         processor.reset_terminal()
 
 
@@ -1,20 +1,280 @@
+"""
+Audits hls_runner's output without decoding it.
+
+A track lands in the completed list once ffmpeg exits cleanly and the publish
+copy returns, and until now nothing looked again: a write cut short on the SMB
+node -- a dropped session, a full share -- left a playlist pointing past the end
+of its stream.m4s, and the first to notice was a player. For every quality of
+every completed track this checks:
+
+    playlist   present, parses, ends with #EXT-X-ENDLIST
+    init       the EXT-X-MAP range is inside the file and opens with ftyp, moov
+    segments   every EXT-X-BYTERANGE is inside the file, opens on a moof box
+               (after ffmpeg's sidx, or a styp), and its boxes tile the range
+               exactly -- a segment that ends mid-box was cut or misaddressed
+    duration   the EXTINF durations sum to the source's within
+               DURATION_TOLERANCE_S
+
+Only box headers are read, 8 or 16 bytes at a time with unbuffered I/O, so a
+segment costs two or three small reads (sidx, moof, mdat) and the audio itself
+never crosses the wire. Legacy per-segment output is checked the same way, each
+segment file as one range.
+
+Source durations come from analysis_pass.py's samples sink where it ran (exact)
+and from Shared.probe_cache otherwise; a track with neither skips that check.
+
+Failed tracks are re-queued: their ids are taken out of every completed list,
+so the next hls_runner run encodes them again, and with TLMC_QUEUE_DB set their
+queue rows go back to pending. The lists are rewritten in place, so run this
+between encode runs, not alongside one -- a runner appends to the file it
+opened and its lines after the rewrite would be lost.
+
+    python -m Postprocessor.HlsTranscode.hls_verify [--dry-run]
+"""
+
+import glob
 import os
-import re
-import subprocess
-import Postprocessor.HlsTranscode.output.path_definitions as HlsTranscodePathDef
-from Shared import json_utils, utils
-from Shared.reporting_multi_processor import (
-    JournalWriter,
-    OutputWriter,
-    PrintMessageReporter,
-    StatAutoMuxMultiProcessor,
-)
-from Shared.utils import get_output_path
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Dict, Iterable, List, Optional, Set, Tuple
 
-SEGMENT_INDEX_EXTRACTOR = re.compile(r'segment_(\d+)\.m4s')
+import Postprocessor.HlsTranscode.output.path_definitions as HlsTranscodePathDef
+from Postprocessor.HlsTranscode import hls_playlist
+from Postprocessor.HlsTranscode.hls_queue import LeaseQueue
+from Postprocessor.HlsTranscode.hls_runner import HlsRunner, hls_completed_output
+from Shared import artifact_store, probe_cache, utils
 
 hls_worklist_output = utils.get_output_path(
     HlsTranscodePathDef, HlsTranscodePathDef.HLS_TRANSCODE_FILELIST_OUTPUT_NAME
 )
+hls_verify_failed_output = utils.get_output_path(
+    HlsTranscodePathDef, HlsTranscodePathDef.HLS_VERIFY_FAILED_OUTPUT_NAME
+)
+
+# Header reads are latency-bound, not bandwidth-bound: on the SMB node one
+# round trip is ~1 ms, so throughput scales with requests in flight.
+WORKERS = int(os.environ.get("TLMC_VERIFY_WORKERS") or 32)
+
+# AAC priming and the last partial frame put the EXTINF sum a frame or two off
+# the source (~23 ms each); a lost segment is ten seconds.
+DURATION_TOLERANCE_S = 0.5
+
+# Boxes a media segment may open with before its moof: ffmpeg's single_file
+# output puts a sidx ahead of every fragment.
+SEGMENT_PREFIX_BOXES = (b"sidx", b"styp", b"prft")
+
+
+def box_header(f: BinaryIO, pos: int) -> Optional[Tuple[bytes, int, int]]:
+    """(type, box size, header size) of the box at `pos`, or None on a short read."""
+    f.seek(pos)
+    head = f.read(8)
+    if len(head) < 8:
+        return None
+    size = int.from_bytes(head[:4], "big")
+    if size == 1:
+        large = f.read(8)
+        if len(large) < 8:
+            return None
+        return head[4:8], int.from_bytes(large, "big"), 16
+    # 0 means "to the end of the file"; the caller bounds it by the range.
+    return head[4:8], size, 8
+
+
+def check_range(
+    f: BinaryIO,
+    file_size: int,
+    offset: int,
+    length: int,
+    first: Tuple[bytes, ...],
+    prefix: Tuple[bytes, ...] = (),
+) -> Optional[str]:
+    """
+    Walks the box headers of one byte range: the first box after any `prefix`
+    boxes must be one of `first`, and the boxes must end exactly where the
+    range does. Returns what is wrong, or None.
+    """
+    end = offset + length
+    if length <= 0 or end > file_size:
+        return f"range {length}@{offset} past end of file ({file_size} bytes)"
+
+    lead = None
+    pos = offset
+    while pos < end:
+        header = box_header(f, pos)
+        if header is None:
+            return f"short read at {pos}"
+        box_type, size, header_size = header
+        if lead is None and box_type not in prefix:
+            # Checked before trusting the size: a range that starts off a box
+            # boundary reads payload as a header.
+            lead = box_type
+            if lead not in first:
+                return f"range {length}@{offset} opens with {lead!r}, not {first[0].decode()}"
+        if size == 0:
+            size = end - pos
+        if size < header_size:
+            return f"bad box size {size} at {pos}"
+        pos += size
+
+    if pos != end:
+        return f"boxes overrun range {length}@{offset} by {pos - end} bytes"
+    if lead is None:
+        return f"range {length}@{offset} holds no {first[0].decode()}"
+    return None
+
+
+def check_quality(dst_root: str, expected: Optional[float]) -> Optional[str]:
+    try:
+        playlist = hls_playlist.read(dst_root)
+    except (OSError, ValueError) as e:
+        return f"playlist: {e}"
+    if not playlist.ended:
+        return "playlist has no #EXT-X-ENDLIST"
+    if not playlist.segments:
+        return "playlist has no segments"
+
+    # One open file per media file: in single_file output that is one handle
+    # for the init section and every segment.
+    handles: Dict[str, Tuple[BinaryIO, int]] = {}
+    try:
+        def handle(uri: str) -> Tuple[BinaryIO, int]:
+            if uri not in handles:
+                f = open(os.path.join(dst_root, uri), "rb", buffering=0)
+                handles[uri] = (f, os.fstat(f.fileno()).st_size)
+            return handles[uri]
+
+        try:
+            if playlist.init_uri is not None:
+                f, size = handle(playlist.init_uri)
+                offset, length = playlist.init_byterange or (0, size)
+                problem = check_range(f, size, offset, length, (b"ftyp",))
+                if problem is None:
+                    # The init section is ftyp then moov; without the moov no
+                    # segment can be decoded.
+                    _, ftyp_size, _ = box_header(f, offset)
+                    moov = box_header(f, offset + ftyp_size)
+                    if moov is None or moov[0] != b"moov":
+                        problem = "init section has no moov"
+                if problem:
+                    return f"init: {problem}"
+
+            for i, segment in enumerate(playlist.segments):
+                f, size = handle(segment.uri)
+                offset, length = segment.byterange or (0, size)
+                problem = check_range(f, size, offset, length, (b"moof",), SEGMENT_PREFIX_BOXES)
+                if problem:
+                    return f"segment {i}: {problem}"
+        except OSError as e:
+            return f"media: {e}"
+    finally:
+        for f, _ in handles.values():
+            f.close()
+
+    if expected is not None and abs(playlist.duration - expected) > DURATION_TOLERANCE_S:
+        return f"duration {playlist.duration:.3f}s, source {expected:.3f}s"
+    return None
+
+
+def check_track(work_group: dict, durations: Dict[str, float]) -> List[Tuple[str, str]]:
+    """(quality, problem) for each quality of one track that fails."""
+    src = next(iter(work_group.values()))["src"]
+    expected = durations.get(src)
+    if expected is None:
+        expected = probe_cache.duration(src)
+
+    failures = []
+    for quality, work in work_group.items():
+        problem = check_quality(work["dst_root"], expected)
+        if problem:
+            failures.append((quality, problem))
+    return failures
+
+
+def verify(
+    worklist: dict, track_ids: Iterable[str], durations: Dict[str, float]
+) -> Dict[str, List[Tuple[str, str]]]:
+    track_ids = [t for t in track_ids if t in worklist]
+    failed: Dict[str, List[Tuple[str, str]]] = {}
+    lock = threading.Lock()
+    done = 0
+
+    def run(track_id):
+        nonlocal done
+        try:
+            failures = check_track(worklist[track_id], durations)
+        except Exception as e:
+            failures = [("*", f"verifier error: {e!r}")]
+        with lock:
+            if failures:
+                failed[track_id] = failures
+            done += 1
+            if done % 1000 == 0:
+                print(f"[{done}/{len(track_ids)}] {len(failed)} failed", end="\r")
+
+    with ThreadPoolExecutor(max_workers=WORKERS) as executor:
+        list(executor.map(run, track_ids))
+    print(f"[{done}/{len(track_ids)}] {len(failed)} failed")
+    return failed
+
+
+def write_report(failed: Dict[str, List[Tuple[str, str]]], path: str) -> None:
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        for track_id in sorted(failed):
+            for quality, problem in failed[track_id]:
+                f.write(f"{track_id}\t{quality}\t{problem}\n")
+    os.replace(tmp, path)
+
+
+def drop_from_completed(track_ids: Set[str]) -> int:
+    """Removes `track_ids` from every shard's completed list; returns lines dropped."""
+    root, ext = os.path.splitext(hls_completed_output)
+    dropped = 0
+    for path in sorted(glob.glob(f"{root}*{ext}")):
+        with open(path, "r", encoding="utf-8") as f:
+            lines = f.readlines()
+        kept = [line for line in lines if line.strip() not in track_ids]
+        if len(kept) == len(lines):
+            continue
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.writelines(kept)
+        os.replace(tmp, path)
+        dropped += len(lines) - len(kept)
+    return dropped
+
+
+def main():
+    dry_run = "--dry-run" in sys.argv[1:]
+
+    print(f"Load worklist from {hls_worklist_output}")
+    worklist = artifact_store.load(hls_worklist_output)
+    completed = HlsRunner.read_completed()
+    print(f"{len(completed)} completed tracks to verify with {WORKERS} workers")
+
+    # Imported here: the analysis pass pulls in the loudness stage's module,
+    # which nothing else in the verifier needs.
+    from Preprocessor.AudioNormalizer.analysis_pass import load_durations
+
+    failed = verify(worklist, completed, load_durations())
+    write_report(failed, hls_verify_failed_output)
+    print(f"Wrote {hls_verify_failed_output}")
+
+    if not failed:
+        return
+    if dry_run:
+        print(f"--dry-run: {len(failed)} failed tracks left in the completed lists")
+        return
+
+    print(f"Dropped {drop_from_completed(set(failed))} completed entries")
+    queue_db = os.environ.get("TLMC_QUEUE_DB")
+    if queue_db:
+        queue = LeaseQueue(queue_db, owner="verify")
+        print(f"Requeued {queue.requeue(failed)} tracks in {queue_db}")
+        queue.close()
+    print(f"{len(failed)} failed tracks will be encoded again by the next hls_runner run")
+
 
-hls_worklist = 
+if __name__ == "__main__":
+    main()
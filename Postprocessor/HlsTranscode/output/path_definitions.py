@@ -17,3 +17,6 @@ HLS_TRANSCODE_JOURNAL_GENERAL_OUTPUT_NAME = "hls_transcode.journal.general.outpu
 
 
 HLS_FINALIZED_FILELIST_OUTPUT_NAME = "hls.finalized.output.json"
+
+HLS_VERIFY_FAILED_OUTPUT_NAME = "hls_verify.failed.output.txt"
+HLS_FINALIZER_SCAN_CACHE_NAME = "hls_finalizer.scan.sqlite3"
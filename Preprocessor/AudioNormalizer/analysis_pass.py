@@ -0,0 +1,444 @@
+"""
+One decode per track, fanned out to every analysis that needs the PCM.
+
+Each full-catalog analysis used to be a read of the whole array of its own:
+loudness_measure.py's ebur128 pass (~8h), the exact durations, and the 24 kHz
+mono derivative the embedding run wants (V6-MIGRATION-HANDOFF.md section 7, ~6h
+disk-bound). The decode is cheap -- ~1000x realtime on one core -- and the read
+is what costs, so this runs a single ffmpeg per track whose filter graph feeds
+every sink that still lacks the track:
+
+    [0:a:0] -> ebur128 -> astats ... -> null        taps, chained in series
+            -> aresample 24k mono -> FLAC            writers, one branch each
+
+Taps are pass-through analysis filters, so they share one branch and cost no
+copy; each writer gets its own branch off an asplit.
+
+Sinks, picked with TLMC_ANALYSIS_SINKS (default "loudness,samples"):
+
+    loudness  integrated loudness, true peak, LRA and the static gain, into
+              loudness.output.jsonl -- the same records loudness_measure.py
+              writes, so the two are interchangeable and resume each other
+    samples   exact per-channel sample count from the decode, and the sample
+              rate; backfill_file_metadata.py prefers these durations
+    stats     astats DC offset, peak/RMS level, flat factor, clipped-peak
+              count and noise floor, for spotting broken rips
+    mert24k   24 kHz mono s16 FLAC under TLMC_MERT_AUDIO_ROOT, mirroring the
+              library layout -- what MERT consumes, at ~1/3 of the source size
+    fingerprint
+              spectral sub-fingerprints of the first two minutes, from 11 kHz
+              mono PCM piped back to the worker, for duplicate_match.py
+
+Every sink keeps its own JSONL of finished paths, so the pass resumes per sink:
+adding a sink later decodes only for that sink, and a track every sink already
+has is not read at all.
+
+A new sink is a class with a `tap` filter, or a `writer()` branch, and a
+`finish()` turning ffmpeg's log (and for a writer, its output file or ffmpeg's
+stdout) into a record; see the ones below. At most one writer can take stdout.
+"""
+
+import json
+import os
+import re
+import subprocess
+import sys
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Set, Tuple
+
+import Preprocessor.AudioNormalizer.output.path_definitions as AudioNormalizerPathDef
+import Processor.AudioDedup.output.path_definitions as AudioDedupPathDef
+from Preprocessor.AudioNormalizer import loudness_measure
+from Processor.AudioDedup import fingerprint
+from Shared import delta_worklist
+from Shared.utils import get_output_path
+
+SINKS = [
+    name.strip()
+    for name in os.environ.get("TLMC_ANALYSIS_SINKS", "loudness,samples").split(",")
+    if name.strip()
+]
+
+MERT_AUDIO_ROOT = os.environ.get("TLMC_MERT_AUDIO_ROOT", "")
+MERT_SAMPLE_RATE = 24000
+
+# One ffmpeg per worker, each pinned to one core, as in loudness_measure.py. The
+# taps add little to the decode; the 24 kHz writer roughly doubles per-track CPU
+# (soxr plus the FLAC encode), still well under what the disks can feed.
+MAX_WORKERS = loudness_measure.MAX_WORKERS
+
+# Generous next to loudness_measure's 600 s: the writer branch makes a long
+# track's pass slower, and a timeout throws the whole decode away.
+TIMEOUT = 1200
+
+samples_output = get_output_path(
+    AudioNormalizerPathDef, AudioNormalizerPathDef.ANALYSIS_SAMPLES_OUTPUT_NAME
+)
+stats_output = get_output_path(
+    AudioNormalizerPathDef, AudioNormalizerPathDef.ANALYSIS_STATS_OUTPUT_NAME
+)
+mert24k_output = get_output_path(
+    AudioNormalizerPathDef, AudioNormalizerPathDef.ANALYSIS_MERT24K_OUTPUT_NAME
+)
+fingerprints_output = get_output_path(
+    AudioDedupPathDef, AudioDedupPathDef.FINGERPRINTS_OUTPUT_NAME
+)
+
+# ffmpeg prints the input's stream line before any filter runs, and the filter
+# summaries after the last frame. ebur128 logs a line per 100 ms in between --
+# ~1 MB for a long track -- so only the two ends are decoded and searched.
+HEAD_BYTES = 16384
+TAIL_BYTES = 16384
+
+_INPUT_RATE = re.compile(r"Stream #0:\d+[^\n]*?: Audio: [^\n]*?, (\d+) Hz")
+_NUMBER_OF_SAMPLES = re.compile(r"\] Number of samples: (\d+)")
+
+_STATS_FIELDS = {
+    "DC offset": "dc_offset",
+    "Peak level dB": "peak_db",
+    "RMS level dB": "rms_db",
+    "Flat factor": "flat_factor",
+    "Peak count": "peak_count",
+    "Noise floor dB": "noise_floor_db",
+}
+_STATS = re.compile(r"\] (" + "|".join(_STATS_FIELDS) + r"): (\S+)")
+
+
+def read_done(path: str) -> Set[str]:
+    """The paths in a JSONL output; records are parsed but not kept."""
+    done = set()
+    if not os.path.isfile(path):
+        return done
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                done.add(json.loads(line)["path"])
+            except (json.JSONDecodeError, KeyError):
+                continue
+    return done
+
+
+def read_jsonl(path: str) -> Dict[str, dict]:
+    """{path: record} from a JSONL output, skipping a torn last line."""
+    records = {}
+    if not os.path.isfile(path):
+        return records
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                rec = json.loads(line)
+                records[rec["path"]] = rec
+            except (json.JSONDecodeError, KeyError):
+                continue
+    return records
+
+
+def load_durations() -> Dict[str, float]:
+    """{source path: exact duration in seconds} from the samples sink."""
+    return {
+        path: rec["duration"]
+        for path, rec in read_jsonl(samples_output).items()
+        if rec.get("duration")
+    }
+
+
+def _float(text: str) -> Optional[float]:
+    # astats prints -inf for a silent channel's levels; null, as in loudness.
+    try:
+        value = float(text)
+    except ValueError:
+        return None
+    return value if value not in (float("inf"), float("-inf")) and value == value else None
+
+
+class Sink(ABC):
+    name = ""
+    output_path = ""
+    # A pass-through filter chained with the other taps, or None for a writer.
+    tap: Optional[str] = None
+
+    def __init__(self) -> None:
+        # Paths only: the fingerprint output runs to a GB, and its records
+        # are of no use here.
+        self.done = read_done(self.output_path)
+
+    def writer(self, path: str) -> Optional[Tuple[str, List[str]]]:
+        """(filter chain, output args) for a writer sink's own branch."""
+        return None
+
+    @abstractmethod
+    def finish(self, path: str, head: str, tail: str, stdout: bytes) -> Optional[dict]:
+        """The record for `path` after a successful run, or None if unusable."""
+
+    def discard(self, path: str) -> None:
+        """Cleans up after a failed run."""
+
+
+class LoudnessSink(Sink):
+    name = "loudness"
+    output_path = loudness_measure.OUTPUT_PATH
+    tap = "ebur128=peak=true"
+
+    def __init__(self) -> None:
+        done = loudness_measure.load_done()
+        # Measurements carried over from normalizer_pass1 are written out, as
+        # loudness_measure.py does, so hls_assignment.py finds them.
+        loudness_measure.persist_done(done)
+        self.done = set(done)
+
+    def finish(self, path, head, tail, stdout):
+        result = loudness_measure.parse_ebur128(tail)
+        if result is None:
+            return None
+        return loudness_measure.loudness_record(path, *result)
+
+
+class SamplesSink(Sink):
+    name = "samples"
+    output_path = samples_output
+    tap = "astats=measure_perchannel=none:measure_overall=Number_of_samples"
+
+    def finish(self, path, head, tail, stdout):
+        rate = _INPUT_RATE.search(head)
+        samples = _NUMBER_OF_SAMPLES.search(tail)
+        if not (rate and samples):
+            return None
+        sample_rate, count = int(rate.group(1)), int(samples.group(1))
+        return {
+            "path": path,
+            "samples": count,
+            "sample_rate": sample_rate,
+            "duration": count / sample_rate if sample_rate else None,
+        }
+
+
+class StatsSink(Sink):
+    name = "stats"
+    output_path = stats_output
+    tap = "astats=measure_perchannel=none:measure_overall=" + "+".join(
+        key.replace(" dB", "").replace(" ", "_") for key in _STATS_FIELDS
+    )
+
+    def finish(self, path, head, tail, stdout):
+        found = {_STATS_FIELDS[k]: _float(v) for k, v in _STATS.findall(tail)}
+        if not found:
+            return None
+        return {"path": path, **found}
+
+
+class Mert24kSink(Sink):
+    name = "mert24k"
+    output_path = mert24k_output
+
+    def __init__(self, src_root: str, dst_root: str) -> None:
+        if not dst_root:
+            raise ValueError("the mert24k sink needs TLMC_MERT_AUDIO_ROOT")
+        super().__init__()
+        self.src_root = src_root
+        self.dst_root = dst_root
+
+    def target(self, path: str) -> str:
+        rel = os.path.relpath(path, self.src_root)
+        # Appended rather than substituted, so `x.wav` and `x.flac` side by
+        # side do not land on the same file.
+        if not rel.lower().endswith(".flac"):
+            rel += ".flac"
+        return os.path.join(self.dst_root, rel)
+
+    def writer(self, path):
+        out = self.target(path)
+        os.makedirs(os.path.dirname(out), exist_ok=True)
+        # soxr for the rate change; the mono downmix is the channel mean, which
+        # is what MERT's own preprocessing does.
+        chain = (
+            f"aresample={MERT_SAMPLE_RATE}:resampler=soxr,"
+            "aformat=sample_fmts=s16:channel_layouts=mono"
+        )
+        return chain, ["-map_metadata", "-1", "-c:a", "flac", "-f", "flac", out + ".partial"]
+
+    def finish(self, path, head, tail, stdout):
+        out = self.target(path)
+        try:
+            os.replace(out + ".partial", out)
+            size = os.path.getsize(out)
+        except OSError:
+            return None
+        return {"path": path, "out": out, "bytes": size}
+
+    def discard(self, path):
+        try:
+            os.remove(self.target(path) + ".partial")
+        except OSError:
+            pass
+
+
+class FingerprintSink(Sink):
+    name = "fingerprint"
+    output_path = fingerprints_output
+
+    def writer(self, path):
+        chain = (
+            f"atrim=end={fingerprint.FINGERPRINT_SECONDS},"
+            f"aresample={fingerprint.SAMPLE_RATE}:resampler=soxr,"
+            "aformat=sample_fmts=s16:channel_layouts=mono"
+        )
+        # Two minutes at 11 kHz is 2.6 MB; it comes back over the pipe rather
+        # than through a file.
+        return chain, ["-f", "s16le", "pipe:1"]
+
+    def finish(self, path, head, tail, stdout):
+        fp = fingerprint.fingerprint(stdout)
+        if not len(fp):
+            return None
+        return {
+            "path": path,
+            "fp": fingerprint.encode(fp),
+            # Header reads of a file just decoded, so from the page cache.
+            "md5": fingerprint.streaminfo_md5(path),
+            "duration": fingerprint.streaminfo_duration(path),
+        }
+
+
+def make_sinks(names: List[str], src_root: str) -> List[Sink]:
+    sinks = []
+    for name in names:
+        if name == "loudness":
+            sinks.append(LoudnessSink())
+        elif name == "samples":
+            sinks.append(SamplesSink())
+        elif name == "stats":
+            sinks.append(StatsSink())
+        elif name == "mert24k":
+            sinks.append(Mert24kSink(src_root, MERT_AUDIO_ROOT))
+        elif name == "fingerprint":
+            sinks.append(FingerprintSink())
+        else:
+            raise ValueError(f"unknown analysis sink: {name}")
+    return sinks
+
+
+def build_command(path: str, sinks: List[Sink]) -> List[str]:
+    """One ffmpeg run feeding every sink in `sinks` from a single decode."""
+    taps = [s.tap for s in sinks if s.tap]
+    writers = [w for w in (s.writer(path) for s in sinks) if w is not None]
+
+    branches = (1 if taps else 0) + len(writers)
+    graph = []
+    if branches == 1:
+        sources = ["[0:a:0]"]
+    else:
+        sources = [f"[b{k}]" for k in range(branches)]
+        graph.append(f"[0:a:0]asplit={branches}" + "".join(sources))
+
+    outputs = []
+    k = 0
+    if taps:
+        graph.append(f"{sources[k]}{','.join(taps)}[o{k}]")
+        outputs += ["-map", f"[o{k}]", "-f", "null", "-"]
+        k += 1
+    for chain, args in writers:
+        graph.append(f"{sources[k]}{chain}[o{k}]")
+        outputs += ["-map", f"[o{k}]", *args]
+        k += 1
+
+    return [
+        "ffmpeg", "-hide_banner", "-nostats", "-y", "-i", path,
+        "-threads", "1", "-filter_complex_threads", "1",
+        "-filter_complex", ";".join(graph), *outputs,
+    ]
+
+
+def analyze(path: str, sinks: List[Sink]) -> Optional[Dict[str, dict]]:
+    """{sink name: record} for the sinks that produced one; None if ffmpeg failed."""
+    try:
+        # Bytes, not text: ffmpeg echoes the Shift-JIS and GB18030 filenames of
+        # this library into its log (see loudness_measure.measure).
+        proc = subprocess.run(
+            build_command(path, sinks), capture_output=True, timeout=TIMEOUT
+        )
+        ok = proc.returncode == 0
+    except (subprocess.TimeoutExpired, OSError):
+        ok = False
+
+    if not ok:
+        for sink in sinks:
+            sink.discard(path)
+        return None
+
+    head = proc.stderr[:HEAD_BYTES].decode("utf-8", errors="replace")
+    tail = proc.stderr[-TAIL_BYTES:].decode("utf-8", errors="replace")
+    records = {}
+    for sink in sinks:
+        rec = sink.finish(path, head, tail, proc.stdout)
+        if rec is not None:
+            records[sink.name] = rec
+    return records
+
+
+def main():
+    root = input("Enter TLMC root path: ").strip()
+    if not os.path.isdir(root):
+        print("Invalid path")
+        sys.exit(1)
+
+    sinks = make_sinks(SINKS, root)
+    files = delta_worklist.restrict(loudness_measure.collect(root))
+    pending = [(f, [s for s in sinks if f not in s.done]) for f in files]
+    pending = [(f, needed) for f, needed in pending if needed]
+
+    print(f"Audio files : {len(files)}")
+    for sink in sinks:
+        print(f"  {sink.name:<9} : {len(sink.done)} done")
+    print(f"Pending     : {len(pending)} decodes")
+    print(f"Workers     : {MAX_WORKERS}")
+    if not pending:
+        print("Nothing to do.")
+        return
+
+    lock = threading.Lock()
+    outs = {s.name: open(s.output_path, "a", encoding="utf-8") for s in sinks}
+    state = {"n": 0, "failed": 0, "incomplete": 0}
+
+    def work(item):
+        path, needed = item
+        # One bad file must not end the pass, as in loudness_measure.
+        try:
+            records = analyze(path, needed)
+        except Exception as e:  # noqa: BLE001 - deliberately broad
+            print(f"\nanalysis failed for {path!r}: {e!r}")
+            records = None
+        with lock:
+            state["n"] += 1
+            if records is None:
+                state["failed"] += 1
+            else:
+                if len(records) < len(needed):
+                    state["incomplete"] += 1
+                for name, rec in records.items():
+                    outs[name].write(json.dumps(rec, ensure_ascii=False) + "\n")
+                    outs[name].flush()
+            if state["n"] % 200 == 0:
+                print(f"[{state['n']}/{len(pending)}] {state['failed']} failed", end="\r")
+
+    try:
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            list(executor.map(work, pending))
+    finally:
+        for f in outs.values():
+            f.close()
+
+    print(f"\nDecoded {state['n'] - state['failed']} tracks, {state['failed']} failed")
+    if state["incomplete"]:
+        print(f"{state['incomplete']} decodes left a sink without a result; "
+              f"rerun to retry them")
+    for sink in sinks:
+        print(f"Wrote {sink.output_path}")
+
+
+if __name__ == "__main__":
+    main()
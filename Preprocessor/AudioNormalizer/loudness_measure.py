@@ -35,7 +35,8 @@ import sys
 import threading
 from concurrent.futures import ThreadPoolExecutor
 
-from Shared.utils import get_file_relative
+from Shared import delta_worklist
+from Shared.utils import get_output_root
 
 # Streaming platforms converge on -14 LUFS (Spotify, YouTube, Tidal, Amazon);
 # Apple uses -16. The pipeline previously targeted -24, which is the EBU R128
@@ -51,7 +52,7 @@ MAX_WORKERS = max(1, (os.cpu_count() or 4) - 2)
 
 AUDIO_EXTENSIONS = (".flac", ".mp3", ".wav", ".wv", ".m4a")
 
-output_root = get_file_relative(__file__, "output")
+output_root = get_output_root(__file__)
 os.makedirs(output_root, exist_ok=True)
 OUTPUT_PATH = os.path.join(output_root, "loudness.output.jsonl")
 LEGACY_PASS1 = os.path.join(output_root, "normalize.firstpass_detect.output.json")
@@ -136,13 +137,41 @@ def measure(path: str):
 
     # ebur128 prints its summary at the end of stderr. Only the numbers matter,
     # so any undecodable filename bytes can be replaced rather than raising.
-    tail = proc.stderr[-2000:].decode("utf-8", errors="replace")
+    return parse_ebur128(proc.stderr[-2000:].decode("utf-8", errors="replace"))
+
+
+def parse_ebur128(tail: str):
+    """(i, tp, lra) from the end of an ebur128=peak=true log, or None."""
+    # The per-frame lines before the summary carry running "I:" values too.
+    summary = tail.rfind("Summary:")
+    if summary >= 0:
+        tail = tail[summary:]
     i, lra, peak = _I.search(tail), _LRA.search(tail), _PEAK.search(tail)
     if not (i and lra and peak):
         return None
     return float(i.group(1)), float(peak.group(1)), float(lra.group(1))
 
 
+def loudness_record(path: str, i: float, tp: float, lra: float) -> dict:
+    """One output line for a measured track."""
+    # json.dumps would write bare Infinity/NaN, which no strict JSON reader
+    # accepts. Null says the same thing portably, and gain_db is 0 either way.
+    return {
+        "path": path,
+        "i": i if math.isfinite(i) else None,
+        "tp": tp if math.isfinite(tp) else None,
+        "lra": lra if math.isfinite(lra) else None,
+        "gain_db": round(static_gain_db(i, tp), 3),
+        "source": "ebur128",
+    }
+
+
+def is_silent(i: float, tp: float) -> bool:
+    # A silent track reads I = -70 LUFS with a peak of -inf, so the peak is the
+    # non-finite one, not the loudness.
+    return not (math.isfinite(i) and math.isfinite(tp)) or i <= SILENCE_FLOOR_LUFS
+
+
 def load_done():
     """Paths already measured, from this stage or an earlier normalizer_pass1 run."""
     done = {}
@@ -188,6 +217,18 @@ def load_done():
     return done
 
 
+def persist_done(done) -> None:
+    """
+    Rewrites the output so carried-over records are persisted alongside new
+    ones, and the file is the single source of truth afterwards.
+    """
+    if not done:
+        return
+    with open(OUTPUT_PATH, "w", encoding="utf-8") as f:
+        for rec in done.values():
+            f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+
+
 def collect(root: str):
     files = []
     for path, _dirs, names in os.walk(root):
@@ -204,14 +245,9 @@ def main():
         sys.exit(1)
 
     done = load_done()
-    if done:
-        # Rewrite the output so carried-over records are persisted alongside new
-        # ones, and the file is the single source of truth afterwards.
-        with open(OUTPUT_PATH, "w", encoding="utf-8") as f:
-            for rec in done.values():
-                f.write(json.dumps(rec, ensure_ascii=False) + "\n")
-
-    files = collect(root)
+    persist_done(done)
+
+    files = delta_worklist.restrict(collect(root))
     pending = [f for f in files if f not in done]
     print(f"Audio files      : {len(files)}")
     print(f"Already measured : {len(done)}")
@@ -239,22 +275,9 @@ def main():
             if result is None:
                 state["failed"] += 1
             else:
-                i, tp, lra = result
-                # A silent track reads I = -70 LUFS with a peak of -inf, so the
-                # peak is the non-finite one, not the loudness.
-                if not (math.isfinite(i) and math.isfinite(tp)) or i <= SILENCE_FLOOR_LUFS:
+                if is_silent(result[0], result[1]):
                     state["silent"] += 1
-                # json.dumps would write bare Infinity/NaN, which no strict JSON
-                # reader accepts. Null says the same thing portably, and gain_db
-                # is 0 either way.
-                out.write(json.dumps({
-                    "path": path,
-                    "i": i if math.isfinite(i) else None,
-                    "tp": tp if math.isfinite(tp) else None,
-                    "lra": lra if math.isfinite(lra) else None,
-                    "gain_db": round(static_gain_db(i, tp), 3),
-                    "source": "ebur128",
-                }, ensure_ascii=False) + "\n")
+                out.write(json.dumps(loudness_record(path, *result), ensure_ascii=False) + "\n")
                 out.flush()
             if state["n"] % 200 == 0:
                 print(f"[{state['n']}/{len(pending)}] {state['failed']} failed", end="\r")
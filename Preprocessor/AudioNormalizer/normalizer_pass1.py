@@ -5,6 +5,7 @@ from dataclasses import dataclass
 from typing import Dict
 
 import Preprocessor.AudioNormalizer.output.path_definitions as AudioNormalizerOutputPaths
+from Shared import probe_cache
 from Shared.reporting_multi_processor import (
     JournalWriter,
     OutputWriter,
@@ -104,21 +105,6 @@ class Stage1WorkResult:
 
 class Stage1:
 
-    @staticmethod
-    def make_ffprobe_get_sample_format_cmd(src: str):
-        return [
-            "ffprobe",
-            "-show_format",
-            "-show_streams",
-            "-of",
-            "json",
-            "-i",
-            oslex_quote(src),
-            "-hide_banner",
-            "-v",
-            "quiet",
-        ]
-
     @staticmethod
     def make_ffmpeg_detect_loudness_cmd(src):
         return [
@@ -216,44 +202,18 @@ class Stage1:
 
             results_json = json.loads(Stage1.find_json_output(all_outputs))
 
-            # Get the file's sample format as by default the loutnorm filter will output s32
-            cmd = " ".join(
-                Stage1.make_ffprobe_get_sample_format_cmd(file),
-            )
-
-            proc = subprocess.Popen(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                shell=True,
-            )
-
-            read_format_results = []
-            for line in proc.stdout:
-                try:
-                    line_decoded = line.decode("utf-8")
-                    read_format_results.append(line_decoded.strip())
-                    messageWriter.report_state(f"[{file}] ffprobe in progress")
-                except UnicodeDecodeError as ude:
-                    journalWriter.report(
-                        f"Process {file} with command [{cmd}] Results in non utf-8 decodable line in the output. Hexdump of line in interest: |{line.hex().strip()}|. Skipping the decode for the line and continuing\n"
-                    )
-                except Exception as e:
-                    journalWriter.report_error(
-                        f"Failed to process {file} with command [{cmd}] [EXCEPTION: {e}]\n"
-                    )
-
-            proc.wait()
-
-            if proc.returncode != 0:
+            # Get the file's sample format as by default the loutnorm filter will output s32.
+            # From the shared probe cache: the info scanners have usually seen
+            # this file already, and a miss probes it once for every stage.
+            sample_fmt_json = probe_cache.probe(file)
+            if sample_fmt_json is None:
                 journalWriter.report_error(
-                    f"Failed to process {file} with command [{cmd}]. Process returned code {proc.returncode}\n"
+                    f"Failed to process {file}: could not probe sample format\n"
                 )
                 return
 
-            sample_fmt_json = json.loads("".join(read_format_results))
             sample_fmt = "s16"
-            for stream in sample_fmt_json["streams"]:
+            for stream in sample_fmt_json.get("streams", []):
                 if stream["codec_type"] == "audio":
                     if "sample_fmt" in stream:
                         sample_fmt = stream["sample_fmt"]
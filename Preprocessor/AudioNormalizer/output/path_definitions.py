@@ -17,3 +17,9 @@ NORMALIZE_SECOND_PASS_CONVERT_JOURNAL_NAME = "normalize.secondpass_convert.journ
 # Per-track loudness measurement used to apply a static gain at HLS transcode
 # time (loudness_measure.py). Replaces the two-pass in-place normalizer.
 LOUDNESS_OUTPUT_NAME = "loudness.output.jsonl"
+
+# Fused single-decode analysis (analysis_pass.py). Loudness lands in
+# LOUDNESS_OUTPUT_NAME as before; the other sinks each get a JSONL of their own.
+ANALYSIS_SAMPLES_OUTPUT_NAME = "analysis.samples.output.jsonl"
+ANALYSIS_STATS_OUTPUT_NAME = "analysis.stats.output.jsonl"
+ANALYSIS_MERT24K_OUTPUT_NAME = "analysis.mert24k.output.jsonl"
@@ -17,6 +17,8 @@ public struct TrackProcess
     public string Performer { get; set; }
     public string? Begin { get; set; }
     public string Duration { get; set; }
+    public int BeginFrames { get; set; }
+    public int? EndFrames { get; set; }
 }
 
 public struct AlbumProcess
@@ -135,7 +137,9 @@ public static class CueSplit
             TrackNumber = track.TrackNumber.ToString(),
             Performer = track.Performer,
             Begin = begin.ToTimeSpan().ToString(),
-            Duration = end?.Duration(begin).ToString() ?? string.Empty
+            Duration = end?.Duration(begin).ToString() ?? string.Empty,
+            BeginFrames = begin.ToFrames(),
+            EndFrames = end?.ToFrames()
         };
 
         return trackProcess;
@@ -9,6 +9,15 @@ public static class IndexExtensions
         return new TimeSpan(0, index.Minutes, index.Seconds);
     }
 
+    /// <summary>
+    /// Absolute position in CD frames (1/75 s). Unlike ToTimeSpan this keeps the
+    /// frame part of the index, so it maps onto an exact sample offset.
+    /// </summary>
+    public static int ToFrames(this Index index)
+    {
+        return (index.Minutes * 60 + index.Seconds) * 75 + index.Frames;
+    }
+
     public static TimeSpan Duration(this Index index, Index comp)
     {
         return (index.ToTimeSpan() - comp.ToTimeSpan()).Duration();
@@ -9,7 +9,7 @@ from Shared.json_utils import json_dump
 from Shared.utils import (
     check_cuesheet_attr,
     get_cuesheet_attr,
-    get_file_relative,
+    get_output_root,
     max_common_prefix,
     recurse_search,
 )
@@ -57,7 +57,7 @@ from Preprocessor.CueSplitter.output.path_definitions import (
     CUE_SPLIT_PLAN_OUTPUT_NAME,
 )
 
-output_root = get_file_relative(__file__, "output")
+output_root = get_output_root(__file__)
 input_potential = os.path.join(output_root, CUE_SCANNER_OUTPUT_NAME)
 input_split_plan = os.path.join(output_root, CUE_SPLIT_PLAN_OUTPUT_NAME)
 output_designated = os.path.join(output_root, CUE_DESIGNATER_OUTPUT_NAME)
@@ -1,24 +1,29 @@
 import json
 import os
 import threading
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 from Preprocessor.CueSplitter.output.path_definitions import CUE_SCANNER_OUTPUT_NAME
-from Shared.utils import check_cuesheet_attr, get_file_relative
+from Shared import delta_worklist
+from Shared.utils import check_cuesheet_attr, get_output_root
 
 TARGET_TYPES = (".flac", ".wav", ".mp3", ".m4a")
 
-# One ffprobe is spawned per audio file (~48ms each, ~150k files), so the scan is
-# subprocess bound rather than CPU or disk bound. Scanning albums concurrently
-# turns a two hour serial walk into minutes. Kept modest so the probes do not
-# swamp a rotational disk with seeks.
+# One ffprobe used to be spawned per audio file (~48ms each, ~150k files), which
+# made the scan subprocess bound. The CUESHEET tag is now read from the file
+# headers in process (Shared/media_reader.py), which is a few KB of reads and
+# pure-Python parsing, so albums are scanned in a process pool rather than
+# threads. Kept modest so the reads do not swamp a rotational disk with seeks.
+# Results land in the shared probe cache (Shared/probe_cache.py), so a rerun --
+# and the later stages that read the same files -- read nothing for files that
+# have not changed.
 MAX_WORKERS = 8
 
 # The full result is written once, at the end. Flushing partial results
 # periodically means an interrupted scan still leaves something usable.
 PARTIAL_WRITE_EVERY = 250
 
-output_root = get_file_relative(__file__, "output")
+output_root = get_output_root(__file__)
 os.makedirs(output_root, exist_ok=True)
 output_file = os.path.join(output_root, CUE_SCANNER_OUTPUT_NAME)
 
@@ -158,6 +163,7 @@ def main():
     album_paths = []
     for circle_path in circles:
         album_paths.extend(list_subdirectories(circle_path))
+    album_paths = delta_worklist.restrict(album_paths)
 
     print(f"Found {len(album_paths)} albums under {len(circles)} circles")
     print(f"Scanning with {MAX_WORKERS} workers")
@@ -166,7 +172,7 @@ def main():
     lock = threading.Lock()
     scanned = 0
 
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+    with ProcessPoolExecutor(max_workers=MAX_WORKERS) as executor:
         futures = {
             executor.submit(scan_potential_album, path): path for path in album_paths
         }
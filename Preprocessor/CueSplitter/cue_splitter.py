@@ -11,12 +11,12 @@ from Preprocessor.CueSplitter.output.path_definitions import CUE_DESIGNATER_OUTP
 from Shared.json_utils import json_dump, json_load
 from Shared.utils import (
     check_cuesheet_attr,
-    get_file_relative,
+    get_output_root,
     max_common_prefix,
     oslex_quote,
 )
 
-output_root = get_file_relative(__file__, "output")
+output_root = get_output_root(__file__)
 input_designated = os.path.join(output_root, CUE_DESIGNATER_OUTPUT_NAME)
 
 journal_completed_path = os.path.join(output_root, "splitter.completed.output.txt")
@@ -37,6 +37,81 @@ def mk_ffmpeg_cmd(track, info):
     return f'ffmpeg -i {oslex_quote(audio_path)} -ss {track["Begin"]} -t {track["Duration"]} -movflags faststart {oslex_quote(out)} -y -stats -v quiet'
 
 
+# "single_pass": one ffmpeg per image, decoded once and fanned out to every
+# track through asplit/atrim. "per_track": the original one-ffmpeg-per-track
+# split. With -ss after -i each of those decodes the image from the start up
+# to its seek point, so an N-track image costs ~N/2 full decodes.
+SPLIT_MODE = "single_pass"
+
+# CUE INDEX times are mm:ss:ff with 75 frames per second. A frame is a whole
+# number of samples at every rate TLMC ships (588 @ 44.1k, 640 @ 48k), so a
+# frame offset is an exact sample offset.
+CUE_FRAMES_PER_SECOND = 75
+
+_timespan_re = re.compile(r"^(?:(\d+)\.)?(\d+):(\d+):(\d+)(?:\.(\d+))?$")
+
+
+def timespan_seconds(ts: str) -> float:
+    # .NET TimeSpan.ToString(): [d.]hh:mm:ss[.fffffff]
+    m = _timespan_re.match(ts)
+    if not m:
+        raise ValueError(f"Unrecognized TimeSpan {ts!r}")
+    days, h, mins, sec, frac = m.groups()
+    seconds = int(days or 0) * 86400 + int(h) * 3600 + int(mins) * 60 + int(sec)
+    return seconds + (float(f"0.{frac}") if frac else 0.0)
+
+
+def track_bounds(track):
+    """
+    (begin, end) of a track in CUE frames, end is None for the last track.
+
+    Profiles designated before CueSplitInfoProvider emitted BeginFrames only
+    carry the TimeSpan strings, which have the frame part truncated off.
+    """
+    if track.get("BeginFrames") is not None:
+        return track["BeginFrames"], track.get("EndFrames")
+
+    begin = round(timespan_seconds(track["Begin"]) * CUE_FRAMES_PER_SECOND)
+    if not track["Duration"]:
+        return begin, None
+    duration = round(timespan_seconds(track["Duration"]) * CUE_FRAMES_PER_SECOND)
+    return begin, begin + duration
+
+
+def frames_to_time(frames: int) -> str:
+    # ffmpeg parses durations to the microsecond and atrim rounds to the
+    # nearest sample. At <= 192 kHz that error is under 0.1 sample, so the cut
+    # lands exactly on the frame's sample.
+    return f"{frames / CUE_FRAMES_PER_SECOND:.6f}"
+
+
+def mk_ffmpeg_single_pass_cmd(info):
+    audio_path = info["AudioFilePath"]
+    if info["AudioFilePathGuessed"]:
+        audio_path = info["AudioFilePathGuessed"]
+
+    tracks = info["Tracks"]
+    graph = [
+        f"[0:a]asplit={len(tracks)}" + "".join(f"[s{i}]" for i in range(len(tracks)))
+    ]
+    outputs = []
+    for idx, track in enumerate(tracks):
+        begin, end = track_bounds(track)
+        trim = f"start={frames_to_time(begin)}"
+        if end is not None:
+            trim += f":end={frames_to_time(end)}"
+        # atrim keeps the source timestamps, reset them so every track starts at 0
+        graph.append(f"[s{idx}]atrim={trim},asetpts=PTS-STARTPTS[o{idx}]")
+
+        out = os.path.join(info["Root"], track["TrackName"])
+        outputs.append(f"-map {oslex_quote(f'[o{idx}]')} {oslex_quote(out)}")
+
+    return (
+        f"ffmpeg -y -stats -v quiet -i {oslex_quote(audio_path)} "
+        f"-filter_complex {oslex_quote(';'.join(graph))} {' '.join(outputs)}"
+    )
+
+
 # Delete the source image and its cue once every track has been written and
 # verified. Off by default: splitting is irreversible, and a mistake in the
 # designation (wrong cue paired to the wrong audio, stale CUESHEET tag on an
@@ -52,35 +127,77 @@ stats = {
 }
 
 
+cap_time = re.compile(r"time=(\d{2}:\d{2}:\d{2}.\d{2})")
+
+
+def split_per_track(profile, ident):
+    """Returns the command executed for each track, in track order."""
+    exec_cmds = []
+    for idx, track in enumerate(profile["Tracks"]):
+        file_name = track["TrackName"]
+        cmd = mk_ffmpeg_cmd(track, profile)
+        exec_cmds.append(cmd)
+        proc = subprocess.Popen(
+            cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            universal_newlines=True,
+            shell=True,
+            encoding="utf-8",
+        )
+
+        for line in proc.stdout:
+            progress_time = cap_time.search(line)
+            print_logs[ident] = (
+                f"[{idx + 1}/{len(profile['Tracks'])}] ({progress_time.group(1) if progress_time else 'NO_INFO'}) {file_name}"
+            )
+
+        proc.wait()
+
+        time.sleep(0.6)
+
+    return exec_cmds
+
+
+def split_single_pass(profile, ident):
+    """Returns the command executed for each track, in track order."""
+    cmd = mk_ffmpeg_single_pass_cmd(profile)
+    proc = subprocess.Popen(
+        cmd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        universal_newlines=True,
+        shell=True,
+        encoding="utf-8",
+    )
+
+    for line in proc.stdout:
+        progress_time = cap_time.search(line)
+        print_logs[ident] = (
+            f"[{len(profile['Tracks'])} tracks] ({progress_time.group(1) if progress_time else 'NO_INFO'}) {profile['id']}"
+        )
+
+    proc.wait()
+
+    # All tracks come out of one process, so a non-zero exit can leave every
+    # file truncated but non-empty; the size check below would not catch it.
+    if proc.returncode != 0:
+        raise Exception(
+            f"FFmpeg exited with {proc.returncode} (FFmpeg Cmd Executed: {cmd})"
+        )
+
+    return [cmd] * len(profile["Tracks"])
+
+
 def process_one(profile):
     global print_logs
-    cap_time = re.compile(r"time=(\d{2}:\d{2}:\d{2}.\d{2})")
     try:
         ident = threading.get_ident()
         # PROBE EACH OUTPUT FILE TO SEE IF IT EXISTS AND IS COMPLETE AFTER PROCESSING
-        exec_cmds = []
-        for idx, track in enumerate(profile["Tracks"]):
-            file_name = track["TrackName"]
-            cmd = mk_ffmpeg_cmd(track, profile)
-            exec_cmds.append(cmd)
-            proc = subprocess.Popen(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                universal_newlines=True,
-                shell=True,
-                encoding="utf-8",
-            )
-
-            for line in proc.stdout:
-                progress_time = cap_time.search(line)
-                print_logs[ident] = (
-                    f"[{idx + 1}/{len(profile['Tracks'])}] ({progress_time.group(1) if progress_time else 'NO_INFO'}) {file_name}"
-                )
-
-            proc.wait()
-
-            time.sleep(0.6)
+        if SPLIT_MODE == "single_pass":
+            exec_cmds = split_single_pass(profile, ident)
+        else:
+            exec_cmds = split_per_track(profile, ident)
 
         for (
             idx,
@@ -8,6 +8,25 @@ the two-level `<circle>/<album>/` layout the rest of the pipeline expects.
 
 Progress is journaled per archive, so the script can be interrupted and rerun;
 archives already recorded as complete are skipped.
+
+Several `7z x` run at once. The v6 archives are `Method = Copy`, so each
+extraction is a stream copy bound by the disk, not the CPU, and one at a time
+left the second drive behind the bridge idle. A job is started only when:
+
+  * the destination has room for it: its unpacked size from the plan, on top of
+    what the running jobs have reserved and a safety margin. The release fits
+    on the volume only because archives are unlinked as they go (handoff doc,
+    3.3), so running ahead of the unlinks must never fill the disk;
+  * every device it touches -- the one holding the archive and the one being
+    written -- has a free slot. A spinning disk gets two streams, which keeps
+    its queue full without turning the copy into seeks; solid state gets more
+    (Preprocessor/Extract/snapshot.py, device_workers).
+
+An archive is unlinked only after its extraction is verified -- 7z exited
+cleanly, every album directory the plan expects exists, and for a flat archive
+the bytes on disk match the listing -- and after the journal line saying so is
+on disk. The journal stays open for the run; lines are fsynced in batches, and
+at once before anything is deleted.
 """
 
 import json
@@ -15,17 +34,28 @@ import os
 import shutil
 import subprocess
 import threading
+import time
 from collections import defaultdict
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
 import Preprocessor.Extract.output.path_definitions as ExtractOutputPaths
 from Preprocessor.Extract.extract_plan import LAYOUT_FLAT
+from Preprocessor.Extract.snapshot import device_workers
 from Shared.json_utils import json_load
 from Shared.utils import get_output_path
 
-# Extraction is IO bound and the v6 archives are stored uncompressed, so more
-# workers only helps on solid state storage. Keep this at 1 for spinning disks.
-MAX_WORKERS = 1
+# Upper bound on extractions in flight; the per-device slots usually bind first.
+MAX_WORKERS = int(os.environ.get("TLMC_EXTRACT_WORKERS") or 4)
+
+# Streams per device. Unset, taken from whether the device is rotational.
+JOBS_PER_DEVICE = int(os.environ.get("TLMC_EXTRACT_JOBS_PER_DEVICE") or 0)
+
+# Left free on the destination beyond every running job's reservation, for the
+# filesystem's own metadata and whatever else is writing to the volume.
+FREE_SPACE_MARGIN = 8 * 1024**3
+
+# Journal lines are fsynced at least this often, and always before an unlink.
+JOURNAL_SYNC_SECONDS = 5.0
 
 # Delete each archive once it has been extracted. Halves the peak disk
 # requirement but destroys the downloaded release (and any torrent seeding it).
@@ -61,16 +91,48 @@ def load_journal():
     return completed
 
 
-def append_journal(record, lock):
-    with lock:
-        with open(journal_path, "a", encoding="utf-8") as f:
-            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+class Journal:
+    """
+    The extraction journal and error log, each opened once for the run.
+
+    Lines are written as they come and fsynced every JOURNAL_SYNC_SECONDS, so a
+    crash loses at most the last few seconds of records -- which only means
+    re-extracting those archives. sync() forces them out, and is called before
+    an archive is deleted: a "completed" line lost after the unlink would leave
+    the rerun looking for an archive that is gone.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._journal = open(journal_path, "a", encoding="utf-8")
+        self._errors = open(error_log_path, "a", encoding="utf-8")
+        self._last_sync = time.monotonic()
+
+    def record(self, record) -> None:
+        with self._lock:
+            self._journal.write(json.dumps(record, ensure_ascii=False) + "\n")
+            if time.monotonic() - self._last_sync >= JOURNAL_SYNC_SECONDS:
+                self._sync()
+
+    def error(self, message) -> None:
+        with self._lock:
+            self._errors.write(message + "\n")
+            self._errors.flush()
+
+    def _sync(self) -> None:
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+        self._last_sync = time.monotonic()
 
+    def sync(self) -> None:
+        with self._lock:
+            self._sync()
 
-def append_error(message, lock):
-    with lock:
-        with open(error_log_path, "a", encoding="utf-8") as f:
-            f.write(message + "\n")
+    def close(self) -> None:
+        with self._lock:
+            self._sync()
+            self._journal.close()
+            self._errors.close()
 
 
 def check_collisions(entries):
@@ -86,17 +148,63 @@ def check_collisions(entries):
     return {key: value for key, value in destinations.items() if len(value) > 1}
 
 
+def unpacked_bytes(entry):
+    """
+    Space an archive needs once extracted. Plans written before the listing
+    recorded it fall back to the archive's own size, which for the v6 `Method =
+    Copy` archives is within a few KiB.
+    """
+    if entry.get("UnpackedBytes") is not None:
+        return entry["UnpackedBytes"]
+    try:
+        return os.path.getsize(entry["Archive"])
+    except OSError:
+        return 0
+
+
 def required_bytes(entries):
+    return sum(unpacked_bytes(entry) for entry in entries)
+
+
+def tree_bytes(path):
     total = 0
-    for entry in entries:
-        try:
-            total += os.path.getsize(entry["Archive"])
-        except OSError:
-            pass
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
     return total
 
 
-def extract_one(entry, lock):
+def verify(entry):
+    """Problems with an extraction 7z reported as successful; empty if none."""
+    destination = entry["ExtractInto"]
+
+    # For a flat archive the destination is the album directory itself; for
+    # the other layouts the archive brought its own album directories along.
+    if entry["Layout"] == LAYOUT_FLAT:
+        expected = [destination]
+    else:
+        expected = [os.path.join(destination, a) for a in entry["Albums"]]
+
+    problems = []
+    missing = [path for path in expected if not os.path.isdir(path)]
+    if missing:
+        problems.append(f"MISSING ALBUM DIRS expected {missing}")
+
+    # Only a flat archive owns its destination outright; the album directories
+    # of the others do not necessarily hold every file the archive carried.
+    if entry["Layout"] == LAYOUT_FLAT and not missing and entry.get("UnpackedBytes"):
+        on_disk = tree_bytes(destination)
+        if on_disk != entry["UnpackedBytes"]:
+            problems.append(
+                f"SIZE MISMATCH {on_disk} bytes on disk, {entry['UnpackedBytes']} listed"
+            )
+    return problems
+
+
+def extract_one(entry, journal):
     """
     Extracts a single archive into the destination its plan entry assigns.
 
@@ -118,12 +226,9 @@ def extract_one(entry, lock):
 
         if result.returncode != 0:
             output = result.stdout.decode("utf-8", errors="replace").strip()
-            append_error(
-                f"7Z FAILED [{archive}] exit {result.returncode}\n{output}", lock
-            )
-            append_journal(
-                {"Archive": archive, "Status": "failed", "Code": result.returncode},
-                lock,
+            journal.error(f"7Z FAILED [{archive}] exit {result.returncode}\n{output}")
+            journal.record(
+                {"Archive": archive, "Status": "failed", "Code": result.returncode}
             )
             # Do not leave an empty album directory behind; the album scanner
             # would otherwise pick it up and flag it as an album with no tracks.
@@ -131,29 +236,82 @@ def extract_one(entry, lock):
                 os.rmdir(destination)
             return False
 
-        # For a flat archive the destination is the album directory itself; for
-        # the other layouts the archive brought its own album directories along.
-        if entry["Layout"] == LAYOUT_FLAT:
-            expected = [destination]
-        else:
-            expected = [os.path.join(destination, a) for a in entry["Albums"]]
+        problems = verify(entry)
+        for problem in problems:
+            journal.error(f"{problem} [{archive}]")
 
-        missing = [path for path in expected if not os.path.isdir(path)]
-        if missing:
-            append_error(f"MISSING ALBUM DIRS [{archive}] expected {missing}", lock)
-
-        if DELETE_ARCHIVE_AFTER_EXTRACT:
+        # Recorded as completed either way -- 7z is done with it, and a rerun
+        # would only extract it over itself -- but an archive whose result
+        # does not check out is kept for a look by hand.
+        journal.record(
+            {"Archive": archive, "Status": "completed", "Verified": not problems}
+        )
+        if DELETE_ARCHIVE_AFTER_EXTRACT and not problems:
+            journal.sync()
             os.unlink(archive)
-
-        append_journal({"Archive": archive, "Status": "completed"}, lock)
         return True
 
     except Exception as e:
-        append_error(f"ERROR [{archive}] {e}", lock)
-        append_journal({"Archive": archive, "Status": "failed", "Error": str(e)}, lock)
+        journal.error(f"ERROR [{archive}] {e}")
+        journal.record({"Archive": archive, "Status": "failed", "Error": str(e)})
         return False
 
 
+def devices_of(entry, destination_dev):
+    """Devices an extraction reads from or writes to."""
+    try:
+        source_dev = os.stat(entry["Archive"]).st_dev
+    except OSError:
+        # Missing archive; 7z fails fast and the journal records why.
+        return {destination_dev}
+    return {source_dev, destination_dev}
+
+
+class Scheduler:
+    """
+    Decides which pending archive, if any, can start now.
+
+    Reservations are taken against free space as measured when a job is
+    admitted. A running job's partial output is then counted twice -- once on
+    disk, once in its reservation -- which errs on the side of waiting.
+    """
+
+    def __init__(self, pending, destination_root):
+        self.pending = list(pending)
+        self.destination_root = destination_root
+        destination_dev = os.stat(destination_root).st_dev
+        self.devices = {
+            entry["Archive"]: devices_of(entry, destination_dev) for entry in self.pending
+        }
+        self.reserved = 0
+        self.busy = defaultdict(int)
+
+    def slots(self, dev):
+        return JOBS_PER_DEVICE if JOBS_PER_DEVICE > 0 else device_workers(dev)
+
+    def admit(self):
+        """The next entry that fits on disk and in its devices' slots, or None."""
+        free = shutil.disk_usage(self.destination_root).free
+        for i, entry in enumerate(self.pending):
+            devices = self.devices[entry["Archive"]]
+            if any(self.busy[dev] >= self.slots(dev) for dev in devices):
+                continue
+            need = unpacked_bytes(entry)
+            if need + self.reserved + FREE_SPACE_MARGIN > free:
+                continue
+            del self.pending[i]
+            self.reserved += need
+            for dev in devices:
+                self.busy[dev] += 1
+            return entry
+        return None
+
+    def release(self, entry):
+        self.reserved -= unpacked_bytes(entry)
+        for dev in self.devices[entry["Archive"]]:
+            self.busy[dev] -= 1
+
+
 def main():
     if not os.path.isfile(plan_path):
         print(f"Extraction plan not found at {plan_path}")
@@ -214,25 +372,55 @@ def main():
     print()
     input("Press enter to start extraction, Ctrl+C to abort")
 
-    lock = threading.Lock()
+    scheduler = Scheduler(pending, destination_root)
+    journal = Journal()
+    total = len(pending)
     done = 0
     failed = 0
+    running = {}
 
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        for entry, ok in zip(pending, executor.map(lambda e: extract_one(e, lock), pending)):
-            done += 1
-            if not ok:
-                failed += 1
-            print(
-                f"[{done}/{len(pending)}] {'FAIL' if not ok else 'ok  '} "
-                f"{os.path.basename(entry['Archive'])}",
-                end="\r",
-            )
+    try:
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            while scheduler.pending or running:
+                while len(running) < MAX_WORKERS:
+                    entry = scheduler.admit()
+                    if entry is None:
+                        break
+                    running[executor.submit(extract_one, entry, journal)] = entry
+
+                if not running:
+                    # Nothing in flight to free space or slots, and nothing fits.
+                    break
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    entry = running.pop(future)
+                    scheduler.release(entry)
+                    ok = future.result()
+                    done += 1
+                    if not ok:
+                        failed += 1
+                    print(
+                        f"[{done}/{total}] {'FAIL' if not ok else 'ok  '} "
+                        f"({len(running)} running) {os.path.basename(entry['Archive'])}",
+                        end="\r",
+                    )
+    finally:
+        journal.close()
 
     print()
     print(f"Extracted {done - failed} archives, {failed} failed")
     if failed:
         print(f"See {error_log_path}")
+    if scheduler.pending:
+        print(
+            f"{len(scheduler.pending)} archives were not started: the destination "
+            f"has no room for them, even with nothing else running."
+        )
+        print(
+            f"Smallest needs {min(map(unpacked_bytes, scheduler.pending)) / 1024**3:.1f} GiB "
+            f"plus the {FREE_SPACE_MARGIN / 1024**3:.0f} GiB margin. Free space and rerun."
+        )
 
 
 if __name__ == "__main__":
@@ -26,6 +26,7 @@ from collections import defaultdict
 from concurrent.futures import ThreadPoolExecutor
 
 import Preprocessor.Extract.output.path_definitions as ExtractOutputPaths
+from Preprocessor.Extract.listing_cache import ListingCache
 from Shared.json_utils import json_dump, json_load
 from Shared.utils import get_file_relative, get_output_path
 
@@ -81,13 +82,34 @@ review_output_path = get_output_path(
 )
 
 
-def list_archive(archive_path):
+def list_archive(archive_path, cache=None):
     """
     Reads an archive's index without extracting it.
 
-    Returns (file_paths, dir_paths) as archive-relative paths using forward
-    slashes, or None if 7z could not read the archive.
+    Returns (file_paths, dir_paths, unpacked_bytes): archive-relative paths
+    using forward slashes, and the total size of the files once extracted. None
+    if 7z could not read the archive.
+
+    With a ListingCache, an archive unchanged since it was last listed is not
+    read at all.
     """
+    if cache is None:
+        return read_listing(archive_path)
+
+    try:
+        st = os.stat(archive_path)
+    except OSError:
+        return None
+    listing = cache.get(archive_path, st)
+    if listing is None:
+        listing = read_listing(archive_path)
+        if listing is not None:
+            cache.put(archive_path, listing, st)
+    return listing
+
+
+def read_listing(archive_path):
+    """list_archive without the cache: one `7z l -slt` of the archive."""
     result = subprocess.run(
         ["7z", "l", "-slt", archive_path],
         stdout=subprocess.PIPE,
@@ -102,18 +124,24 @@ def list_archive(archive_path):
 
     files = []
     dirs = []
+    unpacked = 0
     path = None
+    size = 0
     for line in body[1].splitlines():
         if line.startswith("Path = "):
             path = line[len("Path = ") :].replace("\\", "/").rstrip("/")
+            size = 0
+        elif line.startswith("Size = "):
+            size = int(line[len("Size = ") :] or 0)
         elif line.startswith("Attributes = ") and path is not None:
             if "D" in line[len("Attributes = ") :]:
                 dirs.append(path)
             else:
                 files.append(path)
+                unpacked += size
             path = None
 
-    return (files, dirs)
+    return (files, dirs, unpacked)
 
 
 def top_level_dirs(files, dirs):
@@ -579,21 +607,31 @@ def main():
     )
     print(f"Found {len(work)} archives, reading indexes...")
 
+    listing_cache = ListingCache()
+
     def probe(item):
         archive_path = item[2]
-        listing = list_archive(archive_path)
+        listing = list_archive(archive_path, listing_cache)
         if listing is None:
             archive_name = os.path.splitext(os.path.basename(archive_path))[0]
-            return (LAYOUT_FLAT, [archive_name], ["Could not read archive index"])
-        return classify(archive_path, *listing)
+            return (LAYOUT_FLAT, [archive_name], ["Could not read archive index"], None)
+        files, dirs, unpacked = listing
+        return (*classify(archive_path, files, dirs), unpacked)
 
     with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
         probed = list(executor.map(probe, work))
+    print(
+        f"Listings: {listing_cache.hits} reused, {listing_cache.misses} read "
+        f"({listing_cache.path})"
+    )
 
     entries = []
-    for (label, circle, archive_path, release_path), (layout, albums, reasons) in zip(
-        work, probed
-    ):
+    for (label, circle, archive_path, release_path), (
+        layout,
+        albums,
+        reasons,
+        unpacked,
+    ) in zip(work, probed):
         canonical_circle, circle_reasons = resolve_circle(
             label, circle, archive_path, aliases, exclusions
         )
@@ -614,6 +652,9 @@ def main():
                 "Layout": layout,
                 "Albums": albums,
                 "ExtractInto": extract_into,
+                # What extract.py reserves on the destination before starting
+                # this archive.
+                "UnpackedBytes": unpacked,
                 "NeedsManualReview": bool(reasons),
                 "NeedsManualReviewReason": reasons,
             }
@@ -1,10 +1,8 @@
-import json
 import os
-from typing import List
-
-import xxhash
 
 import Preprocessor.Extract.output.path_definitions as ExtractOutputPaths
+from Preprocessor.Extract.snapshot import take_snapshot
+from Shared import probe_cache
 from Shared.utils import get_output_path
 
 output_path = get_output_path(
@@ -21,42 +19,6 @@ def generate_file_list(root: str):
     return results
 
 
-def filter_filelist_by_completed(filelist: List[str]):
-    # File will be structued as {filename: {hash: str, size: int}}
-    # each line in the output file will be a separate JSON object
-    with open(output_path, "r", encoding="utf-8") as f:
-        completed_files = [json.loads(line) for line in f.readlines()]
-        completed_files = {list(file.keys())[0] for file in completed_files}
-
-    return [file for file in filelist if file not in completed_files]
-
-
-def generate_files_snapshot(filelist: List[str]):
-    for idx, file in enumerate(filelist):
-        with open(file, "rb") as f:
-            print(f"[{idx}/{len(filelist)}] Hashing {file}", end="\r")
-
-            # Stream hash the file
-            hash = xxhash.xxh128()
-            while True:
-                data = f.read(4096)
-                if not data:
-                    break
-                hash.update(data)
-
-            size = os.path.getsize(file)
-
-            obj = {
-                file: {
-                    "hash": hash.hexdigest(),
-                    "size": size,
-                }
-            }
-
-            with open(output_path, "a", encoding="utf-8") as f:
-                f.write(json.dumps(obj, ensure_ascii=False) + "\n")
-
-
 if __name__ == "__main__":
     tlmc_root = input("Enter TLMC root path: ")
 
@@ -64,15 +26,13 @@ if __name__ == "__main__":
         print("Invalid path")
         exit(1)
 
-    if not os.path.isfile(output_path):
-        with open(output_path, "w", encoding="utf-8") as f:
-            pass
-
     print("Generating file list")
     files = generate_file_list(tlmc_root)
     print("Total: ", len(files))
-    print("Filtering file list")
-    files = filter_filelist_by_completed(files)
-    print("Filtered Total: ", len(files))
     print("Generating snapshot")
-    generate_files_snapshot(files)
+    entries = take_snapshot(files, output_path)
+
+    # The hashes are paid for already; the probe cache keys moved content on
+    # them, so a respelt circle or album is not probed again.
+    hashed, carried = probe_cache.default_cache().adopt_hashes(entries)
+    print(f"Probe cache: {hashed} entries hashed, {carried} carried over from moved files")
@@ -0,0 +1,164 @@
+"""
+Parsed `7z l -slt` listings, kept across planning runs.
+
+extract_plan.py reads every archive's header to classify it. The archives never
+change between runs, but the decisions built on them do -- an alias override,
+an exclusion, a collision resolution -- and every re-plan paid for ~10k header
+reads again, seek-bound on the spinning disks. Here a listing is read once and
+reused until the archive changes.
+
+An entry is valid while the archive's (size, mtime_ns) match what was recorded,
+as in Shared/probe_cache.py. When the archive has an entry in the unextracted
+snapshot taken under the same (size, mtime_ns), its xxh128 is recorded too, and
+an archive that was moved or had its mtime touched is found again by hash --
+a release copied to a new volume re-plans without reading a header.
+
+A listing is stored as its file and directory paths, newline-joined and
+zlib-compressed, plus the unpacked size. Archives 7z cannot read are not
+stored; they are tried again next run.
+"""
+
+import os
+import sqlite3
+import threading
+import zlib
+from typing import List, Optional, Tuple
+
+import Preprocessor.Extract.output.path_definitions as ExtractOutputPaths
+from Preprocessor.Extract.snapshot import load_entries
+from Shared.utils import get_output_path
+
+cache_path = os.environ.get("TLMC_LISTING_CACHE") or get_output_path(
+    ExtractOutputPaths, ExtractOutputPaths.ARCHIVE_LISTING_CACHE_NAME
+)
+
+snapshot_path = get_output_path(
+    ExtractOutputPaths, ExtractOutputPaths.UNEXTRACTED_RAR_SNAPSHOT_OUTPUT_NAME
+)
+
+Listing = Tuple[List[str], List[str], int]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS listing (
+    path     TEXT PRIMARY KEY,
+    size     INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    xxh128   TEXT,
+    unpacked INTEGER NOT NULL,
+    files    BLOB NOT NULL,
+    dirs     BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS listing_xxh128 ON listing (xxh128);
+"""
+
+
+def _pack(paths: List[str]) -> bytes:
+    return zlib.compress("\n".join(paths).encode("utf-8"), 6)
+
+
+def _unpack(blob: bytes) -> List[str]:
+    text = zlib.decompress(blob).decode("utf-8")
+    return text.split("\n") if text else []
+
+
+class ListingCache:
+    def __init__(self, path: str = cache_path, snapshot: Optional[str] = snapshot_path) -> None:
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        self._counts_lock = threading.Lock()
+        # {archive path: {"hash", "size", "mtime_ns", ...}} from the archive
+        # snapshot, when one has been taken.
+        self._snapshot = load_entries(snapshot) if snapshot else {}
+
+    def _conn(self) -> sqlite3.Connection:
+        # Keyed on pid as well as thread: a connection inherited across fork()
+        # must not be used by the child.
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=60)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # A lost tail after a power cut costs a few header reads, not corruption.
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(_SCHEMA)
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def snapshot_hash(self, path: str, st: os.stat_result) -> Optional[str]:
+        """The archive's xxh128 from the snapshot, if taken of this very file."""
+        entry = self._snapshot.get(path)
+        if (
+            entry is None
+            or entry.get("size") != st.st_size
+            or entry.get("mtime_ns") != st.st_mtime_ns
+        ):
+            return None
+        return entry.get("hash")
+
+    def _count(self, hit: bool) -> None:
+        with self._counts_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, path: str, st: os.stat_result) -> Optional[Listing]:
+        """The recorded listing for `path`, or None if absent or stale."""
+        conn = self._conn()
+        xxh128 = self.snapshot_hash(path, st)
+        row = conn.execute(
+            "SELECT files, dirs, unpacked, xxh128 FROM listing "
+            "WHERE path = ? AND size = ? AND mtime_ns = ?",
+            (path, st.st_size, st.st_mtime_ns),
+        ).fetchone()
+
+        if row is not None and row[3] is None and xxh128 is not None:
+            # Listed before the snapshot was taken; record the hash now so the
+            # listing survives the archive moving.
+            with conn:
+                conn.execute(
+                    "UPDATE listing SET xxh128 = ? WHERE path = ?", (xxh128, path)
+                )
+        elif row is None:
+            if xxh128 is not None:
+                row = conn.execute(
+                    "SELECT files, dirs, unpacked FROM listing "
+                    "WHERE xxh128 = ? AND size = ? LIMIT 1",
+                    (xxh128, st.st_size),
+                ).fetchone()
+                if row is not None:
+                    # Same bytes under a new path or mtime: file it under this
+                    # one so the next run hits on the first query.
+                    self.put(path, (_unpack(row[0]), _unpack(row[1]), row[2]), st)
+
+        self._count(row is not None)
+        if row is None:
+            return None
+        return (_unpack(row[0]), _unpack(row[1]), row[2])
+
+    def put(self, path: str, listing: Listing, st: os.stat_result) -> None:
+        files, dirs, unpacked = listing
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT INTO listing (path, size, mtime_ns, xxh128, unpacked, files, dirs) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (path) DO UPDATE SET "
+                "size = excluded.size, mtime_ns = excluded.mtime_ns, "
+                "xxh128 = excluded.xxh128, unpacked = excluded.unpacked, "
+                "files = excluded.files, dirs = excluded.dirs",
+                (
+                    path,
+                    st.st_size,
+                    st.st_mtime_ns,
+                    self.snapshot_hash(path, st),
+                    unpacked,
+                    _pack(files),
+                    _pack(dirs),
+                ),
+            )
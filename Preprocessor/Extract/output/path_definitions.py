@@ -6,3 +6,7 @@ EXTRACTED_FILESYSTEM_SNAPSHOT_OUTPUT_NAME = "extracted_filesystem_snapshot.outpu
 EXTRACTION_PLAN_OUTPUT_NAME = "extraction_plan.output.json"
 EXTRACTION_PLAN_REVIEW_OUTPUT_NAME = "extraction_plan.review.output.json"
 EXTRACTION_JOURNAL_OUTPUT_NAME = "extraction_journal.output.jsonl"
+
+# Parsed 7z listings reused across planning runs (listing_cache.py). Override with
+# TLMC_LISTING_CACHE; delete it to make extract_plan.py read every header again.
+ARCHIVE_LISTING_CACHE_NAME = "archive_listing_cache.sqlite3"
@@ -0,0 +1,249 @@
+"""
+Hashing engine behind extracted_snapshot.py and unextracted_snapshot.py.
+
+Both scripts used to hash one file at a time in 4 KiB reads and reopen the
+output for every line, so a 5.4 TB tree behind the USB bridge ran as one core
+waiting on one small read after another, nowhere near the 472 MB/s the link
+measured with both drives streaming (Docs/V6-MIGRATION-HANDOFF.md, 3.1). Here:
+
+  * reads are TLMC_SNAPSHOT_READ_MB (4 MiB by default) into a reused buffer, with the file
+    marked POSIX_FADV_SEQUENTIAL so the kernel reads ahead, and dropped from the
+    page cache once hashed -- the snapshot reads each byte exactly once;
+  * files are grouped by device and each device gets its own small thread pool:
+    two streams for a spinning disk, where more only adds seeks, eight for an
+    SSD or an unknown device. Within a device files are queued in inode order,
+    which on ext4 and NTFS roughly follows their order on disk;
+  * an entry from the previous snapshot is kept without reading the file when
+    its size, mtime_ns and inode are unchanged, so a second snapshot of an
+    unchanged tree is a stat per file;
+  * progress is appended, buffered, to `<output>.partial` as files finish, and
+    the snapshot itself is written once at the end, sorted by path, to a
+    temporary file renamed over the output. An interrupted run leaves the old
+    snapshot intact, and the next run picks up the partial's hashes.
+
+Lines keep the shape {path: {"hash": xxh128, "size": bytes}} that
+DataUpdates/FileDeltaScanner/fs-compare.py reads, with mtime_ns and inode added
+for reuse. Entries from snapshots taken before those fields existed are hashed
+again once.
+
+The output only lists files present when it was taken, rather than everything
+any earlier run saw. Copy it aside before snapshotting the next release.
+"""
+
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import xxhash
+
+READ_SIZE = int(float(os.environ.get("TLMC_SNAPSHOT_READ_MB") or 4) * 2**20)
+
+# Per-device stream counts. TLMC_SNAPSHOT_WORKERS overrides both.
+ROTATIONAL_WORKERS = 2
+SOLID_STATE_WORKERS = 8
+WORKERS_OVERRIDE = int(os.environ.get("TLMC_SNAPSHOT_WORKERS") or 0)
+
+# How often finished hashes are pushed out to the partial file.
+FLUSH_SECONDS = 10
+
+_local = threading.local()
+
+
+def _buffer() -> memoryview:
+    buf = getattr(_local, "buf", None)
+    if buf is None:
+        buf = _local.buf = memoryview(bytearray(READ_SIZE))
+    return buf
+
+
+def hash_file(path: str) -> str:
+    buf = _buffer()
+    h = xxhash.xxh128()
+    fd = os.open(path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+    try:
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        with open(fd, "rb", buffering=0, closefd=False) as f:
+            while True:
+                n = f.readinto(buf)
+                if not n:
+                    break
+                h.update(buf[:n])
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    finally:
+        os.close(fd)
+    return h.hexdigest()
+
+
+def device_workers(st_dev: int) -> int:
+    """Hashing streams for the device holding a file, from sysfs where it says."""
+    if WORKERS_OVERRIDE > 0:
+        return WORKERS_OVERRIDE
+    try:
+        block = f"/sys/dev/block/{os.major(st_dev)}:{os.minor(st_dev)}"
+        # A partition has no queue/ of its own; its parent disk does.
+        for queue in (f"{block}/queue", f"{block}/../queue"):
+            rotational = os.path.join(queue, "rotational")
+            if os.path.isfile(rotational):
+                with open(rotational, "r") as f:
+                    return ROTATIONAL_WORKERS if f.read().strip() == "1" else SOLID_STATE_WORKERS
+    except (AttributeError, OSError):
+        pass
+    # ZFS, SMB, Windows: no single block device to ask.
+    return SOLID_STATE_WORKERS
+
+
+def load_entries(path: str) -> Dict[str, dict]:
+    """A snapshot or partial as {path: entry}; the last line for a path wins."""
+    entries = {}
+    if not os.path.isfile(path):
+        return entries
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entries.update(json.loads(line))
+            except json.JSONDecodeError:
+                # The partial's last line may have been cut off mid-write.
+                continue
+    return entries
+
+
+def _entry(hash: str, st: os.stat_result) -> dict:
+    return {
+        "hash": hash,
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "inode": st.st_ino,
+    }
+
+
+def _reusable(prior: Optional[dict], st: os.stat_result) -> bool:
+    return (
+        prior is not None
+        and prior.get("size") == st.st_size
+        and prior.get("mtime_ns") == st.st_mtime_ns
+        and prior.get("inode") == st.st_ino
+    )
+
+
+def _seed_reusable(seed: Optional[dict], st: os.stat_result) -> bool:
+    # Another snapshot's entry for the same path: the inode is not compared,
+    # since that snapshot may have been taken before the tree was copied or
+    # remounted, and a copy that kept size and mtime kept the bytes.
+    return (
+        seed is not None
+        and seed.get("size") == st.st_size
+        and seed.get("mtime_ns") == st.st_mtime_ns
+    )
+
+
+def _write_atomic(entries: Dict[str, dict], output_path: str) -> None:
+    tmp = output_path + ".tmp"
+    with open(tmp, "w", encoding="utf-8", buffering=2**20) as f:
+        for path in sorted(entries):
+            f.write(json.dumps({path: entries[path]}, ensure_ascii=False) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, output_path)
+
+
+def take_snapshot(
+    paths: Iterable[str], output_path: str, seed: Optional[Dict[str, dict]] = None
+) -> Dict[str, dict]:
+    """
+    Hashes `paths` into the snapshot at `output_path`, reusing what it can:
+    its own previous entries, and `seed` -- another snapshot's entries by
+    path -- where size and mtime still match.
+    """
+    partial_path = output_path + ".partial"
+    prior = load_entries(output_path)
+    prior.update(load_entries(partial_path))
+    seed = seed or {}
+
+    entries: Dict[str, dict] = {}
+    pending: Dict[int, List[Tuple[str, os.stat_result]]] = {}
+    vanished = 0
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except OSError:
+            vanished += 1
+            continue
+        if _reusable(prior.get(path), st):
+            entries[path] = prior[path]
+        elif _seed_reusable(seed.get(path), st):
+            entries[path] = _entry(seed[path]["hash"], st)
+        else:
+            pending.setdefault(st.st_dev, []).append((path, st))
+
+    total = sum(len(files) for files in pending.values())
+    total_bytes = sum(st.st_size for files in pending.values() for _, st in files)
+    print(
+        f"Reusing {len(entries)} unchanged entries; hashing {total} files "
+        f"({total_bytes / 2**30:,.1f} GiB) on {len(pending)} device(s)"
+        + (f"; {vanished} vanished since listing" if vanished else "")
+    )
+
+    # Appended to, not truncated: hashes carried over from an interrupted run
+    # have to survive a second interruption too.
+    with open(partial_path, "a", encoding="utf-8", buffering=2**20) as partial:
+        pools: List[ThreadPoolExecutor] = []
+        futures: Dict[Future, Tuple[str, os.stat_result]] = {}
+        try:
+            for st_dev, files in pending.items():
+                pool = ThreadPoolExecutor(
+                    max_workers=device_workers(st_dev),
+                    thread_name_prefix=f"snapshot-{st_dev}",
+                )
+                pools.append(pool)
+                files.sort(key=lambda item: item[1].st_ino)
+                for path, st in files:
+                    futures[pool.submit(hash_file, path)] = (path, st)
+
+            done = 0
+            done_bytes = 0
+            errors = 0
+            started = last_flush = last_print = time.monotonic()
+            for future in as_completed(futures):
+                path, st = futures.pop(future)
+                done += 1
+                try:
+                    entry = _entry(future.result(), st)
+                except OSError as e:
+                    errors += 1
+                    print(f"\nFailed to hash {path}: {e}")
+                    continue
+                entries[path] = entry
+                done_bytes += st.st_size
+                partial.write(json.dumps({path: entry}, ensure_ascii=False) + "\n")
+
+                now = time.monotonic()
+                if now - last_flush >= FLUSH_SECONDS:
+                    partial.flush()
+                    last_flush = now
+                if now - last_print >= 0.5 or done == total:
+                    rate = done_bytes / max(now - started, 1e-9) / 2**20
+                    print(f"[{done}/{total}] {rate:,.0f} MiB/s  {path}", end="\r")
+                    last_print = now
+        finally:
+            for pool in pools:
+                pool.shutdown(wait=True, cancel_futures=True)
+
+    if total:
+        print()
+    if errors:
+        # Keep the partial so a rerun does not rehash what did succeed.
+        print(f"{errors} files could not be hashed; snapshot not written. Rerun to retry them.")
+        return entries
+
+    _write_atomic(entries, output_path)
+    os.remove(partial_path)
+    print(f"Wrote {len(entries)} entries to {output_path}")
+    return entries
@@ -0,0 +1,313 @@
+"""
+Clusters tracks that carry the same audio, across albums.
+
+TLMC ships the same recording many times over: a re-release, a compilation
+reissue, one track as a CUE image rip in one album and as split files in
+another. Each copy was transcoded, embedded and stored on its own, and the only
+duplicate check anywhere was disc_duration_guard.is_mirror, within one album.
+
+Input is the fingerprint sink of analysis_pass.py (see fingerprint.py). Two
+kinds of match come out:
+
+    identical  equal STREAMINFO MD5 -- the copies decode to the same samples
+    acoustic   sub-fingerprints agree at some alignment to within ACOUSTIC_BER,
+               and durations agree -- a re-encode, a gain change, a remaster
+               that left the audio alone, a split shifted by its pregap
+
+Comparing every pair of ~170k tracks is out of the question, so each track
+indexes a bottom-k MinHash sketch of its sub-fingerprint values (SKETCH_K
+postings) and only pairs sharing MIN_SHARED sketch values are compared. On test
+material a re-encode, a 20 ms shift or a 6 dB EQ change kept 8 of 32 sketch
+values and about 0.05-0.10 bit error; unrelated tracks shared none and sat at
+0.49.
+
+The index is a SQLite file rebuilt incrementally from the JSONL, so a rerun
+after new fingerprints only re-sketches those. Clusters are written through
+Shared.artifact_store, keyed by their canonical member:
+
+    {"canonical": path, "members": [{"path", "kind", "ber"}, ...]}
+
+`canonical_map()` turns that into {path: canonical path} for a stage that wants
+to do its work once per cluster.
+"""
+
+import json
+import os
+import sqlite3
+from collections import defaultdict
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+
+import Processor.AudioDedup.output.path_definitions as AudioDedupPathDef
+from Processor.AudioDedup import fingerprint
+from Shared import artifact_store
+from Shared.utils import get_output_path
+
+fingerprints_path = get_output_path(
+    AudioDedupPathDef, AudioDedupPathDef.FINGERPRINTS_OUTPUT_NAME
+)
+index_path = get_output_path(AudioDedupPathDef, AudioDedupPathDef.FINGERPRINT_INDEX_NAME)
+clusters_path = get_output_path(
+    AudioDedupPathDef, AudioDedupPathDef.DUPLICATE_CLUSTERS_OUTPUT_NAME
+)
+
+SKETCH_K = 32
+MIN_SHARED = 2
+# A sketch value held by more tracks than this is a pattern (a sustained tone,
+# a common intro jingle), not a recording; it is left out of candidate search.
+HOT_POSTING = 200
+
+# Random pairs sit at ~0.5; re-encodes and shifted splits at 0.05-0.10.
+ACOUSTIC_BER = 0.2
+# ±4.4 s of alignment search (hop is 46 ms): pregap differences between an
+# image rip and split files are a couple of seconds at most.
+MAX_SHIFT_FRAMES = 96
+# ~9 s of non-silent overlap before a bit error rate means anything.
+MIN_OVERLAP_FRAMES = 200
+
+# Two copies of one recording are the same length to within rounding of the
+# split; an extended mix that opens identically is not.
+DURATION_TOLERANCE_S = 2.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS track (
+    id       INTEGER PRIMARY KEY,
+    path     TEXT NOT NULL UNIQUE,
+    md5      TEXT,
+    duration REAL,
+    fp       BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS posting (
+    value INTEGER NOT NULL,
+    track INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS posting_value ON posting (value);
+CREATE INDEX IF NOT EXISTS posting_track ON posting (track);
+CREATE INDEX IF NOT EXISTS track_md5 ON track (md5);
+"""
+
+
+def connect(path: str = index_path) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, timeout=60)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def ingest(conn: sqlite3.Connection, records: Iterable[dict]) -> int:
+    """Adds new or changed fingerprints to the index; returns how many."""
+    changed = 0
+    with conn:
+        for rec in records:
+            blob = fingerprint.decode(rec["fp"]).astype("<u4").tobytes()
+            row = conn.execute(
+                "SELECT id, fp FROM track WHERE path = ?", (rec["path"],)
+            ).fetchone()
+            if row is not None and row[1] == blob:
+                continue
+            if row is not None:
+                conn.execute("DELETE FROM posting WHERE track = ?", (row[0],))
+                conn.execute(
+                    "UPDATE track SET md5 = ?, duration = ?, fp = ? WHERE id = ?",
+                    (rec.get("md5"), rec.get("duration"), blob, row[0]),
+                )
+                track_id = row[0]
+            else:
+                track_id = conn.execute(
+                    "INSERT INTO track (path, md5, duration, fp) VALUES (?, ?, ?, ?)",
+                    (rec["path"], rec.get("md5"), rec.get("duration"), blob),
+                ).lastrowid
+            fp = np.frombuffer(blob, dtype="<u4")
+            conn.executemany(
+                "INSERT INTO posting (value, track) VALUES (?, ?)",
+                ((int(v), track_id) for v in fingerprint.sketch(fp, SKETCH_K)),
+            )
+            changed += 1
+    return changed
+
+
+def read_records(path: str) -> Iterable[dict]:
+    """The fingerprint JSONL, last record per path winning."""
+    latest: Dict[str, int] = {}
+    with open(path, "rb") as f:
+        while True:
+            offset = f.tell()
+            line = f.readline()
+            if not line:
+                break
+            try:
+                latest[json.loads(line)["path"]] = offset
+            except (json.JSONDecodeError, KeyError):
+                continue
+        # A second pass by offset keeps only one record in memory at a time.
+        for offset in sorted(latest.values()):
+            f.seek(offset)
+            yield json.loads(f.readline())
+
+
+def candidate_pairs(conn: sqlite3.Connection) -> List[Tuple[int, int]]:
+    return conn.execute(
+        """
+        WITH hot AS (
+            SELECT value FROM posting GROUP BY value HAVING COUNT(*) > ?
+        )
+        SELECT a.track, b.track
+        FROM posting a JOIN posting b ON a.value = b.value AND a.track < b.track
+        WHERE a.value NOT IN hot
+        GROUP BY a.track, b.track
+        HAVING COUNT(*) >= ?
+        """,
+        (HOT_POSTING, MIN_SHARED),
+    ).fetchall()
+
+
+# Lower is stronger evidence.
+_KIND_RANK = {"identical": 0, "acoustic": 1}
+
+
+class Clusters:
+    """Union-find over track ids, remembering how each member was matched."""
+
+    def __init__(self, tracks: Dict[int, tuple]) -> None:
+        # {id: (path, md5, duration)}
+        self.tracks = tracks
+        self.parent: Dict[int, int] = {}
+        self.how: Dict[int, Tuple[str, float]] = {}
+
+    def find(self, x: int) -> int:
+        self.parent.setdefault(x, x)
+        while self.parent[x] != x:
+            self.parent[x] = self.parent[self.parent[x]]
+            x = self.parent[x]
+        return x
+
+    def union(self, a: int, b: int, kind: str, ber: float) -> None:
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            self.parent[rb] = ra
+        # Keep the strongest evidence seen for each member.
+        for t in (a, b):
+            old = self.how.get(t)
+            if old is None or (_KIND_RANK[kind], ber) < (_KIND_RANK[old[0]], old[1]):
+                self.how[t] = (kind, ber)
+
+    def groups(self) -> List[List[int]]:
+        by_root = defaultdict(list)
+        for t in self.parent:
+            by_root[self.find(t)].append(t)
+        return [g for g in by_root.values() if len(g) > 1]
+
+
+def durations_agree(a, b) -> bool:
+    # Unknown on either side (a non-FLAC without a samples record): the
+    # fingerprint alone decides.
+    return a is None or b is None or abs(a - b) <= DURATION_TOLERANCE_S
+
+
+def match(conn: sqlite3.Connection, durations: Dict[str, float]) -> Clusters:
+    tracks = {
+        tid: (path, md5, durations.get(path, duration))
+        for tid, path, md5, duration in conn.execute(
+            "SELECT id, path, md5, duration FROM track"
+        )
+    }
+    clusters = Clusters(tracks)
+
+    by_md5 = defaultdict(list)
+    for tid, (_, md5, _) in tracks.items():
+        if md5:
+            by_md5[md5].append(tid)
+    for ids in by_md5.values():
+        for other in ids[1:]:
+            clusters.union(ids[0], other, "identical", 0.0)
+
+    pairs = candidate_pairs(conn)
+    print(f"{len(pairs)} candidate pairs from {len(tracks)} tracks")
+    fps: Dict[int, np.ndarray] = {}
+
+    def fp_of(tid):
+        if tid not in fps:
+            blob = conn.execute("SELECT fp FROM track WHERE id = ?", (tid,)).fetchone()[0]
+            fps[tid] = np.frombuffer(blob, dtype="<u4")
+        return fps[tid]
+
+    verified = 0
+    for i, (a, b) in enumerate(pairs, 1):
+        if clusters.find(a) == clusters.find(b):
+            continue
+        if not durations_agree(tracks[a][2], tracks[b][2]):
+            continue
+        result = fingerprint.compare(fp_of(a), fp_of(b), MAX_SHIFT_FRAMES, MIN_OVERLAP_FRAMES)
+        if result is not None and result[0] <= ACOUSTIC_BER:
+            clusters.union(a, b, "acoustic", round(result[0], 4))
+            verified += 1
+        if i % 5000 == 0:
+            print(f"[{i}/{len(pairs)}] {verified} acoustic matches", end="\r")
+        # ~10 KB a fingerprint; bounded rather than kept for the whole run.
+        if len(fps) > 20000:
+            fps.clear()
+    print(f"\n{verified} acoustic matches")
+    return clusters
+
+
+def canonical(paths: List[str]) -> str:
+    # FLAC before anything lossy or containerised, then the shortest path --
+    # usually the original release rather than a compilation's nested copy.
+    return min(paths, key=lambda p: (not p.lower().endswith(".flac"), len(p), p))
+
+
+def cluster_records(clusters: Clusters) -> List[dict]:
+    records = []
+    for group in clusters.groups():
+        paths = {clusters.tracks[t][0]: t for t in group}
+        head = canonical(list(paths))
+        records.append({
+            "canonical": head,
+            "members": [
+                {"path": p, "kind": clusters.how[t][0], "ber": clusters.how[t][1]}
+                for p, t in sorted(paths.items())
+                if p != head
+            ],
+        })
+    records.sort(key=lambda r: r["canonical"])
+    return records
+
+
+def canonical_map(path: str = clusters_path) -> Dict[str, str]:
+    """{member path: canonical path} for every duplicate, from the last run."""
+    mapping = {}
+    for cluster in artifact_store.load(path):
+        for member in cluster["members"]:
+            mapping[member["path"]] = cluster["canonical"]
+    return mapping
+
+
+def main():
+    if not os.path.isfile(fingerprints_path):
+        print(f"No fingerprints at {fingerprints_path}; run analysis_pass.py "
+              f"with TLMC_ANALYSIS_SINKS including fingerprint first")
+        return
+
+    # Imported here: the analysis pass pulls in the loudness stage's module,
+    # which nothing else in matching needs.
+    from Preprocessor.AudioNormalizer.analysis_pass import load_durations
+
+    conn = connect()
+    changed = ingest(conn, read_records(fingerprints_path))
+    print(f"Indexed {changed} new or changed fingerprints")
+
+    clusters = match(conn, load_durations())
+    records = cluster_records(clusters)
+    artifact_store.dump(records, clusters_path, key_field="canonical")
+
+    members = sum(len(r["members"]) for r in records)
+    identical = sum(m["kind"] == "identical" for r in records for m in r["members"])
+    print(f"{len(records)} clusters, {members} duplicate tracks "
+          f"({identical} identical, {members - identical} acoustic)")
+    print(f"Wrote {clusters_path}")
+
+
+if __name__ == "__main__":
+    main()
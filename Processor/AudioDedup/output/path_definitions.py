@@ -0,0 +1,8 @@
+# One line per track from analysis_pass.py's fingerprint sink.
+FINGERPRINTS_OUTPUT_NAME = "fingerprints.output.jsonl"
+
+# Tracks, their fingerprints and the sketch postings duplicate_match.py
+# searches; rebuilt incrementally from the JSONL above.
+FINGERPRINT_INDEX_NAME = "fingerprint_index.sqlite3"
+
+DUPLICATE_CLUSTERS_OUTPUT_NAME = "duplicate_clusters.output.json"
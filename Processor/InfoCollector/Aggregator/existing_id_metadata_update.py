@@ -4,7 +4,7 @@ from uuid import uuid4
 import Processor.InfoCollector.Aggregator.output.path_definitions as AggregatorPathDef
 import Processor.InfoCollector.AlbumInfo.output.path_definitions as AlbumInfoPathDef
 import Processor.InfoCollector.ArtistInfo.output.path_definitions as ArtistInfoPathDef
-from Shared import json_utils, utils
+from Shared import artifact_store, utils
 
 
 info_phase3_output = utils.get_output_path(
@@ -17,29 +17,52 @@ assigned_metadata_update_output = utils.get_output_path(
     AggregatorPathDef, AggregatorPathDef.ID_MAINTAIN_METADATA_UPDATE_PATH
 )
 
-info_phase3 = json_utils.json_load(info_phase3_output)
-assigned = json_utils.json_load(assigned_merged_output)
-# transform info phase 3 to a dict with AlbumRoot as Key for easy lookup
-info_phase3_dict = {entry["AlbumRoot"]: entry for entry in info_phase3}
+ALBUM_METADATA_FIELDS_TO_UPDATE = [
+    "AlbumName",
+    "AlbumArtist",
+    "ReleaseDate",
+    "CatalogNumber",
+    "ReleaseConvention",
+]
 
-for existing_assigned in assigned.values():
-    album_root = existing_assigned["AlbumRoot"]
-    if album_root not in info_phase3_dict:
-        print(f"AlbumRoot {album_root} not found in InfoPhase3")
-        continue
 
-    album_metadata_fields_to_update = [
-        "AlbumName",
-        "AlbumArtist",
-        "ReleaseDate",
-        "CatalogNumber",
-        "ReleaseConvention",
-    ]
+def updated_entries(assigned, info_phase3):
+    """
+    The assigned albums with their metadata refreshed from phase 3, streamed:
+    phase 3 rows are fetched by AlbumRoot for one batch of albums at a time
+    rather than both artifacts being held whole.
+    """
+    changed = 0
+    batch = []
 
-    update_src = info_phase3_dict[album_root]
-    # update metadata fields
-    for field in album_metadata_fields_to_update:
-        existing_assigned["AlbumMetadata"][field] = update_src["AlbumMetadata"][field]
+    def flush():
+        nonlocal changed
+        roots = [entry["AlbumRoot"] for _, entry in batch]
+        found = info_phase3.get_many(roots)
+        for album_id, existing_assigned in batch:
+            album_root = existing_assigned["AlbumRoot"]
+            update_src = found.get(album_root)
+            if update_src is None:
+                print(f"AlbumRoot {album_root} not found in InfoPhase3")
+            else:
+                metadata = existing_assigned["AlbumMetadata"]
+                for field in ALBUM_METADATA_FIELDS_TO_UPDATE:
+                    if metadata[field] != update_src["AlbumMetadata"][field]:
+                        metadata[field] = update_src["AlbumMetadata"][field]
+                        changed += 1
+            yield album_id, existing_assigned
 
+    for album_id, existing_assigned in assigned.items():
+        batch.append((album_id, existing_assigned))
+        if len(batch) >= artifact_store.BATCH:
+            yield from flush()
+            batch = []
+    yield from flush()
+    print(f"Updated {changed} metadata fields")
 
-json_utils.json_dump(assigned, assigned_metadata_update_output)
+
+info_phase3 = artifact_store.open_store(info_phase3_output, key_field="AlbumRoot")
+assigned = artifact_store.open_store(assigned_merged_output)
+artifact_store.dump_items(
+    updated_entries(assigned, info_phase3), assigned_metadata_update_output
+)
@@ -6,7 +6,7 @@ from uuid6 import uuid7
 import Processor.InfoCollector.Aggregator.output.path_definitions as AggregatorPathDef
 import Processor.InfoCollector.AlbumInfo.output.path_definitions as AlbumInfoPathDef
 import Processor.InfoCollector.ArtistInfo.output.path_definitions as ArtistInfoPathDef
-from Shared import json_utils, utils
+from Shared import artifact_store, json_utils, utils
 
 circle_list_output = utils.get_output_path(
     ArtistInfoPathDef, ArtistInfoPathDef.ARTIST_DISCOVERY_MERGED_ARTISTS_OUTPUT_PATH
@@ -94,7 +94,7 @@ def transform_with_album_id_as_key(info_phase3):
 
 def main():
     circle_list = json_utils.json_load(circle_list_output)
-    info_phase3 = json_utils.json_load(info_phase3_output)
+    info_phase3 = artifact_store.load(info_phase3_output)
 
     print("Assigning IDs and merging info...")
 
@@ -114,7 +114,7 @@ def main():
     info_phase3 = transform_with_album_id_as_key(info_phase3)
 
     print("Writing output...")
-    json_utils.json_dump(info_phase3, assigned_merged_output)
+    artifact_store.dump(info_phase3, assigned_merged_output)
 
 
 if __name__ == "__main__":
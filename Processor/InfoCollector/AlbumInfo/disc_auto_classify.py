@@ -37,7 +37,7 @@ from Processor.InfoCollector.AlbumInfo.output.path_definitions import (
 )
 from Shared.json_utils import json_dump, json_load
 
-output_root = utils.get_file_relative(__file__, "output")
+output_root = utils.get_output_root(__file__)
 scanned_output_file = os.path.join(output_root, DISC_SCANNER_OUTPUT_NAME)
 disc_output_file = os.path.join(output_root, DISC_MANUAL_CHECKER_OUTPUT_NAME)
 review_output_file = os.path.join(output_root, "disc_auto_classify.review.output.json")
@@ -26,7 +26,6 @@ two stages together produce one file for info_scanner_ph1.
 
 import json
 import os
-import subprocess
 import sys
 import threading
 from concurrent.futures import ThreadPoolExecutor
@@ -42,6 +41,7 @@ from Processor.InfoCollector.AlbumInfo.disc_scanner import (
 from Processor.InfoCollector.AlbumInfo.output.path_definitions import (
     DISC_MANUAL_CHECKER_OUTPUT_NAME,
 )
+from Shared import probe_cache
 from Shared.json_utils import json_dump, json_load
 
 # A directory has to carry a real programme to count as a disc on measurement
@@ -57,7 +57,7 @@ DEDUPE_MATCH_RATIO = 0.85
 
 MAX_WORKERS = max(1, (os.cpu_count() or 4) - 2)
 
-output_root = utils.get_file_relative(__file__, "output")
+output_root = utils.get_output_root(__file__)
 disc_output_file = os.path.join(output_root, DISC_MANUAL_CHECKER_OUTPUT_NAME)
 review_file = os.path.join(output_root, "disc_auto_classify.review.output.json")
 guard_review_file = os.path.join(output_root, "disc_duration_guard.review.output.json")
@@ -76,16 +76,11 @@ def durations(directory: str) -> List[float]:
     for name in names:
         if not name.lower().endswith(ACCEPTED_AUDIO_FILE_EXTENSIONS):
             continue
-        path = os.path.join(directory, name)
-        proc = subprocess.run(
-            ["ffprobe", "-v", "error", "-show_entries", "format=duration",
-             "-of", "csv=p=0", path],
-            capture_output=True,
-        )
-        try:
-            out.append(float(proc.stdout.decode("utf-8", "replace").strip()))
-        except ValueError:
-            continue
+        # Through the shared probe cache: cue_scanner and info_scanner_ph1
+        # have usually probed these files already.
+        duration = probe_cache.duration(os.path.join(directory, name))
+        if duration is not None:
+            out.append(duration)
     return out
 
 
@@ -1,7 +1,6 @@
 import json
 import os
-import threading
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ProcessPoolExecutor
 from typing import List, Tuple
 
 import Shared.utils as utils
@@ -10,9 +9,10 @@ from Processor.InfoCollector.AlbumInfo.output.path_definitions import (
     INFO_SCANNER_PHASE1_OUTPUT_NAME, INFO_SCANNER_PROBED_RESULT_DEBUG_NAME,
     INFO_SCANNER_PROBED_RESULT_OUTPUT_NAME,
     INFO_SCANNER_PROBED_RESULT_TMP_LINES_OUTPUT_NAME)
+from Shared import artifact_store, delta_worklist, probe_cache
 from Shared.json_utils import json_dump, json_load
 
-output_root = utils.get_file_relative(__file__, "output")
+output_root = utils.get_output_root(__file__)
 os.makedirs(output_root, exist_ok=True)
 disc_final_output_file = os.path.join(output_root, DISC_MANUAL_CHECKER_OUTPUT_NAME)
 probed_results_path = os.path.join(output_root, INFO_SCANNER_PROBED_RESULT_OUTPUT_NAME)
@@ -27,8 +27,9 @@ phase1_output_path = os.path.join(output_root, INFO_SCANNER_PHASE1_OUTPUT_NAME)
 
 ACCEPTED_AUDIO_FILE_EXTENSIONS = {"flac", "mp3", "wav", "wv", "m4a"}
 
-# ffprobe is one short-lived process per file and the library sits on a USB
-# disk, so the pass is bound by seek latency, not CPU.
+# Headers are parsed in worker processes (see gen_probe_results); two cores are
+# left for the parent, which writes the results, and the rest of the desktop.
+# Files already in the shared probe cache (Shared/probe_cache.py) are not read.
 PROBE_WORKERS = max(1, (os.cpu_count() or 4) - 2)
 THUMBNAIL_FILE_NAMES = {"folder", "cover"}
 IMAGE_EXTENSIONS = {"jpg", "jpeg", "png", "gif", "bmp", "svg", "webp", "ico", "tif"}
@@ -508,12 +509,12 @@ def gen_file_list(root):
         for name in list_dir(root)
         if (full_path := join_paths(root, name)) and os.path.isdir(full_path)
     ]
-    albums = [
+    albums = delta_worklist.restrict(
         full_path
         for circle in circles
         for name in list_dir(circle)
         if (full_path := join_paths(circle, name)) and os.path.isdir(full_path)
-    ]
+    )
 
     directory_tree = {}
     for album in albums:
@@ -547,6 +548,22 @@ def load_probed_lines():
     return done
 
 
+def probe_one(item):
+    index, file_path = item
+    try:
+        result = probe_cache.probe(file_path)
+    except Exception as e:  # noqa: BLE001 - one bad file must not end the pass
+        print(f"\nprobe failed for {file_path!r}: {e!r}")
+        result = None
+
+    # The shared cache holds streams too; this artifact has only ever
+    # carried the format section, and downstream reads nothing else.
+    json_result = None
+    if result and "format" in result:
+        json_result = {"format": result["format"]}
+    return index, file_path, json_result
+
+
 def gen_probe_results(file_list):
     filtered = filter_probe_list(file_list)
 
@@ -556,29 +573,18 @@ def gen_probe_results(file_list):
 
     # One ffprobe per file, serially, was the longest single step in the
     # pipeline: the library holds ~178k tracks on a USB disk, where each call is
-    # dominated by seek latency rather than CPU. Probing concurrently turns that
-    # from hours into minutes, exactly as it did for the loudness pass.
-    lock = threading.Lock()
+    # dominated by seek latency rather than CPU. Tags and stream info are now
+    # parsed from the headers in process (Shared/media_reader.py), which makes
+    # the pass CPU bound on the parsing instead, so it runs in a process pool.
+    # Workers only probe; this process owns the output files.
     state = {"n": 0, "failed": 0}
     tmp_out = open(probed_results_path_tmp_lines, "a", encoding="utf-8")
     dbg_out = open(probed_results_path_debug, "a", encoding="utf-8")
 
-    def work(item):
-        index, file_path = item
-        try:
-            result = utils.probe_flac("ffprobe", file_path)
-        except Exception as e:  # noqa: BLE001 - one bad file must not end the pass
-            print(f"\nprobe failed for {file_path!r}: {e!r}")
-            result = None
-
-        json_result = None
-        if result:
-            try:
-                json_result = json.loads(result)
-            except json.JSONDecodeError:
-                json_result = None
-
-        with lock:
+    with ProcessPoolExecutor(max_workers=PROBE_WORKERS) as executor:
+        for index, file_path, json_result in executor.map(
+            probe_one, enumerate(pending), chunksize=64
+        ):
             state["n"] += 1
             if json_result is None:
                 state["failed"] += 1
@@ -604,15 +610,12 @@ def gen_probe_results(file_list):
                     end="\r",
                 )
 
-    with ThreadPoolExecutor(max_workers=PROBE_WORKERS) as executor:
-        list(executor.map(work, enumerate(pending)))
-
     tmp_out.close()
     dbg_out.close()
     print(f"\nProbed {state['n'] - state['failed']} files, {state['failed']} failed")
 
     # Return them in the file list's order so the output does not depend on the
-    # order threads happened to finish in.
+    # order workers happened to finish in.
     return [done[p] for p in filtered if p in done]
 
 
@@ -658,6 +661,9 @@ def main():
 
     print("Loading discs info...")
     discs_info = json_load(disc_final_output_file)
+    # The disc artifact covers the whole library; under a delta worklist the
+    # file list only has the worklist's albums.
+    discs_info = dict(delta_worklist.restrict(discs_info.items(), lambda kv: kv[0]))
 
     # Checked before the probe, not after: probing is the expensive step and a
     # stale file list is cheap to detect and cheap to fix.
@@ -683,7 +689,7 @@ def main():
     phase1_results = phase1.generate()
 
     print("Dumping phase 1 results...")
-    json_dump(phase1_results, phase1_output_path)
+    artifact_store.dump(phase1_results, phase1_output_path, key_field="AlbumRoot")
 
 
 if __name__ == "__main__":
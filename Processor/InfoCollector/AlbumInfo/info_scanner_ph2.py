@@ -11,7 +11,8 @@ from Processor.InfoCollector.AlbumInfo.output.path_definitions import (
     INFO_SCANNER_PHASE2_TRACKINFO_OUTPUT_NAME,
     INFO_SCANNER_PROBED_RESULT_OUTPUT_NAME,
 )
-from Shared.json_utils import json_dump, json_load
+from Shared import artifact_store
+from Shared.json_utils import json_load
 
 # The canonical TLMC filename is "(NN) [artist] title.flac", but the same
 # convention is used for every format the pipeline accepts. Anchoring on .flac
@@ -50,7 +51,7 @@ ALBUM_DATE_VALIDATOR = re.compile(
 )
 
 
-output_root = utils.get_file_relative(__file__, "output")
+output_root = utils.get_output_root(__file__)
 os.makedirs(output_root, exist_ok=True)
 probed_results_path = os.path.join(output_root, INFO_SCANNER_PROBED_RESULT_OUTPUT_NAME)
 phase1_output_path = os.path.join(output_root, INFO_SCANNER_PHASE1_OUTPUT_NAME)
@@ -414,16 +415,18 @@ class Phase02AlbumExtractor:
 
 
 def main():
-    phase_1_result = json_load(phase1_output_path)
+    phase_1_result = artifact_store.load(phase1_output_path)
     probe_result = json_load(probed_results_path)
 
     album_extractor = Phase02AlbumExtractor(phase_1_result, probe_result)
     result = album_extractor.process()
-    json_dump(result, phase2_albuminfo_output_path)
+    # Phase 2's output is reviewed and corrected by hand (STEPS.md), so it
+    # stays indented; the other artifacts are written compact.
+    artifact_store.dump(result, phase2_albuminfo_output_path, indent=4)
 
     track_extractor = Phase02TrackExtractor(phase_1_result, probe_result)
     result = track_extractor.process()
-    json_dump(result, phase2_trackinfo_output_path)
+    artifact_store.dump(result, phase2_trackinfo_output_path, indent=4)
 
 
 if __name__ == "__main__":
@@ -11,9 +11,9 @@ from Processor.InfoCollector.AlbumInfo.output.path_definitions import (
     INFO_SCANNER_PHASE2_TRACKINFO_OUTPUT_NAME,
     INFO_SCANNER_PHASE3_OUTPUT_NAME,
 )
-from Shared.json_utils import json_dump, json_load
+from Shared import artifact_store
 
-output_root = utils.get_file_relative(__file__, "output")
+output_root = utils.get_output_root(__file__)
 os.makedirs(output_root, exist_ok=True)
 phase1_output_path = os.path.join(output_root, INFO_SCANNER_PHASE1_OUTPUT_NAME)
 phase2_trackinfo_output_path = os.path.join(
@@ -85,13 +85,13 @@ def merge(ph1, ph2_track, ph2_album):
 
 
 def main():
-    phase1_output = json_load(phase1_output_path)
-    phase2_trackinfo_output = json_load(phase2_trackinfo_output_path)
-    phase2_albuminfo_output = json_load(phase2_albuminfo_output_path)
+    phase1_output = artifact_store.load(phase1_output_path)
+    phase2_trackinfo_output = artifact_store.load(phase2_trackinfo_output_path)
+    phase2_albuminfo_output = artifact_store.load(phase2_albuminfo_output_path)
 
     # merge phase1 and phase2
     merge(phase1_output, phase2_trackinfo_output, phase2_albuminfo_output)
-    json_dump(phase1_output, phase3_output_path)
+    artifact_store.dump(phase1_output, phase3_output_path, key_field="AlbumRoot")
 
 
 if __name__ == "__main__":
@@ -17,7 +17,7 @@ from Shared.json_utils import json_dump, json_load
 
 CIRCLE_INFO_EXTRACTOR = re.compile(r"\[(.+)\](.+)?")
 
-output_root = utils.get_file_relative(__file__, "output")
+output_root = utils.get_output_root(__file__)
 
 artist_merged_name_dump_output = os.path.join(
     output_root, ARTIST_DISCOVERY_MERGED_ARTISTS_OUTPUT_PATH
@@ -8,7 +8,7 @@ from Processor.InfoCollector.ArtistInfo.output.path_definitions import (
 )
 from Shared.json_utils import json_dump, json_load
 
-output_root = utils.get_file_relative(__file__, "output")
+output_root = utils.get_output_root(__file__)
 os.makedirs(output_root, exist_ok=True)
 artist_existing_name_dump_output = os.path.join(
     output_root, EXISTING_ARTIST_NAME_DUMP_OUTPUT_PATH
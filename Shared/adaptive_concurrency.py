@@ -0,0 +1,232 @@
+"""
+Run-time worker tuning for the long StatAutoMuxMultiProcessor stages.
+
+Every worker count in hls_runner was found by trial on the production nodes:
+64 workers ran slower than 32 on the SMB node (0.45 vs 0.61 tracks/s), and
+publishing on a separate pool dropped it from 0.61 to 0.40. Each of those cost a
+run at the wrong setting before the numbers said so. The right count depends on
+the node, the mount and what else the disk is serving that day, so instead of
+fixing it up front the tuner measures completed tracks per second and moves the
+active worker count towards the peak while the run is going.
+
+The policy is AIMD, as in TCP congestion control. Each window is judged
+against the one before it, in light of the last move:
+
+  * a step up that made the run faster earns another step up;
+  * a step up that made it slower -- or any window that spends more than
+    IOWAIT_CEILING of the CPU waiting on I/O without ffmpeg getting any more
+    CPU -- backs off multiplicatively;
+  * a step up that changed nothing is taken back, since the extra workers were
+    only adding streams to the mount;
+  * otherwise the count holds, and probes up again after a few quiet windows,
+    because the peak moves with what the disk is serving and with track length.
+
+Comparing against the previous window rather than the best ever seen matters:
+tracks vary in length across the library, so a rate measured an hour ago on a
+run of short tracks says nothing about the current count.
+
+Only one limit is tuned at a time: a controller keeps the turn while it is
+moving and passes it on once it holds. Encode and publish cross the same mount,
+so moving both at once would leave no way to tell which change the rate
+answered.
+
+Lowering a limit never interrupts anything: running jobs finish and the next
+ones wait at acquire() until the active count is back under it.
+"""
+
+import os
+import threading
+import time
+from typing import Callable, List, Optional, Tuple
+
+# Long enough to average over a few hundred completions at production rates --
+# individual tracks vary from seconds to minutes -- short enough that a node
+# climbs from its floor to 32 workers in well under an hour.
+INTERVAL_SECONDS = float(os.environ.get("TLMC_AUTOTUNE_INTERVAL") or 120)
+
+# Window-to-window noise measured on the real run was ~5%; a change smaller
+# than this is not evidence of anything.
+TOLERANCE = 0.08
+
+# Fraction of all CPU time spent in iowait above which the mount is treated as
+# congested. The SMB node sat well past this at 64 workers.
+IOWAIT_CEILING = 0.40
+
+BACKOFF = 0.75
+HOLD_WINDOWS = 3
+
+
+class AdaptiveLimit:
+    """A semaphore whose size can be changed while it is held."""
+
+    def __init__(self, limit: int) -> None:
+        self._limit = max(1, limit)
+        self._active = 0
+        self._cond = threading.Condition()
+
+    @property
+    def limit(self) -> int:
+        return self._limit
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    def acquire(self) -> None:
+        with self._cond:
+            while self._active >= self._limit:
+                self._cond.wait()
+            self._active += 1
+
+    def release(self) -> None:
+        with self._cond:
+            self._active -= 1
+            self._cond.notify()
+
+    def set_limit(self, limit: int) -> None:
+        with self._cond:
+            self._limit = max(1, limit)
+            self._cond.notify_all()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class AimdController:
+    def __init__(
+        self, name: str, limit: AdaptiveLimit, lower: int, upper: int, step: int = 2
+    ) -> None:
+        self.name = name
+        self.limit = limit
+        self.lower = max(1, lower)
+        self.upper = max(self.lower, upper)
+        self.step = step
+        self.last_rate = None
+        self.last_move = 0
+        self.quiet = 0
+        limit.set_limit(min(max(limit.limit, self.lower), self.upper))
+
+    def update(
+        self,
+        rate: float,
+        iowait: Optional[float],
+        cpu_grew: bool,
+    ) -> Tuple[int, str]:
+        """Move the limit for one window's measurements; returns (new limit, why)."""
+        current = self.limit.limit
+        congested = iowait is not None and iowait > IOWAIT_CEILING and not cpu_grew
+
+        if self.last_rate is None:
+            faster = slower = False
+        else:
+            faster = rate > self.last_rate * (1 + TOLERANCE)
+            slower = rate < self.last_rate * (1 - TOLERANCE)
+
+        if congested:
+            new, why = int(current * BACKOFF), "I/O congested"
+        elif self.last_rate is None:
+            new, why = current + self.step, "starting"
+        elif self.last_move > 0 and faster:
+            new, why = current + self.step, "faster"
+        elif self.last_move > 0 and slower:
+            new, why = int(current * BACKOFF), "slower"
+        elif self.last_move > 0:
+            new, why = current - self.step, "no gain, stepping back"
+        elif self.last_move < 0 and slower:
+            new, why = current + self.step, "backed off too far"
+        elif self.quiet + 1 >= HOLD_WINDOWS:
+            new, why = current + self.step, "probing"
+        else:
+            new, why = current, "holding"
+
+        new = min(max(new, self.lower), self.upper)
+        self.limit.set_limit(new)
+
+        self.last_move = (new > current) - (new < current)
+        self.quiet = self.quiet + 1 if new == current else 0
+        self.last_rate = rate
+        return new, why
+
+
+def read_iowait() -> Optional[Tuple[int, int]]:
+    """(iowait, total) jiffies across all CPUs, or None off Linux."""
+    try:
+        with open("/proc/stat", "r", encoding="ascii") as f:
+            fields = [int(x) for x in f.readline().split()[1:]]
+    except (OSError, ValueError):
+        return None
+    return fields[4], sum(fields)
+
+
+def children_cpu_seconds() -> float:
+    # ffmpeg is the only child these stages spawn, and subprocess reaps every
+    # one of them, so this is ffmpeg's CPU time to within the last few jobs.
+    t = os.times()
+    return t.children_user + t.children_system
+
+
+class AutoTuner:
+    """
+    Samples throughput every INTERVAL_SECONDS and hands it to whichever
+    controller has the turn.
+    """
+
+    def __init__(
+        self,
+        completed: Callable[[], int],
+        controllers: List[AimdController],
+        log: Callable[[str], None] = print,
+        interval: float = INTERVAL_SECONDS,
+    ) -> None:
+        self.completed = completed
+        self.controllers = controllers
+        self.log = log
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _run(self) -> None:
+        turn = 0
+        last_done = self.completed()
+        last_io = read_iowait()
+        last_cpu = children_cpu_seconds()
+        last_cores = None
+        last_t = time.monotonic()
+
+        while not self._stop.wait(self.interval):
+            now = time.monotonic()
+            done, io, cpu = self.completed(), read_iowait(), children_cpu_seconds()
+            elapsed = now - last_t
+
+            rate = (done - last_done) / elapsed
+            cores = (cpu - last_cpu) / elapsed
+            iowait = None
+            if io is not None and last_io is not None and io[1] > last_io[1]:
+                iowait = (io[0] - last_io[0]) / (io[1] - last_io[1])
+            cpu_grew = last_cores is not None and cores > last_cores * (1 + TOLERANCE)
+
+            controller = self.controllers[turn % len(self.controllers)]
+            before = controller.limit.limit
+            after, why = controller.update(rate, iowait, cpu_grew)
+            self.log(
+                f"autotune: {rate:.3f}/s, ffmpeg {cores:.1f} cores, "
+                f"iowait {'n/a' if iowait is None else f'{iowait:.0%}'} -> "
+                f"{controller.name} {before} -> {after} ({why})\n"
+            )
+
+            if after == before:
+                turn += 1
+            last_done, last_io, last_cpu, last_cores, last_t = done, io, cpu, cores, now
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="autotune", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
@@ -0,0 +1,360 @@
+"""
+Keyed row store behind the large stage artifacts.
+
+The info scanner phases, id_assign_and_merge, the HLS worklist and the finalizer
+manifest were each one pretty-printed JSON document of the whole library:
+~170k tracks, written with indent=4 and read back in full by every consumer,
+even one that looks at a handful of albums or flips one field per track. Here
+each artifact is also kept as a SQLite file next to its JSON, one row per album
+root, track path or id:
+
+    <name>.output.json      compact JSON export, same shape as before
+    <name>.output.sqlite3   row(seq, key, body) -- body is that entry's JSON
+
+so a stage can stream the rows, fetch the few it needs by key, or rewrite only
+the rows it changed and re-export. SQLite's json_extract works on the bodies,
+which makes the store the quicker thing to query by hand:
+
+    sqlite3 info_scanner_phase3.output.sqlite3 \\
+        "SELECT key FROM row
+         WHERE json_extract(body, '$.AlbumMetadata.AlbumName') = ''"
+
+The JSON stays the interchange format -- the backend's importer and the
+scrapers read it -- but it is written compact, straight from the stored row
+text (phase 2's, which is corrected by hand, stays indented). A store is only
+used while its JSON is the export it wrote (same size and mtime); a JSON edited
+by hand or written by an older script wins, and open_store() reimports it.
+
+    python -m Shared.artifact_store export <store> <json> [--indent N]
+"""
+
+import json
+import os
+import sqlite3
+import sys
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from Shared.json_utils import json_load
+
+SHAPE_LIST = "list"
+SHAPE_DICT = "dict"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS row (
+    seq  INTEGER PRIMARY KEY,
+    key  TEXT NOT NULL UNIQUE,
+    body TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    name  TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+# Rows per executemany and per fetch while streaming.
+BATCH = 2000
+
+
+def store_path(json_path: str) -> str:
+    root, ext = os.path.splitext(json_path)
+    return (root if ext == ".json" else json_path) + ".sqlite3"
+
+
+def _dumps(value) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+class ArtifactStore:
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def exists(self) -> bool:
+        return os.path.isfile(self.path)
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.path, timeout=60)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(_SCHEMA)
+        return self._conn
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _meta(self, name: str) -> Optional[str]:
+        row = self._db().execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, conn: sqlite3.Connection, name: str, value: str) -> None:
+        conn.execute(
+            "INSERT INTO meta (name, value) VALUES (?, ?) "
+            "ON CONFLICT (name) DO UPDATE SET value = excluded.value",
+            (name, value),
+        )
+
+    @property
+    def shape(self) -> str:
+        return self._meta("shape") or SHAPE_DICT
+
+    @property
+    def key_field(self) -> Optional[str]:
+        return self._meta("key_field")
+
+    def replace(self, data, key_field: Optional[str] = None) -> int:
+        """
+        Replaces the whole store with `data`: a dict, or a list of dicts keyed
+        by their `key_field`.
+        """
+        if isinstance(data, dict):
+            return self.replace_items(data.items())
+        if key_field is None:
+            raise ValueError("a list artifact needs a key_field")
+        rows = ((v[key_field], v) for v in data)
+        return self._replace(SHAPE_LIST, key_field, rows)
+
+    def replace_items(self, entries: Iterable[Tuple[str, Any]]) -> int:
+        """Replaces the store with a dict artifact, consumed one entry at a time."""
+        return self._replace(SHAPE_DICT, None, entries)
+
+    def _replace(self, shape: str, key_field: Optional[str], entries) -> int:
+        # Built in a temporary file and renamed over the store, so a reader
+        # never sees half of it and a failed stage leaves the old one intact.
+        tmp = ArtifactStore(self.path + ".tmp")
+        for leftover in (tmp.path, tmp.path + "-wal", tmp.path + "-shm"):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+        conn = tmp._db()
+        count = 0
+        done = False
+        try:
+            with conn:
+                self._set_meta(conn, "shape", shape)
+                if key_field is not None:
+                    self._set_meta(conn, "key_field", key_field)
+                batch = []
+                for key, value in entries:
+                    batch.append((str(key), _dumps(value)))
+                    if len(batch) >= BATCH:
+                        conn.executemany("INSERT INTO row (key, body) VALUES (?, ?)", batch)
+                        count += len(batch)
+                        batch = []
+                conn.executemany("INSERT INTO row (key, body) VALUES (?, ?)", batch)
+                count += len(batch)
+            # Fold the WAL back in so the renamed file is complete on its own.
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            done = True
+        except sqlite3.IntegrityError as e:
+            raise ValueError(f"duplicate key in artifact for {self.path}: {e}") from e
+        finally:
+            tmp.close()
+            if not done:
+                for leftover in (tmp.path, tmp.path + "-wal", tmp.path + "-shm"):
+                    if os.path.exists(leftover):
+                        os.remove(leftover)
+
+        self.close()
+        for stale in (self.path + "-wal", self.path + "-shm"):
+            if os.path.exists(stale):
+                os.remove(stale)
+        os.replace(tmp.path, self.path)
+        return count
+
+    def __len__(self) -> int:
+        return self._db().execute("SELECT COUNT(*) FROM row").fetchone()[0]
+
+    def keys(self) -> List[str]:
+        return [k for (k,) in self._db().execute("SELECT key FROM row ORDER BY seq")]
+
+    def _raw(self) -> Iterator[Tuple[str, str]]:
+        cursor = self._db().execute("SELECT key, body FROM row ORDER BY seq")
+        while True:
+            rows = cursor.fetchmany(BATCH)
+            if not rows:
+                return
+            yield from rows
+
+    def items(self) -> Iterator[Tuple[str, Any]]:
+        """(key, entry) in the artifact's order, a batch of rows in memory at a time."""
+        for key, body in self._raw():
+            yield key, json.loads(body)
+
+    def get(self, key: str) -> Optional[Any]:
+        row = self._db().execute("SELECT body FROM row WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        """The entries present among `keys`; absent keys are left out."""
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        conn = self._db()
+        # Under SQLite's bound-parameter limit on older builds.
+        for i in range(0, len(keys), 500):
+            chunk = keys[i : i + 500]
+            marks = ",".join("?" * len(chunk))
+            for key, body in conn.execute(
+                f"SELECT key, body FROM row WHERE key IN ({marks})", chunk
+            ):
+                found[key] = json.loads(body)
+        return found
+
+    def put_many(self, entries: Iterable[Tuple[str, Any]]) -> int:
+        """Rewrites the given rows in place; new keys go to the end."""
+        conn = self._db()
+        count = 0
+        with conn:
+            batch = []
+            for key, value in entries:
+                batch.append((str(key), _dumps(value)))
+                if len(batch) >= BATCH:
+                    self._upsert(conn, batch)
+                    count += len(batch)
+                    batch = []
+            self._upsert(conn, batch)
+            count += len(batch)
+        return count
+
+    def delete_many(self, keys: Iterable[str]) -> int:
+        conn = self._db()
+        with conn:
+            return conn.executemany(
+                "DELETE FROM row WHERE key = ?", ((str(k),) for k in keys)
+            ).rowcount
+
+    @staticmethod
+    def _upsert(conn: sqlite3.Connection, batch: List[Tuple[str, str]]) -> None:
+        conn.executemany(
+            "INSERT INTO row (key, body) VALUES (?, ?) "
+            "ON CONFLICT (key) DO UPDATE SET body = excluded.body",
+            batch,
+        )
+
+    def load(self):
+        """The whole artifact, shaped as its JSON would load."""
+        if self.shape == SHAPE_LIST:
+            return [value for _, value in self.items()]
+        return dict(self.items())
+
+    def export_json(
+        self, json_path: str, indent: Optional[int] = None, stamp: bool = True
+    ) -> None:
+        """
+        Writes the JSON export, atomically. Compact exports are assembled from
+        the stored row text without parsing it. With `stamp`, the store
+        records this file as its export, so load() may read the store instead.
+        """
+        as_list = self.shape == SHAPE_LIST
+        tmp = json_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8", buffering=2**20) as f:
+            if indent is not None:
+                json.dump(self.load(), f, indent=indent, ensure_ascii=False)
+            else:
+                f.write("[" if as_list else "{")
+                for i, (key, body) in enumerate(self._raw()):
+                    if i:
+                        f.write(",")
+                    if not as_list:
+                        f.write(_dumps(key) + ":")
+                    f.write(body)
+                f.write("]" if as_list else "}")
+        os.replace(tmp, json_path)
+
+        if stamp:
+            st = os.stat(json_path)
+            conn = self._db()
+            with conn:
+                self._set_meta(conn, "export", f"{os.path.abspath(json_path)}:{st.st_size}:{st.st_mtime_ns}")
+
+    def is_export_of(self, json_path: str) -> bool:
+        """Whether `json_path` is, unchanged, the last export written from this store."""
+        if not self.exists():
+            return False
+        try:
+            st = os.stat(json_path)
+        except OSError:
+            # No JSON at all: the store is all there is.
+            return True
+        return self._meta("export") == (
+            f"{os.path.abspath(json_path)}:{st.st_size}:{st.st_mtime_ns}"
+        )
+
+
+def dump(
+    data, json_path: str, key_field: Optional[str] = None, indent: Optional[int] = None
+) -> None:
+    """
+    Writes an artifact: its store, then the JSON export from it -- compact,
+    unless it is one meant to be edited by hand. A list artifact is keyed by
+    its entries' `key_field`.
+    """
+    store = ArtifactStore(store_path(json_path))
+    store.replace(data, key_field)
+    store.export_json(json_path, indent=indent)
+    store.close()
+
+
+def dump_items(entries: Iterable[Tuple[str, Any]], json_path: str) -> None:
+    """dump() for a dict artifact produced entry by entry."""
+    store = ArtifactStore(store_path(json_path))
+    store.replace_items(entries)
+    store.export_json(json_path)
+    store.close()
+
+
+def load(json_path: str):
+    """
+    An artifact in full, from its store when the JSON is that store's own
+    export, from the JSON otherwise.
+    """
+    store = ArtifactStore(store_path(json_path))
+    try:
+        if store.is_export_of(json_path):
+            return store.load()
+    finally:
+        store.close()
+    return json_load(json_path)
+
+
+def open_store(json_path: str, key_field: Optional[str] = None) -> ArtifactStore:
+    """
+    The artifact's store for streaming, keyed reads and partial updates.
+
+    A JSON that is not the store's own export -- edited by hand, or written
+    before stores existed -- is imported first; `key_field` says how to key a
+    list artifact that has no store yet to take it from.
+    """
+    store = ArtifactStore(store_path(json_path))
+    if not store.is_export_of(json_path):
+        print(f"Importing {json_path} into {store.path}")
+        data = json_load(json_path)
+        if key_field is None and store.exists():
+            key_field = store.key_field
+        store.replace(data, key_field)
+        store.export_json(json_path)
+    return store
+
+
+def main():
+    args = sys.argv[1:]
+    indent = None
+    if "--indent" in args:
+        i = args.index("--indent")
+        indent = int(args[i + 1])
+        del args[i : i + 2]
+    if len(args) != 3 or args[0] != "export":
+        print("usage: python -m Shared.artifact_store export <store> <json> [--indent N]")
+        sys.exit(2)
+
+    store = ArtifactStore(args[1])
+    if not store.exists():
+        print(f"No store at {args[1]}")
+        sys.exit(1)
+    store.export_json(args[2], indent=indent, stamp=False)
+    print(f"Exported {len(store)} rows to {args[2]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Restricts a pipeline stage to the albums a release delta touched.
+
+DataUpdates/FileDeltaScanner/fs-compare.py diffs the extracted snapshots of two
+releases and writes a worklist of the albums that were added, modified or moved.
+With
+
+    TLMC_DELTA_WORKLIST=DataUpdates/FileDeltaScanner/output/delta_worklist.output.json
+
+set, the stages that walk the library or a full-library artifact keep only
+paths inside those albums: cue_scanner, info_scanner_ph1 (and so ph2/ph3, which
+read its output), loudness_measure, hls_assignment and backfill_file_metadata.
+Unset, nothing changes.
+
+Albums are named `<circle>/<album>`, relative to the library root, and a path
+is matched by looking for that pair of directories anywhere in it. That way the
+same worklist works on every node, whatever the library is mounted as.
+
+A restricted run writes the usual artifacts, covering only the worklist's
+albums, so give it an output root of its own:
+
+    TLMC_OUTPUT_ROOT=/srv/tlmc/delta-2024-10
+
+mirrors every stage's output directory under that root (Shared/utils.py), and
+the full run's artifacts are left as they were. Each stage of the restricted
+run then reads the previous one's output from there too. The shared probe
+cache moves with it; point TLMC_PROBE_CACHE at the full run's to keep it warm.
+"""
+
+import json
+import os
+from typing import Callable, Iterable, List, Optional, TypeVar
+
+from Shared import utils
+
+T = TypeVar("T")
+
+WORKLIST_PATH = os.environ.get("TLMC_DELTA_WORKLIST")
+
+
+def _parts(path: str) -> List[str]:
+    # Snapshots taken on Windows carry backslashes.
+    return [p for p in path.replace("\\", "/").split("/") if p]
+
+
+class DeltaWorklist:
+    def __init__(self, albums: Iterable[str]) -> None:
+        self.albums = {"/".join(_parts(a)) for a in albums}
+
+    def selects(self, path: str) -> bool:
+        """Whether `path` is, or is inside, one of the worklist's albums."""
+        parts = _parts(path)
+        return any(
+            f"{parts[i]}/{parts[i + 1]}" in self.albums for i in range(len(parts) - 1)
+        )
+
+
+_loaded = False
+_worklist: Optional[DeltaWorklist] = None
+
+
+def load() -> Optional[DeltaWorklist]:
+    """The worklist named by TLMC_DELTA_WORKLIST, or None when unset."""
+    global _loaded, _worklist
+    if not _loaded:
+        _loaded = True
+        if WORKLIST_PATH:
+            with open(WORKLIST_PATH, "r", encoding="utf-8") as f:
+                _worklist = DeltaWorklist(json.load(f)["Albums"])
+            print(
+                f"Delta worklist {WORKLIST_PATH}: restricted to "
+                f"{len(_worklist.albums)} albums"
+            )
+            if not utils.OUTPUT_ROOT:
+                print(
+                    "WARNING: TLMC_OUTPUT_ROOT is not set; this run overwrites "
+                    "the full library's artifacts with the worklist's albums"
+                )
+    return _worklist
+
+
+def restrict(items: Iterable[T], path_of: Callable[[T], str] = lambda x: x) -> List[T]:
+    """`items` whose path lies in a worklist album; all of them without a worklist."""
+    items = list(items)
+    worklist = load()
+    if worklist is None:
+        return items
+    kept = [item for item in items if worklist.selects(path_of(item))]
+    print(f"Delta worklist: kept {len(kept)} of {len(items)}")
+    return kept
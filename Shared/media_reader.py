@@ -0,0 +1,833 @@
+"""
+Reads tags and stream info straight from audio file headers, in process.
+
+ffprobe costs ~48ms a file, nearly all of it process start-up and the seek to
+read a few KB of header. This reads the same few KB without the process and
+returns the dict ffprobe `-show_format -show_streams -of json` would, so
+reformat_probed, Phase02TrackExtractor and the probe cache cannot tell the two
+apart: `format.filename`, `format.duration` (a string, as ffprobe prints it),
+`format.tags` with ffmpeg's generic key names, and one audio stream.
+
+Only header structures are read, each with a bounded read. Embedded artwork --
+FLAC PICTURE blocks, ID3 APIC frames, APE binary items, MP4 `covr` -- is stepped
+over with a seek and never read, which is what made mutagen's full parse
+~250ms a file on this library (see backfill_file_metadata._streaminfo_duration).
+
+Anything this does not understand (RF64, unsynchronised ID3v2.3 tags, a FLAC
+without a sample count, ...) returns None, and the caller falls back to
+ffprobe. Parsing is pure Python and holds the GIL, so bulk reads go through
+`read_many`, which fans out over a process pool.
+"""
+
+import os
+import struct
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+# Cap on any single tag structure that is read into memory. Text tags are a few
+# KB; anything past this is artwork or damage, and is skipped rather than read.
+MAX_TAG_BYTES = 1 << 20
+# How far past the ID3v2 tag to look for the first MPEG frame sync.
+MP3_SYNC_WINDOW = 64 * 1024
+
+READ_WORKERS = max(1, (os.cpu_count() or 4) - 2)
+
+
+class UnsupportedFile(Exception):
+    pass
+
+
+# ffmpeg renames container-native tag keys to its generic names before ffprobe
+# prints them. These are the conversions its demuxers apply; keys not listed
+# pass through with their original spelling, as they do in ffprobe.
+VORBIS_KEYS = {
+    "albumartist": "album_artist",
+    "tracknumber": "track",
+    "discnumber": "disc",
+    "description": "comment",
+}
+
+ID3V2_KEYS = {
+    # 2.3 / 2.4
+    "TALB": "album",
+    "TCOM": "composer",
+    "TCON": "genre",
+    "TCOP": "copyright",
+    "TENC": "encoded_by",
+    "TIT2": "title",
+    "TLAN": "language",
+    "TPE1": "artist",
+    "TPE2": "album_artist",
+    "TPE3": "performer",
+    "TPOS": "disc",
+    "TPUB": "publisher",
+    "TRCK": "track",
+    "TSSE": "encoder",
+    "TDRC": "date",
+    "TDRL": "date",
+    "TYER": "date",
+    "TDAT": "date",
+    "TSOA": "album-sort",
+    "TSOP": "artist-sort",
+    "TSOT": "title-sort",
+    "TIT1": "grouping",
+    # 2.2
+    "TAL": "album",
+    "TCO": "genre",
+    "TCM": "composer",
+    "TT2": "title",
+    "TEN": "encoded_by",
+    "TP1": "artist",
+    "TP2": "album_artist",
+    "TP3": "performer",
+    "TRK": "track",
+    "TPA": "disc",
+    "TYE": "date",
+}
+
+RIFF_INFO_KEYS = {
+    b"IART": "artist",
+    b"ICMT": "comment",
+    b"ICOP": "copyright",
+    b"ICRD": "date",
+    b"IGNR": "genre",
+    b"ILNG": "language",
+    b"INAM": "title",
+    b"IPRD": "album",
+    b"IPRT": "track",
+    b"ITRK": "track",
+    b"ISFT": "encoder",
+    b"ITCH": "encoded_by",
+}
+
+MP4_KEYS = {
+    b"\xa9nam": "title",
+    b"\xa9ART": "artist",
+    b"aART": "album_artist",
+    b"\xa9alb": "album",
+    b"\xa9day": "date",
+    b"\xa9gen": "genre",
+    b"\xa9wrt": "composer",
+    b"\xa9cmt": "comment",
+    b"\xa9too": "encoder",
+    b"\xa9grp": "grouping",
+    b"\xa9lyr": "lyrics",
+    b"cprt": "copyright",
+    b"\xa9cpy": "copyright",
+    b"desc": "description",
+}
+
+
+def _add_tag(tags: Dict[str, str], key: str, value: str):
+    value = value.rstrip("\x00")
+    if not value:
+        return
+    # Repeated fields (two ARTIST comments, a multi-value ID3 frame) are joined
+    # the way ffprobe prints them.
+    if key in tags:
+        tags[key] = f"{tags[key]};{value}"
+    else:
+        tags[key] = value
+
+
+def _result(path, format_name, duration, tags, stream, size):
+    fmt = {
+        "filename": path,
+        "nb_streams": 1,
+        "format_name": format_name,
+        "duration": f"{duration:.6f}",
+        "size": str(size),
+    }
+    if duration > 0:
+        fmt["bit_rate"] = str(int(size * 8 / duration))
+    if tags:
+        fmt["tags"] = tags
+
+    stream = {"index": 0, "codec_type": "audio", **stream}
+    stream["duration"] = f"{duration:.6f}"
+    return {"streams": [stream], "format": fmt}
+
+
+# ---------------------------------------------------------------------- FLAC
+
+
+def _skip_id3v2(f) -> int:
+    """Offset just past a leading ID3v2 tag, or 0 if there is none."""
+    f.seek(0)
+    header = f.read(10)
+    if len(header) < 10 or header[:3] != b"ID3":
+        f.seek(0)
+        return 0
+    size = _syncsafe(header[6:10]) + 10
+    if header[5] & 0x10:  # footer present
+        size += 10
+    f.seek(size)
+    return size
+
+
+def _syncsafe(b: bytes) -> int:
+    return (b[0] << 21) | (b[1] << 14) | (b[2] << 7) | b[3]
+
+
+def _parse_vorbis_comment(data: bytes, tags: Dict[str, str]):
+    vendor_len = struct.unpack_from("<I", data, 0)[0]
+    pos = 4 + vendor_len
+    (count,) = struct.unpack_from("<I", data, pos)
+    pos += 4
+    for _ in range(count):
+        (length,) = struct.unpack_from("<I", data, pos)
+        pos += 4
+        entry = data[pos : pos + length].decode("utf-8", errors="replace")
+        pos += length
+        key, sep, value = entry.partition("=")
+        if not sep:
+            continue
+        # Base64 artwork inside the comment block; ffmpeg turns it into an
+        # attached picture rather than a tag.
+        if key.upper() == "METADATA_BLOCK_PICTURE":
+            continue
+        _add_tag(tags, VORBIS_KEYS.get(key.lower(), key), value)
+
+
+def _render_cuesheet_block(data: bytes, sample_rate: int, filename: str) -> Optional[str]:
+    """
+    A FLAC CUESHEET metadata block as cue sheet text.
+
+    ffprobe only exposes this block as chapters, never as a tag, so an image
+    carrying its cue this way was invisible to cue_scanner. Rendering it as the
+    text a CUESHEET comment would hold lets it flow through the same path.
+    """
+    pos = 128 + 8  # media catalog number, lead-in
+    is_cd = bool(data[pos] & 0x80)
+    pos += 1 + 258
+    num_tracks = data[pos]
+    pos += 1
+    if not is_cd or not sample_rate:
+        return None
+
+    lines = [f'FILE "{filename}" WAVE']
+    for _ in range(num_tracks):
+        offset, number = struct.unpack_from(">QB", data, pos)
+        pos += 8 + 1 + 12
+        non_audio = bool(data[pos] & 0x80)
+        pos += 1 + 13
+        num_indices = data[pos]
+        pos += 1
+        indices = []
+        for _ in range(num_indices):
+            idx_offset, idx_number = struct.unpack_from(">QB", data, pos)
+            pos += 12
+            indices.append((idx_number, offset + idx_offset))
+        # 170 (CD) / 255 is the lead-out, not a track
+        if number in (170, 255) or non_audio:
+            continue
+        lines.append(f"  TRACK {number:02d} AUDIO")
+        for idx_number, sample in indices:
+            frames = sample * 75 // sample_rate
+            mm, rem = divmod(frames, 75 * 60)
+            ss, ff = divmod(rem, 75)
+            lines.append(f"    INDEX {idx_number:02d} {mm:02d}:{ss:02d}:{ff:02d}")
+
+    return "\n".join(lines) + "\n" if len(lines) > 1 else None
+
+
+def read_flac(f, path: str, size: int) -> dict:
+    _skip_id3v2(f)
+    if f.read(4) != b"fLaC":
+        raise UnsupportedFile("no fLaC magic")
+
+    tags: Dict[str, str] = {}
+    sample_rate = channels = bps = total_samples = 0
+    cuesheet_block = None
+    last = False
+    while not last:
+        header = f.read(4)
+        if len(header) < 4:
+            break
+        last = bool(header[0] & 0x80)
+        block_type = header[0] & 0x7F
+        length = int.from_bytes(header[1:4], "big")
+
+        if block_type == 0:  # STREAMINFO
+            si = f.read(length)
+            sample_rate = (si[10] << 12) | (si[11] << 4) | (si[12] >> 4)
+            channels = ((si[12] >> 1) & 0x07) + 1
+            bps = (((si[12] & 0x01) << 4) | (si[13] >> 4)) + 1
+            total_samples = ((si[13] & 0x0F) << 32) | int.from_bytes(si[14:18], "big")
+        elif block_type == 4:  # VORBIS_COMMENT
+            _parse_vorbis_comment(f.read(length), tags)
+        elif block_type == 5 and length <= MAX_TAG_BYTES:  # CUESHEET
+            cuesheet_block = f.read(length)
+        else:
+            # PICTURE, PADDING, SEEKTABLE, APPLICATION: never read
+            f.seek(length, os.SEEK_CUR)
+
+    if not sample_rate or not total_samples:
+        raise UnsupportedFile("STREAMINFO without a sample count")
+
+    if cuesheet_block is not None and not any(k.lower() == "cuesheet" for k in tags):
+        rendered = _render_cuesheet_block(
+            cuesheet_block, sample_rate, os.path.basename(path)
+        )
+        if rendered:
+            tags["CUESHEET"] = rendered
+
+    stream = {
+        "codec_name": "flac",
+        "sample_fmt": "s16" if bps <= 16 else "s32",
+        "sample_rate": str(sample_rate),
+        "channels": channels,
+        "bits_per_raw_sample": str(bps),
+    }
+    return _result(path, "flac", total_samples / sample_rate, tags, stream, size)
+
+
+# ----------------------------------------------------------------------- ID3
+
+
+def _decode_id3_text(encoding: int, data: bytes) -> str:
+    if encoding == 0:
+        text = data.decode("latin-1")
+    elif encoding == 1:
+        text = data.decode("utf-16", errors="replace")
+    elif encoding == 2:
+        text = data.decode("utf-16-be", errors="replace")
+    else:
+        text = data.decode("utf-8", errors="replace")
+    # v2.4 separates multiple values with NUL
+    return ";".join(v for v in text.split("\x00") if v)
+
+
+def _split_id3_terminated(encoding: int, data: bytes) -> Tuple[bytes, bytes]:
+    """Split at the first encoding-appropriate NUL terminator."""
+    if encoding in (1, 2):
+        i = 0
+        while i + 1 < len(data):
+            if data[i] == 0 and data[i + 1] == 0:
+                return data[:i], data[i + 2 :]
+            i += 2
+        return data, b""
+    head, _, tail = data.partition(b"\x00")
+    return head, tail
+
+
+def read_id3v2(f, offset: int, tags: Dict[str, str]) -> int:
+    """
+    Parses an ID3v2 tag at `offset` into `tags`; returns the offset past it.
+
+    Frames are visited one header at a time, and anything that is not a text or
+    comment frame -- APIC above all -- is skipped with a seek.
+    """
+    f.seek(offset)
+    header = f.read(10)
+    if len(header) < 10 or header[:3] != b"ID3":
+        return offset
+
+    major = header[3]
+    flags = header[5]
+    tag_size = _syncsafe(header[6:10])
+    end = offset + 10 + tag_size
+    if major not in (2, 3, 4):
+        return end + (10 if flags & 0x10 else 0)
+    if flags & 0x80 and major < 4:
+        # Whole-tag unsynchronisation: frame sizes refer to the decoded
+        # stream, so frames cannot be located without reading everything.
+        raise UnsupportedFile("unsynchronised ID3v2 tag")
+
+    pos = offset + 10
+    if flags & 0x40:  # extended header
+        f.seek(pos)
+        ext = f.read(4)
+        pos += _syncsafe(ext) if major == 4 else struct.unpack(">I", ext)[0] + 4
+
+    id_len, header_len = (3, 6) if major == 2 else (4, 10)
+    while pos + header_len <= end:
+        f.seek(pos)
+        fh = f.read(header_len)
+        frame_id = fh[:id_len]
+        if not frame_id.strip(b"\x00") or not frame_id.isalnum():
+            break  # padding
+
+        if major == 2:
+            frame_size = int.from_bytes(fh[3:6], "big")
+            frame_flags = 0
+        elif major == 3:
+            frame_size = struct.unpack(">I", fh[4:8])[0]
+            frame_flags = struct.unpack(">H", fh[8:10])[0]
+        else:
+            frame_size = _syncsafe(fh[4:8])
+            frame_flags = struct.unpack(">H", fh[8:10])[0]
+        body_pos = pos + header_len
+        pos = body_pos + frame_size
+
+        fid = frame_id.decode("latin-1")
+        wanted = fid[0] == "T" or fid in ("COMM", "COM")
+        if not wanted or frame_size == 0 or frame_size > MAX_TAG_BYTES:
+            continue
+        compressed_or_encrypted = (
+            (major == 3 and frame_flags & 0x00C0) or (major == 4 and frame_flags & 0x000C)
+        )
+        if compressed_or_encrypted:
+            continue
+
+        body = f.read(frame_size)
+        if major == 4 and frame_flags & 0x0001:  # data length indicator
+            body = body[4:]
+        if major == 4 and frame_flags & 0x0002:  # per-frame unsynchronisation
+            body = body.replace(b"\xff\x00", b"\xff")
+
+        encoding = body[0]
+        if fid in ("TXXX", "TXX"):
+            desc, value = _split_id3_terminated(encoding, body[1:])
+            _add_tag(
+                tags,
+                _decode_id3_text(encoding, desc),
+                _decode_id3_text(encoding, value),
+            )
+        elif fid in ("COMM", "COM"):
+            _, text = _split_id3_terminated(encoding, body[4:])
+            _add_tag(tags, "comment", _decode_id3_text(encoding, text))
+        else:
+            _add_tag(tags, ID3V2_KEYS.get(fid, fid), _decode_id3_text(encoding, body[1:]))
+
+    return end + (10 if flags & 0x10 else 0)
+
+
+def read_id3v1(f, size: int, tags: Dict[str, str]) -> bool:
+    """Fills gaps in `tags` from an ID3v1 tag; returns whether one was present."""
+    if size < 128:
+        return False
+    f.seek(size - 128)
+    data = f.read(128)
+    if data[:3] != b"TAG":
+        return False
+
+    def text(b):
+        return b.split(b"\x00", 1)[0].decode("latin-1").strip()
+
+    fields = {
+        "title": text(data[3:33]),
+        "artist": text(data[33:63]),
+        "album": text(data[63:93]),
+        "date": text(data[93:97]),
+        "comment": text(data[97:127]),
+    }
+    if data[125] == 0 and data[126] != 0:
+        fields["comment"] = text(data[97:125])
+        fields["track"] = str(data[126])
+    for key, value in fields.items():
+        if value and key not in tags:
+            tags[key] = value
+    return True
+
+
+# ----------------------------------------------------------------------- MP3
+
+_MP3_BITRATES = {
+    # (version is MPEG1, layer) -> kbps by index
+    (True, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (True, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (True, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (False, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (False, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (False, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+_MP3_SAMPLE_RATES = {3: [44100, 48000, 32000], 2: [22050, 24000, 16000], 0: [11025, 12000, 8000]}
+
+
+def _mp3_frame_header(h: bytes):
+    if len(h) < 4 or h[0] != 0xFF or (h[1] & 0xE0) != 0xE0:
+        return None
+    version = (h[1] >> 3) & 0x03  # 3 = MPEG1, 2 = MPEG2, 0 = MPEG2.5
+    layer = 4 - ((h[1] >> 1) & 0x03)
+    bitrate_idx = h[2] >> 4
+    rate_idx = (h[2] >> 2) & 0x03
+    if version == 1 or layer == 4 or bitrate_idx in (0, 15) or rate_idx == 3:
+        return None
+    mpeg1 = version == 3
+    bitrate = _MP3_BITRATES[(mpeg1, layer)][bitrate_idx] * 1000
+    sample_rate = _MP3_SAMPLE_RATES[version][rate_idx]
+    channels = 1 if (h[3] >> 6) == 3 else 2
+    if layer == 1:
+        spf = 384
+    elif layer == 2 or mpeg1:
+        spf = 1152
+    else:
+        spf = 576
+    return mpeg1, layer, bitrate, sample_rate, channels, spf
+
+
+def read_mp3(f, path: str, size: int) -> dict:
+    tags: Dict[str, str] = {}
+    audio_start = read_id3v2(f, 0, tags)
+    has_v1 = read_id3v1(f, size, tags)
+
+    f.seek(audio_start)
+    window = f.read(MP3_SYNC_WINDOW)
+    header = None
+    for i in range(len(window) - 4):
+        if window[i] == 0xFF:
+            header = _mp3_frame_header(window[i : i + 4])
+            if header is not None:
+                break
+    if header is None:
+        raise UnsupportedFile("no MPEG frame sync")
+    first_frame = i
+    mpeg1, layer, bitrate, sample_rate, channels, spf = header
+
+    # Xing/Info (LAME) or VBRI header in the first frame gives the frame count,
+    # which is the only exact duration for VBR files.
+    frames = None
+    side_info = (32 if channels == 2 else 17) if mpeg1 else (17 if channels == 2 else 9)
+    xing_at = first_frame + 4 + side_info
+    if window[xing_at : xing_at + 4] in (b"Xing", b"Info"):
+        (xflags,) = struct.unpack_from(">I", window, xing_at + 4)
+        if xflags & 0x01:
+            (frames,) = struct.unpack_from(">I", window, xing_at + 8)
+    elif window[first_frame + 36 : first_frame + 40] == b"VBRI":
+        (frames,) = struct.unpack_from(">I", window, first_frame + 36 + 14)
+
+    if frames:
+        duration = frames * spf / sample_rate
+    else:
+        audio_bytes = size - (audio_start + first_frame) - (128 if has_v1 else 0)
+        duration = audio_bytes * 8 / bitrate
+
+    stream = {
+        "codec_name": "mp3" if layer == 3 else f"mp{layer}",
+        "sample_fmt": "fltp",
+        "sample_rate": str(sample_rate),
+        "channels": channels,
+        "bit_rate": str(bitrate),
+    }
+    return _result(path, "mp3", duration, tags, stream, size)
+
+
+# ----------------------------------------------------------------------- WAV
+
+
+def read_wav(f, path: str, size: int) -> dict:
+    head = f.read(12)
+    if head[:4] != b"RIFF" or head[8:12] != b"WAVE":
+        raise UnsupportedFile("not a RIFF/WAVE file")
+
+    tags: Dict[str, str] = {}
+    fmt = None
+    data_size = None
+    pos = 12
+    while pos + 8 <= size:
+        f.seek(pos)
+        chunk_id, chunk_size = struct.unpack("<4sI", f.read(8))
+        body = pos + 8
+        if chunk_id == b"fmt ":
+            fmt = f.read(min(chunk_size, 40))
+        elif chunk_id == b"data":
+            # Streamed WAVs leave this 0 or 0xFFFFFFFF; the data runs to EOF.
+            data_size = chunk_size
+            if chunk_size in (0, 0xFFFFFFFF) or body + chunk_size > size:
+                data_size = size - body
+        elif chunk_id == b"LIST" and chunk_size <= MAX_TAG_BYTES:
+            info = f.read(chunk_size)
+            if info[:4] == b"INFO":
+                ipos = 4
+                while ipos + 8 <= len(info):
+                    sub_id, sub_size = struct.unpack_from("<4sI", info, ipos)
+                    raw = info[ipos + 8 : ipos + 8 + sub_size].split(b"\x00", 1)[0]
+                    text = raw.decode("utf-8", errors="replace")
+                    _add_tag(tags, RIFF_INFO_KEYS.get(sub_id, sub_id.decode("latin-1")), text)
+                    ipos += 8 + sub_size + (sub_size & 1)
+        elif chunk_id in (b"id3 ", b"ID3 "):
+            read_id3v2(f, body, tags)
+        pos = body + chunk_size + (chunk_size & 1)
+
+    if fmt is None or data_size is None:
+        raise UnsupportedFile("missing fmt or data chunk")
+
+    format_tag, channels, sample_rate, byte_rate, block_align, bits = struct.unpack_from(
+        "<HHIIHH", fmt
+    )
+    if format_tag == 0xFFFE and len(fmt) >= 26:  # WAVE_FORMAT_EXTENSIBLE
+        format_tag = struct.unpack_from("<H", fmt, 24)[0]
+    if format_tag not in (1, 3) or not byte_rate:
+        raise UnsupportedFile(f"non-PCM WAV (format tag {format_tag:#x})")
+
+    if format_tag == 3:
+        codec, sample_fmt = f"pcm_f{bits}le", "flt" if bits == 32 else "dbl"
+    elif bits == 8:
+        codec, sample_fmt = "pcm_u8", "u8"
+    else:
+        codec, sample_fmt = f"pcm_s{bits}le", "s16" if bits == 16 else "s32"
+
+    stream = {
+        "codec_name": codec,
+        "sample_fmt": sample_fmt,
+        "sample_rate": str(sample_rate),
+        "channels": channels,
+        "bits_per_sample": bits,
+        "bit_rate": str(byte_rate * 8),
+    }
+    return _result(path, "wav", data_size / byte_rate, tags, stream, size)
+
+
+# ------------------------------------------------------------------- WavPack
+
+_WV_SAMPLE_RATES = [
+    6000, 8000, 9600, 11025, 12000, 16000, 22050, 24000,
+    32000, 44100, 48000, 64000, 88200, 96000, 192000,
+]
+
+
+def read_apev2(f, size: int, tags: Dict[str, str]):
+    """APEv2 tag at the end of the file, before an ID3v1 tag if there is one."""
+    for footer_at in (size - 32, size - 128 - 32):
+        if footer_at < 0:
+            continue
+        f.seek(footer_at)
+        footer = f.read(32)
+        if footer[:8] == b"APETAGEX":
+            break
+    else:
+        return
+
+    _, tag_size, item_count, _ = struct.unpack_from("<IIII", footer, 8)
+    pos = footer_at + 32 - tag_size
+    for _ in range(item_count):
+        f.seek(pos)
+        item_head = f.read(8 + 256)
+        value_size, item_flags = struct.unpack_from("<II", item_head, 0)
+        key_end = item_head.index(b"\x00", 8)
+        key = item_head[8:key_end].decode("ascii", errors="replace")
+        value_at = pos + key_end + 1
+        pos = value_at + value_size
+        # Item type 1 is binary -- cover art -- and is skipped unread.
+        if (item_flags >> 1) & 0x03 != 0 or value_size > MAX_TAG_BYTES:
+            continue
+        f.seek(value_at)
+        value = f.read(value_size).decode("utf-8", errors="replace")
+        _add_tag(tags, key, ";".join(v for v in value.split("\x00") if v))
+
+
+def read_wv(f, path: str, size: int) -> dict:
+    header = f.read(32)
+    if header[:4] != b"wvpk":
+        raise UnsupportedFile("no wvpk block header")
+
+    (block_size, _version, _idx_u8, total_u8, total32, _index, _samples, flags, _crc) = (
+        struct.unpack_from("<IHBBIIIII", header, 4)
+    )
+    if total32 == 0xFFFFFFFF:
+        raise UnsupportedFile("WavPack stream of unknown length")
+    total_samples = (total_u8 << 32) | total32
+
+    rate_idx = (flags >> 23) & 0x0F
+    sample_rate = _WV_SAMPLE_RATES[rate_idx] if rate_idx < len(_WV_SAMPLE_RATES) else 0
+    channels = 1 if flags & 0x04 else 2
+
+    # The first block's metadata sub-blocks carry what the flags cannot: a
+    # non-standard sample rate and the channel count of multichannel files.
+    body = f.read(min(block_size - 24, MAX_TAG_BYTES))
+    pos = 0
+    while pos + 2 <= len(body):
+        sub_id = body[pos]
+        if sub_id & 0x80:
+            length = int.from_bytes(body[pos + 1 : pos + 4], "little") * 2
+            pos += 4
+        else:
+            length = body[pos + 1] * 2
+            pos += 2
+        data = body[pos : pos + length - (1 if sub_id & 0x40 else 0)]
+        if sub_id & 0x3F == 0x0D and data:  # ID_CHANNEL_INFO
+            channels = data[0]
+        elif sub_id & 0x3F == 0x27 and len(data) >= 3:  # ID_SAMPLE_RATE
+            sample_rate = int.from_bytes(data[:3], "little")
+        pos += length
+
+    if not sample_rate:
+        raise UnsupportedFile("WavPack sample rate not found")
+
+    tags: Dict[str, str] = {}
+    read_apev2(f, size, tags)
+
+    bits = ((flags & 0x03) + 1) * 8
+    if flags & 0x80:
+        sample_fmt = "fltp"
+    elif bits == 8:
+        sample_fmt = "u8p"
+    else:
+        sample_fmt = "s16p" if bits == 16 else "s32p"
+
+    stream = {
+        "codec_name": "wavpack",
+        "sample_fmt": sample_fmt,
+        "sample_rate": str(sample_rate),
+        "channels": channels,
+        "bits_per_raw_sample": str(bits),
+    }
+    return _result(path, "wv", total_samples / sample_rate, tags, stream, size)
+
+
+# ----------------------------------------------------------------------- MP4
+
+_MP4_CONTAINERS = {b"moov", b"trak", b"mdia", b"minf", b"stbl", b"udta", b"ilst"}
+
+
+def _mp4_atoms(f, start: int, end: int) -> Iterator[Tuple[bytes, int, int]]:
+    """(type, payload offset, payload end) for each atom in [start, end)."""
+    pos = start
+    while pos + 8 <= end:
+        f.seek(pos)
+        size, kind = struct.unpack(">I4s", f.read(8))
+        header = 8
+        if size == 1:
+            size = struct.unpack(">Q", f.read(8))[0]
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header:
+            return
+        yield kind, pos + header, min(pos + size, end)
+        pos += size
+
+
+def _mp4_ilst_item(f, kind: bytes, start: int, end: int, tags: Dict[str, str]):
+    name = None
+    for child, c_start, c_end in _mp4_atoms(f, start, end):
+        if c_end - c_start > MAX_TAG_BYTES:
+            continue
+        if child == b"name":
+            f.seek(c_start + 4)
+            name = f.read(c_end - c_start - 4).decode("utf-8", errors="replace")
+        elif child == b"data":
+            f.seek(c_start)
+            payload = f.read(c_end - c_start)
+            data_type = struct.unpack_from(">I", payload, 0)[0] & 0xFFFFFF
+            value = payload[8:]
+            if kind in (b"trkn", b"disk"):
+                if len(value) >= 6:
+                    num, total = struct.unpack_from(">HH", value, 2)
+                    key = "track" if kind == b"trkn" else "disc"
+                    _add_tag(tags, key, f"{num}/{total}" if total else str(num))
+            elif kind == b"----":
+                if name:
+                    _add_tag(tags, name, value.decode("utf-8", errors="replace"))
+            elif kind in MP4_KEYS and data_type == 1:
+                _add_tag(tags, MP4_KEYS[kind], value.decode("utf-8", errors="replace"))
+
+
+def read_m4a(f, path: str, size: int) -> dict:
+    tags: Dict[str, str] = {}
+    info = {"timescale": 0, "duration": 0, "codec": None, "channels": 0, "rate": 0, "bits": 16}
+    found_moov = False
+
+    def walk(start, end, in_sound_track=False):
+        nonlocal found_moov
+        for kind, a_start, a_end in _mp4_atoms(f, start, end):
+            if kind == b"moov":
+                found_moov = True
+            elif kind == b"ftyp" and a_end - a_start <= 256:
+                f.seek(a_start)
+                ftyp = f.read(a_end - a_start)
+                tags["major_brand"] = ftyp[:4].decode("latin-1")
+                tags["minor_version"] = str(struct.unpack_from(">I", ftyp, 4)[0])
+                tags["compatible_brands"] = ftyp[8:].decode("latin-1")
+                continue
+            if kind == b"trak":
+                walk(a_start, a_end, _mp4_is_sound_track(f, a_start, a_end))
+            elif kind in _MP4_CONTAINERS:
+                if kind == b"ilst":
+                    for item, i_start, i_end in _mp4_atoms(f, a_start, a_end):
+                        if item != b"covr":  # artwork: never read
+                            _mp4_ilst_item(f, item, i_start, i_end, tags)
+                else:
+                    walk(a_start, a_end, in_sound_track)
+            elif kind == b"meta":
+                # ISO meta is a full box (4 bytes version/flags before the
+                # children); QuickTime's is not. Tell them apart by peeking.
+                f.seek(a_start)
+                skip = 4 if f.read(4) == b"\x00\x00\x00\x00" else 0
+                walk(a_start + skip, a_end, in_sound_track)
+            elif kind in (b"mvhd", b"mdhd") and (kind == b"mvhd" or in_sound_track):
+                f.seek(a_start)
+                hd = f.read(32)
+                if hd[0] == 1:
+                    timescale, duration = struct.unpack_from(">IQ", hd, 20)
+                else:
+                    timescale, duration = struct.unpack_from(">II", hd, 12)
+                # The sound track's own mdhd is more precise than the movie's
+                if kind == b"mdhd" or not info["timescale"]:
+                    info["timescale"], info["duration"] = timescale, duration
+            elif kind == b"stsd" and in_sound_track:
+                f.seek(a_start + 8)
+                entry = f.read(36)
+                info["codec"] = entry[4:8]
+                info["channels"], info["bits"] = struct.unpack_from(">HH", entry, 24)
+                info["rate"] = struct.unpack_from(">I", entry, 32)[0] >> 16
+
+    walk(0, size)
+    if not found_moov or not info["timescale"] or not info["duration"]:
+        raise UnsupportedFile("no moov/mvhd")
+
+    codec = {b"mp4a": "aac", b"alac": "alac"}.get(info["codec"])
+    if codec is None:
+        raise UnsupportedFile(f"unhandled sample entry {info['codec']!r}")
+    if codec == "aac":
+        sample_fmt = "fltp"
+    else:
+        sample_fmt = "s16p" if info["bits"] <= 16 else "s32p"
+
+    stream = {
+        "codec_name": codec,
+        "sample_fmt": sample_fmt,
+        "sample_rate": str(info["rate"]),
+        "channels": info["channels"],
+    }
+    duration = info["duration"] / info["timescale"]
+    return _result(path, "mov,mp4,m4a,3gp,3g2,mj2", duration, tags, stream, size)
+
+
+def _mp4_is_sound_track(f, start: int, end: int) -> bool:
+    for kind, a_start, a_end in _mp4_atoms(f, start, end):
+        if kind == b"mdia":
+            for child, c_start, _ in _mp4_atoms(f, a_start, a_end):
+                if child == b"hdlr":
+                    f.seek(c_start + 8)
+                    return f.read(4) == b"soun"
+    return False
+
+
+# ------------------------------------------------------------------- dispatch
+
+READERS = {
+    "flac": read_flac,
+    "mp3": read_mp3,
+    "wav": read_wav,
+    "wv": read_wv,
+    "m4a": read_m4a,
+    "mp4": read_m4a,
+}
+
+
+def read(path: str) -> Optional[dict]:
+    """ffprobe-shaped metadata for `path`, or None if it cannot be parsed here."""
+    ext = path[path.rfind(".") + 1 :].lower()
+    reader = READERS.get(ext)
+    if reader is None:
+        return None
+    try:
+        size = os.path.getsize(path)
+        with open(path, "rb") as f:
+            return reader(f, path, size)
+    except (UnsupportedFile, OSError, struct.error, IndexError, ValueError):
+        return None
+
+
+def _read_pair(path: str) -> Tuple[str, Optional[dict]]:
+    return path, read(path)
+
+
+def read_many(
+    paths: Iterable[str], workers: int = READ_WORKERS, chunksize: int = 64
+) -> Iterator[Tuple[str, Optional[dict]]]:
+    """(path, result) for each path, parsed across a process pool."""
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(_read_pair, paths, chunksize=chunksize)
@@ -0,0 +1,6 @@
+# Shared by every stage that reads audio metadata: cue_scanner, info_scanner_ph1,
+# disc_duration_guard, normalizer_pass1 and backfill_file_metadata all consult
+# it before probing a file. Override with TLMC_PROBE_CACHE to put it elsewhere;
+# on a mount several nodes open, also set TLMC_PROBE_CACHE_SHARED=1 (WAL does
+# not work over SMB/NFS, see probe_cache.py).
+PROBE_CACHE_NAME = "probe_cache.sqlite3"
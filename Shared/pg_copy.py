@@ -0,0 +1,225 @@
+"""
+Writes rows for PostgreSQL's COPY, in binary format or as CSV.
+
+The DbCommit scripts hand psql their output through temp tables and \\copy. As
+CSV, every uuid, integer and color array is formatted to text here, quoted,
+and parsed back on the server -- at 650k asset rows plus the variant ladder and
+color arrays that is most of the apply. Binary COPY carries each value in its
+wire representation instead, so neither side formats or parses anything.
+
+A writer is opened with the column types of the temp table it loads, and takes
+plain Python values:
+
+    uuid      str or uuid.UUID
+    int2, int4, int8, float8, bool, text
+    text[]    a list of str (one dimension; None elements are NULL)
+    jsonb     anything json.dumps accepts
+
+None is NULL in every column. Binary COPY does not convert types, so the types
+must be exactly the table's -- an int4 written into a smallint column is an
+error on the server, not a cast.
+
+    with pg_copy.open_writer("variants", ("uuid", "int2", "uuid"), out_dir) as w:
+        w.writerow((artwork_id, 120, asset_id))
+
+writes variants.bin, or variants.csv under TLMC_COPY_FORMAT=csv (for psql
+older than 10, or to read the output by eye). The apply scripts load either:
+
+    psql -f apply_artwork_variants.sql            # binary
+    psql -v csv=1 -f apply_artwork_variants.sql   # CSV
+
+Output is buffered and written in CHUNK_BYTES pieces; a path of "-" streams
+to stdout.
+"""
+
+import csv
+import io
+import json
+import os
+import struct
+import sys
+import uuid
+from contextlib import contextmanager
+from typing import Any, BinaryIO, Iterator, Sequence
+
+FORMAT_BINARY = "binary"
+FORMAT_CSV = "csv"
+FORMAT = (os.environ.get("TLMC_COPY_FORMAT") or FORMAT_BINARY).lower()
+
+EXTENSIONS = {FORMAT_BINARY: ".bin", FORMAT_CSV: ".csv"}
+
+CHUNK_BYTES = 1 << 20
+
+# PGCOPY\n\377\r\n\0, then a flags word and a header-extension length.
+_SIGNATURE = b"PGCOPY\n\xff\r\n\x00"
+_HEADER = _SIGNATURE + struct.pack(">ii", 0, 0)
+_TRAILER = struct.pack(">h", -1)
+_NULL = struct.pack(">i", -1)
+
+_TEXT_OID = 25
+_JSONB_VERSION = b"\x01"
+
+
+def _uuid(value) -> bytes:
+    return (value if isinstance(value, uuid.UUID) else uuid.UUID(value)).bytes
+
+
+def _text(value) -> bytes:
+    return str(value).encode("utf-8")
+
+
+def _text_array(values) -> bytes:
+    values = list(values)
+    if not values:
+        # Zero dimensions: the empty array '{}'.
+        return struct.pack(">iii", 0, 0, _TEXT_OID)
+    has_null = any(v is None for v in values)
+    parts = [struct.pack(">iiiii", 1, int(has_null), _TEXT_OID, len(values), 1)]
+    for v in values:
+        if v is None:
+            parts.append(_NULL)
+        else:
+            data = _text(v)
+            parts.append(struct.pack(">i", len(data)) + data)
+    return b"".join(parts)
+
+
+def _jsonb(value) -> bytes:
+    return _JSONB_VERSION + json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+_ENCODERS = {
+    "uuid": _uuid,
+    "int2": struct.Struct(">h").pack,
+    "int4": struct.Struct(">i").pack,
+    "int8": struct.Struct(">q").pack,
+    "float8": struct.Struct(">d").pack,
+    "bool": lambda v: b"\x01" if v else b"\x00",
+    "text": _text,
+    "text[]": _text_array,
+    "jsonb": _jsonb,
+}
+
+
+class BinaryCopyWriter:
+    def __init__(self, f: BinaryIO, types: Sequence[str]) -> None:
+        unknown = [t for t in types if t not in _ENCODERS]
+        if unknown:
+            raise ValueError(f"unsupported COPY column types: {unknown}")
+        self.f = f
+        self.encoders = [_ENCODERS[t] for t in types]
+        self.field_count = struct.pack(">h", len(types))
+        self.buf = bytearray(_HEADER)
+        self.rows = 0
+
+    def writerow(self, row: Sequence[Any]) -> None:
+        if len(row) != len(self.encoders):
+            raise ValueError(f"row has {len(row)} fields, expected {len(self.encoders)}")
+        buf = self.buf
+        buf += self.field_count
+        for encode, value in zip(self.encoders, row):
+            if value is None:
+                buf += _NULL
+            else:
+                data = encode(value)
+                buf += struct.pack(">i", len(data))
+                buf += data
+        self.rows += 1
+        if len(buf) >= CHUNK_BYTES:
+            self.flush()
+
+    def flush(self) -> None:
+        self.f.write(self.buf)
+        self.buf = bytearray()
+
+    def close(self) -> None:
+        self.buf += _TRAILER
+        self.flush()
+
+
+def _csv_array(values) -> str:
+    # Array literal: every element double-quoted, so commas, braces and spaces
+    # in it need no further thought; NULL unquoted.
+    items = []
+    for v in values:
+        if v is None:
+            items.append("NULL")
+        else:
+            items.append('"' + str(v).replace("\\", "\\\\").replace('"', '\\"') + '"')
+    return "{" + ",".join(items) + "}"
+
+
+_CSV_FORMATTERS = {
+    "text[]": _csv_array,
+    "jsonb": lambda v: json.dumps(v, ensure_ascii=False),
+    "bool": lambda v: "t" if v else "f",
+    "float8": repr,
+}
+
+
+class CsvCopyWriter:
+    def __init__(self, f: BinaryIO, types: Sequence[str]) -> None:
+        unknown = [t for t in types if t not in _ENCODERS]
+        if unknown:
+            raise ValueError(f"unsupported COPY column types: {unknown}")
+        self.text = io.TextIOWrapper(f, encoding="utf-8", newline="", write_through=False)
+        # Every non-NULL field quoted, so an empty string stays '' rather than
+        # reading back as NULL; None is written bare, which is COPY's CSV NULL.
+        self.writer = csv.writer(self.text, quoting=csv.QUOTE_NOTNULL)
+        self.formatters = [_CSV_FORMATTERS.get(t, str) for t in types]
+        self.rows = 0
+
+    def writerow(self, row: Sequence[Any]) -> None:
+        if len(row) != len(self.formatters):
+            raise ValueError(f"row has {len(row)} fields, expected {len(self.formatters)}")
+        self.writer.writerow(
+            None if value is None else fmt(value) for fmt, value in zip(self.formatters, row)
+        )
+        self.rows += 1
+
+    def flush(self) -> None:
+        self.text.flush()
+
+    def close(self) -> None:
+        self.text.flush()
+        self.text.detach()
+
+
+def output_path(name: str, out_dir: str, fmt: str = None) -> str:
+    """`<out_dir>/<name>.bin` or `.csv` for the format in use."""
+    return os.path.join(out_dir, name + EXTENSIONS[fmt or FORMAT])
+
+
+@contextmanager
+def open_writer(
+    name: str, types: Sequence[str], out_dir: str = ".", fmt: str = None
+) -> Iterator:
+    """
+    A writer for `<out_dir>/<name>` in `fmt` (TLMC_COPY_FORMAT by default), or
+    for stdout when `name` is "-". A file is written under a temporary name and
+    renamed once complete, so psql never loads half of one.
+    """
+    fmt = fmt or FORMAT
+    if fmt not in EXTENSIONS:
+        raise ValueError(f"unknown COPY format {fmt!r}; expected one of {sorted(EXTENSIONS)}")
+    cls = BinaryCopyWriter if fmt == FORMAT_BINARY else CsvCopyWriter
+
+    if name == "-":
+        writer = cls(sys.stdout.buffer, types)
+        yield writer
+        writer.close()
+        sys.stdout.buffer.flush()
+        return
+
+    path = output_path(name, out_dir, fmt)
+    tmp = path + ".tmp"
+    with open(tmp, "wb", buffering=0) as f:
+        writer = cls(f, types)
+        try:
+            yield writer
+            writer.close()
+        except BaseException:
+            f.close()
+            os.remove(tmp)
+            raise
+    os.replace(tmp, path)
@@ -0,0 +1,285 @@
+"""
+One probe result per audio file, shared by every stage that needs metadata.
+
+cue_scanner, info_scanner_ph1, disc_duration_guard, normalizer_pass1 and
+backfill_file_metadata used to spawn their own ffprobe for the same ~170k files
+and keep the answers in their own side files, so every rerun of the chain paid
+for the whole library again -- ~48ms a file, mostly seek latency on the USB disk.
+They now ask this store first and only probe on a miss.
+
+An entry is valid while the file's (size, mtime_ns) match what was recorded; a
+rewritten file misses and is probed again. The stored result is ffprobe's
+`-show_format -show_streams` JSON, a superset of what any stage reads, with
+duration and the cuesheet tag pulled out into columns so they can be queried
+without parsing it. `xxh128` is optional -- nothing here reads a whole file to
+fill it -- but extracted_snapshot.py, which hashes every file anyway, hands its
+entries to `adopt_hashes`: current rows take their hash, and a path with no row
+takes the result recorded for the same content under another path, so an
+album that moved or was respelt since it was probed costs no probes at all.
+
+SQLite in WAL mode: readers never block, writers serialise on the file lock, and
+each thread and each process opens its own connection, so it works from the
+ThreadPoolExecutor stages and the multiprocessing ones alike. WAL's index lives
+in shared memory, which only works between processes on one host; a store on a
+network mount that several nodes open (TLMC_PROBE_CACHE_SHARED=1) uses the
+rollback journal instead, as hls_queue.py does.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterable, Optional, Tuple
+
+import Shared.output.path_definitions as SharedOutputPaths
+from Shared import media_reader
+from Shared.utils import get_output_path, probe_flac
+
+cache_path = os.environ.get("TLMC_PROBE_CACHE") or get_output_path(
+    SharedOutputPaths, SharedOutputPaths.PROBE_CACHE_NAME
+)
+# Set when cache_path is on SMB/NFS and opened from more than one node.
+SHARED = os.environ.get("TLMC_PROBE_CACHE_SHARED", "0") != "0"
+
+# Read headers in process (Shared/media_reader.py) before spawning ffprobe.
+# ffprobe remains the fallback for anything the reader cannot parse; set
+# TLMC_NATIVE_PROBE=0 to go back to ffprobe for everything.
+NATIVE_READER = os.environ.get("TLMC_NATIVE_PROBE", "1") != "0"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS probe (
+    path     TEXT PRIMARY KEY,
+    size     INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    xxh128   TEXT,
+    duration REAL,
+    cuesheet TEXT,
+    result   TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS probe_xxh128 ON probe (xxh128);
+"""
+
+
+def _tag(result: dict, name: str):
+    # Tag case depends on the container: FLAC keeps the Vorbis comment's own
+    # spelling, so CUESHEET and cuesheet both occur in the library.
+    tags = result.get("format", {}).get("tags", {})
+    for key, value in tags.items():
+        if key.lower() == name:
+            return value
+    return None
+
+
+def _duration(result: dict) -> Optional[float]:
+    try:
+        return float(result["format"]["duration"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+class ProbeCache:
+    def __init__(self, path: str = cache_path, shared: bool = SHARED) -> None:
+        self.path = path
+        self.shared = shared
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        # Keyed on pid as well as thread: a connection inherited across fork()
+        # must not be used by the child.
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=60)
+        if self.shared:
+            conn.execute("PRAGMA journal_mode=DELETE")
+        else:
+            conn.execute("PRAGMA journal_mode=WAL")
+            # A lost tail after a power cut costs a few re-probes, not
+            # corruption. (Only in WAL; with the rollback journal NORMAL can.)
+            conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(_SCHEMA)
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def get(self, path: str, st: Optional[os.stat_result] = None) -> Optional[dict]:
+        """The recorded result for `path`, or None if absent or stale."""
+        if st is None:
+            try:
+                st = os.stat(path)
+            except OSError:
+                return None
+
+        row = self._conn().execute(
+            "SELECT size, mtime_ns, result FROM probe WHERE path = ?", (path,)
+        ).fetchone()
+        if row is None or row[0] != st.st_size or row[1] != st.st_mtime_ns:
+            return None
+        return json.loads(row[2])
+
+    def put(
+        self,
+        path: str,
+        result: dict,
+        st: Optional[os.stat_result] = None,
+        xxh128: Optional[str] = None,
+    ) -> None:
+        if st is None:
+            st = os.stat(path)
+
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT INTO probe (path, size, mtime_ns, xxh128, duration, cuesheet, result) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (path) DO UPDATE SET "
+                "size = excluded.size, mtime_ns = excluded.mtime_ns, "
+                "xxh128 = COALESCE(excluded.xxh128, probe.xxh128), "
+                "duration = excluded.duration, cuesheet = excluded.cuesheet, "
+                "result = excluded.result",
+                (
+                    path,
+                    st.st_size,
+                    st.st_mtime_ns,
+                    xxh128,
+                    _duration(result),
+                    _tag(result, "cuesheet"),
+                    json.dumps(result, ensure_ascii=False),
+                ),
+            )
+
+    def set_hashes(self, rows: Iterable[Tuple[str, str, int, int]]) -> None:
+        """
+        Record hashes computed elsewhere, as (path, xxh128, size, mtime_ns);
+        a row is only updated while it is still current for that size and mtime.
+        """
+        conn = self._conn()
+        with conn:
+            conn.executemany(
+                "UPDATE probe SET xxh128 = ? WHERE path = ? AND size = ? AND mtime_ns = ?",
+                ((xxh128, path, size, mtime_ns) for path, xxh128, size, mtime_ns in rows),
+            )
+
+    def find_by_hash(self, xxh128: str, path: str) -> Optional[dict]:
+        """
+        A result recorded for the same content under any path, rewritten for `path`.
+
+        Only meaningful when the caller already knows the file's hash; a moved
+        album then costs no probes at all.
+        """
+        row = self._conn().execute(
+            "SELECT result FROM probe WHERE xxh128 = ? LIMIT 1", (xxh128,)
+        ).fetchone()
+        if row is None:
+            return None
+        result = json.loads(row[0])
+        result.setdefault("format", {})["filename"] = path
+        return result
+
+    def adopt_hashes(self, entries: Dict[str, dict]) -> Tuple[int, int]:
+        """
+        Takes hashes from snapshot entries ({path: {"hash", "size", "mtime_ns"}},
+        as Preprocessor/Extract/snapshot.py writes them). Returns how many
+        current rows were hashed, and how many paths without one were given the
+        result of a row with the same content.
+        """
+        known = {
+            path: (size, mtime_ns)
+            for path, size, mtime_ns in self._conn().execute(
+                "SELECT path, size, mtime_ns FROM probe"
+            )
+        }
+
+        current = []
+        unknown = []
+        for path, entry in entries.items():
+            xxh128, size, mtime_ns = entry.get("hash"), entry.get("size"), entry.get("mtime_ns")
+            if not xxh128 or mtime_ns is None:
+                continue
+            if known.get(path) == (size, mtime_ns):
+                current.append((path, xxh128, size, mtime_ns))
+            else:
+                unknown.append((path, xxh128, size, mtime_ns))
+        # Hashed first, so a moved file finds the row it moved from.
+        self.set_hashes(current)
+
+        carried = 0
+        for path, xxh128, size, mtime_ns in unknown:
+            # Only content that was once probed matches, so the snapshot's
+            # scans and logs fall through here cheaply.
+            result = self.find_by_hash(xxh128, path)
+            if result is None:
+                continue
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            if (st.st_size, st.st_mtime_ns) == (size, mtime_ns):
+                self.put(path, result, st, xxh128=xxh128)
+                carried += 1
+
+        return len(current), carried
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def default_cache() -> ProbeCache:
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = ProbeCache()
+        return _default
+
+
+def probe(
+    path: str,
+    ffprobe: str = "ffprobe",
+    timeout: int = 60,
+    cache: Optional[ProbeCache] = None,
+) -> Optional[dict]:
+    """
+    ffprobe's format and stream info for `path`, from the cache when current,
+    otherwise from the native header reader, otherwise from ffprobe itself.
+
+    Returns None when the file cannot be stat'ed or probed; a failed probe is
+    not recorded, so the next run tries it again.
+    """
+    cache = cache or default_cache()
+    try:
+        st = os.stat(path)
+    except OSError as e:
+        print(f"\nCannot stat {path}: {e}\n")
+        return None
+
+    result = cache.get(path, st)
+    if result is not None:
+        return result
+
+    if NATIVE_READER:
+        result = media_reader.read(path)
+
+    if result is None:
+        raw = probe_flac(ffprobe, path, timeout=timeout, show_streams=True)
+        if raw is None:
+            return None
+        try:
+            result = json.loads(raw)
+        except json.JSONDecodeError:
+            return None
+
+    cache.put(path, result, st)
+    return result
+
+
+def cached(path: str, cache: Optional[ProbeCache] = None) -> Optional[dict]:
+    """The cached result for `path` without probing on a miss."""
+    return (cache or default_cache()).get(path)
+
+
+def duration(path: str, cache: Optional[ProbeCache] = None) -> Optional[float]:
+    result = probe(path, cache=cache)
+    return None if result is None else _duration(result)
@@ -1,8 +1,12 @@
 import os
 import threading
-from concurrent.futures import ALL_COMPLETED, ThreadPoolExecutor, wait
+import time
+from concurrent.futures import ThreadPoolExecutor
 from os import PathLike
-from typing import Any, Callable, List
+from typing import Any, Callable, List, Optional
+
+from Shared.adaptive_concurrency import AdaptiveLimit
+from Shared.run_metrics import MetricsPublisher, RunMetrics
 
 
 class JournalWriter:
@@ -88,13 +92,32 @@ class StatAutoMuxMultiProcessor:
         num_processors: int,
         journal_writer: JournalWriter,
         output_writer: OutputWriter,
+        limit: Optional[AdaptiveLimit] = None,
+        name: Optional[str] = None,
     ):
+        # With a limit, num_processors is the ceiling: the pool has that many
+        # threads, but only `limit.limit` of them run a job at once, and the
+        # limit may be moved while jobs are running (Shared/adaptive_concurrency.py).
         self.num_processors = num_processors
+        self.limit = limit
         self.executor = ThreadPoolExecutor(max_workers=num_processors)
         self.journal_writers = journal_writer
         self.output_writer = output_writer
         self.print_reporter = PrintMessageReporter()
-        self.processes = []
+
+        # The series lands beside the general journal, so every stage gets one
+        # without having to name another output file (Shared/run_metrics.py).
+        journal_root = os.path.splitext(journal_writer.journal.name)[0]
+        self.metrics = RunMetrics(
+            name or os.path.basename(journal_root).split(".")[0],
+            failed=lambda: journal_writer.stats["failed"],
+        )
+        if limit is not None:
+            self.metrics.limit = lambda: limit.limit
+        self.metrics_publisher = MetricsPublisher(
+            self.metrics, f"{journal_root}.metrics.jsonl"
+        )
+        self.metrics_publisher.start()
 
     def submit_job(
         self,
@@ -102,35 +125,63 @@ class StatAutoMuxMultiProcessor:
         *args
     ):
         self.journal_writers: JournalWriter
-        proc = self.executor.submit(
+        self.metrics.job_submitted()
+        self.executor.submit(
+            self._run_job,
             target,
             self.journal_writers,
             self.print_reporter,
             self.output_writer,
             *args,
         )
-        self.processes.append(proc)
+
+    def _run_job(self, target, *args):
+        if self.limit is not None:
+            self.limit.acquire()
+        self.metrics.job_started()
+        started = time.monotonic()
+        try:
+            return target(*args)
+        except Exception as e:
+            # Nothing calls .result() on these futures, so an exception that
+            # escaped the job used to vanish; journal it so it is counted.
+            job = args[3] if len(args) > 3 else target.__name__
+            self.journal_writers.report_error(f"Unhandled error in job {job}: {e}\n")
+        finally:
+            self.metrics.job_finished(time.monotonic() - started)
+            if self.limit is not None:
+                self.limit.release()
 
     def wait_print_complete(self):
+        # Waits on the finished-job counter rather than scanning every future:
+        # with ~170k jobs submitted the old any(p.running() ...) walked the
+        # whole list twice a second for the entire run.
         try:
-            while any([p.running() for p in self.processes]):
-                key = self.print_reporter.message.keys()
-                if key:
-                    print(
-                        "PROGRESS [{}/{} | {}]".format(
-                            self.journal_writers.stats["completed"],
-                            len(self.processes),
-                            self.journal_writers.stats["failed"],
-                        )
+            while not self.metrics.wait_all_finished(timeout=0.5):
+                key = list(self.print_reporter.message.keys())
+                if not key:
+                    continue
+                # An escape sequence rather than os.system("clear"), which
+                # forked a shell twice a second.
+                if os.name == "nt":
+                    os.system("cls")
+                else:
+                    print("\x1b[H\x1b[2J", end="")
+                print(
+                    "PROGRESS [{}/{} | {}]".format(
+                        self.journal_writers.stats["completed"],
+                        self.metrics.submitted,
+                        self.journal_writers.stats["failed"],
                     )
-                    for ident in key:
-                        print(self.print_reporter.message[ident], end="\n")
+                )
+                for ident in key:
+                    print(self.print_reporter.message[ident], end="\n")
 
-                    print("\n\n")
-                    wait(self.processes, timeout=0.5, return_when=ALL_COMPLETED)
-                    os.system("cls" if os.name == "nt" else "clear")
+                print("\n\n")
         except Exception as e:
             print(e)
+        finally:
+            self.metrics_publisher.stop()
 
     def reset_terminal(self):
         if os.name != "nt":
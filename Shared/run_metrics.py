@@ -0,0 +1,229 @@
+"""
+Counters for the long StatAutoMuxMultiProcessor runs, readable without a tmux.
+
+The transcode and loudness passes run for days, and until now the only view of
+one was its terminal: a screen cleared and reprinted twice a second. Nothing was
+kept, so a slowdown could only be noticed live and tracks/s could not be
+compared between runs. Every processor now keeps a RunMetrics and publishes it
+two ways:
+
+  * a JSONL time series, one snapshot every TLMC_METRICS_INTERVAL seconds
+    (default 10), written next to the run's general journal as
+    `<journal>.metrics.jsonl`. Always on; a week of it is a few MB.
+  * a Prometheus text endpoint on 127.0.0.1:TLMC_METRICS_PORT/metrics, when
+    that is set. Bound to localhost only -- reach it over ssh -L from elsewhere.
+    Inside a container localhost is the container's own, so there set
+    TLMC_METRICS_HOST=0.0.0.0 and publish the port to the host's loopback
+    with `-p 127.0.0.1:9108:9108`.
+
+Job counts come from the processor's own wrapper around each job, not from the
+futures, so reading them is O(1) however many jobs were submitted. Failures are
+the JournalWriter's count, since jobs report failure by journalling it rather
+than by raising. Bytes are the operating system's block I/O counters for this
+process and every child it has reaped (ffmpeg): reads served from page cache
+and traffic over a network mount do not appear in them.
+"""
+
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+METRICS_INTERVAL = float(os.environ.get("TLMC_METRICS_INTERVAL") or 10)
+METRICS_PORT = int(os.environ.get("TLMC_METRICS_PORT") or 0)
+METRICS_HOST = os.environ.get("TLMC_METRICS_HOST") or "127.0.0.1"
+
+# Seconds. Spans a 0.2 s loudness probe up to a long track's full HLS ladder
+# over SMB.
+JOB_SECONDS_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+def block_io_bytes():
+    """(read, written) bytes of block I/O by this process and its reaped children."""
+    if resource is None:
+        return 0, 0
+    # ru_inblock/ru_oublock count 512-byte blocks on Linux.
+    read = written = 0
+    for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN):
+        usage = resource.getrusage(who)
+        read += usage.ru_inblock * 512
+        written += usage.ru_oublock * 512
+    return read, written
+
+
+class RunMetrics:
+    def __init__(self, name: str, failed: Callable[[], int] = lambda: 0) -> None:
+        self.name = name
+        self.failed = failed
+        self.started_at = time.time()
+        self.submitted = 0
+        self.started = 0
+        self.finished = 0
+        self.job_seconds_sum = 0.0
+        self.job_seconds_buckets = [0] * len(JOB_SECONDS_BUCKETS)
+        self.limit: Callable[[], Optional[int]] = lambda: None
+        self._cond = threading.Condition()
+
+    def job_submitted(self) -> None:
+        with self._cond:
+            self.submitted += 1
+
+    def job_started(self) -> None:
+        with self._cond:
+            self.started += 1
+
+    def job_finished(self, seconds: float) -> None:
+        with self._cond:
+            self.finished += 1
+            self.job_seconds_sum += seconds
+            for i, bound in enumerate(JOB_SECONDS_BUCKETS):
+                if seconds <= bound:
+                    self.job_seconds_buckets[i] += 1
+            self._cond.notify_all()
+
+    def wait_all_finished(self, timeout: float) -> bool:
+        """Block until every submitted job has finished, or `timeout` passes."""
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: self.finished >= self.submitted, timeout=timeout
+            )
+
+    def snapshot(self) -> Dict:
+        with self._cond:
+            snap = {
+                "time": time.time(),
+                "stage": self.name,
+                "submitted": self.submitted,
+                "started": self.started,
+                "finished": self.finished,
+                "running": self.started - self.finished,
+                "queued": self.submitted - self.started,
+                "job_seconds_sum": round(self.job_seconds_sum, 3),
+                "job_seconds_buckets": dict(
+                    zip(map(str, JOB_SECONDS_BUCKETS), self.job_seconds_buckets)
+                ),
+            }
+        snap["failed"] = self.failed()
+        snap["bytes_read"], snap["bytes_written"] = block_io_bytes()
+        snap["limit"] = self.limit()
+        snap["uptime"] = round(snap["time"] - self.started_at, 1)
+        return snap
+
+    def render_prometheus(self) -> str:
+        snap = self.snapshot()
+        label = f'stage="{self.name}"'
+        lines = []
+
+        series = [
+            ("tlmc_jobs_submitted_total", "counter", "submitted", "Jobs submitted."),
+            ("tlmc_jobs_finished_total", "counter", "finished", "Jobs returned, whatever the outcome."),
+            ("tlmc_jobs_failed_total", "counter", "failed", "Jobs that journalled a failure."),
+            ("tlmc_jobs_running", "gauge", "running", "Jobs currently running."),
+            ("tlmc_queue_depth", "gauge", "queued", "Jobs submitted but not yet started."),
+            ("tlmc_io_read_bytes_total", "counter", "bytes_read", "Block I/O read by the run and its children."),
+            ("tlmc_io_written_bytes_total", "counter", "bytes_written", "Block I/O written by the run and its children."),
+            ("tlmc_concurrency_limit", "gauge", "limit", "Jobs allowed to run at once."),
+        ]
+        for name, kind, key, help_text in series:
+            if snap[key] is None:
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.append(f"{name}{{{label}}} {snap[key]}")
+
+        lines.append("# HELP tlmc_job_seconds Wall time per job.")
+        lines.append("# TYPE tlmc_job_seconds histogram")
+        for bound, count in snap["job_seconds_buckets"].items():
+            lines.append(f'tlmc_job_seconds_bucket{{{label},le="{bound}"}} {count}')
+        lines.append(f'tlmc_job_seconds_bucket{{{label},le="+Inf"}} {snap["finished"]}')
+        lines.append(f"tlmc_job_seconds_sum{{{label}}} {snap['job_seconds_sum']}")
+        lines.append(f"tlmc_job_seconds_count{{{label}}} {snap['finished']}")
+        return "\n".join(lines) + "\n"
+
+
+class MetricsPublisher:
+    """Writes the JSONL series and, if a port is given, serves /metrics."""
+
+    def __init__(
+        self,
+        metrics: RunMetrics,
+        jsonl_path: Optional[str],
+        port: int = METRICS_PORT,
+        interval: float = METRICS_INTERVAL,
+    ) -> None:
+        self.metrics = metrics
+        self.jsonl_path = jsonl_path
+        self.port = port
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        self._server = None
+
+    def _write(self, out) -> None:
+        out.write(json.dumps(self.metrics.snapshot()) + "\n")
+        out.flush()
+
+    def _record(self) -> None:
+        with open(self.jsonl_path, "a", encoding="utf-8") as out:
+            self._write(out)
+            while not self._stop.wait(self.interval):
+                self._write(out)
+            # One last line, so the series ends with the final totals.
+            self._write(out)
+
+    def _serve(self) -> None:
+        metrics = self.metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip("/") not in ("", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = metrics.render_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                # The default logs every scrape to stderr, under the progress display.
+                pass
+
+        self._server = ThreadingHTTPServer((METRICS_HOST, self.port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(
+            target=self._server.serve_forever, name="metrics-http", daemon=True
+        ).start()
+
+    def start(self) -> None:
+        if self.port:
+            try:
+                self._serve()
+                print(f"Metrics on http://{METRICS_HOST}:{self.port}/metrics")
+            except OSError as e:
+                # Two runs on one host with the same port: the second still
+                # runs, it just goes without the endpoint.
+                print(f"Metrics endpoint not started on port {self.port}: {e}")
+        if self.jsonl_path:
+            self._thread = threading.Thread(
+                target=self._record, name="metrics-jsonl", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
@@ -28,14 +28,42 @@ def open_for_read(fp: str, create_if_not_exist: bool = True) -> TextIOWrapper:
     return file
 
 
+# Set for a restricted run (Shared/delta_worklist.py): every stage's output
+# directory is mirrored under this root, at its path relative to the repo, so
+# the full run's artifacts are left as they were.
+OUTPUT_ROOT = os.environ.get("TLMC_OUTPUT_ROOT")
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def redirect_output(directory: str) -> str:
+    """`directory`, or its mirror under TLMC_OUTPUT_ROOT when that is set."""
+    if not OUTPUT_ROOT:
+        return directory
+    try:
+        relative = os.path.relpath(os.path.abspath(directory), REPO_ROOT)
+    except ValueError:
+        # Another drive on Windows: not part of the repo.
+        return directory
+    if relative.split(os.sep)[0] == os.pardir:
+        return directory
+    mirrored = os.path.join(OUTPUT_ROOT, relative)
+    os.makedirs(mirrored, exist_ok=True)
+    return mirrored
+
+
 def get_output_path(module, name):
     module_path = os.path.dirname(module.__file__)
-    return os.path.join(module_path, name)
+    return os.path.join(redirect_output(module_path), name)
 
 
 def get_self_output_path(module_fp, name):
     module_path = os.path.dirname(module_fp)
-    return os.path.join(module_path, name)
+    return os.path.join(redirect_output(module_path), name)
+
+
+def get_output_root(module_fp):
+    """The `output` directory next to `module_fp`, honouring TLMC_OUTPUT_ROOT."""
+    return redirect_output(os.path.join(os.path.dirname(module_fp), "output"))
 
 
 def join_paths(*paths):
@@ -77,10 +105,11 @@ def oslex_quote(path):
     return shlex.quote(path)
 
 
-def probe_flac(ffprobe: str, path: str, timeout: int = 60):
+def probe_flac(ffprobe: str, path: str, timeout: int = 60, show_streams: bool = False):
     exec = ffprobe
     args = [
         "-show_format",
+        *(["-show_streams"] if show_streams else []),
         "-of",
         "json",
         "-i",
@@ -114,11 +143,13 @@ def probe_flac(ffprobe: str, path: str, timeout: int = 60):
 
 
 def check_cuesheet_attr(path: str) -> bool:
-    probe_result = probe_flac("ffprobe", path)
-    if probe_result is None:
+    # Imported here: probe_cache runs ffprobe through probe_flac above.
+    from Shared import probe_cache
+
+    result = probe_cache.probe(path)
+    if result is None:
         return False
 
-    result = json.loads(probe_result)
     if "format" not in result:
         return False
 
@@ -132,20 +163,23 @@ def check_cuesheet_attr(path: str) -> bool:
 
 
 def get_cuesheet_attr(path: str) -> str:
-    probe_result = probe_flac("ffprobe", path)
-    if probe_result is None:
+    from Shared import probe_cache
+
+    result = probe_cache.probe(path)
+    if result is None:
         return None
 
-    result = json.loads(probe_result)
     if "format" not in result:
         return None
 
     if "tags" not in result["format"]:
         return None
 
-    tags = [i.lower() for i in result["format"]["tags"].keys()]
-    if "cuesheet" in tags:
-        return result["format"]["tags"]["cuesheet"]
+    # The key keeps the case it was written with ("CUESHEET" in most rips, and
+    # always for one media_reader renders from a CUESHEET metadata block).
+    for key, value in result["format"]["tags"].items():
+        if key.lower() == "cuesheet":
+            return value
     return None
 
 